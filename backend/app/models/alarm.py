@@ -0,0 +1,49 @@
+from datetime import datetime
+from .. import db
+
+
+class AlarmRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    register_id = db.Column(db.Integer, db.ForeignKey('register.id', ondelete='CASCADE'), nullable=False, index=True)
+    rule_type = db.Column(db.String(20), nullable=False)  # 'high', 'low', 'rate_of_change' or 'deviation'
+    threshold = db.Column(db.Float, nullable=False)  # Units per second for rate_of_change
+    setpoint = db.Column(db.Float, nullable=True)  # deviation from a fixed value...
+    reference_register_id = db.Column(db.Integer, db.ForeignKey('register.id', ondelete='CASCADE'),
+                                      nullable=True)  # ...or from another register of the PLC
+    deadband = db.Column(db.Float, default=0.0)  # Hysteresis before an active alarm clears
+    on_delay = db.Column(db.Float, default=0.0)  # seconds
+    off_delay = db.Column(db.Float, default=0.0)  # seconds
+    severity = db.Column(db.String(20), default='warning', nullable=False)
+    message = db.Column(db.String(255), nullable=True)
+    enabled = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AlarmRule {self.id} ({self.rule_type}, Register: {self.register_id})>'
+
+
+class Alarm(db.Model):
+    """One occurrence of an alarm, from raised to cleared"""
+    id = db.Column(db.Integer, primary_key=True)
+    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id', ondelete='CASCADE'), nullable=False)
+    register_id = db.Column(db.Integer, db.ForeignKey('register.id', ondelete='CASCADE'), nullable=False)
+    rule_id = db.Column(db.Integer, db.ForeignKey('alarm_rule.id', ondelete='SET NULL'),
+                        nullable=True)  # None for the register's own min/max limits
+    rule_type = db.Column(db.String(20), nullable=False)
+    severity = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(255), nullable=True)
+    threshold = db.Column(db.Float, nullable=False)
+    value = db.Column(db.Float, nullable=True)
+    raised_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    cleared_at = db.Column(db.DateTime, nullable=True)
+    clear_value = db.Column(db.Float, nullable=True)
+    acknowledged_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Active alarms are those not cleared yet
+        db.Index('ix_alarm_plc_id_cleared_at', 'plc_id', 'cleared_at'),
+        db.Index('ix_alarm_register_id', 'register_id'),
+    )
+
+    def __repr__(self):
+        return f'<Alarm {self.id} ({self.rule_type}, Register: {self.register_id})>'
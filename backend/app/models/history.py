@@ -0,0 +1,19 @@
+from .. import db
+
+
+class HistoryChunk(db.Model):
+    """A run of a register's compressed history on one PLC: ``count``
+    (timestamp, value) float64 pairs packed into ``points``, timestamps in
+    epoch seconds. Template registers have a history per linked PLC."""
+    id = db.Column(db.Integer, primary_key=True)
+    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id', ondelete='CASCADE'), nullable=False)
+    register_id = db.Column(db.Integer, db.ForeignKey('register.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.Float, nullable=False)
+    end_time = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        # Queries read a register's chunks on a PLC in time order
+        db.Index('ix_history_chunk_plc_id_register_id_start_time', 'plc_id', 'register_id', 'start_time'),
+    )
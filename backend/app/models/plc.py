@@ -5,16 +5,37 @@ from .. import db
 class PLC(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
-    ip_address = db.Column(db.String(120), unique=True, nullable=False)
+    ip_address = db.Column(db.String(120), nullable=False)  # Slaves behind one gateway share it
     port = db.Column(db.Integer, default=502)
     unit_id = db.Column(db.Integer, default=1)
+    protocol = db.Column(db.String(20), default='tcp', nullable=False)  # 'tcp', 'rtu_over_tcp' or 'rtu'
+    serial_port = db.Column(db.String(120), nullable=True)
+    baudrate = db.Column(db.Integer, nullable=True)
+    inter_frame_delay = db.Column(db.Float, nullable=True)  # ms, derived from the transport when unset
+    # Seconds between polls (POLL_INTERVAL when unset) and the slowest load shedding may stretch it to
+    poll_interval = db.Column(db.Float, nullable=True)
+    max_poll_interval = db.Column(db.Float, nullable=True)
+    # Registers the PLC answers in one read, for devices below the protocol's 125
+    max_read_count = db.Column(db.Integer, nullable=True)
     description = db.Column(db.String(255))
     last_seen = db.Column(db.DateTime, nullable=True)
     is_connected = db.Column(db.Boolean, default=False)
+    # Set by start-monitoring and cleared by stop-monitoring, so polling resumes after a restart
+    monitoring_enabled = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    # Unit id the Modbus gateway presents the PLC on, and where its addresses start in that unit's
+    gateway_unit_id = db.Column(db.Integer, nullable=True)
+    gateway_offset = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Polls the template's registers besides its own, see DeviceTemplate
+    template_id = db.Column(db.Integer, db.ForeignKey('device_template.id'), nullable=True)
     registers = db.relationship('Register', backref='plc', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_plc_user_id', 'user_id'),
+        db.Index('ix_plc_template_id', 'template_id'),
+    )
+
     def __repr__(self):
         return f'<PLC {self.name}>'
 
@@ -23,15 +44,31 @@ class Register(db.Model):
     name = db.Column(db.String(80), nullable=False)
     address = db.Column(db.Integer, nullable=False)
     data_type = db.Column(db.String(50), nullable=False)
+    register_area = db.Column(db.String(20), default='holding_register', nullable=False)
     scaling_factor = db.Column(db.Float, default=1.0)
+    # Historian compression: change ignored (exception deadband) and straight-line error allowed (swinging door)
+    history_deadband = db.Column(db.Float, nullable=True)
+    history_deviation = db.Column(db.Float, nullable=True)
     unit = db.Column(db.String(20))
     description = db.Column(db.String(255))
     is_monitored = db.Column(db.Boolean, default=True)
     min_value = db.Column(db.Float, nullable=True)
     max_value = db.Column(db.Float, nullable=True)
     read_write = db.Column(db.String(20), default='read_write', nullable=False)
+    expression = db.Column(db.Text, nullable=True)  # Derived registers are computed from others instead of read
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id'), nullable=False)
+    # A register belongs to either a PLC or a device template
+    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id'), nullable=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('device_template.id', ondelete='CASCADE'), nullable=True)
+
+    __table_args__ = (
+        # Monitoring loads a PLC's monitored registers; lists and exports walk a PLC's map in address order
+        db.Index('ix_register_plc_id_is_monitored', 'plc_id', 'is_monitored'),
+        db.Index('ix_register_plc_id_area_address', 'plc_id', 'register_area', 'address'),
+        db.Index('ix_register_template_id_area_address', 'template_id', 'register_area', 'address'),
+    )
 
     def __repr__(self):
+        if self.template_id is not None:
+            return f'<Register {self.name} (Template: {self.template_id})>'
         return f'<Register {self.name} (PLC: {self.plc_id})>' 
\ No newline at end of file
@@ -0,0 +1,19 @@
+from datetime import datetime
+from .. import db
+
+
+class RegisterScan(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending', 'running', 'completed', 'failed', 'cancelled'
+    options = db.Column(db.JSON, nullable=True)
+    progress = db.Column(db.Float, default=0.0)
+    requests = db.Column(db.Integer, default=0)
+    ranges = db.Column(db.JSON, nullable=True)  # Readable address ranges found by the sweep
+    proposed_registers = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RegisterScan {self.id} (PLC: {self.plc_id}, {self.status})>'
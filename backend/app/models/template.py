@@ -0,0 +1,39 @@
+from datetime import datetime
+from .. import db
+
+
+class DeviceTemplate(db.Model):
+    """A register map shared by identical devices, e.g. one model of drive.
+
+    Its registers are Register rows with ``template_id`` set and no PLC;
+    every PLC linked to the template polls them, along with any registers
+    of its own.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    description = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    registers = db.relationship('Register', backref='template', lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<DeviceTemplate {self.name}>'
+
+
+class RegisterOverride(db.Model):
+    """A PLC's own settings for one register of its template; NULL keeps the template's"""
+    id = db.Column(db.Integer, primary_key=True)
+    plc_id = db.Column(db.Integer, db.ForeignKey('plc.id', ondelete='CASCADE'), nullable=False)
+    register_id = db.Column(db.Integer, db.ForeignKey('register.id', ondelete='CASCADE'), nullable=False)
+    scaling_factor = db.Column(db.Float, nullable=True)
+    unit = db.Column(db.String(20), nullable=True)
+    is_monitored = db.Column(db.Boolean, nullable=True)
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('plc_id', 'register_id', name='uq_register_override_plc_id_register_id'),
+    )
+
+    def __repr__(self):
+        return f'<RegisterOverride PLC: {self.plc_id} Register: {self.register_id}>'
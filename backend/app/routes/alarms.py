@@ -0,0 +1,259 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+from ..models.plc import PLC, Register
+from ..models.alarm import AlarmRule, Alarm
+from .. import db, socketio
+from ..utils.alarm_engine import AlarmEvaluator, validate_rule, HIGH, LOW
+from ..utils.listing import ListingError, parse_fields, fetch_page, page_response
+from ..utils.response_cache import alarm_rules_changed, templates_changed
+from ..utils.device_templates import device_registers, effective_columns
+from sqlalchemy import select
+from datetime import datetime
+
+alarms_bp = Blueprint('alarms', __name__)
+
+# Fields of a rule a client may set
+RULE_FIELDS = ('register_id', 'rule_type', 'threshold', 'setpoint', 'reference_register_id', 'deadband',
+               'on_delay', 'off_delay', 'severity', 'message', 'enabled')
+
+# Fields an alarm list may project with fields=
+ALARM_FIELDS = {
+    'id': Alarm.id,
+    'plc_id': Alarm.plc_id,
+    'register_id': Alarm.register_id,
+    'rule_id': Alarm.rule_id,
+    'rule_type': Alarm.rule_type,
+    'severity': Alarm.severity,
+    'message': Alarm.message,
+    'threshold': Alarm.threshold,
+    'value': Alarm.value,
+    'raised_at': Alarm.raised_at,
+    'cleared_at': Alarm.cleared_at,
+    'clear_value': Alarm.clear_value,
+    'acknowledged_at': Alarm.acknowledged_at
+}
+
+def rule_to_dict(rule):
+    return {field: getattr(rule, field) for field in ('id',) + RULE_FIELDS}
+
+def alarm_to_dict(alarm):
+    return {field: getattr(alarm, field) for field in ALARM_FIELDS}
+
+def rule_key(rule_id, register_id, rule_type):
+    """Identifies the open alarm of a rule; min/max limits have no rule id"""
+    return (rule_id, register_id, rule_type)
+
+def build_evaluator(plc_id, register_limits=True):
+    """Compile a PLC's enabled rules, and its registers' min/max limits when
+    ``register_limits`` is set, resuming the alarms left open in the database.
+    Rules and limits of its template's registers apply too. Open alarms
+    whose rule is gone or disabled are cleared."""
+    template_id = db.session.execute(select(PLC.template_id).where(PLC.id == plc_id)).scalar()
+    registers = device_registers(plc_id, template_id)
+    rules = [{
+        'rule_id': rule.id,
+        'register_id': rule.register_id,
+        'rule_type': rule.rule_type,
+        'threshold': rule.threshold,
+        'setpoint': rule.setpoint,
+        'reference_register_id': rule.reference_register_id,
+        'deadband': rule.deadband,
+        'on_delay': rule.on_delay,
+        'off_delay': rule.off_delay,
+        'severity': rule.severity,
+        'message': rule.message
+    } for rule in db.session.execute(
+        select(AlarmRule).join(Register, AlarmRule.register_id == Register.id)
+        .where(registers, AlarmRule.enabled.is_(True))
+    ).scalars()]
+
+    if register_limits:
+        # With the PLC's overrides of its template's limits
+        columns, select_from = effective_columns(plc_id, {
+            'id': Register.id,
+            'name': Register.name,
+            'unit': Register.unit,
+            'min_value': Register.min_value,
+            'max_value': Register.max_value
+        })
+        limits = db.session.execute(
+            select(*[column.label(name) for name, column in columns.items()]).select_from(select_from)
+            .where(registers, (columns['min_value'].isnot(None)) | (columns['max_value'].isnot(None)))
+        ).all()
+        for register in limits:
+            for rule_type, threshold, word in ((LOW, register.min_value, 'below minimum'),
+                                               (HIGH, register.max_value, 'above maximum')):
+                if threshold is not None:
+                    rules.append({
+                        'rule_id': None,
+                        'register_id': register.id,
+                        'rule_type': rule_type,
+                        'threshold': threshold,
+                        'severity': 'warning',
+                        'message': f'{register.name} {word} {threshold:g}{register.unit or ""}'
+                    })
+
+    indexes = {rule_key(rule['rule_id'], rule['register_id'], rule['rule_type']): index
+               for index, rule in enumerate(rules)}
+    active, orphaned = [], []
+    for alarm in Alarm.query.filter_by(plc_id=plc_id, cleared_at=None).all():
+        index = indexes.get(rule_key(alarm.rule_id, alarm.register_id, alarm.rule_type))
+        if index is None:
+            orphaned.append(alarm)
+        else:
+            active.append(index)
+    if orphaned:
+        now = datetime.utcnow()
+        for alarm in orphaned:
+            alarm.cleared_at = now
+        db.session.commit()
+        for alarm in orphaned:
+            socketio.emit('alarm', dict(alarm_to_dict(alarm), active=False))
+    return AlarmEvaluator(rules, active)
+
+def record_transitions(plc_id, evaluator, transitions, timestamp):
+    """Store the alarms raised and cleared in a cycle and emit one alarm event each"""
+    when = datetime.utcfromtimestamp(timestamp)
+    changed = []
+    for index, is_active, value in transitions:
+        rule = evaluator.rules[index]
+        if is_active:
+            alarm = Alarm(
+                plc_id=plc_id,
+                register_id=rule['register_id'],
+                rule_id=rule['rule_id'],
+                rule_type=rule['rule_type'],
+                severity=rule['severity'],
+                message=rule['message'],
+                threshold=rule['threshold'],
+                value=value,
+                raised_at=when
+            )
+            db.session.add(alarm)
+        else:
+            alarm = Alarm.query.filter_by(plc_id=plc_id, register_id=rule['register_id'], rule_id=rule['rule_id'],
+                                          rule_type=rule['rule_type'], cleared_at=None).first()
+            if alarm is None:
+                continue
+            alarm.cleared_at = when
+            alarm.clear_value = value
+        changed.append((alarm, is_active))
+    db.session.commit()
+    for alarm, is_active in changed:
+        socketio.emit('alarm', dict(alarm_to_dict(alarm), active=is_active))
+
+def validate_rule_registers(plc, data):
+    """Return an error message unless the rule's registers belong to the PLC or its template"""
+    register_ids = {data.get('register_id'), data.get('reference_register_id')} - {None}
+    found = dict(db.session.execute(
+        select(Register.id, Register.template_id)
+        .where(device_registers(plc.id, plc.template_id), Register.id.in_(register_ids))
+    ).all())
+    if len(found) != len(register_ids):
+        return 'register_id and reference_register_id must be registers of this PLC'
+    # A rule on a template register applies to every PLC of the template
+    if data.get('reference_register_id') is not None and found[data['register_id']] is not None \
+            and found[data['reference_register_id']] is None:
+        return 'A rule on a template register can only reference registers of the template'
+    return None
+
+def rules_changed(plc_id, register_id):
+    """Recompile the evaluators using a rule on ``register_id``: the PLC's, or
+    every linked PLC's when it is a template register"""
+    alarm_rules_changed(plc_id)
+    template_id = db.session.execute(select(Register.template_id).where(Register.id == register_id)).scalar()
+    if template_id is not None:
+        templates_changed(template_id)
+
+def find_rule(plc, rule_id):
+    return AlarmRule.query.join(Register, AlarmRule.register_id == Register.id).filter(
+        AlarmRule.id == rule_id, device_registers(plc.id, plc.template_id)).first_or_404()
+
+@alarms_bp.route('/plcs/<int:plc_id>/alarm-rules', methods=['GET'])
+@login_required
+def get_alarm_rules(plc_id):
+    """Rules on a PLC's registers, including those on its template's registers"""
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    rules = db.session.execute(
+        select(AlarmRule).join(Register, AlarmRule.register_id == Register.id)
+        .where(device_registers(plc_id, plc.template_id)).order_by(AlarmRule.id)
+    ).scalars()
+    return jsonify([rule_to_dict(rule) for rule in rules])
+
+@alarms_bp.route('/plcs/<int:plc_id>/alarm-rules', methods=['POST'])
+@login_required
+def create_alarm_rule(plc_id):
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    data = request.get_json()
+
+    error = validate_rule(data) or validate_rule_registers(plc, data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    rule = AlarmRule(**{field: data[field] for field in RULE_FIELDS if data.get(field) is not None})
+    db.session.add(rule)
+    db.session.commit()
+    rules_changed(plc_id, rule.register_id)
+
+    return jsonify(rule_to_dict(rule)), 201
+
+@alarms_bp.route('/plcs/<int:plc_id>/alarm-rules/<int:rule_id>', methods=['PUT'])
+@login_required
+def update_alarm_rule(plc_id, rule_id):
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    rule = find_rule(plc, rule_id)
+    previous_register_id = rule.register_id
+    data = dict(rule_to_dict(rule), **request.get_json())
+
+    error = validate_rule(data) or validate_rule_registers(plc, data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    for field in RULE_FIELDS:
+        setattr(rule, field, data[field])
+    db.session.commit()
+    rules_changed(plc_id, previous_register_id)
+    if rule.register_id != previous_register_id:
+        rules_changed(plc_id, rule.register_id)
+
+    return jsonify(rule_to_dict(rule))
+
+@alarms_bp.route('/plcs/<int:plc_id>/alarm-rules/<int:rule_id>', methods=['DELETE'])
+@login_required
+def delete_alarm_rule(plc_id, rule_id):
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    rule = find_rule(plc, rule_id)
+    register_id = rule.register_id
+    # Close its open alarm here, the history keeps it without a rule id
+    Alarm.query.filter_by(rule_id=rule.id, cleared_at=None).update({'cleared_at': datetime.utcnow()})
+    db.session.delete(rule)
+    db.session.commit()
+    rules_changed(plc_id, register_id)
+    return '', 204
+
+@alarms_bp.route('/alarms', methods=['GET'])
+@login_required
+def get_alarms():
+    """Alarm history, oldest first; active=1 lists only uncleared alarms"""
+    criteria = []
+    if request.args.get('active') in ('1', 'true'):
+        criteria.append(Alarm.cleared_at.is_(None))
+    try:
+        if request.args.get('plc_id'):
+            if not request.args['plc_id'].isdigit():
+                raise ListingError('plc_id must be an integer')
+            criteria.append(Alarm.plc_id == int(request.args['plc_id']))
+        rows, next_cursor = fetch_page(db.session, parse_fields(ALARM_FIELDS), Alarm.id, *criteria)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    return page_response(rows, next_cursor)
+
+@alarms_bp.route('/alarms/<int:alarm_id>/acknowledge', methods=['POST'])
+@login_required
+def acknowledge_alarm(alarm_id):
+    alarm = Alarm.query.get_or_404(alarm_id)
+    if alarm.acknowledged_at is None:
+        alarm.acknowledged_at = datetime.utcnow()
+        db.session.commit()
+        socketio.emit('alarm', dict(alarm_to_dict(alarm), active=alarm.cleared_at is None))
+    return jsonify(alarm_to_dict(alarm))
@@ -0,0 +1,142 @@
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_login import login_required
+from .. import db
+from ..models.plc import PLC, Register
+from ..utils.historian import interpolate
+from ..utils.device_templates import device_registers
+from ..utils.history_export import FORMATS, WRITERS, available_formats, iter_samples
+from datetime import datetime, timezone
+import numpy as np
+import time
+
+history_bp = Blueprint('history', __name__)
+
+# Most timestamps a single history request may interpolate at
+MAX_POINTS = 100000
+
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 time (UTC unless it has an offset)"""
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+def _column(values):
+    return [None if value != value else value for value in values.tolist()]
+
+
+@history_bp.route('/plcs/<int:plc_id>/registers/<int:register_id>/history', methods=['GET'])
+@login_required
+def get_register_history(plc_id, register_id):
+    """A register's history between start and end (default: the last hour).
+
+    Returns the archived points, or the values interpolated at every
+    ``step`` seconds or at the comma-separated times in ``at``.
+    """
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    register = Register.query.filter(Register.id == register_id,
+                                     device_registers(plc_id, plc.template_id)).first_or_404()
+    historian = current_app.extensions.get('historian')
+    if historian is None:
+        return jsonify({'error': 'The historian is disabled'}), 404
+
+    try:
+        end = parse_time(request.args['end']) if request.args.get('end') else time.time()
+        start = parse_time(request.args['start']) if request.args.get('start') else end - 3600
+        at = [parse_time(value) for value in request.args['at'].split(',')] if request.args.get('at') else None
+        step = float(request.args['step']) if request.args.get('step') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time: {str(e)}'}), 400
+    if at is not None:
+        start, end = min(at), max(at)
+    elif end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+    if step is not None:
+        if not step > 0:
+            return jsonify({'error': 'step must be positive'}), 400
+        at = start + step * np.arange(int((end - start) // step) + 1)
+    if at is not None and len(at) > MAX_POINTS:
+        return jsonify({'error': f'At most {MAX_POINTS} timestamps per request'}), 400
+
+    points = historian.points(plc_id, register_id, start, end)
+    if at is None:
+        inside = (points['timestamp'] >= start) & (points['timestamp'] <= end)
+        timestamps, values = points['timestamp'][inside], points['value'][inside]
+    else:
+        timestamps = np.asarray(at, dtype=np.float64)
+        # Booleans hold their value until the next change instead of ramping
+        values = interpolate(points, timestamps, hold=register.data_type == 'bool')
+    return jsonify({
+        'register_id': register_id,
+        'start': start,
+        'end': end,
+        'interpolated': at is not None,
+        'timestamps': timestamps.tolist(),
+        'values': _column(values)
+    })
+
+
+@history_bp.route('/history/export', methods=['GET'])
+@login_required
+def export_history():
+    """Stream the history of a PLC's registers, or of the registers in
+    ``register_ids``, as Parquet, an Arrow IPC stream or CSV.
+
+    Rows are (timestamp, plc_id, register_id, value): the archived points
+    between start and end (default: all history), or values interpolated
+    every ``step`` seconds. The body is written batch by batch straight
+    from the history chunks, so memory use does not grow with the range.
+    """
+    historian = current_app.extensions.get('historian')
+    if historian is None:
+        return jsonify({'error': 'The historian is disabled'}), 404
+    formats = available_formats()
+    export_format = request.args.get('format', formats[0])
+    if export_format not in formats:
+        missing = ' (install pyarrow for parquet and arrow)' if export_format in FORMATS else ''
+        return jsonify({'error': f'format must be one of {", ".join(formats)}{missing}'}), 400
+
+    plc_id = request.args.get('plc_id', type=int)
+    try:
+        register_ids = [int(value) for value in request.args['register_ids'].split(',')] \
+            if request.args.get('register_ids') else None
+    except ValueError:
+        return jsonify({'error': 'register_ids must be comma-separated integers'}), 400
+    if plc_id is None and register_ids is None:
+        return jsonify({'error': 'Give plc_id, register_ids or both'}), 400
+    try:
+        end = parse_time(request.args['end']) if request.args.get('end') else time.time()
+        start = parse_time(request.args['start']) if request.args.get('start') else 0.0
+        step = float(request.args['step']) if request.args.get('step') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time: {str(e)}'}), 400
+    if end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+    if step is not None:
+        if not step > 0:
+            return jsonify({'error': 'step must be positive'}), 400
+        if request.args.get('start') is None:
+            return jsonify({'error': 'Resampling needs a start'}), 400
+
+    # A template's registers have a history on each PLC using the template
+    query = db.select(Register.id, PLC.id.label('plc_id'), Register.data_type).join(
+        PLC, (Register.plc_id == PLC.id) | (Register.template_id == PLC.template_id))
+    if plc_id is not None:
+        query = query.where(PLC.id == plc_id)
+    if register_ids is not None:
+        query = query.where(Register.id.in_(register_ids))
+    registers = [(row.id, row.plc_id, row.data_type == 'bool')
+                 for row in db.session.execute(query.order_by(PLC.id, Register.id))]
+    if not registers:
+        return jsonify({'error': 'No matching registers'}), 404
+
+    mimetype, extension = FORMATS[export_format]
+    body = WRITERS[export_format](iter_samples(historian, registers, start, end, step))
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="history.{extension}"'
+    })
@@ -1,26 +1,172 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app
 from flask_login import login_required, current_user
-from ..models.plc import PLC
+from ..models.plc import PLC, Register
+from ..models.template import DeviceTemplate, RegisterOverride
 from .. import db
-from pymodbus.client import ModbusTcpClient
-from pymodbus.exceptions import ConnectionException
+from ..utils.modbus_bus import (BusManager, bus_key, validate_transport, validate_poll_intervals,
+                               validate_max_read_count, TCP, PROTOCOLS)
+from ..utils.listing import ListingError, parse_fields, fetch_page, page_response
+from ..utils.response_cache import cached_response, plcs_changed, registers_changed, PLCS, REGISTERS
+from ..utils.live_values import latest_values, recent_samples, register_images
+from ..utils.polling_service import polling_service
+from ..utils.modbus_gateway import validate_gateway_address
+from ..utils.discovery import (ProbeTarget, iter_probe_results, parse_ip_range, parse_unit_ids,
+                               MAX_TARGETS)
+from sqlalchemy import func, select, update
+from datetime import datetime
+import json
 
 plc_bp = Blueprint('plc', __name__)
 
+# Fields a PLC list may project with fields=
+PLC_FIELDS = {
+    'id': PLC.id,
+    'name': PLC.name,
+    'ip_address': PLC.ip_address,
+    'port': PLC.port,
+    'unit_id': PLC.unit_id,
+    'protocol': PLC.protocol,
+    'serial_port': PLC.serial_port,
+    'baudrate': PLC.baudrate,
+    'inter_frame_delay': PLC.inter_frame_delay,
+    'poll_interval': PLC.poll_interval,
+    'max_poll_interval': PLC.max_poll_interval,
+    'max_read_count': PLC.max_read_count,
+    'is_connected': PLC.is_connected,
+    'monitoring_enabled': PLC.monitoring_enabled,
+    'gateway_unit_id': PLC.gateway_unit_id,
+    'gateway_offset': PLC.gateway_offset,
+    'description': PLC.description,
+    'last_seen': PLC.last_seen,
+    'template_id': PLC.template_id
+}
+
+DEFAULT_PLC_FIELDS = ('id', 'name', 'ip_address', 'port', 'unit_id', 'protocol', 'serial_port',
+                      'baudrate', 'inter_frame_delay', 'is_connected', 'template_id')
+
+def find_bus_conflict(plc):
+    """Return another PLC using the same unit id on the same bus, if any"""
+    candidates = PLC.query.filter(PLC.unit_id == plc.unit_id, PLC.id != plc.id).all()
+    for other in candidates:
+        if bus_key(other) == bus_key(plc):
+            return other
+    return None
+
+def find_gateway_conflict(plc):
+    """Return another PLC the Modbus gateway presents at the same unit id and offset, if any"""
+    if plc.gateway_unit_id is None:
+        return None
+    return PLC.query.filter(PLC.gateway_unit_id == plc.gateway_unit_id, PLC.id != plc.id,
+                            func.coalesce(PLC.gateway_offset, 0) == (plc.gateway_offset or 0)).first()
+
+def validate_template_id(template_id):
+    """Return an error message unless template_id is None or an existing template"""
+    if template_id is None:
+        return None
+    if isinstance(template_id, bool) or not isinstance(template_id, int) \
+            or db.session.get(DeviceTemplate, template_id) is None:
+        return f'Unknown template_id {template_id!r}'
+    return None
+
+def save_connection_statuses(statuses):
+    """Write {plc_id: connected} back in a single transaction"""
+    if not statuses:
+        return
+    now = datetime.utcnow()
+    online = [{'id': plc_id, 'is_connected': True, 'last_seen': now}
+              for plc_id, connected in statuses.items() if connected]
+    offline = [{'id': plc_id, 'is_connected': False}
+               for plc_id, connected in statuses.items() if not connected]
+    for rows in (online, offline):
+        if rows:
+            db.session.execute(update(PLC), rows)
+    db.session.commit()
+    plcs_changed()
+
+def build_probe_targets(data):
+    """Targets for a bulk test: known PLCs by id, or an IP range times a unit id range"""
+    if 'plc_ids' in data:
+        plcs = PLC.query.filter(PLC.id.in_([int(plc_id) for plc_id in data['plc_ids']])).all()
+        return [ProbeTarget.from_plc(plc) for plc in plcs]
+    
+    if 'ip_range' not in data:
+        raise ValueError('Provide either plc_ids or ip_range')
+    protocol = data.get('protocol', TCP)
+    if protocol not in PROTOCOLS or protocol == 'rtu':
+        raise ValueError('ip_range discovery supports the tcp and rtu_over_tcp protocols')
+    port = int(data.get('port', 502))
+    addresses = parse_ip_range(data['ip_range'])
+    unit_ids = parse_unit_ids(data.get('unit_ids', 1))
+    if len(addresses) * len(unit_ids) > MAX_TARGETS:
+        raise ValueError(f'Discovery is limited to {MAX_TARGETS} targets per request')
+    
+    # Results for addresses that are already configured update those PLCs
+    known = {
+        (plc.ip_address, plc.port, plc.unit_id): plc.id
+        for plc in PLC.query.filter(PLC.ip_address.in_(addresses), PLC.protocol == protocol).all()
+    }
+    return [
+        ProbeTarget(protocol, ip_address, port, unit_id, known.get((ip_address, port, unit_id)))
+        for ip_address in addresses for unit_id in unit_ids
+    ]
+
 @plc_bp.route('/plcs', methods=['GET'])
+@cached_response(PLCS)
 @login_required
 def get_plcs():
-    plcs = PLC.query.all()
-    return jsonify([{
-        'id': plc.id,
-        'name': plc.name,
-        'ip_address': plc.ip_address,
-        'port': plc.port,
-        'unit_id': plc.unit_id,
-        'is_connected': plc.is_connected
-    } for plc in plcs])
+    """List PLCs from stored columns only; devices are never contacted here"""
+    try:
+        fields = parse_fields(PLC_FIELDS, DEFAULT_PLC_FIELDS)
+        rows, next_cursor = fetch_page(db.session, fields, PLC.id)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    return page_response(rows, next_cursor)
+
+@plc_bp.route('/plcs/summary', methods=['GET'])
+@cached_response(PLCS, REGISTERS)
+@login_required
+def get_fleet_summary():
+    """PLCs with register counts and last known status in a single query.
+    Counts include the registers of a PLC's template, before its overrides."""
+    register_counts = (
+        select(
+            Register.plc_id,
+            func.count(Register.id).label('register_count'),
+            func.count(Register.id).filter(Register.is_monitored.is_(True)).label('monitored_count')
+        )
+        .group_by(Register.plc_id)
+        .subquery()
+    )
+    template_counts = (
+        select(
+            Register.template_id,
+            func.count(Register.id).label('register_count'),
+            func.count(Register.id).filter(Register.is_monitored.is_(True)).label('monitored_count')
+        )
+        .group_by(Register.template_id)
+        .subquery()
+    )
+    fields = {name: PLC_FIELDS[name] for name in (
+        'id', 'name', 'ip_address', 'port', 'unit_id', 'protocol', 'description', 'is_connected', 'last_seen',
+        'template_id')}
+    fields['register_count'] = (func.coalesce(register_counts.c.register_count, 0)
+                                + func.coalesce(template_counts.c.register_count, 0))
+    fields['monitored_count'] = (func.coalesce(register_counts.c.monitored_count, 0)
+                                 + func.coalesce(template_counts.c.monitored_count, 0))
+    try:
+        rows, next_cursor = fetch_page(
+            db.session, fields, PLC.id,
+            select_from=PLC.__table__.outerjoin(register_counts, register_counts.c.plc_id == PLC.id)
+            .outerjoin(template_counts, template_counts.c.template_id == PLC.template_id))
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    bus_manager = BusManager()
+    for row in rows:
+        row['is_polling'] = bus_manager.is_polling(row['id'])
+    return page_response(rows, next_cursor)
 
 @plc_bp.route('/plcs/<int:plc_id>', methods=['GET'])
+@cached_response(PLCS)
 @login_required
 def get_plc_id(plc_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
@@ -30,9 +176,20 @@ def get_plc_id(plc_id):
         'ip_address': plc.ip_address,
         'port': plc.port,
         'unit_id': plc.unit_id,
+        'protocol': plc.protocol,
+        'serial_port': plc.serial_port,
+        'baudrate': plc.baudrate,
+        'inter_frame_delay': plc.inter_frame_delay,
+        'poll_interval': plc.poll_interval,
+        'max_poll_interval': plc.max_poll_interval,
+        'max_read_count': plc.max_read_count,
         'is_connected': plc.is_connected,
+        'monitoring_enabled': plc.monitoring_enabled,
+        'gateway_unit_id': plc.gateway_unit_id,
+        'gateway_offset': plc.gateway_offset,
         'description': getattr(plc, 'description', ''),
-        'last_seen': getattr(plc, 'last_seen', None)
+        'last_seen': getattr(plc, 'last_seen', None),
+        'template_id': plc.template_id
     })
 
 @plc_bp.route('/plcs', methods=['POST'])
@@ -40,16 +197,44 @@ def get_plc_id(plc_id):
 def create_plc():
     data = request.get_json()
     
+    protocol = data.get('protocol', TCP)
+    error = (validate_transport(protocol, data.get('ip_address'), data.get('serial_port'))
+             or validate_template_id(data.get('template_id'))
+             or validate_poll_intervals(data.get('poll_interval'), data.get('max_poll_interval'))
+             or validate_max_read_count(data.get('max_read_count'))
+             or validate_gateway_address(data.get('gateway_unit_id'), data.get('gateway_offset')))
+    if error:
+        return jsonify({'error': error}), 400
+    
     plc = PLC(
         name=data['name'],
-        ip_address=data['ip_address'],
+        ip_address=data.get('ip_address') or '',
         port=data.get('port', 502),
         unit_id=data.get('unit_id', 1),
+        protocol=protocol,
+        serial_port=data.get('serial_port'),
+        baudrate=data.get('baudrate'),
+        inter_frame_delay=data.get('inter_frame_delay'),
+        poll_interval=data.get('poll_interval'),
+        max_poll_interval=data.get('max_poll_interval'),
+        max_read_count=data.get('max_read_count'),
+        gateway_unit_id=data.get('gateway_unit_id'),
+        gateway_offset=data.get('gateway_offset'),
+        template_id=data.get('template_id'),
         user_id=current_user.id
     )
     
+    conflict = find_bus_conflict(plc)
+    if conflict:
+        return jsonify({'error': f'Unit id {plc.unit_id} is already used by {conflict.name} on this bus'}), 400
+    conflict = find_gateway_conflict(plc)
+    if conflict:
+        return jsonify({'error': f'Gateway unit id {plc.gateway_unit_id} offset {plc.gateway_offset or 0} '
+                                 f'is already used by {conflict.name}'}), 400
+    
     db.session.add(plc)
     db.session.commit()
+    plcs_changed()
     
     return jsonify({
         'id': plc.id,
@@ -57,7 +242,17 @@ def create_plc():
         'ip_address': plc.ip_address,
         'port': plc.port,
         'unit_id': plc.unit_id,
-        'is_connected': plc.is_connected
+        'protocol': plc.protocol,
+        'serial_port': plc.serial_port,
+        'baudrate': plc.baudrate,
+        'inter_frame_delay': plc.inter_frame_delay,
+        'poll_interval': plc.poll_interval,
+        'max_poll_interval': plc.max_poll_interval,
+        'max_read_count': plc.max_read_count,
+        'gateway_unit_id': plc.gateway_unit_id,
+        'gateway_offset': plc.gateway_offset,
+        'is_connected': plc.is_connected,
+        'template_id': plc.template_id
     }), 201
 
 @plc_bp.route('/plcs/<int:plc_id>', methods=['PUT'])
@@ -65,13 +260,57 @@ def create_plc():
 def update_plc(plc_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
     data = request.get_json()
+    # The bus and unit id a poller is started with
+    transport = (bus_key(plc), plc.unit_id)
     
     plc.name = data.get('name', plc.name)
     plc.ip_address = data.get('ip_address', plc.ip_address)
     plc.port = data.get('port', plc.port)
     plc.unit_id = data.get('unit_id', plc.unit_id)
+    plc.protocol = data.get('protocol', plc.protocol)
+    plc.serial_port = data.get('serial_port', plc.serial_port)
+    plc.baudrate = data.get('baudrate', plc.baudrate)
+    plc.inter_frame_delay = data.get('inter_frame_delay', plc.inter_frame_delay)
+    plc.poll_interval = data.get('poll_interval', plc.poll_interval)
+    plc.max_poll_interval = data.get('max_poll_interval', plc.max_poll_interval)
+    plc.max_read_count = data.get('max_read_count', plc.max_read_count)
+    plc.gateway_unit_id = data.get('gateway_unit_id', plc.gateway_unit_id)
+    plc.gateway_offset = data.get('gateway_offset', plc.gateway_offset)
+    template_id = plc.template_id
+    plc.template_id = data.get('template_id', plc.template_id)
+    
+    error = (validate_transport(plc.protocol, plc.ip_address, plc.serial_port)
+             or validate_template_id(plc.template_id)
+             or validate_poll_intervals(plc.poll_interval, plc.max_poll_interval)
+             or validate_max_read_count(plc.max_read_count)
+             or validate_gateway_address(plc.gateway_unit_id, plc.gateway_offset))
+    if error:
+        db.session.rollback()
+        return jsonify({'error': error}), 400
     
+    conflict = find_bus_conflict(plc)
+    if conflict:
+        db.session.rollback()
+        return jsonify({'error': f'Unit id {plc.unit_id} is already used by {conflict.name} on this bus'}), 400
+    conflict = find_gateway_conflict(plc)
+    if conflict:
+        db.session.rollback()
+        return jsonify({'error': f'Gateway unit id {plc.gateway_unit_id} offset {plc.gateway_offset or 0} '
+                                 f'is already used by {conflict.name}'}), 400
+    
+    relinked = plc.template_id != template_id
+    if relinked:
+        # Overrides and values belong to the registers of the previous template
+        RegisterOverride.query.filter_by(plc_id=plc_id).delete()
     db.session.commit()
+    plcs_changed()
+    if (bus_key(plc), plc.unit_id) != transport:
+        # Poll it on its new bus and unit id rather than keep reading the old ones
+        polling_service.restart(plc)
+    if relinked:
+        registers_changed(plc_id)
+        latest_values.forget(plc_id)
+        recent_samples.forget(plc_id)
     
     return jsonify({
         'id': plc.id,
@@ -79,7 +318,17 @@ def update_plc(plc_id):
         'ip_address': plc.ip_address,
         'port': plc.port,
         'unit_id': plc.unit_id,
-        'is_connected': plc.is_connected
+        'protocol': plc.protocol,
+        'serial_port': plc.serial_port,
+        'baudrate': plc.baudrate,
+        'inter_frame_delay': plc.inter_frame_delay,
+        'poll_interval': plc.poll_interval,
+        'max_poll_interval': plc.max_poll_interval,
+        'max_read_count': plc.max_read_count,
+        'gateway_unit_id': plc.gateway_unit_id,
+        'gateway_offset': plc.gateway_offset,
+        'is_connected': plc.is_connected,
+        'template_id': plc.template_id
     })
 
 @plc_bp.route('/plcs/<int:plc_id>', methods=['DELETE'])
@@ -88,6 +337,15 @@ def delete_plc(plc_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
     db.session.delete(plc)
     db.session.commit()
+    polling_service.forget(plc_id)
+    plcs_changed()
+    registers_changed(plc_id)
+    latest_values.forget(plc_id)
+    recent_samples.forget(plc_id)
+    register_images.forget(plc_id)
+    publisher = current_app.extensions.get('mqtt_publisher')
+    if publisher is not None:
+        publisher.forget(plc_id)
     return '', 204
 
 @plc_bp.route('/plcs/<int:plc_id>/test-connection', methods=['POST'])
@@ -95,18 +353,40 @@ def delete_plc(plc_id):
 def test_connection(plc_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
     
+    result = next(iter_probe_results([ProbeTarget.from_plc(plc)], timeout=3.0))
+    if result['connected'] != plc.is_connected:
+        save_connection_statuses({plc.id: result['connected']})
+    
+    if result['connected']:
+        return jsonify({'message': 'Connection successful'})
+    return jsonify({'error': f"Connection failed: {result['detail']}"}), 400
+
+@plc_bp.route('/plcs/test-connections', methods=['POST'])
+@login_required
+def test_connections():
+    """Probe many PLCs or an address range concurrently, streaming results as server-sent events"""
+    data = request.get_json() or {}
     try:
-        client = ModbusTcpClient(plc.ip_address, port=plc.port)
-        if client.connect():
-            plc.is_connected = True
-            db.session.commit()
-            client.close()
-            return jsonify({'message': 'Connection successful'})
-        else:
-            plc.is_connected = False
-            db.session.commit()
-            return jsonify({'error': 'Connection failed'}), 400
-    except ConnectionException:
-        plc.is_connected = False
-        db.session.commit()
-        return jsonify({'error': 'Connection failed'}), 400 
\ No newline at end of file
+        targets = build_probe_targets(data)
+        concurrency = int(data.get('concurrency', 50))
+        timeout = float(data.get('timeout', 2.0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    app = current_app._get_current_object()
+    
+    def stream():
+        statuses = {}
+        found = 0
+        for result in iter_probe_results(targets, concurrency, timeout):
+            found += result['connected']
+            if result['plc_id'] is not None:
+                statuses[result['plc_id']] = result['connected']
+            yield f"event: result\ndata: {json.dumps(result)}\n\n"
+        
+        with app.app_context():
+            save_connection_statuses(statuses)
+        yield f"event: done\ndata: {json.dumps({'probed': len(targets), 'connected': found})}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
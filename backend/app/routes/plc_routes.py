@@ -2,59 +2,25 @@ from flask import Blueprint, request, jsonify
 from flask_socketio import emit
 from ..utils.plc_manager import PLCManager
 from ..models.plc import PLC, Register
-from .. import db, socketio
-import threading
-import time
+from ..utils.read_planner import register_size, validate_register_area, HOLDING_REGISTER
+from ..utils.response_cache import plcs_changed, registers_changed
+from ..utils.polling_service import polling_service, MOCK_MONITOR
+from .. import db
+from sqlalchemy import select
 
 mock_plc_bp = Blueprint('mock_plc', __name__)
 plc_manager = PLCManager()
 
-# Store active monitoring threads
-monitoring_threads = {}
-
-def monitor_registers(plc_id):
-    """Background thread to monitor registers and emit updates"""
-    while plc_id in monitoring_threads:
-        try:
-            plc = PLC.query.get(plc_id)
-            if not plc:
-                break
-                
-            registers = Register.query.filter_by(plc_id=plc_id, is_monitored=True).all()
-            data = {}
-            
-            for register in registers:
-                value = plc_manager.read_register(plc_id, register.address, 
-                                                count=2 if register.data_type in ['int32', 'float'] else 1)
-                if value is not None:
-                    data[register.id] = {
-                        'name': register.name,
-                        'value': value * register.scaling_factor,
-                        'unit': register.unit
-                    }
-            
-            socketio.emit('register_update', {
-                'plc_id': plc_id,
-                'data': data,
-                'og':3
-            })
-            
-            time.sleep(1)  # Update every second
-            
-        except Exception as e:
-            print(f"Error monitoring PLC {plc_id}: {str(e)}")
-            time.sleep(5)  # Wait before retrying
-
 @mock_plc_bp.route('/mock/plcs', methods=['GET'])
 def get_mock_plcs():
-    """Get all mock PLCs"""
-    plcs = PLC.query.all()
+    """Get all mock PLCs with their last known status"""
+    plcs = db.session.execute(select(PLC.id, PLC.name, PLC.ip_address, PLC.port)).all()
     return jsonify([{
         'id': plc.id,
         'name': plc.name,
         'ip_address': plc.ip_address,
         'port': plc.port,
-        'status': plc_manager.get_plc_status(plc.id)
+        'status': plc_manager.get_plc_status(plc.id, probe=False)
     } for plc in plcs])
 
 @mock_plc_bp.route('/mock/plcs', methods=['POST'])
@@ -70,9 +36,11 @@ def add_mock_plc():
     
     db.session.add(plc)
     db.session.commit()
+    plcs_changed()
     
     # Add to PLC manager
-    plc_manager.add_plc(plc.id, plc.ip_address, plc.port)
+    plc_manager.add_plc(plc.id, plc.ip_address, plc.port, unit_id=plc.unit_id, protocol=plc.protocol,
+                        serial_port=plc.serial_port)
     
     return jsonify({
         'id': plc.id,
@@ -87,10 +55,8 @@ def remove_mock_plc(plc_id):
     """Remove a mock PLC"""
     plc = PLC.query.get_or_404(plc_id)
     
-    # Stop monitoring
-    if plc_id in monitoring_threads:
-        monitoring_threads[plc_id] = False
-        del monitoring_threads[plc_id]
+    # Stop polling it for every consumer
+    polling_service.forget(plc_id)
     
     # Remove from PLC manager
     plc_manager.remove_plc(plc_id)
@@ -98,6 +64,8 @@ def remove_mock_plc(plc_id):
     # Remove from database
     db.session.delete(plc)
     db.session.commit()
+    plcs_changed()
+    registers_changed(plc_id)
     
     return '', 204
 
@@ -110,6 +78,7 @@ def get_mock_registers(plc_id):
         'name': reg.name,
         'address': reg.address,
         'data_type': reg.data_type,
+        'register_area': reg.register_area,
         'scaling_factor': reg.scaling_factor,
         'unit': reg.unit,
         'description': reg.description,
@@ -121,10 +90,16 @@ def add_mock_register(plc_id):
     """Add a new register to a mock PLC"""
     data = request.get_json()
     
+    register_area = data.get('register_area', HOLDING_REGISTER)
+    error = validate_register_area(register_area, data['data_type'])
+    if error:
+        return jsonify({'error': error}), 400
+    
     register = Register(
         name=data['name'],
         address=data['address'],
         data_type=data['data_type'],
+        register_area=register_area,
         scaling_factor=data.get('scaling_factor', 1.0),
         unit=data.get('unit'),
         description=data.get('description'),
@@ -134,12 +109,14 @@ def add_mock_register(plc_id):
     
     db.session.add(register)
     db.session.commit()
+    registers_changed(plc_id)
     
     return jsonify({
         'id': register.id,
         'name': register.name,
         'address': register.address,
         'data_type': register.data_type,
+        'register_area': register.register_area,
         'scaling_factor': register.scaling_factor,
         'unit': register.unit,
         'description': register.description,
@@ -152,21 +129,30 @@ def update_mock_register(plc_id, register_id):
     register = Register.query.filter_by(plc_id=plc_id, id=register_id).first_or_404()
     data = request.get_json()
     
+    register_area = data.get('register_area', register.register_area)
+    data_type = data.get('data_type', register.data_type)
+    error = validate_register_area(register_area, data_type)
+    if error:
+        return jsonify({'error': error}), 400
+    
     register.name = data.get('name', register.name)
     register.address = data.get('address', register.address)
-    register.data_type = data.get('data_type', register.data_type)
+    register.data_type = data_type
+    register.register_area = register_area
     register.scaling_factor = data.get('scaling_factor', register.scaling_factor)
     register.unit = data.get('unit', register.unit)
     register.description = data.get('description', register.description)
     register.is_monitored = data.get('is_monitored', register.is_monitored)
     
     db.session.commit()
+    registers_changed(plc_id)
     
     return jsonify({
         'id': register.id,
         'name': register.name,
         'address': register.address,
         'data_type': register.data_type,
+        'register_area': register.register_area,
         'scaling_factor': register.scaling_factor,
         'unit': register.unit,
         'description': register.description,
@@ -180,16 +166,20 @@ def remove_mock_register(plc_id, register_id):
     
     db.session.delete(register)
     db.session.commit()
+    registers_changed(plc_id)
     
     return '', 204
 
 @mock_plc_bp.route('/mock/plcs/<int:plc_id>/registers/<int:register_id>/value', methods=['GET'])
 def get_mock_register_value(plc_id, register_id):
-    """Get the current value of a mock register"""
+    """Get the current value of a mock register; with ``max_age`` (seconds) a
+    value read at most that long ago is returned without a new read"""
     register = Register.query.filter_by(plc_id=plc_id, id=register_id).first_or_404()
+    max_age = request.args.get('max_age', type=float)
     
     value = plc_manager.read_register(plc_id, register.address,
-                                    count=2 if register.data_type in ['int32', 'float'] else 1)
+                                    count=register_size(register.register_area, register.data_type),
+                                    area=register.register_area, max_age=max_age)
     
     if value is None:
         return jsonify({'error': 'Failed to read register value'}), 500
@@ -219,24 +209,20 @@ def set_mock_register_value(plc_id, register_id):
 
 @mock_plc_bp.route('/mock/plcs/<int:plc_id>/monitor', methods=['POST'])
 def start_mock_monitoring(plc_id):
-    """Start monitoring registers for a mock PLC"""
-    if plc_id in monitoring_threads:
+    """Start monitoring registers for a mock PLC. It is polled by the same
+    poller as the monitoring API, which emits register_update for both."""
+    plc = PLC.query.get_or_404(plc_id)
+    if not polling_service.subscribe(MOCK_MONITOR, plc):
         return jsonify({'error': 'Monitoring already started'}), 400
-        
-    monitoring_threads[plc_id] = True
-    thread = threading.Thread(target=monitor_registers, args=(plc_id,))
-    thread.daemon = True
-    thread.start()
+    plcs_changed()  # is_polling in the fleet summary
     
     return jsonify({'message': 'Monitoring started'})
 
 @mock_plc_bp.route('/mock/plcs/<int:plc_id>/monitor', methods=['DELETE'])
 def stop_mock_monitoring(plc_id):
     """Stop monitoring registers for a mock PLC"""
-    if plc_id not in monitoring_threads:
+    if not polling_service.unsubscribe(MOCK_MONITOR, plc_id):
         return jsonify({'error': 'Monitoring not started'}), 400
-        
-    monitoring_threads[plc_id] = False
-    del monitoring_threads[plc_id]
+    plcs_changed()
     
-    return jsonify({'message': 'Monitoring stopped'}) 
\ No newline at end of file
+    return jsonify({'message': 'Monitoring stopped'})
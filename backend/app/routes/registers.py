@@ -1,153 +1,289 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_login import login_required, current_user
 from flask_socketio import emit
 from ..models.plc import PLC, Register
+from ..models.template import RegisterOverride
 from .. import db, socketio
-from pymodbus.client import ModbusTcpClient
-from pymodbus.exceptions import ConnectionException
-import threading
+from ..utils.read_planner import plan_reads, encode_value, validate_register_area, COIL, HOLDING_REGISTER
+from ..utils.modbus_bus import BusManager, BusDevice
+from ..utils.register_io import (REGISTER_FIELDS, validate_register_rows, iter_csv_rows, iter_json_rows,
+                                 iter_csv_export, iter_json_export, MAX_ERRORS)
+from ..utils.listing import ListingError, parse_fields, fetch_page, page_response
+from ..utils.response_cache import (cached_response, plcs_changed, registers_changed, response_cache, PLCS,
+                                    REGISTERS, ALARM_RULES, TEMPLATES)
+from ..utils.derived_tags import (derived_tags, parse_expression, dependency_order, rename_inputs, ExpressionError,
+                                 DERIVED)
+from ..utils.live_values import latest_values, recent_samples, register_images
+from ..utils.warm_start import startup_metrics
+from ..utils.polling_service import polling_service, MONITORING
+from ..utils.historian import validate_compression
+from ..utils.poll_tuning import PollTuner, seconds_per_byte
+from ..utils.device_templates import compiled_maps, device_registers, effective_columns, OVERRIDE_FIELDS
+from .alarms import build_evaluator, record_transitions
+from sqlalchemy import insert, select
+import collections
+import csv
 import time
-import struct
-from pymodbus.payload import BinaryPayloadDecoder
-from pymodbus.constants import Endian
+import types
 
 registers_bp = Blueprint('registers', __name__)
+bus_manager = BusManager()
 
-# Store active PLC connections
-active_connections = {}
+# Fields a register list may project with fields=
+REGISTER_LIST_FIELDS = {
+    'id': Register.id,
+    'name': Register.name,
+    'address': Register.address,
+    'data_type': Register.data_type,
+    'register_area': Register.register_area,
+    'scaling_factor': Register.scaling_factor,
+    'history_deadband': Register.history_deadband,
+    'history_deviation': Register.history_deviation,
+    'unit': Register.unit,
+    'description': Register.description,
+    'is_monitored': Register.is_monitored,
+    'min_value': Register.min_value,
+    'max_value': Register.max_value,
+    'read_write': Register.read_write,
+    'expression': Register.expression,
+    'template_id': Register.template_id
+}
 
-def read_register(client, register):
+def load_derived_tags():
+    """Compile every derived register into derived_tags"""
+    generation = response_cache.generation(REGISTERS)
+    rows = db.session.execute(
+        select(Register.id, Register.plc_id, Register.expression, Register.name, Register.unit,
+               Register.min_value, Register.max_value)
+        .where(Register.expression.isnot(None))
+    ).all()
+    derived_tags.load([(row.id, row.plc_id, row.expression) for row in rows], generation, {
+        row.id: {
+            'name': row.name,
+            'unit': row.unit,
+            'min_value': row.min_value,
+            'max_value': row.max_value
+        } for row in rows
+    })
+
+def validate_expression(expression, register_id=None):
+    """Return an error message if a derived register's expression is invalid,
+    reads unknown registers or makes a derived register depend on itself"""
     try:
-        if register.data_type == 'int16':
-            result = client.read_holding_registers(register.address, 1)
-            value = result.registers[0] * register.scaling_factor
-        elif register.data_type == 'int32':
-            result = client.read_holding_registers(register.address, 2)
-            value = (result.registers[0] << 16 | result.registers[1]) * register.scaling_factor
-        # elif register.data_type == 'float':
-        #     result = client.read_holding_registers(register.address, 2)
-        #     value = struct.unpack('>f', struct.pack('>HH', result.registers[0], result.registers[1]))[0] * register.scaling_factor
-        
-        elif register.data_type == 'float':
-            
-            result = client.read_holding_registers(register.address, 2)
+        _, inputs = parse_expression(expression)
+    except ExpressionError as e:
+        return str(e)
+    found = dict(db.session.execute(select(Register.id, Register.template_id).where(Register.id.in_(inputs))).all())
+    missing = [f'r{input_id}' for input_id in inputs if input_id not in found]
+    if missing:
+        return f'Unknown registers in expression: {", ".join(missing)}'
+    # A template register has one value per PLC using the template, so r<id> would be ambiguous
+    shared = [f'r{input_id}' for input_id in inputs if found[input_id] is not None]
+    if shared:
+        return f'Registers of a device template cannot be used in expressions: {", ".join(shared)}'
+    if register_id is None:
+        return None  # A new register cannot be read by another one yet
+    tags = {register_id: inputs}
+    others = db.session.execute(
+        select(Register.id, Register.expression).where(Register.expression.isnot(None), Register.id != register_id)
+    )
+    for other_id, other_expression in others:
+        try:
+            tags[other_id] = parse_expression(other_expression)[1]
+        except ExpressionError:
+            continue
+    try:
+        dependency_order(tags)
+    except ExpressionError as e:
+        return str(e)
+    return None
+
+def effective_register(plc_id, register_id):
+    """A register as a PLC sees it, with its overrides applied"""
+    columns, select_from = effective_columns(plc_id, REGISTER_LIST_FIELDS)
+    row = db.session.execute(
+        select(*[column.label(name) for name, column in columns.items()])
+        .select_from(select_from).where(Register.id == register_id)
+    ).mappings().first()
+    return dict(row)
+
+def update_override(plc, register, data):
+    """Save a PLC's overrides of a template register; values equal to the
+    template's are dropped so later template changes apply again"""
+    fixed = [field for field in REGISTER_LIST_FIELDS
+             if field in data and field not in OVERRIDE_FIELDS + ('id',) and data[field] != getattr(register, field)]
+    if fixed:
+        return jsonify({'error': f'{", ".join(fixed)} of a template register can only be changed on the template'}), 400
     
-            # Try the most common formats first
-            # formats = [
-            #     ('>f', '>HH', [result.registers[0], result.registers[1]]),  # ABCD
-                # ('>f', '>HH', [result.registers[1], result.registers[0]]),  # CDAB
-            #     ('<f', '<HH', [result.registers[0], result.registers[1]]),  # BADC
-            #     ('<f', '<HH', [result.registers[1], result.registers[0]])   # DCBA
-            # ]
-            
-            # for float_fmt, pack_fmt, regs in formats:
-            #     try:
-            #         value = struct.unpack("'>f'", struct.pack("'>HH'", *[result.registers[1], result.registers[0]]))[0]
-            #         if not (value != value or abs(value) == float('inf')):  # Check for NaN/inf
-            #             value *= register.scaling_factor
-            #             return value
-            #             # print(value,";;;;;;;;;;;;;;",float_fmt, pack_fmt, regs )
-            #     except:
-            #         continue
-            value = struct.unpack('>f', struct.pack('>HH', *[result.registers[1], result.registers[0]]))[0]
-            if not (value != value or abs(value) == float('inf')):  # Check for NaN/inf
-                value *= register.scaling_factor
-                return value
+    override = RegisterOverride.query.filter_by(plc_id=plc.id, register_id=register.id).first()
+    if override is None:
+        override = RegisterOverride(plc_id=plc.id, register_id=register.id)
+        db.session.add(override)
+    for field in OVERRIDE_FIELDS:
+        if field in data:
+            value = data[field]
+            setattr(override, field, None if value == getattr(register, field) else value)
+    if all(getattr(override, field) is None for field in OVERRIDE_FIELDS):
+        if override.id is None:
+            db.session.expunge(override)
+        else:
+            db.session.delete(override)
+    db.session.commit()
+    registers_changed(plc.id)
+    return jsonify(effective_register(plc.id, register.id))
+
+def publish_derived(app, plc_id, values, timestamp):
+    """Store and emit derived values computed for another PLC's registers"""
+    forwarder = app.extensions.get('store_forward')
+    if forwarder is not None:
+        forwarder.store(plc_id, values, timestamp)
+    historian = app.extensions.get('historian')
+    if historian is not None:
+        historian.store(plc_id, values, timestamp)
+    publisher = app.extensions.get('mqtt_publisher')
+    if publisher is not None:
+        publisher.store(plc_id, values, timestamp)
+    latest_values.update(plc_id, values, timestamp)
+    sequence = recent_samples.update(plc_id, values, timestamp)
+    socketio.emit('register_update', {
+        'plc_id': plc_id,
+        'data': {
+            register_id: dict(derived_tags.metadata.get(register_id, {}), value=value)
+            for register_id, value in values.items() if value is not None
+        },
+        'timestamp': timestamp,
+        'seq': sequence,
+        'og': 1
+    })
+
+def poll_intervals(config, plc, demand=None):
+    """A PLC's (poll interval, slowest interval load shedding may stretch it to); with
+    its subscribers' ``demand``, the fastest interval they ask for"""
+    interval = plc.poll_interval or config['POLL_INTERVAL']
+    max_interval = plc.max_poll_interval or interval * config['LOAD_SHEDDING_MAX_STRETCH']
+    if demand is not None:
+        interval = demand.interval(interval)
+    return interval, max(max_interval, interval)
+
+class PLCMonitor(BusDevice):
+    """Polls a PLC's monitored registers on its bus, computes derived registers, emits
+    register_update and evaluates its alarms"""
+
+    def __init__(self, app, plc):
+        super().__init__(plc.id, plc.unit_id, *poll_intervals(app.config, plc))
+        self.app = app
+        self.template_id = plc.template_id
+        self.tuner = PollTuner(plc.max_read_count, seconds_per_byte(plc.protocol, plc.baudrate),
+                               app.config['POLL_REPLAN_INTERVAL'])
+        self.plc_generation = None
+        self.applied_demand = None
+        self.register_map = None  # Shared with the other PLCs of its template, see compiled_maps
+        self.registers = {}
+        self.map_generation = None
+        self.alarms = None
+        self.alarm_generation = None
+        # The raw words are only kept for the Modbus gateway
+        self.images = register_images if app.config['MODBUS_GATEWAY_PORT'] is not None else None
+
+    def refresh(self):
+        with self.app.app_context():
+            if derived_tags.generation != response_cache.generation(REGISTERS):
+                load_derived_tags()
+            # Reload the register map only when the PLC's registers, overrides or template changed;
+            # PLCs of one template share its compiled map
+            registers_generation = response_cache.generation((REGISTERS, self.plc_id))
+            plc_generation = (response_cache.generation(PLCS), registers_generation)
+            demand = self.demand
+            if plc_generation != self.plc_generation or demand != self.applied_demand:
+                plc = db.session.execute(
+                    select(PLC.template_id, PLC.poll_interval, PLC.max_poll_interval, PLC.max_read_count)
+                    .where(PLC.id == self.plc_id)
+                ).first()
+                self.template_id = plc.template_id if plc else None
+                if plc and poll_intervals(self.app.config, plc, demand) != (self.base_interval, self.max_interval):
+                    self.set_intervals(*poll_intervals(self.app.config, plc, demand))
+                if plc and plc.max_read_count != self.tuner.max_count:
+                    self.tuner.set_max_count(plc.max_read_count)
+                self.plc_generation = plc_generation
+                self.applied_demand = demand
+            # The plan is rebuilt when the tuner's timings change the planner settings
+            tuning = self.tuner.current()
+            generation = (registers_generation, response_cache.generation((TEMPLATES, self.template_id)))
+            # Only the registers subscribed to, when no subscriber wants them all
+            subscribed = demand.registers if demand is not None else None
+            if generation + (tuning, subscribed) != self.map_generation:
+                self.register_map = compiled_maps.get(self.plc_id, self.template_id, tuning)
+                if subscribed is not None:
+                    self.register_map = self.register_map.subset(subscribed)
+                self.registers = self.register_map.metadata
+                self.plan = self.register_map.plan
+                self.map_generation = generation + (tuning, subscribed)
+            # Recompile alarm rules only when they or the registers' limits changed, not on a re-plan
+            generation += (response_cache.generation((ALARM_RULES, self.plc_id)),)
+            if generation != self.alarm_generation:
+                self.alarms = build_evaluator(self.plc_id, self.app.config['ALARM_REGISTER_LIMITS'])
+                self.alarm_generation = generation
 
-            # result = client.read_holding_registers(register.address, 2)
-            
-            # decoder = BinaryPayloadDecoder.fromRegisters(
-            #     result.registers, 
-            #     byteorder=Endian.Big,    # or Endian.Little
-            #     wordorder=Endian.Big     # or Endian.Little
-            # )
-            # value = decoder.decode_32bit_float() * register.scaling_factor
-        return value
-    except Exception as e:
-        print(f"Error reading register {register.name}: {str(e)}")
-        return None
+    def on_block(self, block, response, elapsed):
+        self.tuner.observe(block, response, elapsed)
+        if self.images is not None:
+            self.images.update(self.plc_id, block, response, time.time())
 
-def monitor_plc(app, plc_id):
-    with app.app_context():
-        plc = PLC.query.get(plc_id)
-        if not plc:
-            return
+    def on_values(self, values):
+        timestamp = time.time()
+        # Derived registers of this PLC go out with its cycle, those of others on their own
+        derived = derived_tags.update(values)
+        values = dict(values)
+        values.update(derived.pop(self.plc_id, {}))
+        for plc_id, plc_values in derived.items():
+            publish_derived(self.app, plc_id, plc_values, timestamp)
         
-        client = ModbusTcpClient(plc.ip_address, port=plc.port)
+        forwarder = self.app.extensions.get('store_forward')
+        if forwarder is not None:
+            forwarder.store(self.plc_id, values, timestamp)
+        historian = self.app.extensions.get('historian')
+        if historian is not None:
+            historian.store(self.plc_id, values, timestamp)
+        publisher = self.app.extensions.get('mqtt_publisher')
+        if publisher is not None:
+            publisher.store(self.plc_id, values, timestamp)
+        latest_values.update(self.plc_id, values, timestamp)
+        sequence = recent_samples.update(self.plc_id, values, timestamp)
+        if any(value is not None for value in values.values()):
+            startup_metrics.value_received(self.plc_id)
         
-        while plc_id in active_connections:
-            try:
-                if not client.connected:
-                    client.connect()
-                
-                registers = Register.query.filter_by(plc_id=plc_id, is_monitored=True).all()
-                data = {}
-                
-                for register in registers:
-                    value = read_register(client, register)
-                    if value is not None:
-                        data[register.id] = {
-                            'name': register.name,
-                            'value': value,
-                            'unit': register.unit,
-                            'min_value':register.min_value,
-                            'max_value':register.max_value
-                        }
-                
-                # socketio.emit('register_update', {
-                #     'plc_id': plc_id,
-                #     'data': data,
-                #     'og':1
-                # })
-                obj =    {
-                        "plc_id": 3,
-                        "data": {
-                            "4": {
-                                "name": "OUTPUT VOLTAGE",
-                                "value": 146,
-                                "unit": "1",
-                                "min_value": "0.0",
-                                "max_value": "415.0"
-                            },
-                            "5": {
-                                "name": "FREQUENCY(HZ)",
-                                "value": 33,
-                                "unit": "1",
-                                "min_value": "0.0",
-                                "max_value": "50.0"
-                            }
-                        },
-                        "og": 1
-                    }
-                
-                socketio.emit('register_update', obj)
-                
-                time.sleep(1)  # Update every second
-                
-            except Exception as e:
-                print(f"Error monitoring PLC {plc_id}: {str(e)}")
-                time.sleep(5)  # Wait before retrying
+        data = {}
+        for register_id, value in values.items():
+            if value is not None and register_id in self.registers:
+                data[register_id] = dict(self.registers[register_id], value=value)
         
-        client.close()
+        socketio.emit('register_update', {
+            'plc_id': self.plc_id,
+            'data': data,
+            'timestamp': timestamp,
+            'seq': sequence,
+            'og':1
+        })
+        
+        if self.alarms:
+            transitions = self.alarms.evaluate(values, timestamp)
+            if transitions:
+                with self.app.app_context():
+                    record_transitions(self.plc_id, self.alarms, transitions, timestamp)
 
 @registers_bp.route('/plcs/<int:plc_id>/registers', methods=['GET'])
+@cached_response(PLCS, TEMPLATES, lambda plc_id: (REGISTERS, plc_id))
 @login_required
 def get_registers(plc_id):
+    """A PLC's registers and those of its template, with its overrides applied"""
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
-    registers = Register.query.filter_by(plc_id=plc_id).all()
-    return jsonify([{
-        'id': reg.id,
-        'name': reg.name,
-        'address': reg.address,
-        'data_type': reg.data_type,
-        'scaling_factor': reg.scaling_factor,
-        'unit': reg.unit,
-        'description': reg.description,
-        'is_monitored': reg.is_monitored,
-        'min_value': reg.min_value,
-        'max_value': reg.max_value,
-        'read_write': reg.read_write
-    } for reg in registers])
+    columns, select_from = effective_columns(plc_id, REGISTER_LIST_FIELDS)
+    try:
+        rows, next_cursor = fetch_page(db.session, parse_fields(columns), Register.id,
+                                       device_registers(plc_id, plc.template_id), select_from=select_from)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    return page_response(rows, next_cursor)
 
 @registers_bp.route('/plcs/<int:plc_id>/registers', methods=['POST'])
 @login_required
@@ -155,93 +291,316 @@ def create_register(plc_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
     data = request.get_json()
     
+    expression = data.get('expression') or None
+    if expression:
+        # Derived registers are never read, so they have no address of their own
+        register_area, data_type, address = DERIVED, 'float', 0
+        error = validate_expression(expression)
+    else:
+        register_area = data.get('register_area', HOLDING_REGISTER)
+        data_type = data['data_type']
+        address = data['address']
+        error = validate_register_area(register_area, data_type)
+    error = error or validate_compression(data.get('history_deadband'), data.get('history_deviation'))
+    if error:
+        return jsonify({'error': error}), 400
+    
     register = Register(
         name=data['name'],
-        address=data['address'],
-        data_type=data['data_type'],
+        address=address,
+        data_type=data_type,
+        register_area=register_area,
         scaling_factor=data.get('scaling_factor', 1.0),
+        history_deadband=data.get('history_deadband'),
+        history_deviation=data.get('history_deviation'),
         unit=data.get('unit'),
         description=data.get('description'),
         is_monitored=data.get('is_monitored', True),
         min_value=data.get('min_value'),
         max_value=data.get('max_value'),
         read_write=data.get('read_write', 'read_write'),
+        expression=expression,
         plc_id=plc_id
     )
     
     db.session.add(register)
     db.session.commit()
+    registers_changed(plc_id)
     
     return jsonify({
         'id': register.id,
         'name': register.name,
         'address': register.address,
         'data_type': register.data_type,
+        'register_area': register.register_area,
         'scaling_factor': register.scaling_factor,
+        'history_deadband': register.history_deadband,
+        'history_deviation': register.history_deviation,
         'unit': register.unit,
         'description': register.description,
         'is_monitored': register.is_monitored,
         'min_value': register.min_value,
         'max_value': register.max_value,
-        'read_write': register.read_write
+        'read_write': register.read_write,
+        'expression': register.expression
     }), 201
 
+@registers_bp.route('/plcs/<int:plc_id>/registers/bulk', methods=['POST'])
+@login_required
+def bulk_import_registers(plc_id):
+    """Import many registers from a CSV or JSON body in a single transaction"""
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    replace = request.args.get('mode', 'append') == 'replace'
+    
+    if request.mimetype in ('text/csv', 'application/csv'):
+        raw_rows = iter_csv_rows(request.stream)
+    elif request.mimetype in ('application/json', 'application/x-ndjson'):
+        raw_rows = iter_json_rows(request.stream)
+    else:
+        return jsonify({'error': 'Send text/csv or application/json'}), 415
+    
+    existing = () if replace else db.session.execute(
+        select(Register.register_area, Register.address, Register.data_type, Register.name)
+        .where(Register.plc_id == plc_id)
+    ).all()
+    
+    try:
+        rows, errors = validate_register_rows(raw_rows, existing, validate_expression)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # A replace gives the registers new ids, so an expression reading a replaced register
+    # reads the imported one of the same name, as when importing a PLC's own export
+    replaced = dict(db.session.execute(
+        select(Register.id, Register.name).where(Register.plc_id == plc_id)
+    ).all()) if replace else {}
+    imported = collections.Counter(row['name'] for row in rows)
+    for row in rows:
+        if row['expression'] is None or len(errors) >= MAX_ERRORS:
+            continue
+        for input_id in parse_expression(row['expression'])[1]:
+            name = replaced.get(input_id)
+            if name is not None and imported[name] != 1:
+                errors.append({'error': f"{row['name']!r} reads r{input_id} ({name!r}), which this import replaces "
+                                        f"with {imported[name]} registers of that name"})
+    if errors:
+        return jsonify({'error': 'Validation failed, nothing was imported', 'errors': errors}), 400
+    
+    if replace:
+        Register.query.filter_by(plc_id=plc_id).delete()
+    if rows:
+        for row in rows:
+            row['plc_id'] = plc_id
+        db.session.execute(insert(Register), rows)
+    if replaced and any(row['expression'] is not None for row in rows):
+        new_ids = dict(db.session.execute(
+            select(Register.name, Register.id).where(Register.plc_id == plc_id)
+        ).all())
+        renamed = {old_id: new_ids[name] for old_id, name in replaced.items() if imported[name] == 1}
+        for register in Register.query.filter(Register.plc_id == plc_id, Register.expression.isnot(None)):
+            register.expression = rename_inputs(register.expression, renamed)
+    db.session.commit()
+    registers_changed(plc_id)
+    
+    return jsonify({'imported': len(rows), 'replaced': replace}), 201
+
+@registers_bp.route('/plcs/<int:plc_id>/registers/export', methods=['GET'])
+@login_required
+def export_registers(plc_id):
+    """Stream a PLC's registers as CSV or JSON"""
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'json'):
+        return jsonify({'error': 'format must be csv or json'}), 400
+    
+    # A template's registers are exported as the PLC sees them, ready to import as its own
+    columns, select_from = effective_columns(plc_id, {field: getattr(Register, field) for field in REGISTER_FIELDS})
+    query = (select(*[column.label(field) for field, column in columns.items()])
+             .select_from(select_from)
+             .where(device_registers(plc_id, plc.template_id))
+             .order_by(Register.register_area, Register.address)
+             .execution_options(yield_per=500))
+    rows = db.session.execute(query)
+    
+    if export_format == 'csv':
+        body, mimetype = iter_csv_export(rows), 'text/csv'
+    else:
+        body, mimetype = iter_json_export(rows), 'application/json'
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{plc.name}-registers.{export_format}"'
+    })
+
 @registers_bp.route('/plcs/<int:plc_id>/registers/<int:register_id>', methods=['PUT'])
 @login_required
 def update_register(plc_id, register_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
-    register = Register.query.filter_by(id=register_id, plc_id=plc_id).first_or_404()
+    register = Register.query.filter(Register.id == register_id,
+                                     device_registers(plc_id, plc.template_id)).first_or_404()
     data = request.get_json()
+    if register.template_id is not None:
+        return update_override(plc, register, data)
+    
+    expression = data.get('expression', register.expression) or None
+    if expression:
+        register_area, data_type, address = DERIVED, 'float', 0
+        error = validate_expression(expression, register.id)
+    else:
+        register_area = data.get('register_area', register.register_area)
+        data_type = data.get('data_type', register.data_type)
+        address = data.get('address', register.address)
+        error = validate_register_area(register_area, data_type)
+    error = error or validate_compression(data.get('history_deadband', register.history_deadband),
+                                          data.get('history_deviation', register.history_deviation))
+    if error:
+        return jsonify({'error': error}), 400
     
     register.name = data.get('name', register.name)
-    register.address = data.get('address', register.address)
-    register.data_type = data.get('data_type', register.data_type)
+    register.address = address
+    register.data_type = data_type
+    register.register_area = register_area
     register.scaling_factor = data.get('scaling_factor', register.scaling_factor)
+    register.history_deadband = data.get('history_deadband', register.history_deadband)
+    register.history_deviation = data.get('history_deviation', register.history_deviation)
     register.unit = data.get('unit', register.unit)
     register.description = data.get('description', register.description)
     register.is_monitored = data.get('is_monitored', register.is_monitored)
     register.min_value = data.get('min_value', register.min_value)
     register.max_value = data.get('max_value', register.max_value)
     register.read_write = data.get('read_write', register.read_write)
+    register.expression = expression
     
     db.session.commit()
+    registers_changed(plc_id)
     
     return jsonify({
         'id': register.id,
         'name': register.name,
         'address': register.address,
         'data_type': register.data_type,
+        'register_area': register.register_area,
         'scaling_factor': register.scaling_factor,
+        'history_deadband': register.history_deadband,
+        'history_deviation': register.history_deviation,
         'unit': register.unit,
         'description': register.description,
         'is_monitored': register.is_monitored,
         'min_value': register.min_value,
         'max_value': register.max_value,
-        'read_write': register.read_write
+        'read_write': register.read_write,
+        'expression': register.expression
     })
 
 @registers_bp.route('/plcs/<int:plc_id>/registers/<int:register_id>', methods=['DELETE'])
 @login_required
 def delete_register(plc_id, register_id):
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
-    register = Register.query.filter_by(id=register_id, plc_id=plc_id).first_or_404()
+    register = Register.query.filter(Register.id == register_id,
+                                     device_registers(plc_id, plc.template_id)).first_or_404()
+    if register.template_id is not None:
+        return jsonify({'error': 'Registers of a device template can only be deleted from the template'}), 400
     db.session.delete(register)
     db.session.commit()
+    registers_changed(plc_id)
+    latest_values.forget(plc_id, [register_id])
+    recent_samples.forget(plc_id, [register_id])
     return '', 204
 
+@registers_bp.route('/plcs/<int:plc_id>/values', methods=['GET'])
+@login_required
+def get_latest_values(plc_id):
+    """Last polled or derived value of each of a PLC's registers, without contacting it"""
+    PLC.query.filter_by(id=plc_id).first_or_404()
+    return jsonify({
+        register_id: {'value': value, 'timestamp': timestamp}
+        for register_id, (value, timestamp) in latest_values.get(plc_id).items()
+    })
+
+@registers_bp.route('/plcs/<int:plc_id>/registers/<int:register_id>/value', methods=['GET'])
+@login_required
+def read_register_value(plc_id, register_id):
+    """Read one register from its PLC on demand.
+
+    With ``max_age`` (seconds) a value polled or read at most that long ago
+    is returned without contacting the device. Concurrent reads of the same
+    registers, including the PLC's own polling, share one bus transaction.
+    """
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    Register.query.filter(Register.id == register_id, device_registers(plc_id, plc.template_id)).first_or_404()
+    register = effective_register(plc_id, register_id)
+    try:
+        max_age = float(request.args['max_age']) if 'max_age' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'max_age must be a number of seconds'}), 400
+
+    latest = latest_values.get(plc_id).get(register_id)
+    if latest is not None and (register['register_area'] == DERIVED
+                               or max_age is not None and time.time() - latest[1] <= max_age):
+        value, timestamp = latest
+        return jsonify({'value': value, 'unit': register['unit'], 'timestamp': timestamp, 'cached': True})
+    if register['register_area'] == DERIVED:
+        return jsonify({'error': 'A derived register has no value until its inputs are read'}), 400
+
+    block = plan_reads([types.SimpleNamespace(**register)])[0]
+    with bus_manager.using(plc) as bus:
+        values = bus.read(block, plc.unit_id)
+    if not values or values.get(register_id) is None:
+        return jsonify({'error': 'Failed to read register value'}), 500
+    timestamp = time.time()
+    latest_values.update(plc_id, {register_id: values[register_id]}, timestamp)
+    return jsonify({'value': values[register_id], 'unit': register['unit'], 'timestamp': timestamp, 'cached': False})
+
+@registers_bp.route('/plcs/<int:plc_id>/registers/<int:register_id>/value', methods=['PUT'])
+@login_required
+def write_register_value(plc_id, register_id):
+    """Write a scaled value to a coil or holding register. The write is queued
+    ahead of on-demand reads and polling on the PLC's bus."""
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    Register.query.filter(Register.id == register_id, device_registers(plc_id, plc.template_id)).first_or_404()
+    register = effective_register(plc_id, register_id)
+    if register['register_area'] not in (COIL, HOLDING_REGISTER):
+        return jsonify({'error': f'{register["register_area"]} registers cannot be written'}), 400
+    if register['read_write'] == 'read_only':
+        return jsonify({'error': 'This register is read-only'}), 400
+    data = request.get_json(silent=True) or {}
+    if 'value' not in data:
+        return jsonify({'error': 'value is required'}), 400
+    try:
+        value = float(data['value'])
+        words = encode_value(register['data_type'], value / (register['scaling_factor'] or 1.0))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid value: {str(e)}'}), 400
+
+    with bus_manager.using(plc) as bus:
+        written = bus.write(register['register_area'], register['address'], words, plc.unit_id)
+    if not written:
+        return jsonify({'error': 'Failed to write register value'}), 500
+    return jsonify({'value': value, 'unit': register['unit']})
+
+@registers_bp.route('/plcs/<int:plc_id>/poll-plan', methods=['GET'])
+@login_required
+def get_poll_plan(plc_id):
+    """The blocks a monitored PLC is polled in, the latency model they were
+    planned from and the estimated cycle time saved over the default plan"""
+    PLC.query.filter_by(id=plc_id).first_or_404()
+    monitor = bus_manager.device(plc_id)
+    if monitor is None:
+        return jsonify({'error': 'PLC is not being monitored'}), 400
+    return jsonify(monitor.tuner.report(monitor.plan))
+
 @registers_bp.route('/plcs/<int:plc_id>/start-monitoring', methods=['POST'])
 @login_required
 def start_monitoring(plc_id):
+    """Subscribe the monitoring API to all of a PLC's monitored registers at its
+    poll interval; the PLC is polled once however many consumers subscribe"""
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    # Resumed after a restart, see warm_start
+    if not plc.monitoring_enabled:
+        plc.monitoring_enabled = True
+        db.session.commit()
+        plcs_changed()
     
-    if plc_id not in active_connections:
-        active_connections[plc_id] = True
-        thread = threading.Thread(
-            target=monitor_plc,
-            args=(current_app._get_current_object(), plc_id)
-        )
-        thread.daemon = True
-        thread.start()
+    if polling_service.subscribe(MONITORING, plc):
+        plcs_changed()  # is_polling in the fleet summary
         return jsonify({'message': 'Monitoring started'})
     
     return jsonify({'message': 'Monitoring already active'})
@@ -249,10 +608,15 @@ def start_monitoring(plc_id):
 @registers_bp.route('/plcs/<int:plc_id>/stop-monitoring', methods=['POST'])
 @login_required
 def stop_monitoring(plc_id):
+    """Drop the monitoring API's subscription; the PLC stays polled while other consumers subscribe"""
     plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    if plc.monitoring_enabled:
+        plc.monitoring_enabled = False
+        db.session.commit()
+        plcs_changed()
     
-    if plc_id in active_connections:
-        active_connections.pop(plc_id)
-        return jsonify({'message': 'Monitoring stopped'})
+    if polling_service.unsubscribe(MONITORING, plc_id):
+        plcs_changed()
+        return jsonify({'message': 'Monitoring stopped', 'is_polling': bus_manager.is_polling(plc_id)})
     
-    return jsonify({'message': 'Monitoring not active'}) 
\ No newline at end of file
+    return jsonify({'message': 'Monitoring not active'})
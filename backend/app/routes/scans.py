@@ -0,0 +1,198 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required
+from ..models.plc import PLC, Register
+from ..models.scan import RegisterScan
+from .. import db
+from ..utils.modbus_bus import BusManager
+from ..utils.transaction_queue import DISCOVERY
+from ..utils.register_scanner import RegisterScanner, ScanAborted, SCAN_AREAS, ADDRESS_SPACE
+from ..utils.read_planner import register_size
+from ..utils.response_cache import registers_changed
+from ..utils.background import start_task
+from sqlalchemy import insert, select
+from datetime import datetime
+import functools
+import time
+
+scans_bp = Blueprint('scans', __name__)
+bus_manager = BusManager()
+
+# Scanners currently running, by scan id
+active_scans = {}
+
+def scan_to_dict(scan, include_registers=True):
+    data = {
+        'id': scan.id,
+        'plc_id': scan.plc_id,
+        'status': scan.status,
+        'options': scan.options,
+        'progress': scan.progress,
+        'requests': scan.requests,
+        'ranges': scan.ranges,
+        'error': scan.error,
+        'created_at': scan.created_at,
+        'finished_at': scan.finished_at
+    }
+    if include_registers:
+        data['proposed_registers'] = scan.proposed_registers
+    return data
+
+def run_scan(app, scan_id):
+    """Background task sweeping a PLC and storing the proposed register map"""
+    with app.app_context():
+        scan = RegisterScan.query.get(scan_id)
+        plc = PLC.query.get(scan.plc_id)
+        options = scan.options
+        last_update = 0.0
+
+        def progress(area, done, total):
+            # Persist progress at most once a second
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update >= 1.0:
+                last_update = now
+                area_index = options['areas'].index(area)
+                scan.progress = round((area_index + min(done / total, 1.0)) / len(options['areas']), 3)
+                scan.requests = scanner.requests
+                db.session.commit()
+
+        # Held for the whole scan, so an unmonitored PLC's bus is closed after it
+        with bus_manager.using(plc) as bus:
+            scanner = RegisterScanner(
+                functools.partial(bus.transaction, DISCOVERY),
+                unit_id=plc.unit_id,
+                areas=options['areas'],
+                start=options['start'],
+                end=options['end'],
+                rate_limit=options['rate_limit'],
+                samples=options['samples'],
+                resolution=options['resolution'],
+                exhaustive=options['exhaustive'],
+                progress=progress
+            )
+            active_scans[scan_id] = scanner
+            scan.status = 'running'
+            db.session.commit()
+
+            try:
+                scan.ranges, scan.proposed_registers = scanner.run()
+                scan.status = 'completed'
+                scan.progress = 1.0
+            except ScanAborted as e:
+                scan.status = 'cancelled' if scanner.cancelled else 'failed'
+                scan.error = str(e)[:255]
+            except Exception as e:
+                print(f"Error scanning PLC {plc.id}: {str(e)}")
+                scan.status = 'failed'
+                scan.error = str(e)[:255]
+            finally:
+                active_scans.pop(scan_id, None)
+                scan.requests = scanner.requests
+                scan.finished_at = datetime.utcnow()
+                db.session.commit()
+
+@scans_bp.route('/plcs/<int:plc_id>/scans', methods=['POST'])
+@login_required
+def start_scan(plc_id):
+    """Start a register map discovery scan"""
+    plc = PLC.query.filter_by(id=plc_id).first_or_404()
+    data = request.get_json(silent=True) or {}
+
+    areas = data.get('areas', list(SCAN_AREAS))
+    if not areas or any(area not in SCAN_AREAS for area in areas):
+        return jsonify({'error': f'areas must be a subset of {", ".join(SCAN_AREAS)}'}), 400
+    options = {'areas': areas}
+    for name, convert, default in (('start', int, 0), ('end', int, ADDRESS_SPACE), ('rate_limit', float, 100.0),
+                                   ('samples', int, 3), ('resolution', int, 8)):
+        try:
+            options[name] = convert(data.get(name, default))
+        except (ValueError, TypeError):
+            return jsonify({'error': f'{name} must be {"an integer" if convert is int else "a number"}'}), 400
+    options['exhaustive'] = bool(data.get('exhaustive', False))
+    if not 0 <= options['start'] < options['end'] <= ADDRESS_SPACE:
+        return jsonify({'error': f'start and end must satisfy 0 <= start < end <= {ADDRESS_SPACE}'}), 400
+
+    if RegisterScan.query.filter(RegisterScan.plc_id == plc_id,
+                                 RegisterScan.status.in_(['pending', 'running'])).first():
+        return jsonify({'error': 'A scan is already running for this PLC'}), 409
+
+    scan = RegisterScan(plc_id=plc_id, options=options)
+    db.session.add(scan)
+    db.session.commit()
+
+    start_task(run_scan, current_app._get_current_object(), scan.id)
+
+    return jsonify(scan_to_dict(scan)), 202
+
+@scans_bp.route('/plcs/<int:plc_id>/scans', methods=['GET'])
+@login_required
+def get_scans(plc_id):
+    PLC.query.filter_by(id=plc_id).first_or_404()
+    scans = RegisterScan.query.filter_by(plc_id=plc_id).order_by(RegisterScan.id.desc()).all()
+    return jsonify([scan_to_dict(scan, include_registers=False) for scan in scans])
+
+@scans_bp.route('/plcs/<int:plc_id>/scans/<int:scan_id>', methods=['GET'])
+@login_required
+def get_scan(plc_id, scan_id):
+    scan = RegisterScan.query.filter_by(id=scan_id, plc_id=plc_id).first_or_404()
+    return jsonify(scan_to_dict(scan))
+
+@scans_bp.route('/plcs/<int:plc_id>/scans/<int:scan_id>', methods=['DELETE'])
+@login_required
+def cancel_scan(plc_id, scan_id):
+    """Cancel a running scan, or delete a finished one"""
+    scan = RegisterScan.query.filter_by(id=scan_id, plc_id=plc_id).first_or_404()
+    scanner = active_scans.get(scan_id)
+    if scanner:
+        scanner.cancelled = True
+        return jsonify({'message': 'Scan cancelling'})
+    db.session.delete(scan)
+    db.session.commit()
+    return '', 204
+
+@scans_bp.route('/plcs/<int:plc_id>/scans/<int:scan_id>/import', methods=['POST'])
+@login_required
+def import_scan(plc_id, scan_id):
+    """Create registers from a scan's proposed map in one transaction"""
+    scan = RegisterScan.query.filter_by(id=scan_id, plc_id=plc_id).first_or_404()
+    if scan.status != 'completed':
+        return jsonify({'error': 'Scan has not completed'}), 400
+    data = request.get_json(silent=True) or {}
+
+    proposals = scan.proposed_registers or []
+    if 'addresses' in data:
+        try:
+            selected = {(item['register_area'], int(item['address'])) for item in data['addresses']}
+        except (KeyError, ValueError, TypeError):
+            return jsonify({'error': 'addresses must be a list of {register_area, address}'}), 400
+        proposals = [p for p in proposals if (p['register_area'], p['address']) in selected]
+
+    # Never duplicate or overlap a register that is already configured
+    existing = db.session.execute(
+        select(Register.register_area, Register.address, Register.data_type, Register.name)
+        .where(Register.plc_id == plc_id)
+    ).all()
+    taken = {}
+    for register_area, address, data_type, _ in existing:
+        for offset in range(register_size(register_area, data_type)):
+            taken[(register_area, address + offset)] = True
+    rows = [{
+        'name': p['name'],
+        'address': p['address'],
+        'data_type': p['data_type'],
+        'register_area': p['register_area'],
+        'scaling_factor': 1.0,
+        'is_monitored': data.get('is_monitored', False),
+        'read_write': 'read_only',
+        'description': f"Discovered by scan {scan.id} (seen {p['min_seen']:g} .. {p['max_seen']:g})",
+        'plc_id': plc_id
+    } for p in proposals
+        if not any((p['register_area'], p['address'] + offset) in taken
+                   for offset in range(register_size(p['register_area'], p['data_type'])))]
+
+    if rows:
+        db.session.execute(insert(Register), rows)
+    db.session.commit()
+    registers_changed(plc_id)
+
+    return jsonify({'imported': len(rows), 'skipped': len(proposals) - len(rows)}), 201
@@ -0,0 +1,81 @@
+from flask import current_app, request
+from flask_login import current_user
+from flask_socketio import emit
+from .. import db, socketio
+from ..models.plc import PLC
+from ..utils.live_values import recent_samples
+from ..utils.modbus_bus import validate_poll_intervals
+from ..utils.polling_service import polling_service
+import numpy as np
+import time
+
+
+@socketio.on('subscribe')
+def subscribe(message):
+    """Send a PLC's last ``lookback`` seconds as one backfill frame.
+
+    A client listens to register_update first, then subscribes, and drops
+    the updates whose seq is not above the frame's ``seq``: those are
+    already in the frame, and every later one arrives live, so the trend
+    has neither gaps nor duplicates.
+
+    With ``poll`` the client also subscribes to the PLC's polling, of its
+    ``registers`` (ids, all monitored ones by default) every ``interval``
+    seconds (its poll interval by default), until it unsubscribes or
+    disconnects; the PLC is polled once for all its subscribers.
+    """
+    if not current_user.is_authenticated:
+        return {'error': 'Not logged in'}
+    try:
+        plc_id = int(message['plc_id'])
+        lookback = float(message.get('lookback', current_app.config['RECENT_SAMPLES_LOOKBACK']))
+        demand = _demand(message)
+    except (KeyError, TypeError, ValueError):
+        return {'error': 'subscribe needs a plc_id, an optional lookback in seconds and, to poll, '
+                         'optional register ids and an interval in seconds'}
+    if message.get('poll'):
+        plc = db.session.get(PLC, plc_id)
+        if plc is None:
+            return {'error': 'PLC not found'}
+        error = validate_poll_intervals(demand[1], None)
+        if error:
+            return {'error': error}
+        polling_service.subscribe(request.sid, plc, *demand)
+
+    timestamps, values, sequence = recent_samples.snapshot(plc_id, time.time() - max(lookback, 0.0))
+    start = float(timestamps[0]) if len(timestamps) else None
+    emit('backfill', {
+        'plc_id': plc_id,
+        'seq': sequence,
+        'start': start,
+        # Milliseconds after start, one per update; values are null where a register was not updated
+        'offsets': np.round((timestamps - start) * 1000).astype(np.int64).tolist() if start is not None else [],
+        'data': {
+            register_id: [None if value != value else value for value in row.tolist()]
+            for register_id, row in values.items()
+        }
+    })
+    return {'ok': True}
+
+
+def _demand(message):
+    registers = message.get('registers')
+    interval = message.get('interval')
+    return (None if registers is None else frozenset(int(register_id) for register_id in registers),
+            None if interval is None else float(interval))
+
+
+@socketio.on('unsubscribe')
+def unsubscribe(message):
+    """Drop a ``poll`` subscription made with the same plc_id, registers and interval"""
+    try:
+        plc_id = int(message['plc_id'])
+        demand = _demand(message)
+    except (KeyError, TypeError, ValueError):
+        return {'error': 'unsubscribe needs the plc_id, registers and interval subscribed with'}
+    return {'ok': polling_service.unsubscribe(request.sid, plc_id, *demand)}
+
+
+@socketio.on('disconnect')
+def disconnect(*args):
+    polling_service.release(request.sid)
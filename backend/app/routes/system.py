@@ -0,0 +1,68 @@
+from flask import Blueprint, jsonify, current_app
+from flask_login import login_required
+from ..utils.device_templates import compiled_maps
+from ..utils.modbus_bus import BusManager
+from ..utils.warm_start import startup_metrics
+from ..utils.polling_service import polling_service
+
+system_bp = Blueprint('system', __name__)
+
+@system_bp.route('/system/store-forward', methods=['GET'])
+@login_required
+def get_store_forward_status():
+    """Backlog and upload state of the store-and-forward buffer"""
+    forwarder = current_app.extensions.get('store_forward')
+    if forwarder is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(forwarder.status(), enabled=True))
+
+@system_bp.route('/system/mqtt', methods=['GET'])
+@login_required
+def get_mqtt_status():
+    """Connection, queue and publishing counts of the MQTT publisher"""
+    publisher = current_app.extensions.get('mqtt_publisher')
+    if publisher is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(publisher.status(), enabled=True))
+
+@system_bp.route('/system/historian', methods=['GET'])
+@login_required
+def get_historian_status():
+    """Compression and write state of the historian"""
+    historian = current_app.extensions.get('historian')
+    if historian is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(historian.status(), enabled=True))
+
+@system_bp.route('/system/register-maps', methods=['GET'])
+@login_required
+def get_register_map_status():
+    """Compiled register maps shared by the PLCs of each device template"""
+    return jsonify(compiled_maps.status())
+
+@system_bp.route('/system/buses', methods=['GET'])
+@login_required
+def get_bus_status():
+    """Devices on each Modbus bus and how many of its reads were shared by concurrent requests"""
+    return jsonify(BusManager().status())
+
+@system_bp.route('/system/polling', methods=['GET'])
+@login_required
+def get_polling_status():
+    """Subscriptions of each polled PLC by register set and interval, with their consumer counts"""
+    return jsonify(polling_service.status())
+
+@system_bp.route('/system/modbus-gateway', methods=['GET'])
+@login_required
+def get_modbus_gateway_status():
+    """Units the Modbus gateway serves, its connections and how many requests it answered or refused"""
+    gateway = current_app.extensions.get('modbus_gateway')
+    if gateway is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(gateway.status(), enabled=True))
+
+@system_bp.route('/system/startup', methods=['GET'])
+@login_required
+def get_startup_status():
+    """Seconds from process start to serving, to the first live value and to every restored monitor being live"""
+    return jsonify(startup_metrics.status())
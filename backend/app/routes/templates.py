@@ -0,0 +1,300 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from ..models.plc import PLC, Register
+from ..models.template import DeviceTemplate
+from .. import db
+from ..utils.modbus_bus import bus_key, validate_transport, validate_poll_intervals, validate_max_read_count, TCP
+from ..utils.register_io import REGISTER_FIELDS, validate_register_rows, iter_csv_rows, iter_json_rows, MAX_ERRORS
+from ..utils.response_cache import cached_response, plcs_changed, templates_changed, PLCS, TEMPLATES
+from ..utils.live_values import latest_values, recent_samples
+from ..utils.polling_service import polling_service, MONITORING
+from .registers import REGISTER_LIST_FIELDS
+from sqlalchemy import func, insert, select
+import csv
+import types
+
+templates_bp = Blueprint('templates', __name__)
+
+# Most devices a single provisioning request may create
+MAX_DEVICES = 5000
+
+# Transport settings a provisioned device may give, with their defaults
+DEVICE_FIELDS = {
+    'ip_address': '',
+    'port': 502,
+    'unit_id': 1,
+    'protocol': TCP,
+    'serial_port': None,
+    'baudrate': None,
+    'inter_frame_delay': None,
+    'poll_interval': None,
+    'max_poll_interval': None,
+    'max_read_count': None,
+    'description': None
+}
+
+TEMPLATE_REGISTER_FIELDS = {name: column for name, column in REGISTER_LIST_FIELDS.items()
+                            if name not in ('expression', 'template_id')}
+
+def template_to_dict(template, register_count=None, device_count=None):
+    return {
+        'id': template.id,
+        'name': template.name,
+        'description': template.description,
+        'created_at': template.created_at,
+        'register_count': register_count,
+        'device_count': device_count
+    }
+
+def template_registers(template_id):
+    rows = db.session.execute(
+        select(*[column.label(name) for name, column in TEMPLATE_REGISTER_FIELDS.items()])
+        .where(Register.template_id == template_id).order_by(Register.register_area, Register.address)
+    ).mappings()
+    return [dict(row) for row in rows]
+
+def linked_plc_ids(template_id):
+    return db.session.execute(select(PLC.id).where(PLC.template_id == template_id)).scalars().all()
+
+def read_register_rows():
+    """Registers given in the body: a JSON ``registers`` list, or a CSV or JSON body of registers"""
+    if request.mimetype in ('text/csv', 'application/csv'):
+        return iter_csv_rows(request.stream)
+    if request.mimetype == 'application/x-ndjson':
+        return iter_json_rows(request.stream)
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        return iter(data.get('registers') or ())
+    if isinstance(data, list):
+        return iter(data)
+    raise ValueError('Send text/csv or application/json')
+
+def insert_template_registers(template_id, raw_rows, replace=False):
+    """Validate and insert a template's registers, returning (count, errors)"""
+    existing = () if replace else db.session.execute(
+        select(Register.register_area, Register.address, Register.data_type, Register.name)
+        .where(Register.template_id == template_id)
+    ).all()
+    rows, errors = validate_register_rows(raw_rows, existing)
+    if errors:
+        return 0, errors
+    if replace:
+        Register.query.filter_by(template_id=template_id).delete()
+    if rows:
+        for row in rows:
+            row['template_id'] = template_id
+        db.session.execute(insert(Register), rows)
+    return len(rows), []
+
+def validate_devices(devices, template_id):
+    """Parse the devices of a provisioning request into PLC rows, returning (rows, errors).
+
+    Names must be new and unit ids unique on each bus, among the existing
+    PLCs and within the request.
+    """
+    names = set(db.session.execute(select(PLC.name)).scalars())
+    units = {(bus_key(plc), plc.unit_id) for plc in db.session.execute(
+        select(PLC.protocol, PLC.ip_address, PLC.port, PLC.serial_port, PLC.unit_id))}
+    rows, errors = [], []
+    for line, device in enumerate(devices, start=1):
+        if len(errors) >= MAX_ERRORS:
+            break
+        if not isinstance(device, dict):
+            errors.append({'row': line, 'error': 'Each device must be a JSON object'})
+            continue
+        row = {field: device.get(field, default) for field, default in DEVICE_FIELDS.items()}
+        row['name'] = str(device.get('name') or '').strip()[:80]
+        error = (validate_transport(row['protocol'], row['ip_address'], row['serial_port'])
+                 or validate_poll_intervals(row['poll_interval'], row['max_poll_interval'])
+                 or validate_max_read_count(row['max_read_count']))
+        if not row['name']:
+            error = 'name is required'
+        elif row['name'] in names:
+            error = f'A PLC named {row["name"]!r} already exists'
+        elif not error:
+            unit = (bus_key(types.SimpleNamespace(**row)), row['unit_id'])
+            if unit in units:
+                error = f'Unit id {row["unit_id"]} is already used on this bus'
+            units.add(unit)
+        if error:
+            errors.append({'row': line, 'error': error})
+            continue
+        names.add(row['name'])
+        row['ip_address'] = row['ip_address'] or ''
+        row['template_id'] = template_id
+        row['user_id'] = current_user.id
+        rows.append(row)
+    return rows, errors
+
+@templates_bp.route('/templates', methods=['GET'])
+@cached_response(TEMPLATES, PLCS)
+@login_required
+def get_templates():
+    register_counts = (select(Register.template_id, func.count(Register.id).label('count'))
+                       .group_by(Register.template_id).subquery())
+    device_counts = (select(PLC.template_id, func.count(PLC.id).label('count'))
+                     .group_by(PLC.template_id).subquery())
+    rows = db.session.execute(
+        select(DeviceTemplate, func.coalesce(register_counts.c.count, 0), func.coalesce(device_counts.c.count, 0))
+        .outerjoin(register_counts, register_counts.c.template_id == DeviceTemplate.id)
+        .outerjoin(device_counts, device_counts.c.template_id == DeviceTemplate.id)
+        .order_by(DeviceTemplate.id)
+    ).all()
+    return jsonify([template_to_dict(template, register_count, device_count)
+                    for template, register_count, device_count in rows])
+
+@templates_bp.route('/templates', methods=['POST'])
+@login_required
+def create_template():
+    """Create a template, optionally with its registers in the same request"""
+    data = request.get_json()
+    name = str(data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    if DeviceTemplate.query.filter_by(name=name).first():
+        return jsonify({'error': f'A template named {name!r} already exists'}), 400
+
+    template = DeviceTemplate(name=name, description=data.get('description'), user_id=current_user.id)
+    db.session.add(template)
+    db.session.flush()
+    try:
+        count, errors = insert_template_registers(template.id, iter(data.get('registers') or ()))
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    if errors:
+        db.session.rollback()
+        return jsonify({'error': 'Validation failed, nothing was created', 'errors': errors}), 400
+    db.session.commit()
+    templates_changed(template.id)
+
+    return jsonify(template_to_dict(template, count, 0)), 201
+
+@templates_bp.route('/templates/<int:template_id>', methods=['GET'])
+@cached_response(PLCS, lambda template_id: (TEMPLATES, template_id))
+@login_required
+def get_template(template_id):
+    template = DeviceTemplate.query.filter_by(id=template_id).first_or_404()
+    registers = template_registers(template_id)
+    data = template_to_dict(template, len(registers), len(linked_plc_ids(template_id)))
+    data['registers'] = registers
+    return jsonify(data)
+
+@templates_bp.route('/templates/<int:template_id>', methods=['PUT'])
+@login_required
+def update_template(template_id):
+    template = DeviceTemplate.query.filter_by(id=template_id).first_or_404()
+    data = request.get_json()
+    name = str(data.get('name', template.name) or '').strip()
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    if DeviceTemplate.query.filter(DeviceTemplate.name == name, DeviceTemplate.id != template_id).first():
+        return jsonify({'error': f'A template named {name!r} already exists'}), 400
+
+    template.name = name
+    template.description = data.get('description', template.description)
+    db.session.commit()
+    templates_changed(template_id)
+    return jsonify(template_to_dict(template))
+
+@templates_bp.route('/templates/<int:template_id>', methods=['DELETE'])
+@login_required
+def delete_template(template_id):
+    template = DeviceTemplate.query.filter_by(id=template_id).first_or_404()
+    if linked_plc_ids(template_id):
+        return jsonify({'error': 'Unlink or delete the PLCs using this template first'}), 400
+    db.session.delete(template)
+    db.session.commit()
+    templates_changed(template_id)
+    return '', 204
+
+@templates_bp.route('/templates/<int:template_id>/registers', methods=['POST'])
+@login_required
+def add_template_registers(template_id):
+    """Add registers to a template from a JSON list, CSV or JSON Lines; ``mode=replace``
+    swaps the whole map. Every PLC using the template polls the new map from its next cycle."""
+    DeviceTemplate.query.filter_by(id=template_id).first_or_404()
+    replace = request.args.get('mode', 'append') == 'replace'
+    try:
+        count, errors = insert_template_registers(template_id, read_register_rows(), replace)
+    except (ValueError, TypeError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    if errors:
+        db.session.rollback()
+        return jsonify({'error': 'Validation failed, nothing was imported', 'errors': errors}), 400
+    db.session.commit()
+    templates_changed(template_id)
+    if replace:
+        for plc_id in linked_plc_ids(template_id):
+            latest_values.forget(plc_id)
+            recent_samples.forget(plc_id)
+    return jsonify({'imported': count, 'replaced': replace}), 201
+
+@templates_bp.route('/templates/<int:template_id>/registers/<int:register_id>', methods=['PUT'])
+@login_required
+def update_template_register(template_id, register_id):
+    register = Register.query.filter_by(id=register_id, template_id=template_id).first_or_404()
+    data = request.get_json()
+    merged = {field: data.get(field, getattr(register, field)) for field in REGISTER_FIELDS}
+    others = db.session.execute(
+        select(Register.register_area, Register.address, Register.data_type, Register.name)
+        .where(Register.template_id == template_id, Register.id != register_id)
+    ).all()
+    try:
+        rows, errors = validate_register_rows([merged], others)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    if errors:
+        return jsonify({'error': errors[0]['error'], 'errors': errors}), 400
+
+    for field, value in rows[0].items():
+        setattr(register, field, value)
+    db.session.commit()
+    templates_changed(template_id)
+    return jsonify({name: getattr(register, name) for name in TEMPLATE_REGISTER_FIELDS})
+
+@templates_bp.route('/templates/<int:template_id>/registers/<int:register_id>', methods=['DELETE'])
+@login_required
+def delete_template_register(template_id, register_id):
+    register = Register.query.filter_by(id=register_id, template_id=template_id).first_or_404()
+    db.session.delete(register)
+    db.session.commit()
+    templates_changed(template_id)
+    for plc_id in linked_plc_ids(template_id):
+        latest_values.forget(plc_id, [register_id])
+        recent_samples.forget(plc_id, [register_id])
+    return '', 204
+
+@templates_bp.route('/templates/<int:template_id>/devices', methods=['POST'])
+@login_required
+def provision_devices(template_id):
+    """Create many PLCs using a template in one transaction.
+
+    The body is ``{"devices": [{"name": ..., "ip_address": ..., "unit_id": ...}, ...]}``
+    with the transport fields of a PLC; with ``"start_monitoring": true``
+    every new PLC is polled right away. Nothing is created if any device is invalid.
+    """
+    DeviceTemplate.query.filter_by(id=template_id).first_or_404()
+    data = request.get_json()
+    devices = data.get('devices') if isinstance(data, dict) else data
+    if not isinstance(devices, list) or not devices:
+        return jsonify({'error': 'devices must be a non-empty list'}), 400
+    if len(devices) > MAX_DEVICES:
+        return jsonify({'error': f'At most {MAX_DEVICES} devices per request'}), 400
+
+    rows, errors = validate_devices(devices, template_id)
+    if errors:
+        return jsonify({'error': 'Validation failed, nothing was created', 'errors': errors}), 400
+    start_monitoring = isinstance(data, dict) and bool(data.get('start_monitoring'))
+    for row in rows:
+        row['monitoring_enabled'] = start_monitoring
+    plc_ids = db.session.execute(insert(PLC).returning(PLC.id, sort_by_parameter_order=True), rows).scalars().all()
+    db.session.commit()
+
+    started = 0
+    if start_monitoring:
+        for plc in PLC.query.filter(PLC.id.in_(plc_ids)).all():
+            started += polling_service.subscribe(MONITORING, plc)
+    plcs_changed()
+    return jsonify({'created': len(plc_ids), 'ids': plc_ids, 'monitoring': started}), 201
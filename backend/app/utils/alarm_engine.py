@@ -0,0 +1,123 @@
+import numpy as np
+
+# Rule types: a limit on the value, on its rate of change per second, or on
+# its distance from a setpoint or from another register of the same PLC
+HIGH = 'high'
+LOW = 'low'
+RATE_OF_CHANGE = 'rate_of_change'
+DEVIATION = 'deviation'
+
+RULE_TYPES = (HIGH, LOW, RATE_OF_CHANGE, DEVIATION)
+SEVERITIES = ('info', 'warning', 'critical')
+
+
+def validate_rule(data):
+    """Return an error message if an alarm rule definition is invalid"""
+    rule_type = data.get('rule_type')
+    if rule_type not in RULE_TYPES:
+        return f'Invalid rule_type {rule_type!r}, expected one of {", ".join(RULE_TYPES)}'
+    if data.get('severity', 'warning') not in SEVERITIES:
+        return f'Invalid severity, expected one of {", ".join(SEVERITIES)}'
+    for field in ('threshold', 'deadband', 'on_delay', 'off_delay'):
+        value = data.get(field)
+        if value is None and field != 'threshold':
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f'{field} must be a number'
+        if field != 'threshold' and value < 0:
+            return f'{field} must not be negative'
+    if rule_type in (RATE_OF_CHANGE, DEVIATION) and data['threshold'] < 0:
+        return f'threshold of a {rule_type} rule must not be negative'
+    if rule_type == DEVIATION and data.get('setpoint') is None and data.get('reference_register_id') is None:
+        return 'A deviation rule needs a setpoint or a reference_register_id'
+    return None
+
+
+class AlarmEvaluator:
+    """Alarm state of a PLC's rules, updated one poll cycle at a time.
+
+    ``rules`` are dicts with ``register_id``, ``rule_type``, ``threshold``
+    and optionally ``setpoint``, ``reference_register_id``, ``deadband``,
+    ``on_delay`` and ``off_delay``; any other keys are left for the caller.
+    They are compiled into parallel arrays so a cycle is evaluated with a
+    fixed number of NumPy operations however many rules there are.
+
+    Every rule is reduced to "measure > threshold raises": low limits are
+    negated, rate of change is the absolute change per second since the
+    register's previous value, and deviation the absolute distance from
+    the setpoint or reference register. An active alarm clears once the
+    measure is back below ``threshold - deadband``. A raise or clear only
+    takes effect once its condition has held for ``on_delay`` or
+    ``off_delay`` seconds. A missing value neither raises nor clears.
+    """
+
+    def __init__(self, rules, active=()):
+        self.rules = list(rules)
+        count = len(self.rules)
+        register_ids = sorted({rule['register_id'] for rule in self.rules} |
+                              {rule['reference_register_id'] for rule in self.rules
+                               if rule.get('reference_register_id') is not None})
+        self.register_index = {register_id: index for index, register_id in enumerate(register_ids)}
+
+        def column(key, default=np.nan):
+            values = [rule.get(key) for rule in self.rules]
+            return np.array([default if value is None else value for value in values], dtype=float)
+
+        types = [rule['rule_type'] for rule in self.rules]
+        self.source = np.array([self.register_index[rule['register_id']] for rule in self.rules], dtype=np.intp)
+        self.reference = np.array([self.register_index.get(rule.get('reference_register_id'), -1)
+                                   for rule in self.rules], dtype=np.intp)
+        self.is_low = np.array([rule_type == LOW for rule_type in types], dtype=bool)
+        self.is_rate = np.array([rule_type == RATE_OF_CHANGE for rule_type in types], dtype=bool)
+        self.is_deviation = np.array([rule_type == DEVIATION for rule_type in types], dtype=bool)
+        self.sign = np.where(self.is_low, -1.0, 1.0)
+        self.threshold = column('threshold') * self.sign
+        self.setpoint = column('setpoint')
+        self.deadband = column('deadband', 0.0)
+        self.on_delay = column('on_delay', 0.0)
+        self.off_delay = column('off_delay', 0.0)
+
+        active = set(active)
+        self.active = np.array([index in active for index in range(count)], dtype=bool)
+        self.since = np.full(count, np.nan)  # When the pending raise or clear condition started
+        self.previous = np.full(len(register_ids), np.nan)
+        self.previous_time = np.full(len(register_ids), np.nan)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, values, timestamp):
+        """Feed one cycle's {register_id: value}; return the transitions as
+        a list of (rule index, is now active, register value)"""
+        current = np.full(len(self.register_index), np.nan)
+        for register_id, value in values.items():
+            index = self.register_index.get(register_id)
+            if index is not None and value is not None:
+                current[index] = value
+
+        value = current[self.source]
+        measure = value.copy()
+        if self.is_rate.any():
+            elapsed = timestamp - self.previous_time[self.source]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = np.abs(value - self.previous[self.source]) / elapsed
+            measure = np.where(self.is_rate, np.where(elapsed > 0, rate, np.nan), measure)
+        if self.is_deviation.any():
+            target = np.where(self.reference >= 0, current[self.reference], self.setpoint)
+            measure = np.where(self.is_deviation, np.abs(value - target), measure)
+        measure *= self.sign
+
+        # NaN compares false both ways, so a missing value holds the state
+        condition = np.where(self.active, measure < self.threshold - self.deadband, measure > self.threshold)
+        self.since = np.where(condition, np.fmin(self.since, timestamp), np.nan)
+        delay = np.where(self.active, self.off_delay, self.on_delay)
+        fired = np.flatnonzero(condition & (timestamp - self.since >= delay))
+
+        seen = ~np.isnan(current)
+        self.previous[seen] = current[seen]
+        self.previous_time[seen] = timestamp
+        if not len(fired):
+            return []
+        self.active[fired] = ~self.active[fired]
+        self.since[fired] = np.nan
+        return [(int(index), bool(self.active[index]), float(value[index])) for index in fired]
@@ -0,0 +1,91 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+
+# Socket.IO async modes the hub runs under; eventlet and gevent need the
+# standard library monkey-patched before anything imports it, see run.py
+THREADING = 'threading'
+EVENTLET = 'eventlet'
+GEVENT = 'gevent'
+ASYNC_MODES = (THREADING, EVENTLET, GEVENT)
+
+
+@functools.lru_cache(maxsize=None)
+def patched_async_mode():
+    """eventlet or gevent if the process was monkey-patched for it, else threading"""
+    # Neither is imported unless it patched the process, which saves importing them
+    eventlet = sys.modules.get('eventlet.patcher')
+    if eventlet is not None and eventlet.is_monkey_patched('socket'):
+        return EVENTLET
+    gevent = sys.modules.get('gevent.monkey')
+    if gevent is not None and gevent.is_module_patched('socket'):
+        return GEVENT
+    return THREADING
+
+
+def select_async_mode(requested=None):
+    """The async mode to run Socket.IO and background tasks with.
+
+    A green mode only works once its monkey-patching made sockets, sleeps
+    and locks cooperative, so the mode follows the patching; a requested
+    mode the process was not patched for falls back to it with a warning.
+    """
+    mode = patched_async_mode()
+    if requested and requested != mode:
+        print(f"ASYNC_MODE {requested} needs the process monkey-patched before the app is imported "
+              f"(start it with run.py); using {mode}")
+    return mode
+
+
+def _server():
+    from .. import socketio
+    return socketio.server
+
+
+def start_task(target, *args, **kwargs):
+    """Run ``target`` in the background: a green thread under eventlet or gevent,
+    a daemon thread otherwise. The returned task has ``join()``."""
+    server = _server()
+    if server is None:
+        # Outside an app, e.g. in the benchmarks
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+    return server.start_background_task(target, *args, **kwargs)
+
+
+def sleep(seconds):
+    """Sleep without blocking the other tasks of the async mode"""
+    server = _server()
+    if server is None:
+        time.sleep(seconds)
+    else:
+        server.sleep(seconds)
+
+
+# Green threads share one OS thread, which runs one asyncio loop at a time
+_event_loop_lock = threading.Lock()
+
+
+def run_event_loop(main):
+    """``asyncio.run(main)`` in a background task; under eventlet and gevent the
+    loops of concurrent tasks take turns"""
+    if patched_async_mode() == THREADING:
+        return asyncio.run(main)
+    with _event_loop_lock:
+        return asyncio.run(main)
+
+
+def run_in_thread(function, *args):
+    """Call CPU-bound ``function`` in a real thread pool under a green async
+    mode, so the green threads serving requests and polling keep running"""
+    mode = patched_async_mode()
+    if mode == EVENTLET:
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    if mode == GEVENT:
+        import gevent
+        return gevent.get_hub().threadpool.apply(function, args)
+    return function(*args)
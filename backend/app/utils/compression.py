@@ -0,0 +1,151 @@
+from flask import request
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is used when brotli is not installed
+    brotli = None
+
+# Responses that are never compressed: server-sent events must reach the
+# client as they are written, and these are already compressed
+SKIP_MIMETYPES = ('text/event-stream', 'application/gzip', 'application/zip', 'application/octet-stream')
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+ENCODINGS = ('br', 'gzip')
+
+
+def choose_encoding(accept_encodings, use_brotli=True):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    if use_brotli and brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class Compressor:
+    """Incremental gzip or brotli compressor with one interface"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data, encoding, level):
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def iter_compressed(chunks, encoding, level):
+    """Compress a streamed body without holding it in memory"""
+    compressor = Compressor(encoding, level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def init_http_compression(app):
+    """Compress JSON and CSV responses above COMPRESSION_THRESHOLD bytes.
+
+    Buffered bodies are compressed in one go; streamed ones (exports) are
+    compressed chunk by chunk as they are produced.
+    """
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESSION_ENABLED'] or response.status_code not in (200, 201):
+            return response
+        if response.mimetype in SKIP_MIMETYPES or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        if 'Content-Encoding' in response.headers:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings, app.config['COMPRESSION_BROTLI'])
+        if encoding is None:
+            return response
+        level = app.config['BROTLI_QUALITY'] if encoding == 'br' else app.config['GZIP_LEVEL']
+
+        if response.is_streamed:
+            response.response = iter_compressed(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < app.config['COMPRESSION_THRESHOLD']:
+                return response
+            response.set_data(compress(body, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        # A strong validator must differ between content codings
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+
+def install_websocket_compression(socketio, enabled=True, level=zlib.Z_DEFAULT_COMPRESSION, threshold=256):
+    """Control permessage-deflate on the Socket.IO websocket transport.
+
+    The eventlet websocket server negotiates permessage-deflate whenever a
+    browser offers it, compressing every frame at the default level. This
+    replaces its websocket handler with one that refuses the extension
+    when ``enabled`` is false, and otherwise compresses at ``level`` and
+    sends frames shorter than ``threshold`` bytes uncompressed. Other
+    async modes have no permessage-deflate support and are left alone.
+    """
+    if socketio.server is None or socketio.server.eio.async_mode != 'eventlet':
+        return False
+    from engineio.async_drivers.eventlet import WebSocketWSGI
+    from eventlet.websocket import RFC6455WebSocket
+
+    class CompressedWebSocket(RFC6455WebSocket):
+        compress_next = False
+
+        def _get_permessage_deflate_enc(self):
+            if not self.compress_next:
+                return None
+            options = self.extensions['permessage-deflate']
+            if options.get('server_no_context_takeover') or self._deflate_enc is None:
+                compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                              -options.get('server_max_window_bits', zlib.MAX_WBITS))
+                if options.get('server_no_context_takeover'):
+                    return compressor
+                self._deflate_enc = compressor
+            return self._deflate_enc
+
+        def _pack_message(self, message, **kwargs):
+            # Skipping a message is allowed mid-stream: an uncompressed frame
+            # simply has RSV1 clear and leaves the shared context alone
+            self.compress_next = len(message) >= threshold
+            return super()._pack_message(message, **kwargs)
+
+    class CompressionWebSocketWSGI(WebSocketWSGI):
+        def _handle_hybi_request(self, environ):
+            if not enabled:
+                environ.pop('HTTP_SEC_WEBSOCKET_EXTENSIONS', None)
+                return super()._handle_hybi_request(environ)
+            ws = super()._handle_hybi_request(environ)
+            if 'permessage-deflate' in ws.extensions:
+                ws.__class__ = CompressedWebSocket
+            return ws
+
+    # The driver table is shared module state, so replace it on this server only
+    socketio.server.eio._async = dict(socketio.server.eio._async, websocket=CompressionWebSocketWSGI)
+    return True
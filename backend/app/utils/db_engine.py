@@ -0,0 +1,40 @@
+from sqlalchemy.engine import make_url
+import os
+
+# Applied to every new SQLite connection. WAL lets the polling threads
+# write while API requests read, NORMAL sync is safe under WAL, and the
+# larger page cache and mmap keep the register tables in memory.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # KiB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,  # ms
+    'foreign_keys': 'ON'
+}
+
+
+def engine_options(database_uri):
+    """SQLAlchemy engine options for the configured database"""
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        # Connections are shared by the request and polling threads
+        return {'connect_args': {'check_same_thread': False, 'timeout': 5}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Engine 'connect' hook setting SQLITE_PRAGMAS on a new connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
@@ -0,0 +1,362 @@
+import ast
+import numpy as np
+import re
+import threading
+
+# register_area of registers computed from an expression instead of read
+DERIVED = 'derived'
+
+# Inputs are referenced by register id, e.g. "r12 * r13 * sqrt(3) * r14"
+REFERENCE = re.compile(r'r(\d+)$')
+
+# name -> (function, fewest arguments, most arguments or None for any number)
+FUNCTIONS = {
+    'abs': (np.abs, 1, 1),
+    'sqrt': (np.sqrt, 1, 1),
+    'exp': (np.exp, 1, 1),
+    'log': (np.log, 1, 1),
+    'log10': (np.log10, 1, 1),
+    'sin': (np.sin, 1, 1),
+    'cos': (np.cos, 1, 1),
+    'tan': (np.tan, 1, 1),
+    'floor': (np.floor, 1, 1),
+    'ceil': (np.ceil, 1, 1),
+    'round': (np.round, 1, 2),
+    'min': (np.minimum, 2, 2),
+    'max': (np.maximum, 2, 2),
+    'clip': (np.clip, 3, 3),
+    # Variadic, one NumPy call however many registers are totalled
+    'sum': (lambda *values: np.sum(values, axis=0), 1, None),
+    'mean': (lambda *values: np.mean(values, axis=0), 1, None),
+}
+
+# (function, argument index) that NumPy needs as an integer constant, e.g. round(r1, 2)
+INTEGER_ARGUMENTS = {('round', 1)}
+
+CONSTANTS = {
+    'pi': np.pi,
+    'e': np.e,
+}
+
+# Syntax allowed in an expression besides names, calls and constants
+OPERATORS = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Load,
+             ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+             ast.Not, ast.And, ast.Or, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class ExpressionError(ValueError):
+    def __init__(self, message, register_id=None):
+        super().__init__(message)
+        self.register_id = register_id  # The derived register at fault, when known
+
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrite an expression over scalars into NumPy calls over arrays.
+
+    Register references become the parameters ``a0``, ``a1``... in order
+    of first use, so expressions differing only in the registers they read
+    share one template.
+    """
+
+    def __init__(self):
+        self.inputs = []
+
+    def generic_visit(self, node):
+        if not isinstance(node, OPERATORS):
+            raise ExpressionError(f'{type(node).__name__} is not allowed in an expression')
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f'Invalid constant {node.value!r}')
+        return ast.Constant(float(node.value))
+
+    def visit_Name(self, node):
+        match = REFERENCE.match(node.id)
+        if match:
+            register_id = int(match.group(1))
+            if register_id not in self.inputs:
+                self.inputs.append(register_id)
+            return ast.Name(f'a{self.inputs.index(register_id)}', ast.Load())
+        if node.id in CONSTANTS:
+            return ast.Constant(float(CONSTANTS[node.id]))
+        if node.id in ('True', 'False'):
+            return ast.Constant(1.0 if node.id == 'True' else 0.0)
+        raise ExpressionError(f'Unknown name {node.id!r}, reference registers as r<id>')
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ExpressionError(f'Unknown function in {ast.unparse(node)!r}')
+        name = node.func.id
+        _, fewest, most = FUNCTIONS[name]
+        if len(node.args) < fewest or (most is not None and len(node.args) > most):
+            if most is None:
+                expected = f'at least {fewest}'
+            else:
+                expected = f'{fewest}' if fewest == most else f'{fewest} or {most}'
+            plural = 's' if (most or fewest) != 1 else ''
+            raise ExpressionError(f'{name}() takes {expected} argument{plural}, got {len(node.args)}')
+        args = []
+        for index, arg in enumerate(node.args):
+            if (name, index) in INTEGER_ARGUMENTS:
+                args.append(ast.Constant(self._integer(name, arg)))
+            else:
+                args.append(self.visit(arg))
+        return ast.Call(ast.Name(f'_{name}', ast.Load()), args, [])
+
+    def _integer(self, name, node):
+        try:
+            value = ast.literal_eval(node)
+        except ValueError:
+            value = None
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ExpressionError(f'{name}() needs an integer constant, not {ast.unparse(node)!r}')
+        return value
+
+    def visit_BoolOp(self, node):
+        function = '_and' if isinstance(node.op, ast.And) else '_or'
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.Call(ast.Name(function, ast.Load()), [result, value], [])
+        return result
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return ast.Call(ast.Name('_not', ast.Load()), [self.visit(node.operand)], [])
+        return super().generic_visit(node)
+
+    def visit_Compare(self, node):
+        # a < b < c becomes _and(a < b, b < c)
+        left = self.visit(node.left)
+        terms = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if not isinstance(op, OPERATORS):
+                raise ExpressionError(f'{type(op).__name__} is not allowed in an expression')
+            right = self.visit(comparator)
+            terms.append(ast.Compare(left, [op], [right]))
+            left = right
+        result = terms[0]
+        for term in terms[1:]:
+            result = ast.Call(ast.Name('_and', ast.Load()), [result, term], [])
+        return result
+
+    def visit_IfExp(self, node):
+        return ast.Call(ast.Name('_where', ast.Load()),
+                        [self.visit(node.test), self.visit(node.body), self.visit(node.orelse)], [])
+
+
+def parse_expression(expression):
+    """Return (template, input register ids) for an expression.
+
+    The template is the canonical vectorised source with the inputs
+    replaced by parameters; raises ExpressionError if the expression is
+    invalid or reads no register.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except (SyntaxError, ValueError) as e:
+        raise ExpressionError(f'Invalid expression: {e.msg if isinstance(e, SyntaxError) else e}')
+    transformer = _Vectorize()
+    body = transformer.visit(tree.body)
+    if not transformer.inputs:
+        raise ExpressionError('An expression must reference at least one register')
+    return ast.unparse(body), transformer.inputs
+
+
+def rename_inputs(expression, register_ids):
+    """The expression reading register ``register_ids[id]`` wherever it read r<id>"""
+    def rename(match):
+        return f'r{register_ids.get(int(match.group(1)), match.group(1))}'
+    return re.sub(r'\br(\d+)\b', rename, expression)
+
+
+_NAMESPACE = dict({f'_{name}': function for name, (function, _, _) in FUNCTIONS.items()},
+                  _and=np.logical_and, _or=np.logical_or, _not=np.logical_not, _where=np.where,
+                  __builtins__={})
+
+_templates = {}
+
+
+def compile_template(template, arity):
+    """Function evaluating a template on arrays, compiled once per template"""
+    function = _templates.get(template)
+    if function is None:
+        parameters = ', '.join(f'a{index}' for index in range(arity))
+        function = eval(compile(f'lambda {parameters}: {template}', '<expression>', 'eval'), _NAMESPACE)
+        _templates[template] = function
+    return function
+
+
+def dependency_order(tags):
+    """Order {register_id: input ids} so every derived tag follows the derived
+    tags it reads, raising ExpressionError on a cycle. Returns {register_id: level}."""
+    levels = {}
+    visiting = set()
+
+    def level(register_id):
+        if register_id in levels:
+            return levels[register_id]
+        if register_id in visiting:
+            raise ExpressionError(f'Register {register_id} depends on itself', register_id)
+        visiting.add(register_id)
+        levels[register_id] = 1 + max((level(input_id) for input_id in tags[register_id] if input_id in tags),
+                                      default=-1)
+        visiting.discard(register_id)
+        return levels[register_id]
+
+    for register_id in tags:
+        level(register_id)
+    return levels
+
+
+class _Group:
+    """Derived tags of one level sharing a template, evaluated in one call"""
+
+    def __init__(self, template, outputs, inputs):
+        self.outputs = np.asarray(outputs, dtype=np.intp)  # Slots written
+        self.inputs = np.asarray(inputs, dtype=np.intp).reshape(len(outputs), -1)  # Slots read, per row
+        arity = self.inputs.shape[1]
+        self.function = compile_template(template, arity)
+        # A plain total or average of many registers is one reduction over the input matrix
+        parameters = ', '.join(f'a{index}' for index in range(arity))
+        self.reduction = {f'_sum({parameters})': np.sum, f'_mean({parameters})': np.mean}.get(template)
+        self.template = template
+        self.error = None  # Last evaluation error, reported once
+
+    def evaluate(self, matrix):
+        if self.reduction is not None:
+            return self.reduction(matrix, axis=1)
+        return self.function(*matrix.T)
+
+
+class DerivedTags:
+    """Computes derived registers from the latest values of their inputs.
+
+    Tags are compiled into groups of identical templates per dependency
+    level, and the latest value of every register involved is kept in one
+    array. :meth:`update` records a PLC's poll cycle and re-evaluates, level
+    by level, only the rows of each group whose inputs changed, so a tag
+    computed from other PLCs' registers uses their last polled values and
+    unchanged tags cost nothing.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.owners = {}  # Derived register id -> plc id
+        self.metadata = {}  # Derived register id -> caller's data, e.g. name and unit
+        self.slots = {}  # Register id -> index into values
+        self.register_ids = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0)
+        self.stale = np.zeros(0, dtype=bool)  # Derived values to compute whatever changed
+        self.groups = []
+
+    def __len__(self):
+        return len(self.owners)
+
+    def load(self, tags, generation=None, metadata=None):
+        """Compile ``tags``, an iterable of (register_id, plc_id, expression).
+
+        Tags with an invalid expression or in a cycle are skipped. Latest
+        input values are kept, and every tag is computed on the next update.
+        """
+        parsed, owners = {}, {}
+        for register_id, plc_id, expression in tags:
+            try:
+                parsed[register_id] = parse_expression(expression)
+                owners[register_id] = plc_id
+            except ExpressionError as e:
+                print(f"Skipping derived register {register_id}: {str(e)}")
+        while True:
+            try:
+                levels = dependency_order({register_id: inputs for register_id, (_, inputs) in parsed.items()})
+                break
+            except ExpressionError as e:
+                print(f"Skipping derived register {e.register_id}: {str(e)}")
+                parsed.pop(e.register_id)
+                owners.pop(e.register_id)
+
+        involved = sorted(set(parsed) | {input_id for _, inputs in parsed.values() for input_id in inputs})
+        slots = {register_id: index for index, register_id in enumerate(involved)}
+        grouped = {}
+        for register_id, (template, inputs) in parsed.items():
+            rows = grouped.setdefault((levels[register_id], template), ([], []))
+            rows[0].append(slots[register_id])
+            rows[1].extend(slots[input_id] for input_id in inputs)
+
+        with self.lock:
+            values = np.full(len(involved), np.nan)
+            for register_id, slot in slots.items():
+                old = self.slots.get(register_id)
+                if old is not None:
+                    values[slot] = self.values[old]
+            self.groups = [_Group(template, outputs, inputs)
+                           for (_, template), (outputs, inputs) in sorted(grouped.items(), key=lambda item: item[0][0])]
+            self.owners = owners
+            self.metadata = metadata or {}
+            self.slots = slots
+            self.register_ids = np.asarray(involved, dtype=np.int64)
+            self.values = values
+            # Expressions may have changed, so compute every tag once
+            self.stale = np.zeros(len(involved), dtype=bool)
+            self.stale[[slots[register_id] for register_id in owners]] = True
+            self.generation = generation
+
+    def update(self, values):
+        """Record a cycle's {register_id: value} and return the derived values
+        that changed as {plc_id: {register_id: value}}"""
+        if not self.groups:
+            return {}
+        with self.lock:
+            changed = np.zeros(len(self.values), dtype=bool)
+            for register_id, value in values.items():
+                slot = self.slots.get(register_id)
+                if slot is None or register_id in self.owners:
+                    continue
+                value = np.nan if value is None else float(value)
+                if not _same(self.values[slot], value):
+                    self.values[slot] = value
+                    changed[slot] = True
+            if not changed.any() and not self.stale.any():
+                return {}
+
+            updated = []
+            for group in self.groups:
+                dirty = changed[group.inputs].any(axis=1) | self.stale[group.outputs]
+                if not dirty.any():
+                    continue
+                outputs = group.outputs[dirty]
+                # A failing expression only leaves its own tags without a value
+                try:
+                    with np.errstate(all='ignore'):
+                        result = group.evaluate(self.values[group.inputs[dirty]])
+                    result = np.broadcast_to(np.asarray(result, dtype=np.float64), outputs.shape)
+                    group.error = None
+                except Exception as e:
+                    if str(e) != group.error:
+                        print(f"Error computing derived registers {self.register_ids[outputs].tolist()} "
+                              f"({group.template}): {str(e)}")
+                    group.error = str(e)
+                    result = np.full(outputs.shape, np.nan)
+                result = np.where(np.isfinite(result), result, np.nan)
+                moved = ~((self.values[outputs] == result) | (np.isnan(self.values[outputs]) & np.isnan(result)))
+                self.values[outputs] = result
+                self.stale[outputs] = False
+                changed[outputs[moved]] = True
+                updated.append(outputs[moved])
+
+            results = {}
+            for slot in np.concatenate(updated) if updated else ():
+                register_id = int(self.register_ids[slot])
+                value = self.values[slot]
+                results.setdefault(self.owners[register_id], {})[register_id] = (
+                    None if np.isnan(value) else float(value))
+            return results
+
+
+def _same(old, new):
+    return old == new or (old != old and new != new)
+
+
+derived_tags = DerivedTags()
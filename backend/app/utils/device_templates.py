@@ -0,0 +1,136 @@
+from .. import db
+from ..models.plc import Register
+from ..models.template import RegisterOverride
+from .read_planner import plan_reads, plan_registers
+from .poll_tuning import UNTUNED
+from .response_cache import response_cache, TEMPLATES
+import threading
+import types
+import weakref
+
+# Register settings a PLC may override for the registers of its template
+OVERRIDE_FIELDS = ('scaling_factor', 'unit', 'is_monitored', 'min_value', 'max_value')
+
+# Columns a read plan and register_update need
+_POLLED_COLUMNS = ('id', 'name', 'address', 'data_type', 'register_area', 'scaling_factor', 'unit', 'is_monitored',
+                   'min_value', 'max_value')
+
+
+def device_registers(plc_id, template_id):
+    """Criterion selecting a PLC's own registers and those of its template"""
+    if template_id is None:
+        return Register.plc_id == plc_id
+    return (Register.plc_id == plc_id) | (Register.template_id == template_id)
+
+
+def effective_columns(plc_id, columns):
+    """Return (columns, select_from) for selecting ``columns``, a {field:
+    Register column} map, as a PLC sees them: its overrides replace the
+    template's values of OVERRIDE_FIELDS"""
+    select_from = Register.__table__.outerjoin(
+        RegisterOverride.__table__,
+        (RegisterOverride.register_id == Register.id) & (RegisterOverride.plc_id == plc_id))
+    return {
+        name: db.func.coalesce(getattr(RegisterOverride, name), column) if name in OVERRIDE_FIELDS else column
+        for name, column in columns.items()
+    }, select_from
+
+
+class CompiledMap:
+    """A register map compiled for polling: the read plan, whose blocks
+    hold the decoders, and the metadata register_update sends with each value"""
+
+    def __init__(self, registers, tuning=UNTUNED):
+        registers = list(registers)
+        self.tuning = tuning
+        self.plan = plan_reads(registers, **tuning.options())
+        self.metadata = {
+            register.id: {
+                'name': register.name,
+                'unit': register.unit,
+                'min_value': register.min_value,
+                'max_value': register.max_value
+            } for register in registers
+        }
+
+    def extend(self, registers):
+        """A copy with more registers, planned in blocks of their own"""
+        extra = CompiledMap(registers, self.tuning)
+        combined = CompiledMap((), self.tuning)
+        combined.base = self  # Keeps the shared map alive while only extensions of it are in use
+        combined.plan = self.plan + extra.plan
+        combined.metadata = {**self.metadata, **extra.metadata}
+        return combined
+
+    def subset(self, register_ids):
+        """A copy reading only ``register_ids``, planned anew"""
+        subset = CompiledMap((), self.tuning)
+        subset.base = self
+        subset.plan = plan_reads([register for register in plan_registers(self.plan) if register.id in register_ids],
+                                 **self.tuning.options())
+        subset.metadata = {register_id: metadata for register_id, metadata in self.metadata.items()
+                           if register_id in register_ids}
+        return subset
+
+
+class CompiledMaps:
+    """Compiled register maps of the device templates, shared by their PLCs.
+
+    Every PLC linked to a template without overrides polls with the same
+    CompiledMap, as do PLCs with identical overrides, so memory grows with
+    the templates in use rather than with devices times registers. Maps
+    are kept only while a PLC uses them and are recompiled when their
+    template's generation changes.
+    """
+
+    def __init__(self):
+        self.maps = weakref.WeakValueDictionary()  # (template_id, generation, overrides, tuning) -> CompiledMap
+        self.lock = threading.Lock()
+        self.compiled = 0
+
+    def get(self, plc_id, template_id, tuning=UNTUNED):
+        """The map a PLC polls: its template's monitored registers (with its
+        overrides) followed by its own, planned with ``tuning``. Runs in an app context."""
+        columns = [getattr(Register, name) for name in _POLLED_COLUMNS]
+        own = db.session.execute(
+            db.select(*columns).where(Register.plc_id == plc_id, Register.is_monitored.is_(True))
+        ).all()
+        if template_id is None:
+            return CompiledMap(own, tuning)
+        overrides = tuple(db.session.execute(
+            db.select(RegisterOverride.register_id, *[getattr(RegisterOverride, name) for name in OVERRIDE_FIELDS])
+            .where(RegisterOverride.plc_id == plc_id).order_by(RegisterOverride.register_id)
+        ).tuples())
+        shared = self.template_map(template_id, overrides, tuning)
+        return shared.extend(own) if own else shared
+
+    def template_map(self, template_id, overrides=(), tuning=UNTUNED):
+        """The shared map of a template's monitored registers with ``overrides``,
+        sorted (register_id, *OVERRIDE_FIELDS) tuples, planned with ``tuning``"""
+        key = (template_id, response_cache.generation((TEMPLATES, template_id)), overrides, tuning)
+        with self.lock:
+            compiled = self.maps.get(key)
+            if compiled is not None:
+                return compiled
+            by_register = {override[0]: override[1:] for override in overrides}
+            registers = []
+            for row in db.session.execute(
+                    db.select(*[getattr(Register, name) for name in _POLLED_COLUMNS])
+                    .where(Register.template_id == template_id)):
+                register = types.SimpleNamespace(**row._asdict())
+                for name, value in zip(OVERRIDE_FIELDS, by_register.get(register.id, ())):
+                    if value is not None:
+                        setattr(register, name, value)
+                if register.is_monitored:
+                    registers.append(register)
+            compiled = CompiledMap(registers, tuning)
+            self.maps[key] = compiled
+            self.compiled += 1
+            return compiled
+
+    def status(self):
+        with self.lock:
+            return {'shared_maps': len(self.maps), 'compiled_this_run': self.compiled}
+
+
+compiled_maps = CompiledMaps()
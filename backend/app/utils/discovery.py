@@ -0,0 +1,206 @@
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.utilities import computeCRC
+from .modbus_bus import BusManager, bus_key, TCP, RTU_OVER_TCP, RTU
+from .transaction_queue import DISCOVERY
+from .background import start_task, run_event_loop
+import asyncio
+import ipaddress
+import queue
+import struct
+import time
+
+# Largest number of probes a single request may run at once
+MAX_CONCURRENCY = 200
+
+# Largest number of targets a single discovery request may expand to
+MAX_TARGETS = 65536
+
+# Gateway exception codes meaning the gateway answered but the slave did not
+GATEWAY_EXCEPTIONS = (0x0A, 0x0B)
+
+
+class ProbeTarget:
+    """One (address, unit id) pair to probe, optionally tied to a PLC row"""
+
+    def __init__(self, protocol, ip_address, port, unit_id, plc_id=None, plc=None):
+        self.protocol = protocol or TCP
+        self.ip_address = ip_address
+        self.port = port
+        self.unit_id = unit_id
+        self.plc_id = plc_id
+        self.plc = plc
+
+    @classmethod
+    def from_plc(cls, plc):
+        return cls(plc.protocol, plc.ip_address, plc.port, plc.unit_id, plc.id, plc)
+
+    @property
+    def bus(self):
+        if self.protocol == RTU:
+            return bus_key(self.plc)
+        return (self.protocol, self.ip_address, self.port)
+
+
+def parse_ip_range(ip_range):
+    """Expand 'a.b.c.d', 'a.b.c.d-a.b.c.e', 'a.b.c.d-e' or a CIDR block to addresses"""
+    ip_range = ip_range.strip()
+    if '/' in ip_range:
+        network = ipaddress.ip_network(ip_range, strict=False)
+        hosts = list(network.hosts()) or [network.network_address]
+        return [str(ip) for ip in hosts]
+    if '-' in ip_range:
+        start, end = (part.strip() for part in ip_range.split('-', 1))
+        first = ipaddress.ip_address(start)
+        if '.' not in end:
+            end = start.rsplit('.', 1)[0] + '.' + end
+        last = ipaddress.ip_address(end)
+        if last < first:
+            raise ValueError(f'Invalid IP range {ip_range!r}')
+        return [str(ipaddress.ip_address(ip)) for ip in range(int(first), int(last) + 1)]
+    return [str(ipaddress.ip_address(ip_range))]
+
+
+def parse_unit_ids(unit_ids):
+    """Accept a list of ids, a single id or a 'first-last' string"""
+    if isinstance(unit_ids, (list, tuple)):
+        ids = [int(unit_id) for unit_id in unit_ids]
+    elif isinstance(unit_ids, str) and '-' in unit_ids:
+        first, last = (int(part) for part in unit_ids.split('-', 1))
+        ids = list(range(first, last + 1))
+    else:
+        ids = [int(unit_ids)]
+    if any(unit_id < 0 or unit_id > 255 for unit_id in ids):
+        raise ValueError('Unit ids must be between 0 and 255')
+    return ids
+
+
+def _request_frame(protocol, unit_id, transaction_id):
+    # Read one holding register at address 0; any well-formed answer,
+    # including an exception, proves the slave is alive
+    pdu = struct.pack('>BHH', 3, 0, 1)
+    if protocol == RTU_OVER_TCP:
+        body = bytes([unit_id]) + pdu
+        return body + struct.pack('>H', computeCRC(body))
+    return struct.pack('>HHHB', transaction_id, 0, len(pdu) + 1, unit_id) + pdu
+
+
+def _parse_response(protocol, data):
+    """Return (alive, detail) for a probe response"""
+    if protocol == RTU_OVER_TCP:
+        if len(data) < 5 or computeCRC(data[:-2]) != struct.unpack('>H', data[-2:])[0]:
+            return False, 'invalid response'
+        function_code, code = data[1], data[2]
+    else:
+        if len(data) < 9:
+            return False, 'invalid response'
+        function_code, code = data[7], data[8]
+    if function_code & 0x80:
+        if code in GATEWAY_EXCEPTIONS:
+            return False, f'gateway exception {code:#04x}'
+        return True, f'exception {code:#04x}'
+    return True, 'ok'
+
+
+async def _probe_tcp(target, timeout):
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(target.ip_address, target.port), timeout)
+        writer.write(_request_frame(target.protocol, target.unit_id, target.unit_id))
+        await writer.drain()
+        if target.protocol == RTU_OVER_TCP:
+            # No length prefix on RTU frames: the shortest answer is 5 bytes
+            data = await asyncio.wait_for(reader.read(256), timeout)
+        else:
+            header = await asyncio.wait_for(reader.readexactly(6), timeout)
+            length = struct.unpack('>H', header[4:6])[0]
+            data = header + await asyncio.wait_for(reader.readexactly(length), timeout)
+        return _parse_response(target.protocol, data)
+    except asyncio.TimeoutError:
+        return False, 'timeout'
+    except (OSError, asyncio.IncompleteReadError) as e:
+        return False, str(e) or e.__class__.__name__
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _probe_bus(target):
+    """Probe through the bus of the target's serial line, or of its gateway or
+    PLC if one is open, so the probe is queued behind polling at the
+    DISCOVERY class instead of opening a connection of its own. Returns None
+    for a gateway or PLC without a bus."""
+    manager = BusManager()
+    with manager.using(target.plc) if target.protocol == RTU else manager.existing(target.bus) as bus:
+        if bus is None:
+            return None
+        try:
+            with bus.transaction(DISCOVERY) as client:
+                response = client.read_holding_registers(0, 1, slave=target.unit_id)
+        except Exception as e:
+            return False, str(e)
+    if response is None:
+        return False, 'no response'
+    if isinstance(response, ExceptionResponse):
+        if response.exception_code in GATEWAY_EXCEPTIONS:
+            return False, f'gateway exception {response.exception_code:#04x}'
+        return True, f'exception {response.exception_code:#04x}'
+    if response.isError():
+        return False, str(response)
+    return True, 'ok'
+
+
+async def probe_targets(targets, concurrency=50, timeout=2.0):
+    """Probe targets with a bounded pool, yielding result dicts as they complete.
+
+    Units behind one gateway or serial line are probed one at a time so
+    discovery never puts two frames on the same bus at once, and through
+    the bus polling them if there is one, see _probe_bus.
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, MAX_CONCURRENCY)))
+    bus_locks = {}
+    loop = asyncio.get_running_loop()
+
+    async def probe(target):
+        lock = bus_locks.setdefault(target.bus, asyncio.Lock())
+        async with semaphore, lock:
+            started = time.monotonic()
+            result = None
+            if target.protocol == RTU or target.bus in BusManager().buses:
+                result = await loop.run_in_executor(None, _probe_bus, target)
+            alive, detail = result if result is not None else await _probe_tcp(target, timeout)
+            return {
+                'plc_id': target.plc_id,
+                'protocol': target.protocol,
+                'ip_address': target.ip_address,
+                'port': target.port,
+                'unit_id': target.unit_id,
+                'connected': alive,
+                'detail': detail,
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+            }
+
+    for result in asyncio.as_completed([probe(target) for target in targets]):
+        yield await result
+
+
+def iter_probe_results(targets, concurrency=50, timeout=2.0):
+    """Run probe_targets on a private event loop and yield its results synchronously"""
+    results = queue.Queue()
+    done = object()
+
+    def run():
+        async def collect():
+            async for result in probe_targets(targets, concurrency, timeout):
+                results.put(result)
+        try:
+            run_event_loop(collect())
+        finally:
+            results.put(done)
+
+    start_task(run)
+    while True:
+        result = results.get()
+        if result is done:
+            break
+        yield result
@@ -0,0 +1,444 @@
+from .. import db
+from ..models.history import HistoryChunk
+from ..models.plc import PLC, Register
+from .response_cache import response_cache, REGISTERS
+from .background import start_task
+import atexit
+import numpy as np
+import threading
+import time
+
+# One archived point as stored in a history chunk: 16 bytes, little-endian
+POINT = np.dtype([('timestamp', '<f8'), ('value', '<f8')])
+
+# Per-register compressor state, one array each
+_STATE = ('deadband', 'deviation', 'archived_time', 'archived_value', 'snapshot_time', 'snapshot_value',
+          'exception_time', 'exception_value', 'last_time', 'last_value', 'upper', 'lower')
+
+
+def validate_compression(deadband, deviation):
+    """Return an error message if a register's compression settings are invalid, else None"""
+    for name, value in (('history_deadband', deadband), ('history_deviation', deviation)):
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value < float('inf'):
+            return f'{name} must be a non-negative number'
+    return None
+
+
+def encode_points(timestamps, values):
+    points = np.empty(len(timestamps), dtype=POINT)
+    points['timestamp'] = timestamps
+    points['value'] = values
+    return points.tobytes()
+
+
+def decode_points(data):
+    return np.frombuffer(data, dtype=POINT)
+
+
+def interpolate(points, at, hold=False):
+    """Values of archived ``points`` at the timestamps ``at``.
+
+    Linear between the surrounding points, or the previous point's value
+    with ``hold`` (for booleans and states); NaN outside the points.
+    """
+    at = np.asarray(at, dtype=np.float64)
+    if not len(points):
+        return np.full(len(at), np.nan)
+    timestamps, values = points['timestamp'], points['value']
+    if not hold:
+        return np.interp(at, timestamps, values, left=np.nan, right=np.nan)
+    index = np.searchsorted(timestamps, at, side='right') - 1
+    result = values[np.maximum(index, 0)].astype(np.float64)
+    result[(index < 0) | (at > timestamps[-1])] = np.nan
+    return result
+
+
+class SwingingDoor:
+    """Exception deadband and swinging-door compression for many registers.
+
+    The exception stage drops a value unless it moved more than the
+    register's ``deadband`` from the last value passed on, or
+    ``max_interval`` seconds went by; when a value passes after others were
+    dropped the last dropped one is passed first, so a step after a flat
+    stretch stays a step. The compression stage (swinging door) extends the
+    line from the last archived point to each new value while that line
+    stays within ``deviation`` of every value passed since; otherwise the
+    previous value is archived and starts the next line. Interpolating the
+    archived points is then within ``deviation`` of every value passed on,
+    and within ``2 * deadband + deviation`` of every value received. Both at 0,
+    only repeated and collinear values are dropped.
+
+    All registers are held in parallel arrays, so a poll cycle is
+    compressed with a fixed number of NumPy operations. A template's
+    register is compressed separately for each PLC polling it.
+    """
+
+    def __init__(self, max_interval=3600.0):
+        self.max_interval = max_interval
+        self.slots = {}  # (plc_id, register_id) -> index into the state arrays
+        self.register_ids = np.zeros(0, dtype=np.int64)
+        self.settings = {}  # Register id -> (deadband, deviation)
+        self.state = {name: np.zeros(0) for name in _STATE}
+        self.skipped = np.zeros(0, dtype=bool)  # The last value was dropped by the exception stage
+
+    def configure(self, settings):
+        """Apply {register_id: (deadband, deviation)}; other registers use 0 and 0"""
+        self.settings = settings
+        for (_, register_id), slot in self.slots.items():
+            self.state['deadband'][slot], self.state['deviation'][slot] = settings.get(register_id, (0.0, 0.0))
+
+    def _rows(self, plc_id, register_ids):
+        new = [register_id for register_id in register_ids if (plc_id, register_id) not in self.slots]
+        if new:
+            size = len(self.slots)
+            for offset, register_id in enumerate(new):
+                self.slots[plc_id, register_id] = size + offset
+            self.register_ids = np.concatenate((self.register_ids, np.asarray(new, dtype=np.int64)))
+            settings = [self.settings.get(register_id, (0.0, 0.0)) for register_id in new]
+            initial = {
+                'deadband': [deadband for deadband, _ in settings],
+                'deviation': [deviation for _, deviation in settings],
+                'upper': np.inf,
+                'lower': -np.inf,
+            }
+            for name in _STATE:
+                self.state[name] = np.concatenate((self.state[name], np.broadcast_to(
+                    np.asarray(initial.get(name, np.nan), dtype=np.float64), (len(new),))))
+            self.skipped = np.concatenate((self.skipped, np.zeros(len(new), dtype=bool)))
+        return np.fromiter((self.slots[plc_id, register_id] for register_id in register_ids), dtype=np.intp,
+                           count=len(register_ids))
+
+    def add(self, plc_id, values, timestamp):
+        """Compress one cycle's {register_id: value} of a PLC; returns the
+        archived points as (register ids, timestamps, values) arrays"""
+        register_ids = [register_id for register_id, value in values.items() if value is not None]
+        if not register_ids:
+            return _empty()
+        rows = self._rows(plc_id, register_ids)
+        value = np.fromiter((values[register_id] for register_id in register_ids), dtype=np.float64,
+                            count=len(register_ids))
+        state = self.state
+
+        passed = (np.isnan(state['exception_time'][rows])
+                  | (np.abs(value - state['exception_value'][rows]) > state['deadband'][rows])
+                  | (timestamp - state['exception_time'][rows] >= self.max_interval))
+        archived = []
+        held = rows[passed & self.skipped[rows]]
+        if len(held):
+            archived.append(self._door(held, state['last_time'][held], state['last_value'][held]))
+        if passed.any():
+            archived.append(self._door(rows[passed], np.full(int(passed.sum()), timestamp), value[passed]))
+            state['exception_time'][rows[passed]] = timestamp
+            state['exception_value'][rows[passed]] = value[passed]
+        state['last_time'][rows] = timestamp
+        state['last_value'][rows] = value
+        self.skipped[rows] = ~passed
+        if not archived:
+            return _empty()
+        slots, timestamps, values = (np.concatenate(parts) for parts in zip(*archived))
+        return self.register_ids[slots], timestamps, values
+
+    def _door(self, rows, timestamps, values):
+        state = self.state
+        fresh = np.isnan(state['archived_time'][rows])
+        archived = [(rows[fresh], timestamps[fresh], values[fresh])]
+        first = rows[fresh]
+        state['archived_time'][first] = timestamps[fresh]
+        state['archived_value'][first] = values[fresh]
+        state['snapshot_time'][first] = np.nan
+        state['upper'][first] = np.inf
+        state['lower'][first] = -np.inf
+
+        rows, timestamps, values = rows[~fresh], timestamps[~fresh], values[~fresh]
+        deviation = state['deviation'][rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            elapsed = timestamps - state['archived_time'][rows]
+            slope = (values - state['archived_value'][rows]) / elapsed
+            # upper/lower bound the slopes of lines from the archived point passing within deviation
+            # of every point since; the tolerance keeps rounding from splitting a straight line
+            tolerance = 1e-9 * (np.abs(slope) + 1.0)
+            close = ~np.isnan(state['snapshot_time'][rows]) & (
+                (slope > state['upper'][rows] + tolerance) | (slope < state['lower'][rows] - tolerance)
+                | (elapsed > self.max_interval))
+            if close.any():
+                closed = rows[close]
+                archived.append((closed, state['snapshot_time'][closed], state['snapshot_value'][closed]))
+                state['archived_time'][closed] = state['snapshot_time'][closed]
+                state['archived_value'][closed] = state['snapshot_value'][closed]
+                state['upper'][closed] = np.inf
+                state['lower'][closed] = -np.inf
+                elapsed[close] = timestamps[close] - state['archived_time'][closed]
+            # The new point lies between the archived point and any later one
+            state['upper'][rows] = np.minimum(
+                state['upper'][rows], (values + deviation - state['archived_value'][rows]) / elapsed)
+            state['lower'][rows] = np.maximum(
+                state['lower'][rows], (values - deviation - state['archived_value'][rows]) / elapsed)
+        state['snapshot_time'][rows] = timestamps
+        state['snapshot_value'][rows] = values
+        return tuple(np.concatenate(parts) for parts in zip(*archived))
+
+    def tail(self, plc_id, register_id):
+        """Points received for a PLC's register but not archived yet, oldest first"""
+        slot = self.slots.get((plc_id, register_id))
+        if slot is None:
+            return []
+        state = self.state
+        points = []
+        if state['snapshot_time'][slot] > state['archived_time'][slot]:
+            points.append((float(state['snapshot_time'][slot]), float(state['snapshot_value'][slot])))
+        if self.skipped[slot]:
+            points.append((float(state['last_time'][slot]), float(state['last_value'][slot])))
+        return points
+
+    def drain(self):
+        """Archive every register's tail, e.g. before shutting down; returns
+        (plc ids, register ids, timestamps, values) arrays"""
+        plc_ids, register_ids, timestamps, values = [], [], [], []
+        for plc_id, register_id in self.slots:
+            for timestamp, value in self.tail(plc_id, register_id):
+                plc_ids.append(plc_id)
+                register_ids.append(register_id)
+                timestamps.append(timestamp)
+                values.append(value)
+        self.slots = {}
+        self.register_ids = np.zeros(0, dtype=np.int64)
+        self.state = {name: np.zeros(0) for name in _STATE}
+        self.skipped = np.zeros(0, dtype=bool)
+        return (np.asarray(plc_ids, dtype=np.int64), np.asarray(register_ids, dtype=np.int64),
+                np.asarray(timestamps), np.asarray(values))
+
+
+def _empty():
+    return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+
+class Historian:
+    """Compresses polled and derived values and stores them as history chunks.
+
+    Archived points are buffered in memory and written every
+    ``flush_interval`` seconds by a background task, one HistoryChunk row
+    per PLC and register; runs of small chunks are merged into chunks of up to
+    ``chunk_points`` points every ``compact_interval`` seconds. Queries
+    combine stored chunks with the points not written yet.
+    """
+
+    def __init__(self, app, max_interval=3600.0, chunk_points=1024, flush_interval=60.0, compact_interval=3600.0):
+        self.app = app
+        self.compressor = SwingingDoor(max_interval)
+        self.chunk_points = chunk_points
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.pending = {}  # (plc_id, register_id) -> [(timestamp, value)] archived but not written
+        self.received = 0
+        self.archived = 0
+        self.written = 0
+        self.last_error = None
+        self.settings_generation = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def store(self, plc_id, values, timestamp):
+        """Compress one cycle's {register_id: value} of a PLC"""
+        with self.lock:
+            register_ids, timestamps, archived = self.compressor.add(plc_id, values, timestamp)
+            self.received += len(values)
+            self.archived += len(register_ids)
+            for register_id, point_time, value in zip(register_ids.tolist(), timestamps.tolist(), archived.tolist()):
+                self.pending.setdefault((plc_id, register_id), []).append((point_time, value))
+
+    def start(self):
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = start_task(self._run)
+
+    def stop(self):
+        """Archive every register's latest value and write everything out"""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            for plc_id, register_id, point_time, value in zip(*(part.tolist() for part in self.compressor.drain())):
+                self.pending.setdefault((plc_id, register_id), []).append((point_time, value))
+        with self.app.app_context():
+            self.flush()
+
+    def _run(self):
+        last_flush = last_compact = time.monotonic()
+        while not self.stopping.wait(1.0):
+            try:
+                with self.app.app_context():
+                    self.load_settings()
+                    if time.monotonic() - last_flush >= self.flush_interval:
+                        last_flush = time.monotonic()
+                        self.flush()
+                    if time.monotonic() - last_compact >= self.compact_interval:
+                        last_compact = time.monotonic()
+                        self.compact()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error writing history: {str(e)}")
+
+    def load_settings(self):
+        """Reload the registers' deadband and deviation after a register change"""
+        generation = response_cache.generation(REGISTERS)
+        if generation == self.settings_generation:
+            return
+        rows = db.session.execute(
+            db.select(Register.id, Register.data_type, Register.history_deadband, Register.history_deviation)
+            .where((Register.history_deadband.isnot(None)) | (Register.history_deviation.isnot(None)))
+        ).all()
+        # Booleans are read back as steps, which a swinging door line would not match
+        settings = {row.id: (row.history_deadband or 0.0,
+                             0.0 if row.data_type == 'bool' else row.history_deviation or 0.0) for row in rows}
+        with self.lock:
+            self.compressor.configure(settings)
+        self.settings_generation = generation
+
+    def flush(self):
+        """Write the pending points, one chunk row per PLC and register"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        # PLCs and registers deleted since their points were archived
+        existing_registers = set(db.session.execute(
+            db.select(Register.id).where(Register.id.in_({register_id for _, register_id in pending}))
+        ).scalars())
+        existing_plcs = set(db.session.execute(
+            db.select(PLC.id).where(PLC.id.in_({plc_id for plc_id, _ in pending}))
+        ).scalars())
+        rows = []
+        for (plc_id, register_id), points in pending.items():
+            if register_id not in existing_registers or plc_id not in existing_plcs:
+                continue
+            for start in range(0, len(points), self.chunk_points):
+                timestamps, values = zip(*points[start:start + self.chunk_points])
+                rows.append({
+                    'plc_id': plc_id,
+                    'register_id': register_id,
+                    'start_time': timestamps[0],
+                    'end_time': timestamps[-1],
+                    'count': len(timestamps),
+                    'points': encode_points(timestamps, values)
+                })
+        try:
+            if rows:
+                db.session.execute(db.insert(HistoryChunk), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self.lock:
+                # Keep the points for the next attempt, ahead of newer ones
+                for key, points in pending.items():
+                    self.pending[key] = points + self.pending.get(key, [])
+            raise
+        self.written += sum(row['count'] for row in rows)
+
+    def compact(self):
+        """Merge each register's runs of consecutive small chunks"""
+        keys = db.session.execute(
+            db.select(HistoryChunk.plc_id, HistoryChunk.register_id).where(HistoryChunk.count < self.chunk_points)
+            .group_by(HistoryChunk.plc_id, HistoryChunk.register_id).having(db.func.count() > 1)
+        ).all()
+        for plc_id, register_id in keys:
+            # Find the runs without loading any points, most chunks being full
+            chunks = db.session.execute(
+                db.select(HistoryChunk.id, HistoryChunk.count)
+                .where(HistoryChunk.plc_id == plc_id, HistoryChunk.register_id == register_id)
+                .order_by(HistoryChunk.start_time)
+            ).all()
+            runs, run = [], []
+            for chunk in chunks:
+                if chunk.count >= self.chunk_points:
+                    runs.append(run)
+                    run = []
+                else:
+                    run.append(chunk)
+            runs.append(run)
+            for run in runs:
+                if len(run) < 2:
+                    continue
+                ids = [chunk.id for chunk in run]
+                points = np.concatenate([decode_points(blob) for blob in db.session.execute(
+                    db.select(HistoryChunk.points).where(HistoryChunk.id.in_(ids)).order_by(HistoryChunk.start_time)
+                ).scalars()])
+                db.session.execute(db.delete(HistoryChunk).where(HistoryChunk.id.in_(ids)))
+                db.session.execute(db.insert(HistoryChunk), [{
+                    'plc_id': plc_id,
+                    'register_id': register_id,
+                    'start_time': float(part['timestamp'][0]),
+                    'end_time': float(part['timestamp'][-1]),
+                    'count': len(part),
+                    'points': part.tobytes()
+                } for part in np.array_split(points, -(-len(points) // self.chunk_points))])
+            db.session.commit()
+
+    def iter_points(self, plc_id, register_id, start, end, yield_per=64):
+        """Yield arrays of a PLC's register's archived points in time order, a chunk
+        at a time, from the chunk holding the last point before ``start`` to
+        the one holding the first point after ``end``, then those not written
+        yet. Memory use does not depend on the time range."""
+        chunk = HistoryChunk.__table__.c
+        first = db.session.execute(
+            db.select(db.func.max(chunk.start_time))
+            .where(chunk.plc_id == plc_id, chunk.register_id == register_id, chunk.start_time < start)
+        ).scalar()
+        query = db.select(chunk.end_time, chunk.points).where(chunk.plc_id == plc_id, chunk.register_id == register_id)
+        if first is not None:
+            query = query.where(chunk.start_time >= first)
+        rows = db.session.execute(query.order_by(chunk.start_time).execution_options(yield_per=yield_per))
+        for row in rows:
+            yield decode_points(row.points)
+            if row.end_time > end:
+                rows.close()
+                return
+        with self.lock:
+            recent = self.pending.get((plc_id, register_id), []) + self.compressor.tail(plc_id, register_id)
+        if recent:
+            yield np.array(recent, dtype=POINT)
+
+    def points(self, plc_id, register_id, start, end):
+        """Archived points of a PLC's register from the last one before ``start``
+        to the first one after ``end``, including those not written yet"""
+        parts = list(self.iter_points(plc_id, register_id, start, end))
+        if not parts:
+            return np.zeros(0, dtype=POINT)
+        points = np.concatenate(parts)
+        timestamps = points['timestamp']
+        first = max(np.searchsorted(timestamps, start, side='left') - 1, 0)
+        last = np.searchsorted(timestamps, end, side='right') + 1
+        return points[first:last]
+
+    def status(self):
+        with self.lock:
+            pending = sum(len(points) for points in self.pending.values())
+        return {
+            'registers': len(self.compressor.slots),
+            'received_this_run': self.received,
+            'archived_this_run': self.archived,
+            'written_this_run': self.written,
+            'pending': pending,
+            'compression_ratio': round(self.received / self.archived, 1) if self.archived else None,
+            'last_error': self.last_error
+        }
+
+
+def init_historian(app):
+    """Start the historian unless HISTORIAN_ENABLED is off"""
+    if not app.config['HISTORIAN_ENABLED']:
+        return None
+    historian = Historian(
+        app,
+        max_interval=app.config['HISTORIAN_MAX_INTERVAL'],
+        chunk_points=app.config['HISTORIAN_CHUNK_POINTS'],
+        flush_interval=app.config['HISTORIAN_FLUSH_INTERVAL']
+    )
+    historian.start()
+    atexit.register(historian.stop)
+    app.extensions['historian'] = historian
+    return historian
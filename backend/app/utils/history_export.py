@@ -0,0 +1,191 @@
+from .historian import interpolate
+import functools
+import importlib.util
+import numpy as np
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Rows per Arrow record batch or Parquet row group, which bounds an export's memory use
+BATCH_ROWS = 262144
+
+
+
+@functools.lru_cache(maxsize=None)
+def _arrow():
+    """(pyarrow, pyarrow.parquet, schema of an export), imported on the first
+    Arrow or Parquet export as importing pyarrow slows down startup"""
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('plc_id', pa.int32()),
+        ('register_id', pa.int32()),
+        ('value', pa.float64()),
+    ])
+    return pa, pq, schema
+
+
+def available_formats():
+    # Optional: only CSV exports are available without pyarrow
+    installed = importlib.util.find_spec('pyarrow') is not None
+    return tuple(name for name in FORMATS if installed or name == 'csv')
+
+
+def iter_samples(historian, registers, start, end, step=None, batch_rows=BATCH_ROWS):
+    """Yield (plc_ids, register_ids, timestamps, values) column batches of
+    about ``batch_rows`` rows for ``registers``, a list of (register_id,
+    plc_id, hold), one register after the other.
+
+    Without ``step`` these are the archived points between ``start`` and
+    ``end``; with it, the values interpolated every ``step`` seconds from
+    ``start`` wherever the register has history.
+    """
+    buffer, size = [], 0
+    for register_id, plc_id, hold in registers:
+        points = historian.iter_points(plc_id, register_id, start, end)
+        if step is None:
+            pieces = _archived(points, start, end)
+        else:
+            pieces = _resampled(points, start, end, step, hold, batch_rows)
+        for timestamps, values in pieces:
+            if not len(timestamps):
+                continue
+            buffer.append((plc_id, register_id, timestamps, values))
+            size += len(timestamps)
+            if size >= batch_rows:
+                yield _columns(buffer)
+                buffer, size = [], 0
+    if buffer:
+        yield _columns(buffer)
+
+
+def _archived(points, start, end):
+    for part in points:
+        timestamps = part['timestamp']
+        inside = (timestamps >= start) & (timestamps <= end)
+        yield timestamps[inside], part['value'][inside]
+
+
+def _resampled(points, start, end, step, hold, batch_rows):
+    count = int((end - start) // step) + 1
+    index = 0
+    previous = None
+    for part in points:
+        # Carry the previous chunk's last point so the grid interpolates across chunk boundaries
+        if previous is not None:
+            part = np.concatenate((previous, part))
+        previous = part[-1:]
+        # Grid times up to the newest point so far
+        stop = min(count, int((part['timestamp'][-1] - start) // step) + 1)
+        while index < stop:
+            upto = min(stop, index + batch_rows)
+            timestamps = start + step * np.arange(index, upto)
+            values = interpolate(part, timestamps, hold=hold)
+            known = ~np.isnan(values)
+            yield timestamps[known], values[known]
+            index = upto
+        if index >= count:
+            return
+
+
+def _columns(buffer):
+    return (
+        np.concatenate([np.full(len(timestamps), plc_id, dtype=np.int32) for plc_id, _, timestamps, _ in buffer]),
+        np.concatenate([np.full(len(timestamps), register_id, dtype=np.int32)
+                        for _, register_id, timestamps, _ in buffer]),
+        np.concatenate([timestamps for _, _, timestamps, _ in buffer]),
+        np.concatenate([values for _, _, _, values in buffer]),
+    )
+
+
+def iter_csv(batches, rows=16384):
+    yield 'timestamp,plc_id,register_id,value\n'
+    for plc_ids, register_ids, timestamps, values in batches:
+        # Text is several times larger than the columns, so format a slice at a time
+        for first in range(0, len(timestamps), rows):
+            part = slice(first, first + rows)
+            times = np.datetime_as_string(np.round(timestamps[part] * 1e6).astype('datetime64[us]'), unit='us',
+                                          timezone='UTC')
+            yield ''.join(f'{time},{plc_id},{register_id},{value!r}\n' for time, plc_id, register_id, value in zip(
+                times.tolist(), plc_ids[part].tolist(), register_ids[part].tolist(), values[part].tolist()))
+
+
+class _Sink:
+    """Write-only file collecting what a pyarrow writer produces until drained"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _record_batch(columns):
+    pa, _, schema = _arrow()
+    plc_ids, register_ids, timestamps, values = columns
+    return pa.record_batch([
+        pa.array(np.round(timestamps * 1e6).astype(np.int64), type=schema.field('timestamp').type),
+        pa.array(plc_ids),
+        pa.array(register_ids),
+        pa.array(values),
+    ], schema=schema)
+
+
+def iter_arrow(batches, compression='zstd'):
+    """Stream batches as an Arrow IPC stream, one record batch at a time"""
+    pa, _, schema = _arrow()
+    sink = _Sink()
+    writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+    for columns in batches:
+        writer.write_batch(_record_batch(columns))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(batches, compression='zstd'):
+    """Stream batches as a Parquet file, one row group per batch"""
+    _, pq, schema = _arrow()
+    sink = _Sink()
+    # Dictionary-encoding timestamps and values is costly and rarely pays off; ids compress to almost nothing
+    writer = pq.ParquetWriter(sink, schema, compression=compression, use_dictionary=['plc_id', 'register_id'],
+                              column_encoding={'timestamp': 'DELTA_BINARY_PACKED'})
+    for columns in batches:
+        writer.write_batch(_record_batch(columns))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'parquet': iter_parquet,
+    'arrow': iter_arrow,
+    'csv': iter_csv,
+}
@@ -0,0 +1,78 @@
+from flask import jsonify, request
+from sqlalchemy import select
+from urllib.parse import urlencode
+
+# Largest page a list request may ask for
+MAX_PAGE_SIZE = 1000
+
+
+class ListingError(ValueError):
+    pass
+
+
+def parse_fields(columns, default=None):
+    """Columns named by the request's ``fields=`` list, else the ``default`` names (or all).
+
+    ``columns`` maps field names to model columns. The id is always
+    selected because it is the pagination key.
+    """
+    requested = request.args.get('fields')
+    if not requested:
+        return {name: columns[name] for name in default or columns}
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ListingError(f'Unknown fields: {", ".join(unknown)}')
+    return {name: columns[name] for name in ['id'] + [name for name in names if name != 'id']}
+
+
+def parse_page():
+    """Read ``after`` (the last id seen) and ``limit`` from the query string.
+
+    Without ``limit`` the whole list is returned, as before pagination.
+    """
+    try:
+        after = int(request.args['after']) if 'after' in request.args else None
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        raise ListingError('after and limit must be integers')
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ListingError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return after, limit
+
+
+def fetch_page(session, columns, id_column, *criteria, select_from=None):
+    """Run a column-only keyset-paginated SELECT, returning (rows, next_cursor).
+
+    Rows are plain dicts keyed by field name, so no ORM objects are built.
+    Pages are ordered by id and ``after`` continues from the last id of the
+    previous page, which stays stable while rows are added or deleted.
+    """
+    after, limit = parse_page()
+    query = select(*(column.label(name) for name, column in columns.items()))
+    if select_from is not None:
+        query = query.select_from(select_from)
+    query = query.where(*criteria)
+    if after is not None:
+        query = query.where(id_column > after)
+    query = query.order_by(id_column)
+    if limit is not None:
+        # One extra row tells whether another page follows
+        query = query.limit(limit + 1)
+    rows = [dict(row) for row in session.execute(query).mappings()]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['id']
+    return rows, next_cursor
+
+
+def page_response(rows, next_cursor):
+    """JSON array response carrying the next page's cursor in headers"""
+    response = jsonify(rows)
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
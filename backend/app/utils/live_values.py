@@ -0,0 +1,199 @@
+from .read_planner import BIT_AREAS
+import numpy as np
+import threading
+
+
+class LatestValues:
+    """Last value and time of every polled or derived register, by PLC.
+
+    Written by the polling threads on each cycle and read by the API, so a
+    request for current values never has to contact a device.
+    """
+
+    def __init__(self):
+        self.plcs = {}  # plc_id -> {register_id: (value, timestamp)}
+        self.updates = 0  # Tells a snapshot writer whether anything changed
+        self.lock = threading.Lock()
+
+    def update(self, plc_id, values, timestamp):
+        with self.lock:
+            self.updates += 1
+            latest = self.plcs.setdefault(plc_id, {})
+            for register_id, value in values.items():
+                if value is not None:
+                    latest[register_id] = (value, timestamp)
+
+    def get(self, plc_id):
+        """Copy of {register_id: (value, timestamp)} for a PLC"""
+        with self.lock:
+            return dict(self.plcs.get(plc_id, {}))
+
+    def copy(self):
+        """Copy of every PLC's {register_id: (value, timestamp)}"""
+        with self.lock:
+            return {plc_id: dict(latest) for plc_id, latest in self.plcs.items()}
+
+    def seed(self, plcs):
+        """Fill in values of {plc_id: {register_id: (value, timestamp)}} from an
+        earlier run, keeping any newer ones already polled"""
+        with self.lock:
+            for plc_id, values in plcs.items():
+                latest = self.plcs.setdefault(plc_id, {})
+                for register_id, (value, timestamp) in values.items():
+                    if register_id not in latest or latest[register_id][1] < timestamp:
+                        latest[register_id] = (value, timestamp)
+
+    def forget(self, plc_id, register_ids=None):
+        """Drop a PLC's values, or only those of ``register_ids``"""
+        with self.lock:
+            if register_ids is None:
+                self.plcs.pop(plc_id, None)
+            elif plc_id in self.plcs:
+                for register_id in register_ids:
+                    self.plcs[plc_id].pop(register_id, None)
+
+
+class RegisterImages:
+    """The raw words, or bits, of every block the pollers last read, by PLC
+    and register area, with the time each was read.
+
+    What a device answered at its addresses, whatever registers are defined
+    there, so the Modbus gateway can answer reads word for word without
+    contacting the device.
+    """
+
+    def __init__(self):
+        self.areas = {}  # (plc_id, area) -> {start address: (values, timestamp)}
+        self.lock = threading.Lock()
+
+    def update(self, plc_id, block, response, timestamp):
+        if response is None or response.isError():
+            return
+        values = response.bits[:block.count] if block.area in BIT_AREAS else list(response.registers)
+        with self.lock:
+            self.areas.setdefault((plc_id, block.area), {})[block.start] = (values, timestamp)
+
+    def read(self, plc_id, area, address, count):
+        """The ``count`` values from ``address`` and the time of the oldest
+        read they came from, or None unless every address was read"""
+        values = [None] * count
+        missing = count
+        oldest = None
+        with self.lock:
+            blocks = self.areas.get((plc_id, area), {})
+            # Newest reads first, where blocks of an earlier plan overlap the current one's
+            for start, (block_values, timestamp) in sorted(blocks.items(), key=lambda item: -item[1][1]):
+                first = max(start, address)
+                end = min(start + len(block_values), address + count)
+                filled = 0
+                for index in range(first, end):
+                    if values[index - address] is None:
+                        values[index - address] = block_values[index - start]
+                        filled += 1
+                if filled:
+                    missing -= filled
+                    oldest = timestamp if oldest is None else min(oldest, timestamp)
+                    if not missing:
+                        return values, oldest
+        return None
+
+    def patch(self, plc_id, area, address, values):
+        """Apply a write to the blocks holding its addresses"""
+        with self.lock:
+            for start, (block_values, _) in self.areas.get((plc_id, area), {}).items():
+                for offset, value in enumerate(values):
+                    if 0 <= address + offset - start < len(block_values):
+                        block_values[address + offset - start] = value
+
+    def forget(self, plc_id):
+        with self.lock:
+            for key in [key for key in self.areas if key[0] == plc_id]:
+                del self.areas[key]
+
+
+class _Ring:
+    """A PLC's last ``capacity`` updates: one timestamp and sequence number
+    per update, one row of values per register (NaN where not updated)"""
+
+    def __init__(self, capacity):
+        self.rows = {}  # Register id -> row of values
+        self.timestamps = np.full(capacity, np.nan)
+        self.sequences = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((0, capacity), np.nan)
+        self.head = 0  # Column the next update goes to
+
+
+class RecentSamples:
+    """Every register's values over the last ``capacity`` updates of its PLC.
+
+    Lets a client that subscribes with a lookback get the recent trend in
+    one frame instead of querying the historian. Each update gets an
+    increasing sequence number, sent along with its register_update, so a
+    client can tell which live updates its backfill already holds.
+    Memory is 8 bytes per register and update kept.
+    """
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.plcs = {}  # plc_id -> _Ring
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def update(self, plc_id, values, timestamp):
+        """Record a PLC's {register_id: value} and return its sequence number"""
+        with self.lock:
+            ring = self.plcs.get(plc_id)
+            if ring is None:
+                ring = self.plcs[plc_id] = _Ring(self.capacity)
+            new = [register_id for register_id, value in values.items()
+                   if value is not None and register_id not in ring.rows]
+            if new:
+                for register_id in new:
+                    ring.rows[register_id] = len(ring.rows)
+                ring.values = np.vstack((ring.values, np.full((len(new), len(ring.timestamps)), np.nan)))
+            column = ring.head
+            ring.head = (column + 1) % len(ring.timestamps)
+            ring.values[:, column] = np.nan
+            for register_id, value in values.items():
+                if value is not None:
+                    ring.values[ring.rows[register_id], column] = value
+            self.sequence += 1
+            ring.timestamps[column] = timestamp
+            ring.sequences[column] = self.sequence
+            return self.sequence
+
+    def snapshot(self, plc_id, since):
+        """A PLC's updates since ``since`` as (timestamps, {register_id: values},
+        last sequence number), oldest first; registers without values are left out"""
+        with self.lock:
+            ring = self.plcs.get(plc_id)
+            if ring is None:
+                return np.zeros(0), {}, self.sequence
+            order = np.roll(np.arange(len(ring.timestamps)), -ring.head)
+            order = order[ring.timestamps[order] >= since]
+            timestamps = ring.timestamps[order]
+            values = ring.values[:, order]
+            rows = dict(ring.rows)
+            # Every later update of this PLC gets a larger number
+            last = self.sequence
+        present = ~np.isnan(values).all(axis=1) if len(timestamps) else np.zeros(len(rows), dtype=bool)
+        return timestamps, {register_id: values[row] for register_id, row in rows.items() if present[row]}, last
+
+    def forget(self, plc_id, register_ids=None):
+        """Drop a PLC's samples, or only those of ``register_ids``"""
+        with self.lock:
+            ring = self.plcs.get(plc_id)
+            if ring is None:
+                return
+            if register_ids is None:
+                del self.plcs[plc_id]
+                return
+            for register_id in register_ids:
+                row = ring.rows.pop(register_id, None)
+                if row is not None:
+                    ring.values[row] = np.nan
+
+
+latest_values = LatestValues()
+register_images = RegisterImages()
+recent_samples = RecentSamples()
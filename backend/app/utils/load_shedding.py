@@ -0,0 +1,146 @@
+from .transaction_queue import FAST_SCAN, SLOW_SCAN
+import collections
+import time
+
+# Scan classes in the order they are slowed down; restored in reverse
+SHED_ORDER = (SLOW_SCAN, FAST_SCAN)
+
+
+class LoadShedder:
+    """Stretches the poll intervals of a bus's devices while its poller is saturated.
+
+    Every ``period`` seconds it looks at the share of the time the poller
+    spent polling and at the cycles that started more than one interval
+    late. At ``high`` utilisation or with overruns, the least urgent scan
+    class that can still slow down is stretched by ``step``, each device
+    staying within its floor (poll interval) and ceiling (max interval);
+    below ``low`` without overruns, the most urgent stretched class is
+    restored by a step. Every decision is kept for status and passed to
+    ``on_decision``.
+    """
+
+    def __init__(self, key=None, period=5.0, high=0.9, low=0.6, step=1.5, on_decision=None, history=50):
+        self.key = key
+        self.period = period
+        self.high = high
+        self.low = low
+        self.step = step
+        self.on_decision = on_decision
+        self.stretch = dict.fromkeys(SHED_ORDER, 1.0)
+        self.decisions = collections.deque(maxlen=history)
+        self.window_start = time.monotonic()
+        self.busy = 0.0
+        self.cycles = 0
+        self.overruns = 0
+        self.utilisation = 0.0
+        self.last_cycles = 0
+        self.last_overruns = 0
+
+    def record(self, device, late, duration):
+        """Account a poll cycle that started ``late`` seconds after it was due"""
+        self.busy += duration
+        self.cycles += 1
+        if late > device.interval:
+            self.overruns += 1
+
+    def interval(self, device):
+        """A device's interval under the current stretch of its class"""
+        stretched = device.base_interval * self.stretch.get(device.scan_class, 1.0)
+        return max(device.base_interval, min(stretched, device.max_interval))
+
+    def apply(self, device):
+        interval = self.interval(device)
+        if interval < device.interval:
+            # Restored: don't wait out the stretched interval
+            device.next_due = min(device.next_due, time.monotonic() + interval)
+        device.interval = interval
+
+    def control(self, devices, now=None):
+        """Close the measurement window once ``period`` has passed and adjust
+        the stretch of one class, returning the decision made, if any"""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.window_start
+        if elapsed < self.period:
+            return None
+        self.utilisation = min(self.busy / elapsed, 1.0)
+        self.last_overruns = self.overruns
+        self.last_cycles = self.cycles
+        self.window_start, self.busy, self.cycles, self.overruns = now, 0.0, 0, 0
+
+        decision = None
+        if self.utilisation >= self.high or self.last_overruns:
+            for scan_class in SHED_ORDER:
+                members = [device for device in devices if device.scan_class == scan_class]
+                if any(self.interval(device) < device.max_interval for device in members):
+                    limit = max(device.max_interval / device.base_interval for device in members)
+                    self.stretch[scan_class] = min(self.stretch[scan_class] * self.step, limit)
+                    decision = self._decision('stretch', scan_class)
+                    break
+            else:
+                # Reported once: every device already polls at its ceiling
+                if not self.decisions or self.decisions[-1]['action'] != 'saturated':
+                    decision = self._decision('saturated', None)
+        elif self.utilisation < self.low:
+            for scan_class in reversed(SHED_ORDER):
+                if self.stretch[scan_class] > 1.0:
+                    stretch = self.stretch[scan_class] / self.step
+                    self.stretch[scan_class] = stretch if stretch > 1.0 + 1e-9 else 1.0
+                    decision = self._decision('restore', scan_class)
+                    break
+        if decision is not None:
+            for device in devices:
+                self.apply(device)
+            self.decisions.append(decision)
+            if self.on_decision is not None:
+                self.on_decision(decision)
+        return decision
+
+    def _decision(self, action, scan_class):
+        reason = f'poller busy {self.utilisation:.0%} of the last {self.period:g} s'
+        if self.last_overruns:
+            reason += f', {self.last_overruns} cycles more than an interval late'
+        return {
+            'bus': self.key,
+            'action': action,
+            'scan_class': scan_class,
+            'stretch': round(self.stretch[scan_class], 3) if scan_class else None,
+            'utilisation': round(self.utilisation, 3),
+            'overruns': self.last_overruns,
+            'reason': reason,
+            'timestamp': time.time()
+        }
+
+    def status(self):
+        return {
+            'utilisation': round(self.utilisation, 3),
+            'cycles': self.last_cycles,
+            'overruns': self.last_overruns,
+            'stretch': {scan_class: round(stretch, 3) for scan_class, stretch in self.stretch.items()},
+            'decisions': list(self.decisions)[-10:]
+        }
+
+
+def init_load_shedding(app):
+    """Configure load shedding for the buses created from now on and emit its
+    decisions as ``load_shedding`` Socket.IO events"""
+    from .. import socketio
+    from .modbus_bus import BusManager
+
+    def on_decision(decision):
+        if decision['action'] == 'saturated':
+            print(f"Load shedding on bus {decision['bus']}: every device at its max_poll_interval, {decision['reason']}")
+        else:
+            print(f"Load shedding on bus {decision['bus']}: {decision['action']} {decision['scan_class']} "
+                  f"to x{decision['stretch']}, {decision['reason']}")
+        socketio.emit('load_shedding', decision)
+
+    bus_manager = BusManager()
+    if not app.config['LOAD_SHEDDING_ENABLED']:
+        bus_manager.load_shedding = None
+        return
+    bus_manager.load_shedding = {
+        'period': app.config['LOAD_SHEDDING_PERIOD'],
+        'high': app.config['LOAD_SHEDDING_HIGH'],
+        'low': app.config['LOAD_SHEDDING_LOW'],
+        'on_decision': on_decision
+    }
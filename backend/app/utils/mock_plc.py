@@ -1,8 +1,18 @@
+from .background import start_task, sleep
+from .read_planner import encode_value
 import random
-import time
-import threading
 from datetime import datetime
 
+class MockResponse:
+    """The parts of a pymodbus read response the read planner uses"""
+
+    def __init__(self, registers=None, bits=None):
+        self.registers = registers
+        self.bits = bits
+
+    def isError(self):
+        return False
+
 class MockPLC:
     def __init__(self, ip_address="127.0.0.1", port=502):
         self.ip_address = ip_address
@@ -39,21 +49,14 @@ class MockPLC:
                     
                     # Keep within bounds
                     new_value = max(reg["min"], min(reg["max"], new_value))
-                    reg["value"] = new_value
-                    
-                    # For int32, update both registers
-                    if reg["type"] == "int32":
-                        self.registers[addr + 1]["value"] = int(new_value >> 16)
-                        reg["value"] = int(new_value & 0xFFFF)
+                    reg["value"] = new_value if reg["type"] == "float" else int(round(new_value))
             
-            time.sleep(1)  # Update every second
+            sleep(1)  # Update every second
     
     def start(self):
         if not self.running:
             self.running = True
-            self.thread = threading.Thread(target=self._update_registers)
-            self.thread.daemon = True
-            self.thread.start()
+            self.thread = start_task(self._update_registers)
     
     def stop(self):
         self.running = False
@@ -64,26 +67,37 @@ class MockPLC:
         if address not in self.registers:
             return None
             
-        reg = self.registers[address]
-        if reg["type"] == "int32" and count >= 2:
-            # Combine two registers for int32
-            high = self.registers[address + 1]["value"]
-            low = reg["value"]
-            return (high << 16) | low
-        elif reg["type"] == "float" and count >= 2:
-            return reg["value"]
-        else:
-            return reg["value"]
+        return self.registers[address]["value"]
     
     def write_register(self, address, value):
         if address not in self.registers:
             return False
             
         reg = self.registers[address]
-        if reg["type"] == "int32":
-            # Split value into two registers
-            self.registers[address + 1]["value"] = int(value >> 16)
-            reg["value"] = int(value & 0xFFFF)
-        else:
-            reg["value"] = value
-        return True 
\ No newline at end of file
+        reg["value"] = value if reg["type"] == "float" else int(value)
+        return True
+
+    # Modbus client interface, so the mock is polled on a bus like a real PLC, see PLCManager.add_plc
+    connected = True
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        """Words ``address`` to ``address + count`` of the registers, 0 where none is mapped"""
+        words = [0] * count
+        for start, reg in list(self.registers.items()):
+            for offset, word in enumerate(encode_value(reg["type"], reg["value"])):
+                if 0 <= start + offset - address < count:
+                    words[start + offset - address] = word
+        return MockResponse(registers=words)
+
+    read_input_registers = read_holding_registers
+
+    def read_coils(self, address, count=1, slave=1):
+        return MockResponse(bits=[False] * count)
+
+    read_discrete_inputs = read_coils 
\ No newline at end of file
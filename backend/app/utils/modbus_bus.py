@@ -0,0 +1,432 @@
+from contextlib import contextmanager, nullcontext
+from .read_planner import fetch_block, decode_block, decode_responses, COIL
+from .single_flight import SingleFlight
+from .transaction_queue import TransactionQueue, WRITE, READ, FAST_SCAN, SLOW_SCAN
+from .load_shedding import LoadShedder
+from .background import start_task, sleep, run_in_thread
+import threading
+import time
+
+# Transports a PLC can be reached through
+TCP = 'tcp'
+RTU_OVER_TCP = 'rtu_over_tcp'
+RTU = 'rtu'
+
+PROTOCOLS = (TCP, RTU_OVER_TCP, RTU)
+
+# Bus of a mock PLC, answered in memory
+SIMULATED = 'simulated'
+
+# Quiet time a gateway needs between frames when none is configured (seconds)
+DEFAULT_GATEWAY_DELAY = 0.02
+
+# Shortest poll interval a PLC may ask for, and devices polled less often than
+# SLOW_SCAN_INTERVAL are slow scans (seconds)
+MIN_POLL_INTERVAL = 0.05
+SLOW_SCAN_INTERVAL = 5.0
+
+
+def validate_transport(protocol, ip_address, serial_port):
+    """Return an error message if the PLC transport settings are incomplete"""
+    if protocol not in PROTOCOLS:
+        return f'Invalid protocol {protocol!r}, expected one of {", ".join(PROTOCOLS)}'
+    if protocol == RTU and not serial_port:
+        return 'serial_port is required for rtu PLCs'
+    if protocol != RTU and not ip_address:
+        return f'ip_address is required for {protocol} PLCs'
+    return None
+
+
+def validate_poll_intervals(poll_interval, max_poll_interval):
+    """Return an error message unless each interval is unset or at least MIN_POLL_INTERVAL
+    seconds, and the maximum is not the shorter one"""
+    for name, value in (('poll_interval', poll_interval), ('max_poll_interval', max_poll_interval)):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or value < MIN_POLL_INTERVAL):
+            return f'{name} must be at least {MIN_POLL_INTERVAL} seconds'
+    if poll_interval is not None and max_poll_interval is not None and max_poll_interval < poll_interval:
+        return 'max_poll_interval must not be shorter than poll_interval'
+    return None
+
+
+def validate_max_read_count(max_read_count):
+    """Return an error message unless max_read_count is unset or 1 to 125 registers"""
+    if max_read_count is None:
+        return None
+    if isinstance(max_read_count, bool) or not isinstance(max_read_count, int) or not 1 <= max_read_count <= 125:
+        return 'max_read_count must be a number of registers from 1 to 125'
+    return None
+
+
+def bus_key(plc):
+    """Key identifying the physical bus a PLC shares with other slaves"""
+    protocol = plc.protocol or TCP
+    if protocol == RTU:
+        return (RTU, plc.serial_port)
+    return (protocol, plc.ip_address, plc.port)
+
+
+def inter_frame_delay(plc):
+    """Minimum silence between two frames on the PLC's bus, in seconds"""
+    if plc.inter_frame_delay is not None:
+        return plc.inter_frame_delay / 1000.0
+    protocol = plc.protocol or TCP
+    if protocol == RTU:
+        # 3.5 character times of 11 bits, fixed at 1.75 ms above 19200 baud
+        baudrate = plc.baudrate or 9600
+        return 0.00175 if baudrate > 19200 else 38.5 / baudrate
+    if protocol == RTU_OVER_TCP:
+        return DEFAULT_GATEWAY_DELAY
+    return 0.0
+
+
+def create_client(plc, timeout=3):
+    """Create the pymodbus client matching the PLC's transport"""
+    # Imported with the first bus rather than at startup
+    from pymodbus.client import ModbusTcpClient, ModbusSerialClient
+    from pymodbus.framer.rtu_framer import ModbusRtuFramer
+    protocol = plc.protocol or TCP
+    if protocol == RTU:
+        return ModbusSerialClient(plc.serial_port, framer=ModbusRtuFramer,
+                                  baudrate=plc.baudrate or 9600, timeout=timeout)
+    if protocol == RTU_OVER_TCP:
+        return ModbusTcpClient(plc.ip_address, port=plc.port, framer=ModbusRtuFramer, timeout=timeout)
+    return ModbusTcpClient(plc.ip_address, port=plc.port, timeout=timeout)
+
+
+class BusDevice:
+    """A slave polled on a bus: its unit id, read plan, poll interval and the
+    transaction class its blocks are queued with"""
+
+    def __init__(self, plc_id, unit_id, interval=1.0, max_interval=None, scan_class=None):
+        self.plc_id = plc_id
+        self.unit_id = unit_id
+        self.plan = []
+        self.demand = None  # What the PLC's subscribers want polled, see PollingService
+        self.next_due = time.monotonic()
+        self.set_intervals(interval, max_interval, scan_class)
+
+    def set_intervals(self, interval, max_interval=None, scan_class=None):
+        """Poll every ``interval`` seconds, and no slower than ``max_interval`` while the bus sheds load"""
+        self.base_interval = self.interval = interval
+        self.max_interval = max(max_interval or interval, interval)
+        self.scan_class = scan_class or (FAST_SCAN if interval < SLOW_SCAN_INTERVAL else SLOW_SCAN)
+
+    def set_demand(self, demand):
+        """Poll what the subscribers ask for from the next cycle on; refresh() applies it"""
+        self.demand = demand
+
+    def refresh(self):
+        """Hook to rebuild ``plan`` before a cycle"""
+
+    def on_block(self, block, response, elapsed):
+        """Hook receiving each block read of a cycle, its raw response (None if
+        none came) and the seconds it took"""
+
+    def on_values(self, values):
+        """Hook receiving the decoded values of a cycle"""
+
+    def on_error(self, error):
+        print(f"Error monitoring PLC {self.plc_id}: {str(error)}")
+
+
+class ModbusBus:
+    """Serializes every request for the slaves sharing one gateway or serial line.
+
+    A single scheduler task polls the devices on the bus in order of
+    their next due time, and every frame (polled, on-demand or written)
+    goes through :meth:`transaction` so the inter-frame delay is honoured
+    no matter which thread issued it. Waiting transactions are served by
+    class, writes first, see :class:`TransactionQueue`.
+    """
+
+    def __init__(self, key, client, delay=0.0, shedder=None, connects=None):
+        self.key = key
+        self.client = client
+        self.delay = delay
+        self.shedder = shedder  # LoadShedder stretching poll intervals while the bus is saturated
+        self.connects = connects or nullcontext()  # Semaphore shared by the buses to bound concurrent connects
+        self.devices = {}
+        self.users = 0  # Callers inside BusManager.using
+        self.stopping = False  # Set by BusManager once it decided to stop the bus
+        self.queue = TransactionQueue()
+        self._thread_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_frame = 0.0
+        self._thread = None
+        self._runner = None  # Ident of the thread running the scheduler task
+        self.flights = SingleFlight()
+
+    @contextmanager
+    def transaction(self, priority=FAST_SCAN):
+        """Exclusive, connected access to the bus client for one frame,
+        queued with the transaction class ``priority``"""
+        self.queue.acquire(priority)
+        try:
+            wait = self._last_frame + self.delay - time.monotonic()
+            if wait > 0:
+                sleep(wait)
+            try:
+                if not self.client.connected:
+                    with self.connects:
+                        self.client.connect()
+                yield self.client
+            finally:
+                self._last_frame = time.monotonic()
+        finally:
+            self.queue.release()
+
+    def fetch(self, block, unit_id, priority=READ):
+        """Send a block read and return the raw response; concurrent reads of the
+        same unit and address range, polled or on-demand, share one transaction"""
+        def fetch():
+            with self.transaction(priority) as client:
+                return fetch_block(client, block, unit_id)
+        # A thread holding the bus (the poller during its cycle) must not wait for a read queued behind it
+        return self.flights.do((unit_id, block.area, block.start, block.count), fetch,
+                               join=not self.queue.holding())
+
+    def read(self, block, unit_id, priority=READ):
+        """Read a block and decode it"""
+        return decode_block(block, self.fetch(block, unit_id, priority))
+
+    def write(self, area, address, words, unit_id):
+        """Write coils or holding registers ahead of any queued read, returning True on success"""
+        try:
+            with self.transaction(WRITE) as client:
+                if area == COIL:
+                    response = client.write_coil(address, bool(words[0]), slave=unit_id)
+                elif len(words) == 1:
+                    response = client.write_register(address, words[0], slave=unit_id)
+                else:
+                    response = client.write_registers(address, words, slave=unit_id)
+            if response.isError():
+                print(f"Error writing {area} {address}: {response}")
+                return False
+            return True
+        except Exception as e:
+            print(f"Error writing {area} {address}: {str(e)}")
+            return False
+
+    def add_device(self, device):
+        if self.shedder is not None:
+            self.shedder.apply(device)
+        with self._thread_lock:
+            self.devices[device.plc_id] = device
+            self._wakeup.set()
+            if self._thread is None:
+                self._thread = start_task(self._run)
+
+    def remove_device(self, plc_id):
+        with self._thread_lock:
+            device = self.devices.pop(plc_id, None)
+            self._wakeup.set()
+        return device
+
+    def stop(self):
+        """Stop the scheduler task once its transaction in progress is done and
+        close the client, releasing the connection or serial port"""
+        self._wakeup.set()
+        with self._thread_lock:
+            thread = None if self.devices else self._thread
+        # Unless called from the task itself, e.g. a device stopping its own polling
+        if thread is not None and self._runner != threading.get_ident():
+            thread.join()
+        # After any transaction still queued, e.g. by a caller that got the bus before it was stopped
+        self.queue.acquire(WRITE)
+        try:
+            self.client.close()
+        finally:
+            self.queue.release()
+
+    def poll(self, device):
+        """Run one polling cycle for a device, one transaction per block;
+        more urgent or starved transactions go out between its blocks. The
+        responses are decoded together off the green threads, see run_in_thread."""
+        device.refresh()
+        fetched = []
+        self.queue.acquire(device.scan_class)
+        try:
+            for index, block in enumerate(device.plan):
+                if index:
+                    self.queue.preempt()
+                if self.devices.get(device.plc_id) is not device:
+                    return  # Removed mid-cycle, see stop()
+                started = time.monotonic()
+                response = self.fetch(block, device.unit_id, device.scan_class)
+                device.on_block(block, response, time.monotonic() - started)
+                fetched.append((block, response))
+        finally:
+            self.queue.release()
+        device.on_values(run_in_thread(decode_responses, fetched))
+
+    def status(self):
+        status = {'bus': self.key, 'devices': len(self.devices), 'reads': self.flights.status(),
+                  'transactions': self.queue.status()}
+        if self.shedder is not None:
+            status['load_shedding'] = dict(self.shedder.status(), stretched_devices=sum(
+                1 for device in list(self.devices.values()) if device.interval > device.base_interval))
+        return status
+
+    def _run(self):
+        self._runner = threading.get_ident()
+        while True:
+            with self._thread_lock:
+                if not self.devices:
+                    self._thread = None
+                    break
+            self._wakeup.clear()
+            try:
+                device = min(list(self.devices.values()), key=lambda d: d.next_due)
+            except ValueError:
+                continue
+            wait = device.next_due - time.monotonic()
+            if wait > 0:
+                if self.shedder is not None:
+                    # Idle time counts too, so intervals are restored while nothing is due
+                    self.shedder.control(list(self.devices.values()))
+                    wait = min(wait, self.shedder.period)
+                # Woken early when devices are added or removed
+                self._wakeup.wait(wait)
+                continue
+            started = time.monotonic()
+            try:
+                self.poll(device)
+                if self.shedder is not None:
+                    self.shedder.apply(device)  # refresh() may have changed its intervals
+                device.next_due = max(device.next_due + device.interval, time.monotonic())
+            except Exception as e:
+                device.on_error(e)
+                device.next_due = time.monotonic() + 5  # Wait before retrying
+            if self.shedder is not None:
+                self.shedder.record(device, -wait, time.monotonic() - started)
+                self.shedder.control(list(self.devices.values()))
+
+
+class BusManager:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(BusManager, cls).__new__(cls)
+                cls._instance._initialized = False
+            return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self.buses = {}  # bus key -> ModbusBus
+        self.device_buses = {}  # plc_id -> bus key
+        self.load_shedding = None  # LoadShedder settings of new buses, see init_load_shedding
+        self.connect_slots = None  # Semaphore bounding the connects in progress, see init_warm_start
+        self.simulated = {}  # plc_id -> client simulating the PLC, see PLCManager.add_plc
+        self._stopped = threading.Condition(self._lock)  # Notified when a stopping bus is dropped
+        self._initialized = True
+
+    def _current(self, key):
+        """The bus open for a key, waiting for one being stopped to be closed
+        and dropped first; called holding the lock"""
+        while key in self.buses and self.buses[key].stopping:
+            self._stopped.wait()
+        return self.buses.get(key)
+
+    def _get_bus(self, plc):
+        """The bus for a PLC, created for the first slave on it; called holding the lock"""
+        simulator = self.simulated.get(plc.id)
+        key = (SIMULATED, plc.id) if simulator is not None else bus_key(plc)
+        bus = self._current(key)
+        if bus is None:
+            shedder = None if self.load_shedding is None else LoadShedder(key, **self.load_shedding)
+            client = simulator if simulator is not None else create_client(plc)
+            bus = ModbusBus(key, client, inter_frame_delay(plc), shedder, self.connect_slots)
+            self.buses[key] = bus
+        return bus
+
+    @contextmanager
+    def using(self, plc):
+        """The bus for a PLC, for on-demand reads, writes and probes. A bus
+        nothing polls is stopped once its last user is done, so requests to
+        PLCs that are not monitored leave no connection behind."""
+        with self._lock:
+            bus = self._get_bus(plc)
+            bus.users += 1
+        try:
+            yield bus
+        finally:
+            self._release(bus)
+
+    @contextmanager
+    def existing(self, key):
+        """The bus open for ``key`` (see bus_key), held like using(), or None
+        without creating one"""
+        with self._lock:
+            bus = self._current(key)
+            if bus is not None:
+                bus.users += 1
+        if bus is None:
+            yield None
+            return
+        try:
+            yield bus
+        finally:
+            self._release(bus)
+
+    def _release(self, bus):
+        with self._lock:
+            bus.users -= 1
+        self._stop_idle(bus)
+
+    def start_device(self, plc, device):
+        """Schedule a device on its PLC's bus, returning False if already polled"""
+        with self._lock:
+            if device.plc_id in self.device_buses:
+                return False
+            bus = self._get_bus(plc)
+            self.device_buses[device.plc_id] = bus.key
+            bus.add_device(device)
+        return True
+
+    def stop_device(self, plc_id):
+        with self._lock:
+            key = self.device_buses.pop(plc_id, None)
+            if key is None:
+                return False
+            bus = self.buses[key]
+            bus.remove_device(plc_id)
+        self._stop_idle(bus)
+        return True
+
+    def _stop_idle(self, bus):
+        """Stop and drop a bus no device polls and no caller uses. Whether to stop is
+        decided under the lock, so the client is only closed once the last
+        using() caller is done and no new one can get the bus meanwhile."""
+        with self._lock:
+            if bus.devices or bus.users or bus.stopping:
+                return
+            bus.stopping = True
+        try:
+            # Closed before it is dropped, so a new bus for the key never finds the port still open
+            bus.stop()
+        finally:
+            with self._lock:
+                if self.buses.get(bus.key) is bus:
+                    del self.buses[bus.key]
+                self._stopped.notify_all()
+
+    def status(self):
+        """Status of every bus, including how many reads were coalesced"""
+        with self._lock:
+            buses = list(self.buses.values())
+        return [bus.status() for bus in buses]
+
+    def device(self, plc_id):
+        """The device polling a PLC, or None"""
+        key = self.device_buses.get(plc_id)
+        bus = self.buses.get(key) if key is not None else None
+        return bus.devices.get(plc_id) if bus is not None else None
+
+    def is_polling(self, plc_id):
+        return plc_id in self.device_buses
@@ -0,0 +1,307 @@
+from .background import start_task
+from .live_values import register_images
+from .read_planner import register_size, COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+from .response_cache import response_cache, PLCS
+import bisect
+import socket
+import struct
+import threading
+import time
+
+# Function codes the gateway serves, by the register area they read or write
+READ_AREAS = {1: COIL, 2: DISCRETE_INPUT, 3: HOLDING_REGISTER, 4: INPUT_REGISTER}
+WRITE_AREAS = {5: COIL, 6: HOLDING_REGISTER, 15: COIL, 16: HOLDING_REGISTER}
+# Most addresses one request may read, by function code
+MAX_READ = {1: 2000, 2: 2000, 3: 125, 4: 125}
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+GATEWAY_PATH_UNAVAILABLE = 10  # No PLC behind the unit id
+GATEWAY_TARGET_FAILED = 11  # No recent poll of the PLC, or its write failed
+
+# Polling service consumer keeping the exposed PLCs polled
+GATEWAY = 'modbus_gateway'
+
+MBAP = struct.Struct('>HHHB')  # transaction, protocol, length, unit id
+
+
+class GatewayError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def validate_gateway_address(unit_id, offset):
+    """Return an error message unless the gateway unit id is unset or 1 to 247
+    and the address offset unset or 0 to 65535"""
+    if unit_id is not None and (isinstance(unit_id, bool) or not isinstance(unit_id, int)
+                                or not 1 <= unit_id <= 247):
+        return 'gateway_unit_id must be a Modbus unit id from 1 to 247'
+    if offset is not None and (isinstance(offset, bool) or not isinstance(offset, int)
+                               or not 0 <= offset <= 65535):
+        return 'gateway_offset must be an address from 0 to 65535'
+    return None
+
+
+def _pack_bits(bits):
+    data = bytearray((len(bits) + 7) // 8)
+    for index, bit in enumerate(bits):
+        if bit:
+            data[index >> 3] |= 1 << (index & 7)
+    return bytes(data)
+
+
+def _unpack_bits(data, count):
+    return [bool(data[index >> 3] >> (index & 7) & 1) for index in range(count)]
+
+
+class ModbusGateway:
+    """Modbus TCP server presenting the hub's PLCs to SCADA clients.
+
+    Each PLC with a gateway_unit_id answers on that unit id, its addresses
+    shifted up by its gateway_offset, so several PLCs can share one unit's
+    address space. Reads are answered from the raw words the pollers last
+    read (see RegisterImages) without contacting the device, and fail with
+    exception 11 once older than MODBUS_GATEWAY_MAX_AGE. Writes to writable
+    registers go out through the PLC's bus like the API's.
+
+    Every connection is served by its own task of the async mode, green
+    threads under eventlet, which keeps hundreds of them cheap.
+    """
+
+    def __init__(self, app, host, port, max_age):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.max_age = max_age
+        self.units = {}  # unit id -> sorted [(offset, plc_id)]
+        self.exposed = set()
+        self.generation = None
+        self.listener = None
+        self.connections = 0
+        self.accepted = 0
+        self.requests = 0
+        self.writes = 0
+        self.exceptions = {}  # code -> count
+        self.map_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def start(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(1024)
+        self.listener = listener
+        self.port = listener.getsockname()[1]
+        self._refresh_map()
+        start_task(self._serve)
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError as e:
+                print(f"Modbus gateway stopped accepting: {str(e)}")
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            start_task(self._connection, connection)
+
+    def _connection(self, connection):
+        with self.lock:
+            self.connections += 1
+            self.accepted += 1
+        reader = connection.makefile('rb')
+        try:
+            while True:
+                header = reader.read(MBAP.size)
+                if len(header) < MBAP.size:
+                    return
+                transaction, protocol, length, unit = MBAP.unpack(header)
+                if protocol != 0 or not 2 <= length <= 254:
+                    return
+                pdu = reader.read(length - 1)
+                if len(pdu) < length - 1:
+                    return
+                response = self.handle(unit, pdu)
+                connection.sendall(MBAP.pack(transaction, 0, len(response) + 1, unit) + response)
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            connection.close()
+            with self.lock:
+                self.connections -= 1
+
+    def handle(self, unit, pdu):
+        """The response PDU to a request PDU for ``unit``"""
+        function = pdu[0]
+        try:
+            if function in READ_AREAS:
+                body = self._read(unit, function, pdu)
+            elif function in WRITE_AREAS:
+                body = self._write(unit, function, pdu)
+            else:
+                raise GatewayError(ILLEGAL_FUNCTION)
+            with self.lock:
+                self.requests += 1
+            return bytes((function,)) + body
+        except GatewayError as e:
+            code = e.code
+        except struct.error:
+            code = ILLEGAL_DATA_VALUE
+        with self.lock:
+            self.requests += 1
+            self.exceptions[code] = self.exceptions.get(code, 0) + 1
+        return bytes((function | 0x80, code))
+
+    def _refresh_map(self):
+        """Reload which PLC answers on which unit id when the PLCs changed,
+        keeping every exposed PLC subscribed with the polling service"""
+        generation = response_cache.generation(PLCS)
+        if generation == self.generation:
+            return
+        from ..models.plc import PLC
+        from .polling_service import polling_service
+
+        with self.map_lock:
+            if generation == self.generation:
+                return
+            with self.app.app_context():
+                plcs = PLC.query.filter(PLC.gateway_unit_id.isnot(None)).all()
+                units = {}
+                for plc in plcs:
+                    units.setdefault(plc.gateway_unit_id, []).append((plc.gateway_offset or 0, plc.id))
+                    polling_service.subscribe(GATEWAY, plc)
+            exposed = {plc.id for plc in plcs}
+            for plc_id in self.exposed - exposed:
+                polling_service.unsubscribe(GATEWAY, plc_id)
+            self.units = {unit: sorted(entries) for unit, entries in units.items()}
+            self.exposed = exposed
+            self.generation = generation
+
+    def resolve(self, unit, address):
+        """The PLC answering ``address`` on ``unit`` and the address on the PLC"""
+        self._refresh_map()
+        entries = self.units.get(unit)
+        if not entries:
+            raise GatewayError(GATEWAY_PATH_UNAVAILABLE)
+        index = bisect.bisect_right(entries, (address, float('inf'))) - 1
+        if index < 0:
+            raise GatewayError(ILLEGAL_DATA_ADDRESS)
+        offset, plc_id = entries[index]
+        return plc_id, address - offset
+
+    def _read(self, unit, function, pdu):
+        address, count = struct.unpack_from('>HH', pdu, 1)
+        if not 1 <= count <= MAX_READ[function] or address + count > 65536:
+            raise GatewayError(ILLEGAL_DATA_VALUE)
+        plc_id, start = self.resolve(unit, address)
+        image = register_images.read(plc_id, READ_AREAS[function], start, count)
+        if image is None:
+            raise GatewayError(ILLEGAL_DATA_ADDRESS)
+        values, timestamp = image
+        if time.time() - timestamp > self.max_age:
+            raise GatewayError(GATEWAY_TARGET_FAILED)
+        if function in (1, 2):
+            data = _pack_bits(values)
+            return bytes((len(data),)) + data
+        return struct.pack(f'>B{count}H', 2 * count, *values)
+
+    def _write(self, unit, function, pdu):
+        if function in (5, 6):
+            address, value = struct.unpack_from('>HH', pdu, 1)
+            if function == 5 and value not in (0, 0xFF00):
+                raise GatewayError(ILLEGAL_DATA_VALUE)
+            values = [value == 0xFF00] if function == 5 else [value]
+        else:
+            address, count, size = struct.unpack_from('>HHB', pdu, 1)
+            data = pdu[6:6 + size]
+            if function == 15:
+                valid = 1 <= count <= 1968 and size == (count + 7) // 8
+            else:
+                valid = 1 <= count <= 123 and size == 2 * count
+            if not valid or len(data) != size or address + count > 65536:
+                raise GatewayError(ILLEGAL_DATA_VALUE)
+            values = _unpack_bits(data, count) if function == 15 else list(struct.unpack(f'>{count}H', data))
+        plc_id, start = self.resolve(unit, address)
+        self._forward(plc_id, WRITE_AREAS[function], start, values)
+        with self.lock:
+            self.writes += 1
+        # Single writes echo the request, multiple writes the address and count
+        return pdu[1:5]
+
+    def _forward(self, plc_id, area, address, values):
+        """Write ``values`` through the PLC's bus, ahead of its polling, if
+        every address belongs to a writable register"""
+        from .. import db
+        from ..models.plc import PLC, Register
+        from .device_templates import device_registers
+        from .modbus_bus import BusManager
+
+        with self.app.app_context():
+            plc = db.session.get(PLC, plc_id)
+            if plc is None:
+                raise GatewayError(GATEWAY_PATH_UNAVAILABLE)
+            rows = db.session.execute(
+                db.select(Register.address, Register.data_type, Register.read_write)
+                .where(device_registers(plc.id, plc.template_id), Register.register_area == area,
+                       Register.expression.is_(None), Register.address < address + len(values),
+                       Register.address > address - 2)
+            ).all()
+        writable, read_only = set(), set()
+        for row in rows:
+            span = range(row.address, row.address + register_size(area, row.data_type))
+            (read_only if row.read_write == 'read_only' else writable).update(span)
+        addresses = set(range(address, address + len(values)))
+        if not addresses <= writable or addresses & read_only:
+            raise GatewayError(ILLEGAL_DATA_ADDRESS)
+
+        with BusManager().using(plc) as bus:
+            if area == COIL:
+                # The bus writes one coil at a time
+                written = all(bus.write(COIL, address + offset, [value], plc.unit_id)
+                              for offset, value in enumerate(values))
+            else:
+                written = bus.write(area, address, values, plc.unit_id)
+        if not written:
+            raise GatewayError(GATEWAY_TARGET_FAILED)
+        # Reads right after the write see it before the next poll does
+        register_images.patch(plc_id, area, address, values)
+
+    def status(self):
+        with self.lock:
+            return {
+                'host': self.host,
+                'port': self.port,
+                'units': {unit: [{'plc_id': plc_id, 'offset': offset} for offset, plc_id in entries]
+                          for unit, entries in self.units.items()},
+                'connections': self.connections,
+                'accepted': self.accepted,
+                'requests': self.requests,
+                'writes': self.writes,
+                'exceptions': dict(self.exceptions),
+                'max_age': self.max_age
+            }
+
+
+def start_modbus_gateway(app):
+    """Serve the Modbus gateway if MODBUS_GATEWAY_PORT is set.
+
+    Started by run.py rather than create_app, so the CLI and benchmarks
+    that create an app do not take the port.
+    """
+    port = app.config['MODBUS_GATEWAY_PORT']
+    if port is None:
+        return None
+    gateway = ModbusGateway(app, app.config['MODBUS_GATEWAY_HOST'], port, app.config['MODBUS_GATEWAY_MAX_AGE'])
+    try:
+        gateway.start()
+    except OSError as e:
+        print(f"Error starting the Modbus gateway on port {port}: {str(e)}")
+        return None
+    app.extensions['modbus_gateway'] = gateway
+    print(f"Modbus gateway listening on {gateway.host}:{gateway.port}")
+    return gateway
@@ -0,0 +1,502 @@
+from .background import start_task
+from .response_cache import response_cache, REGISTERS
+import atexit
+import collections
+import gzip
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+
+try:
+    import paho.mqtt
+    import paho.mqtt.client as mqtt
+except ImportError:  # Optional: MQTT publishing is off without paho-mqtt
+    mqtt = None
+
+JSON = 'json'
+SPARKPLUG = 'sparkplug'
+PAYLOADS = (JSON, SPARKPLUG)
+
+SPARKPLUG_NAMESPACE = 'spBv1.0'
+# Sparkplug B metric data types
+UINT64 = 8
+DOUBLE = 10
+BOOLEAN = 11
+STRING = 12
+
+# Node control metric a Sparkplug host sets in an NCMD to ask for new births
+REBIRTH = 'Node Control/Rebirth'
+
+
+def paho_error():
+    """Why paho-mqtt cannot be used, or None. The client needs the callback
+    API versions of paho-mqtt 2."""
+    if mqtt is None:
+        return 'paho-mqtt is not installed (pip install "paho-mqtt>=2.0,<3")'
+    if not hasattr(mqtt, 'CallbackAPIVersion'):
+        return f'paho-mqtt {paho.mqtt.__version__} is installed, 2.0 or later is required'
+    return None
+
+
+def _varint(value):
+    data = bytearray()
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def _read_varint(data, index):
+    value, shift = 0, 0
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, index
+
+
+def _fields(data):
+    """Yield (field number, value) of a protobuf message: ints for varints,
+    bytes for length-delimited fields. Fixed-width fields are skipped."""
+    index = 0
+    while index < len(data):
+        key, index = _read_varint(data, index)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, index = _read_varint(data, index)
+        elif wire_type == 2:
+            length, index = _read_varint(data, index)
+            value, index = data[index:index + length], index + length
+        elif wire_type in (1, 5):
+            index += 8 if wire_type == 1 else 4
+            continue
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}')
+        yield key >> 3, value
+
+
+def rebirth_requested(payload):
+    """Whether a Sparkplug B NCMD payload sets Node Control/Rebirth"""
+    for number, metric in _fields(payload):
+        if number == 2:
+            fields = dict(_fields(metric))
+            if fields.get(1) == REBIRTH.encode() and fields.get(14):
+                return True
+    return False
+
+
+def _varint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number, data):
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def sparkplug_metric(value, name=None, alias=None, datatype=None):
+    """One protobuf-encoded Sparkplug B Metric: booleans, strings and
+    UInt64 as given, anything else as a double"""
+    if datatype is None:
+        datatype = BOOLEAN if isinstance(value, bool) else STRING if isinstance(value, str) else DOUBLE
+    data = b''
+    if name is not None:
+        data += _bytes_field(1, name.encode())
+    if alias is not None:
+        data += _varint_field(2, alias)
+    data += _varint_field(4, datatype)
+    if datatype == BOOLEAN:
+        data += _varint_field(14, int(value))
+    elif datatype == STRING:
+        data += _bytes_field(15, value.encode())
+    elif datatype == UINT64:
+        data += _varint_field(11, value)
+    else:
+        data += b'\x69' + struct.pack('<d', value)  # Field 13, 64-bit
+    return data
+
+
+def sparkplug_payload(metrics, timestamp=None, seq=None, uuid=None, body=None):
+    """A protobuf-encoded Sparkplug B Payload of encoded ``metrics``, with
+    ``timestamp`` in seconds"""
+    data = b''
+    if timestamp is not None:
+        data += _varint_field(1, int(timestamp * 1000))
+    for metric in metrics:
+        data += _bytes_field(2, metric)
+    if seq is not None:
+        data += _varint_field(3, seq)
+    if uuid is not None:
+        data += _bytes_field(4, uuid.encode())
+    if body is not None:
+        data += _bytes_field(5, body)
+    return data
+
+
+class MqttPublisher:
+    """Publishes polled and derived values to an MQTT broker.
+
+    Each poll cycle becomes at most one message per PLC, holding only the
+    values that changed since they were last queued (report by
+    exception), numbers by more than ``deadband``. ``store`` is called by
+    the pollers and only compares and queues; a background task encodes
+    and publishes, so a slow or unreachable broker never holds up
+    polling. The queue keeps ``capacity`` cycles: when it is full the
+    oldest is dropped and its values count as unpublished, so the next
+    change of any kind brings them up to date.
+
+    ``json`` payloads go to ``<prefix>/<hub id>/plcs/<plc id>`` as
+    {"plc_id", "timestamp", "values": {register id: value}}. ``sparkplug``
+    payloads follow Sparkplug B: the hub is an edge node of ``group`` with
+    an NBIRTH on every connect and an NDEATH as its will, each PLC a device
+    ``plc-<id>`` whose DBIRTH names every register (alias = register id)
+    and whose DDATA carries aliases only. Every MQTT session has its own
+    bdSeq. A host asking for a rebirth in an NCMD gets an NDEATH, then a
+    new session with a new bdSeq and births. Payloads over
+    ``compression_threshold`` bytes are gzipped, Sparkplug ones wrapped as
+    SPBV1.0_COMPRESSED payloads.
+    """
+
+    def __init__(self, app, url, payload=JSON, qos=0, hub_id=None, topic_prefix='plc_hub', group='plc_hub',
+                 capacity=10000, max_inflight=100, compression_threshold=0, deadband=0.0):
+        self.app = app
+        self.url = url
+        self.payload = payload
+        self.qos = qos
+        self.hub_id = hub_id or socket.gethostname()
+        self.topic_prefix = topic_prefix
+        self.group = group
+        self.capacity = capacity
+        self.max_inflight = max_inflight
+        self.compression_threshold = compression_threshold
+        self.deadband = deadband
+        self.queue = collections.deque()
+        self.queued = {}  # plc_id -> {register_id: value} last queued
+        self.names = {}  # register_id -> name, for Sparkplug births
+        self.names_generation = None
+        self.born = {}  # plc_id -> register ids of its DBIRTH this session
+        self.bd_seq = int(time.time()) % 256
+        self.seq = 0
+        self.session = 0  # Connects so far; each needs its births
+        self.birth_session = 0
+        self.rebirth = threading.Event()  # Set by an NCMD asking for a rebirth
+        self.rebirths = 0
+        self.unacknowledged = 0  # QoS 1 and 2 messages not acknowledged yet
+        self.connected = False
+        self.published = 0
+        self.published_bytes = 0
+        self.dropped = 0
+        self.unchanged = 0
+        self.last_error = None
+        self.running = False
+        self.thread = None
+        self.client = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def store(self, plc_id, values, timestamp):
+        """Queue one poll cycle's {register_id: value} changes"""
+        with self.lock:
+            queued = self.queued.setdefault(plc_id, {})
+            changed = {}
+            for register_id, value in values.items():
+                if value is None:
+                    continue
+                if register_id in queued and self._unchanged(queued[register_id], value):
+                    self.unchanged += 1
+                    continue
+                queued[register_id] = value
+                changed[register_id] = value
+            if not changed:
+                return
+            if len(self.queue) >= self.capacity:
+                dropped_plc_id, dropped, _ = self.queue.popleft()
+                self.dropped += 1
+                # Unpublished, so the next cycle must send them whether or not they change
+                stale = self.queued.get(dropped_plc_id, {})
+                for register_id in dropped:
+                    stale.pop(register_id, None)
+            self.queue.append((plc_id, changed, timestamp))
+        self.wakeup.set()
+
+    def _unchanged(self, queued, value):
+        if queued == value:
+            return True
+        numbers = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (queued, value))
+        return numbers and abs(value - queued) <= self.deadband
+
+    def forget(self, plc_id):
+        with self.lock:
+            self.queued.pop(plc_id, None)
+            self.born.pop(plc_id, None)
+
+    def _sparkplug_topic(self, message_type, plc_id=None):
+        topic = f'{SPARKPLUG_NAMESPACE}/{self.group}/{message_type}/{self.hub_id}'
+        return topic if plc_id is None else f'{topic}/plc-{plc_id}'
+
+    def _node_death(self):
+        return sparkplug_payload([sparkplug_metric(self.bd_seq, 'bdSeq', datatype=UINT64)])
+
+    def _compress(self, payload):
+        if not self.compression_threshold or len(payload) <= self.compression_threshold:
+            return payload
+        compressed = gzip.compress(payload, 6)
+        if self.payload == JSON:
+            return compressed
+        return sparkplug_payload([sparkplug_metric('GZIP', 'algorithm')], uuid='SPBV1.0_COMPRESSED', body=compressed)
+
+    def _load_names(self, register_ids):
+        from .. import db
+        from ..models.plc import Register
+
+        with self.app.app_context():
+            rows = db.session.execute(
+                db.select(Register.id, Register.name).where(Register.id.in_(list(register_ids)))).all()
+        self.names.update((row.id, row.name) for row in rows)
+
+    def encode(self, plc_id, values, timestamp):
+        """(topic, payload) publishing a cycle's changes: a Sparkplug DBIRTH
+        with every last-known value instead of DDATA when the device has no
+        birth this session or has registers its birth did not name"""
+        if self.payload == JSON:
+            payload = json.dumps({'plc_id': plc_id, 'timestamp': timestamp, 'values': values}).encode()
+            return f'{self.topic_prefix}/{self.hub_id}/plcs/{plc_id}', self._compress(payload)
+
+        if self.names_generation != response_cache.generation(REGISTERS):
+            # Registers were renamed, added or removed: births must name them again
+            self.names = {}
+            self.born = {}
+            self.names_generation = response_cache.generation(REGISTERS)
+        born = self.born.get(plc_id)
+        if born is not None and born.issuperset(values):
+            metrics = [sparkplug_metric(value, alias=register_id) for register_id, value in values.items()]
+            return self._sparkplug_topic('DDATA', plc_id), self._compress(
+                sparkplug_payload(metrics, timestamp, self.seq))
+        with self.lock:
+            current = dict(self.queued.get(plc_id, {}))
+        current.update(values)
+        unnamed = [register_id for register_id in current if register_id not in self.names]
+        if unnamed:
+            self._load_names(unnamed)
+        metrics = [sparkplug_metric(value, self.names.get(register_id, str(register_id)), register_id)
+                   for register_id, value in current.items()]
+        return self._sparkplug_topic('DBIRTH', plc_id), self._compress(
+            sparkplug_payload(metrics, timestamp, self.seq))
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self.last_error = f'Connection refused: {reason_code}'
+            return
+        if self.payload == SPARKPLUG:
+            client.subscribe(self._sparkplug_topic('NCMD'), qos=1)
+        self.session += 1
+        self.connected = True
+        self.last_error = None
+        self.wakeup.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected = False
+        if reason_code.is_failure:
+            self.last_error = f'Disconnected: {reason_code}'
+        if self.payload == SPARKPLUG:
+            # The next session is born with the next bdSeq, and dies with it
+            self.bd_seq = (self.bd_seq + 1) % 256
+            client.will_set(self._sparkplug_topic('NDEATH'), self._node_death(), qos=1)
+
+    def _on_message(self, client, userdata, message):
+        try:
+            requested = rebirth_requested(message.payload)
+        except (ValueError, IndexError) as e:
+            self.last_error = f'Invalid NCMD payload: {str(e)}'
+            return
+        if requested:
+            self.rebirth.set()
+            self.wakeup.set()
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        if self.qos:
+            with self.lock:
+                self.unacknowledged -= 1
+
+    def start(self):
+        if self.running:
+            return
+        error = paho_error()
+        if error:
+            raise RuntimeError(error)
+        url = urllib.parse.urlparse(self.url)
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f'plc_hub-{self.hub_id}')
+        if url.username:
+            client.username_pw_set(urllib.parse.unquote(url.username),
+                                   urllib.parse.unquote(url.password) if url.password else None)
+        if url.scheme == 'mqtts':
+            client.tls_set()
+        if self.payload == SPARKPLUG:
+            client.will_set(self._sparkplug_topic('NDEATH'), self._node_death(), qos=1)
+        client.max_inflight_messages_set(self.max_inflight)
+        client.max_queued_messages_set(self.max_inflight)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_publish = self._on_publish
+        self.client = client
+        self._connect()
+        self.running = True
+        self.stopping.clear()
+        self.thread = start_task(self._run)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join()
+        self._disconnect()
+
+    def _connect(self):
+        url = urllib.parse.urlparse(self.url)
+        self.client.connect_async(url.hostname, url.port or (8883 if url.scheme == 'mqtts' else 1883))
+        self.client.loop_start()
+
+    def _disconnect(self):
+        if self.connected and self.payload == SPARKPLUG:
+            # A clean disconnect does not send the will
+            if self.qos:
+                with self.lock:
+                    self.unacknowledged += 1
+            self.client.publish(self._sparkplug_topic('NDEATH'), self._node_death(), qos=1).wait_for_publish(1.0)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _reborn(self):
+        """End the session and start a new one, which gets a new bdSeq and
+        births. Messages in flight get up to 5 seconds to be acknowledged
+        first; the client sends any others again on the new session."""
+        self.rebirth.clear()
+        self.rebirths += 1
+        waited = time.monotonic()
+        while self.unacknowledged > 0 and self.connected and time.monotonic() - waited < 5:
+            self.stopping.wait(0.01)
+        self._disconnect()
+        self._connect()
+
+    def _publish(self, topic, payload):
+        """Hand one message to the client, False if it has no room or connection"""
+        if self.qos:
+            with self.lock:
+                self.unacknowledged += 1
+        info = self.client.publish(topic, payload, qos=self.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            if self.qos:
+                with self.lock:
+                    self.unacknowledged -= 1
+            return False
+        self.published += 1
+        self.published_bytes += len(payload)
+        return True
+
+    def _run(self):
+        while self.running:
+            if self.rebirth.is_set():
+                self._reborn()
+                continue
+            births = self.payload == SPARKPLUG and self.birth_session != self.session
+            if not self.connected or not (self.queue or births):
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                continue
+            if births:
+                # A new session starts with the node's birth, seq 0, then every known device's birth
+                self.seq = 0
+                self.born = {}
+                payload = sparkplug_payload([sparkplug_metric(self.bd_seq, 'bdSeq', datatype=UINT64),
+                                             sparkplug_metric(False, REBIRTH)],
+                                            time.time(), self.seq)
+                if not self._publish(self._sparkplug_topic('NBIRTH'), payload):
+                    self.stopping.wait(0.1)
+                    continue
+                self.seq = 1
+                self.birth_session = self.session
+                with self.lock:
+                    self.queue.extendleft((plc_id, {}, time.time()) for plc_id in self.queued)
+                continue
+
+            with self.lock:
+                plc_id, values, timestamp = self.queue.popleft()
+            if not values and plc_id in self.born:
+                continue
+            try:
+                topic, payload = self.encode(plc_id, values, timestamp)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error encoding MQTT payload for PLC {plc_id}: {str(e)}")
+                continue
+            if not self._publish(topic, payload):
+                # The client's queue is full or the connection was lost: retry the cycle shortly
+                with self.lock:
+                    self.queue.appendleft((plc_id, values, timestamp))
+                self.stopping.wait(0.01)
+                continue
+            if self.payload == SPARKPLUG:
+                self.seq = (self.seq + 1) % 256
+                if '/DBIRTH/' in topic:
+                    with self.lock:
+                        self.born[plc_id] = set(self.queued.get(plc_id, {})) | set(values)
+
+    def status(self):
+        with self.lock:
+            queued = len(self.queue)
+        return {
+            'broker': self.url,
+            'payload': self.payload,
+            'qos': self.qos,
+            'hub_id': self.hub_id,
+            'connected': self.connected,
+            'queued': queued,
+            'capacity': self.capacity,
+            'published': self.published,
+            'published_bytes': self.published_bytes,
+            'unacknowledged': self.unacknowledged,
+            'dropped': self.dropped,
+            'unchanged': self.unchanged,
+            'rebirths': self.rebirths,
+            'last_error': self.last_error
+        }
+
+
+def init_mqtt_publisher(app):
+    """Start publishing to MQTT when MQTT_BROKER_URL is configured"""
+    url = app.config.get('MQTT_BROKER_URL')
+    if not url:
+        return None
+    error = paho_error()
+    if error:
+        print(f"MQTT publishing disabled: MQTT_BROKER_URL is set but {error}")
+        return None
+    if app.config['MQTT_PAYLOAD'] not in PAYLOADS or app.config['MQTT_QOS'] not in (0, 1, 2):
+        print(f"MQTT publishing disabled: MQTT_PAYLOAD must be one of {', '.join(PAYLOADS)} "
+              f"and MQTT_QOS 0, 1 or 2")
+        return None
+    publisher = MqttPublisher(
+        app, url,
+        payload=app.config['MQTT_PAYLOAD'],
+        qos=app.config['MQTT_QOS'],
+        hub_id=app.config.get('HUB_ID'),
+        topic_prefix=app.config['MQTT_TOPIC_PREFIX'],
+        group=app.config['MQTT_SPARKPLUG_GROUP'],
+        capacity=app.config['MQTT_QUEUE_CAPACITY'],
+        max_inflight=app.config['MQTT_MAX_INFLIGHT'],
+        compression_threshold=app.config['MQTT_COMPRESSION_THRESHOLD'],
+        deadband=app.config['MQTT_DEADBAND']
+    )
+    publisher.start()
+    atexit.register(publisher.stop)
+    app.extensions['mqtt_publisher'] = publisher
+    return publisher
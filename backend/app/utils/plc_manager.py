@@ -1,7 +1,10 @@
 from .mock_plc import MockPLC
-from pymodbus.client import ModbusTcpClient
+from .read_planner import ReadBlock, fetch_block, BIT_AREAS, HOLDING_REGISTER
+from .single_flight import SingleFlight
+from .modbus_bus import BusManager, bus_key, create_client, TCP
 import threading
 import time
+import types
 
 class PLCManager:
     _instance = None
@@ -20,27 +23,37 @@ class PLCManager:
             
         self.plcs = {}  # Dictionary to store PLC instances
         self.mock_mode = True  # Set to False when using real PLCs
+        self.flights = SingleFlight()
+        self.recent = {}  # (plc_id, area, address, count) -> (value, monotonic time read)
+        self.recent_lock = threading.Lock()
         self._initialized = True
     
-    def add_plc(self, plc_id, ip_address, port=502, use_mock=True):
+    def add_plc(self, plc_id, ip_address, port=502, use_mock=True, unit_id=1, protocol=TCP, serial_port=None):
         """Add a new PLC to the manager"""
         if plc_id in self.plcs:
             return False
             
+        # What bus_key and create_client need to find or reach the PLC's bus
+        transport = types.SimpleNamespace(protocol=protocol, ip_address=ip_address, port=port,
+                                          serial_port=serial_port, baudrate=None)
         if use_mock or self.mock_mode:
             plc = MockPLC(ip_address, port)
         else:
-            plc = ModbusTcpClient(ip_address, port=port)
+            plc = create_client(transport)
             
         self.plcs[plc_id] = {
             'instance': plc,
             'ip_address': ip_address,
             'port': port,
+            'unit_id': unit_id or 1,
+            'transport': transport,
             'is_mock': use_mock or self.mock_mode
         }
         
         if use_mock or self.mock_mode:
             plc.start()
+            # Polled on a bus of its own, through the same polling service as real PLCs
+            BusManager().simulated[plc_id] = plc
             
         return True
     
@@ -51,53 +64,95 @@ class PLCManager:
             
         plc = self.plcs[plc_id]
         if plc['is_mock']:
+            BusManager().simulated.pop(plc_id, None)
             plc['instance'].stop()
         else:
             plc['instance'].close()
             
         del self.plcs[plc_id]
+        self.forget_reads(plc_id)
         return True
     
-    def read_register(self, plc_id, address, count=1):
-        """Read a register from a PLC"""
+    def read_register(self, plc_id, address, count=1, area=HOLDING_REGISTER, max_age=None):
+        """Read a register from a PLC.
+
+        Concurrent reads of the same registers share one request; with
+        ``max_age`` (seconds) a value read at most that long ago, by a
+        request or the monitoring thread, is returned without one.
+        """
         if plc_id not in self.plcs:
             return None
             
-        plc = self.plcs[plc_id]
+        key = (plc_id, area, address, count)
+        if max_age is not None:
+            with self.recent_lock:
+                recent = self.recent.get(key)
+            if recent is not None and time.monotonic() - recent[1] <= max_age:
+                return recent[0]
+        value = self.flights.do(key, lambda: self._read(plc_id, address, count, area))
+        if value is not None:
+            with self.recent_lock:
+                self.recent[key] = (value, time.monotonic())
+        return value
+    
+    def forget_reads(self, plc_id):
+        """Drop a PLC's recently read values"""
+        with self.recent_lock:
+            self.recent = {key: recent for key, recent in self.recent.items() if key[0] != plc_id}
+    
+    def _client(self, plc):
+        """The PLC's own client, for when no bus is open for its address"""
+        if not plc['instance'].connected:
+            plc['instance'].connect()
+        return plc['instance']
+    
+    def _read(self, plc_id, address, count, area):
+        plc = self.plcs.get(plc_id)
+        if plc is None:
+            return None
         if plc['is_mock']:
             return plc['instance'].read_register(address, count)
         else:
             try:
-                if not plc['instance'].connected:
-                    plc['instance'].connect()
-                result = plc['instance'].read_holding_registers(address, count)
-                if result.isError():
+                block = ReadBlock(area, address)
+                block.count = count
+                # The bus of a PLC also being polled at this address, queued with its polling
+                with BusManager().existing(bus_key(plc['transport'])) as bus:
+                    if bus is not None:
+                        result = bus.fetch(block, plc['unit_id'])
+                    else:
+                        result = fetch_block(self._client(plc), block, plc['unit_id'])
+                if result is None or result.isError():
                     return None
-                return result.registers[0] if count == 1 else result.registers
+                values = result.bits[:count] if area in BIT_AREAS else result.registers
+                return values[0] if count == 1 else values
             except Exception as e:
                 print(f"Error reading register: {str(e)}")
                 return None
     
     def write_register(self, plc_id, address, value):
-        """Write a value to a PLC register"""
+        """Write a value to a PLC register, ahead of any polling on its bus"""
         if plc_id not in self.plcs:
             return False
             
+        self.forget_reads(plc_id)
         plc = self.plcs[plc_id]
         if plc['is_mock']:
             return plc['instance'].write_register(address, value)
         else:
             try:
-                if not plc['instance'].connected:
-                    plc['instance'].connect()
-                result = plc['instance'].write_register(address, value)
+                with BusManager().existing(bus_key(plc['transport'])) as bus:
+                    if bus is not None:
+                        # Ahead of the polling on the bus
+                        return bus.write(HOLDING_REGISTER, address, [value], plc['unit_id'])
+                    result = self._client(plc).write_register(address, value, slave=plc['unit_id'])
                 return not result.isError()
             except Exception as e:
                 print(f"Error writing register: {str(e)}")
                 return False
     
-    def get_plc_status(self, plc_id):
-        """Get the status of a PLC"""
+    def get_plc_status(self, plc_id, probe=True):
+        """Get the status of a PLC; with probe=False a disconnected client is not reconnected"""
         if plc_id not in self.plcs:
             return None
             
@@ -112,7 +167,7 @@ class PLCManager:
         else:
             try:
                 connected = plc['instance'].connected
-                if not connected:
+                if not connected and probe:
                     plc['instance'].connect()
                     connected = plc['instance'].connected
                 return {
@@ -0,0 +1,190 @@
+from .read_planner import (plan_reads, plan_registers, register_size, REGISTER_AREAS, BIT_AREAS, MAX_READ_COUNT,
+                           COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER)
+import collections
+import math
+import numpy as np
+import time
+
+# Response bytes per address read in each area
+BYTES_PER_ADDRESS = {
+    COIL: 1 / 8,
+    DISCRETE_INPUT: 1 / 8,
+    INPUT_REGISTER: 2,
+    HOLDING_REGISTER: 2,
+}
+
+# Exception codes a device answers a read it cannot serve with
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+
+# Transfer time per byte assumed until the timings show it: a serial byte is 11 bits
+# on the line, a TCP byte next to nothing
+TCP_SECONDS_PER_BYTE = 1e-6
+DEFAULT_BAUDRATE = 9600
+
+# Reads needed, and the spread of their sizes in bytes, before the slope is fitted
+MIN_SAMPLES = 20
+MIN_SIZE_SPREAD = 32
+
+
+def seconds_per_byte(protocol, baudrate):
+    if protocol == 'tcp':
+        return TCP_SECONDS_PER_BYTE
+    return 11 / (baudrate or DEFAULT_BAUDRATE)
+
+
+def response_bytes(area, count):
+    if area in BIT_AREAS:
+        return math.ceil(count / 8)
+    return 2 * count
+
+
+class PlanTuning(collections.namedtuple('PlanTuning', 'max_gap max_count splits')):
+    """Read planner settings of one device: ((area, gap), ...), ((area, count), ...)
+    and a frozenset of (area, address) splits. Hashable, so devices tuned
+    alike share their compiled maps."""
+
+    def options(self):
+        return {'max_gap': dict(self.max_gap), 'max_count': dict(self.max_count), 'splits': self.splits}
+
+
+UNTUNED = PlanTuning((), (), frozenset())
+
+
+class CostModel:
+    """A device's read latency as ``rtt + per_byte * response bytes``, fitted by
+    least squares over its last ``samples`` block reads.
+
+    While the reads are too few or too alike in size to tell the two apart,
+    ``per_byte`` is the transport's prior and only ``rtt`` is measured.
+    """
+
+    def __init__(self, per_byte, samples=256):
+        self.prior_per_byte = per_byte
+        self.sizes = collections.deque(maxlen=samples)
+        self.times = collections.deque(maxlen=samples)
+
+    def add(self, size, seconds):
+        self.sizes.append(size)
+        self.times.append(seconds)
+
+    def fit(self):
+        """(rtt, per_byte, source) in seconds, or None before MIN_SAMPLES reads"""
+        if len(self.sizes) < MIN_SAMPLES:
+            return None
+        sizes = np.array(self.sizes, dtype=np.float64)
+        times = np.array(self.times, dtype=np.float64)
+        if np.ptp(sizes) >= MIN_SIZE_SPREAD:
+            per_byte, rtt = np.polyfit(sizes, times, 1)
+            if per_byte > 0 and rtt > 0:
+                return float(rtt), float(per_byte), 'measured'
+        per_byte = self.prior_per_byte
+        return max(float(np.median(times - per_byte * sizes)), 0.0), per_byte, 'prior'
+
+    @staticmethod
+    def cycle_time(fit, blocks):
+        rtt, per_byte, _ = fit
+        return sum(rtt + per_byte * response_bytes(block.area, block.count) for block in blocks)
+
+
+class PollTuner:
+    """Re-plans one device's block reads from its measured timings.
+
+    Every block read is timed; every ``interval`` seconds the cost model is
+    refitted and each area's largest gap worth reading through is set to
+    the addresses whose transfer takes as long as one request (rounded
+    down to a power of two so devices on similar links plan alike). The
+    device's ``max_count`` words per read is honoured, and exception
+    responses teach it more: a block with unused addresses failing with an
+    illegal address is split there from then on, any other failing block
+    halves the area's read size.
+    """
+
+    def __init__(self, max_count=None, per_byte=TCP_SECONDS_PER_BYTE, interval=60.0):
+        self.max_count = max_count
+        self.interval = interval
+        self.model = CostModel(per_byte)
+        self.limits = {}  # area -> read size learned from exception responses
+        self.splits = set()
+        self.exceptions = 0
+        self.tuning = self._tuning(None)
+        self.fit = None
+        self.next_update = 0.0
+
+    def set_max_count(self, max_count):
+        self.max_count = max_count
+        self.limits.clear()  # Learned against the old limit
+        self.next_update = 0.0
+
+    def observe(self, block, response, elapsed):
+        """Account a block read that took ``elapsed`` seconds; ``response`` is None if none came"""
+        if response is None:
+            return
+        if response.isError():
+            self._learn(block, getattr(response, 'exception_code', None))
+        else:
+            self.model.add(response_bytes(block.area, block.count), elapsed)
+
+    def _learn(self, block, code):
+        if code not in (ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE) or len(block.registers) < 2:
+            return
+        gaps = block.gap_addresses()
+        if gaps and code == ILLEGAL_DATA_ADDRESS:
+            # The gap holds addresses the device does not map
+            self.splits.update((block.area, address) for address in gaps)
+        else:
+            largest = max(register_size(block.area, data_type) for _, _, data_type, _ in block.registers)
+            self.limits[block.area] = max(largest, min(self.limits.get(block.area, block.count), block.count // 2))
+        self.exceptions += 1
+        self.next_update = 0.0  # Re-plan on the next cycle
+
+    def current(self, now=None):
+        """The planner settings to poll with, refitted every ``interval`` seconds
+        and on every call until the model has its first fit"""
+        now = time.monotonic() if now is None else now
+        if now >= self.next_update or self.fit is None:
+            self.fit = self.model.fit()
+            self.tuning = self._tuning(self.fit)
+            self.next_update = now + self.interval
+        return self.tuning
+
+    def area_limit(self, area):
+        limits = [limit for limit in (self.limits.get(area), None if area in BIT_AREAS else self.max_count)
+                  if limit is not None]
+        return min(limits) if limits else None
+
+    def _tuning(self, fit):
+        max_count = {area: self.area_limit(area) for area in REGISTER_AREAS if self.area_limit(area) is not None}
+        max_gap = {}
+        if fit is not None:
+            rtt, per_byte, _ = fit
+            for area in REGISTER_AREAS:
+                gap = min(rtt / (per_byte * BYTES_PER_ADDRESS[area]), MAX_READ_COUNT[area])
+                max_gap[area] = 2 ** int(math.log2(gap)) if gap >= 1 else 0
+        return PlanTuning(tuple(sorted(max_gap.items())), tuple(sorted(max_count.items())), frozenset(self.splits))
+
+    def report(self, plan):
+        """The current plan, cost model and the cycle time it saves over the default planner"""
+        default = plan_reads(plan_registers(plan), max_count={area: self.area_limit(area) for area in REGISTER_AREAS},
+                             splits=self.splits)
+        report = {
+            'plan': [{'area': block.area, 'start': block.start, 'count': block.count,
+                      'registers': len(block.registers)} for block in plan],
+            'model': None,
+            'samples': len(self.model.sizes),
+            'max_gap': dict(self.tuning.max_gap),
+            'max_count': dict(self.tuning.max_count),
+            'splits': sorted(self.splits),
+            'exceptions': self.exceptions,
+            'blocks': {'tuned': len(plan), 'default': len(default)},
+            'next_replan_in': max(0.0, round(self.next_update - time.monotonic(), 1))
+        }
+        if self.fit is not None:
+            rtt, per_byte, source = self.fit
+            tuned_ms = CostModel.cycle_time(self.fit, plan) * 1000
+            default_ms = CostModel.cycle_time(self.fit, default) * 1000
+            report['model'] = {'rtt_ms': round(rtt * 1000, 3), 'per_byte_us': round(per_byte * 1e6, 3),
+                               'per_byte_from': source}
+            report['estimated_cycle_ms'] = {'tuned': round(tuned_ms, 3), 'default': round(default_ms, 3),
+                                            'saved': round(default_ms - tuned_ms, 3)}
+        return report
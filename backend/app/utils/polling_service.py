@@ -0,0 +1,153 @@
+from .modbus_bus import BusManager
+import collections
+import threading
+
+# Consumers that are not Socket.IO clients: start-monitoring (persisted in
+# PLC.monitoring_enabled) and the mock monitoring API
+MONITORING = 'monitoring'
+MOCK_MONITOR = 'mock_monitor'
+
+
+class Demand(collections.namedtuple('Demand', 'registers intervals')):
+    """What a PLC's consumers want polled: a frozenset of register ids, or None
+    for all its monitored registers, and the intervals asked for, None
+    standing for the PLC's own poll interval"""
+
+    def interval(self, configured):
+        return min(configured if interval is None else interval for interval in self.intervals)
+
+
+class PollingService:
+    """One poller per PLC for every consumer of its values.
+
+    The monitoring APIs, provisioning, warm restart and Socket.IO clients
+    subscribe to a (PLC, register set, interval); subscriptions are
+    counted per key and held at most once per consumer. A PLC with any
+    subscription is polled by a single device on its bus, reading the
+    union of the register sets at the fastest interval asked for, and
+    stops being polled with its last subscription.
+    """
+
+    def __init__(self):
+        self.create_device = None  # plc -> BusDevice, see init_polling_service
+        self.subscriptions = {}  # plc_id -> Counter of (registers, interval)
+        self.consumers = {}  # consumer -> set of (plc_id, registers, interval)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(plc_id, registers, interval):
+        return plc_id, None if registers is None else frozenset(registers), interval
+
+    def subscribe(self, consumer, plc, registers=None, interval=None, due=None):
+        """Subscribe ``consumer`` to a PLC's ``registers`` (ids, or None for all
+        monitored) every ``interval`` seconds (None for the PLC's own),
+        starting its poller, first due at monotonic time ``due``, if needed.
+        Returns False if the consumer already held this subscription."""
+        key = self._key(plc.id, registers, interval)
+        with self.lock:
+            held = self.consumers.setdefault(consumer, set())
+            if key in held:
+                return False
+            held.add(key)
+            self.subscriptions.setdefault(plc.id, collections.Counter())[key[1:]] += 1
+            demand = self._demand(plc.id)
+            device = BusManager().device(plc.id)
+            if device is None:
+                device = self.create_device(plc)
+                device.demand = demand
+                if due is not None:
+                    device.next_due = due
+                BusManager().start_device(plc, device)
+            else:
+                device.set_demand(demand)
+        return True
+
+    def unsubscribe(self, consumer, plc_id, registers=None, interval=None):
+        """Drop one of ``consumer``'s subscriptions, returning False if it held none"""
+        key = self._key(plc_id, registers, interval)
+        with self.lock:
+            held = self.consumers.get(consumer, set())
+            if key not in held:
+                return False
+            held.discard(key)
+            if not held:
+                del self.consumers[consumer]
+            self._release(key)
+        return True
+
+    def release(self, consumer):
+        """Drop every subscription of ``consumer``, e.g. a disconnected client"""
+        with self.lock:
+            for key in self.consumers.pop(consumer, ()):
+                self._release(key)
+
+    def forget(self, plc_id):
+        """Drop every subscription to a deleted PLC and stop polling it"""
+        with self.lock:
+            for consumer, held in list(self.consumers.items()):
+                held.difference_update([key for key in held if key[0] == plc_id])
+                if not held:
+                    del self.consumers[consumer]
+            self.subscriptions.pop(plc_id, None)
+            BusManager().stop_device(plc_id)
+
+    def restart(self, plc):
+        """Poll a subscribed PLC with a new device on its current bus and unit id,
+        e.g. once its transport was edited. Returns False if it is not polled."""
+        with self.lock:
+            if plc.id not in self.subscriptions:
+                return False
+            BusManager().stop_device(plc.id)
+            device = self.create_device(plc)
+            device.demand = self._demand(plc.id)
+            BusManager().start_device(plc, device)
+        return True
+
+    def _release(self, key):
+        plc_id = key[0]
+        counts = self.subscriptions[plc_id]
+        counts[key[1:]] -= 1
+        if counts[key[1:]] <= 0:
+            del counts[key[1:]]
+        if not counts:
+            del self.subscriptions[plc_id]
+            BusManager().stop_device(plc_id)
+            return
+        device = BusManager().device(plc_id)
+        if device is not None:
+            device.set_demand(self._demand(plc_id))
+
+    def _demand(self, plc_id):
+        keys = list(self.subscriptions[plc_id])
+        if any(registers is None for registers, _ in keys):
+            registers = None
+        else:
+            registers = frozenset().union(*(registers for registers, _ in keys))
+        return Demand(registers, frozenset(interval for _, interval in keys))
+
+    def is_subscribed(self, consumer, plc_id, registers=None, interval=None):
+        with self.lock:
+            return self._key(plc_id, registers, interval) in self.consumers.get(consumer, ())
+
+    def status(self, plc_id=None):
+        """Subscriptions by PLC: each register set and interval with its count"""
+        with self.lock:
+            return [{
+                'plc_id': subscribed,
+                'subscriptions': [{
+                    'registers': None if registers is None else sorted(registers),
+                    'interval': interval,
+                    'consumers': count
+                } for (registers, interval), count in counts.items()],
+                'consumers': sum(counts.values())
+            } for subscribed, counts in self.subscriptions.items() if plc_id in (None, subscribed)]
+
+
+polling_service = PollingService()
+
+
+def init_polling_service(app):
+    """Poll subscribed PLCs with PLCMonitors of ``app``"""
+    from ..routes.registers import PLCMonitor
+
+    polling_service.create_device = lambda plc: PLCMonitor(app, plc)
@@ -0,0 +1,277 @@
+import numpy as np
+import types
+
+# Modbus data areas and the pymodbus client call used to read each one
+COIL = 'coil'
+DISCRETE_INPUT = 'discrete_input'
+INPUT_REGISTER = 'input_register'
+HOLDING_REGISTER = 'holding_register'
+
+REGISTER_AREAS = (COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER)
+BIT_AREAS = (COIL, DISCRETE_INPUT)
+
+READ_FUNCTIONS = {
+    COIL: 'read_coils',
+    DISCRETE_INPUT: 'read_discrete_inputs',
+    INPUT_REGISTER: 'read_input_registers',
+    HOLDING_REGISTER: 'read_holding_registers',
+}
+
+# Largest quantity a single FC01/02/03/04 request may return
+MAX_READ_COUNT = {
+    COIL: 2000,
+    DISCRETE_INPUT: 2000,
+    INPUT_REGISTER: 125,
+    HOLDING_REGISTER: 125,
+}
+
+# Largest run of unused addresses worth reading to save a request
+MAX_GAP = {
+    COIL: 256,
+    DISCRETE_INPUT: 256,
+    INPUT_REGISTER: 8,
+    HOLDING_REGISTER: 8,
+}
+
+# Number of 16-bit words occupied by each data type
+WORD_COUNTS = {
+    'bool': 1,
+    'int16': 1,
+    'uint16': 1,
+    'int32': 2,
+    'uint32': 2,
+    'float': 2,
+    'float32': 2,
+}
+
+DATA_TYPES = tuple(WORD_COUNTS)
+
+
+def validate_register_area(area, data_type):
+    """Return an error message if the area/data type combination is invalid"""
+    if area not in REGISTER_AREAS:
+        return f'Invalid register_area {area!r}, expected one of {", ".join(REGISTER_AREAS)}'
+    if data_type not in WORD_COUNTS:
+        return f'Invalid data_type {data_type!r}, expected one of {", ".join(DATA_TYPES)}'
+    if area in BIT_AREAS and data_type != 'bool':
+        return f'{area} registers must use the bool data type'
+    if area not in BIT_AREAS and data_type == 'bool':
+        return f'bool data type is only valid for {" and ".join(BIT_AREAS)} registers'
+    return None
+
+
+def register_size(area, data_type):
+    """Number of addresses a register occupies in its area"""
+    if area in BIT_AREAS:
+        return 1
+    return WORD_COUNTS.get(data_type, 1)
+
+
+class ReadBlock:
+    """One contiguous read request and the registers decoded from its response"""
+
+    def __init__(self, area, start):
+        self.area = area
+        self.start = start
+        self.count = 0
+        self.registers = []  # (register_id, offset, data_type, scaling_factor)
+        self._groups = None
+
+    @property
+    def end(self):
+        return self.start + self.count
+
+    def add(self, register_id, address, data_type, scaling_factor):
+        offset = address - self.start
+        self.registers.append((register_id, offset, data_type, scaling_factor))
+        self.count = max(self.count, offset + register_size(self.area, data_type))
+
+    def compile(self):
+        """Group registers by data type into index arrays for vectorised decoding"""
+        groups = {}
+        for register_id, offset, data_type, scaling_factor in self.registers:
+            ids, offsets, scales = groups.setdefault(data_type, ([], [], []))
+            ids.append(register_id)
+            offsets.append(offset)
+            scales.append(1.0 if scaling_factor is None else scaling_factor)
+        self._groups = {
+            data_type: (ids, np.asarray(offsets, dtype=np.intp), np.asarray(scales, dtype=np.float64))
+            for data_type, (ids, offsets, scales) in groups.items()
+        }
+        return self
+
+    def decode(self, response):
+        """Decode a pymodbus read response into {register_id: value}"""
+        if self._groups is None:
+            self.compile()
+        if self.area in BIT_AREAS:
+            return self._decode_bits(response.bits)
+        return self._decode_words(response.registers)
+
+    def _decode_bits(self, bits):
+        # pymodbus pads the unpacked coil bytes to a multiple of 8
+        bits = np.asarray(bits[:self.count], dtype=bool)
+        values = {}
+        for ids, offsets, _ in self._groups.values():
+            values.update(zip(ids, bits[offsets].tolist()))
+        return values
+
+    def _decode_words(self, registers):
+        words = np.asarray(registers[:self.count], dtype=np.uint32)
+        values = {}
+        for data_type, (ids, offsets, scales) in self._groups.items():
+            decoded = _decode_word_group(words, offsets, data_type)
+            decoded = decoded.astype(np.float64) * scales
+            for register_id, value in zip(ids, decoded.tolist()):
+                values[register_id] = value if np.isfinite(value) else None
+        return values
+
+    def gap_addresses(self):
+        """Addresses of the registers preceded by unused addresses within the block"""
+        addresses = []
+        end = self.start
+        for _, offset, data_type, _ in sorted(self.registers, key=lambda register: register[1]):
+            if self.start + offset > end:
+                addresses.append(self.start + offset)
+            end = max(end, self.start + offset + register_size(self.area, data_type))
+        return addresses
+
+    def __repr__(self):
+        return f'<ReadBlock {self.area} {self.start}+{self.count} ({len(self.registers)} registers)>'
+
+
+def _decode_word_group(words, offsets, data_type):
+    if data_type == 'int16':
+        return words[offsets].astype(np.uint16).view(np.int16)
+    if data_type in ('uint16', 'bool'):
+        return words[offsets]
+    high = words[offsets]
+    low = words[offsets + 1]
+    if data_type == 'int32':
+        return ((high << 16) | low).view(np.int32)
+    if data_type == 'uint32':
+        return (high << 16) | low
+    # Floats are stored low word first (CDAB), matching the devices we poll
+    return ((low << 16) | high).view(np.float32)
+
+
+def plan_reads(registers, max_gap=None, max_count=None, splits=()):
+    """Build the block reads needed to poll registers, one set per data area.
+
+    ``registers`` is an iterable of objects with ``id``, ``address``,
+    ``data_type``, ``scaling_factor`` and ``register_area`` attributes.
+    Registers of the same area are merged into one block as long as the
+    block stays within the protocol limit and ``max_count``, and the unused
+    gap between them is no larger than ``max_gap``; both may be given per
+    area as {area: value}. A register whose (area, address) is in
+    ``splits`` always starts a new block.
+    """
+    by_area = {}
+    for register in registers:
+        area = getattr(register, 'register_area', None) or HOLDING_REGISTER
+        by_area.setdefault(area, []).append(register)
+
+    blocks = []
+    for area in REGISTER_AREAS:
+        area_registers = sorted(by_area.get(area, ()), key=lambda r: r.address)
+        gap = _for_area(max_gap, area, MAX_GAP[area])
+        limit = min(_for_area(max_count, area, MAX_READ_COUNT[area]), MAX_READ_COUNT[area])
+        block = None
+        for register in area_registers:
+            size = register_size(area, register.data_type)
+            if (block is None
+                    or register.address - block.end > gap
+                    or register.address + size - block.start > limit
+                    or (area, register.address) in splits):
+                block = ReadBlock(area, register.address)
+                blocks.append(block)
+            block.add(register.id, register.address, register.data_type, register.scaling_factor)
+
+    return [block.compile() for block in blocks]
+
+
+def _for_area(setting, area, default):
+    if isinstance(setting, dict):
+        setting = setting.get(area)
+    return default if setting is None else setting
+
+
+def plan_registers(blocks):
+    """The registers a plan reads, as objects plan_reads accepts"""
+    return [
+        types.SimpleNamespace(id=register_id, address=block.start + offset, data_type=data_type,
+                              scaling_factor=scaling_factor, register_area=block.area)
+        for block in blocks for register_id, offset, data_type, scaling_factor in block.registers
+    ]
+
+
+def encode_value(data_type, value):
+    """The 16-bit words that store a raw ``value`` of ``data_type``, in the
+    word order the decoders expect; raises ValueError if it does not fit"""
+    if data_type in ('float', 'float32'):
+        word = int(np.array(value, dtype=np.float32).view(np.uint32))
+        return [word & 0xFFFF, word >> 16]
+    value = int(round(value))
+    low, high = {
+        'bool': (0, 1),
+        'int16': (-0x8000, 0x7FFF),
+        'uint16': (0, 0xFFFF),
+        'int32': (-0x80000000, 0x7FFFFFFF),
+        'uint32': (0, 0xFFFFFFFF),
+    }[data_type]
+    if not low <= value <= high:
+        raise ValueError(f'{value} is out of range for {data_type}')
+    if WORD_COUNTS[data_type] == 1:
+        return [value & 0xFFFF]
+    value &= 0xFFFFFFFF
+    return [value >> 16, value & 0xFFFF]
+
+
+def fetch_block(client, block, unit_id=1):
+    """Send one planned read and return the raw response, which may be an
+    exception response, or None if none came"""
+    try:
+        read = getattr(client, READ_FUNCTIONS[block.area])
+        response = read(block.start, block.count, slave=unit_id)
+        if response.isError():
+            print(f"Error reading {block}: {response}")
+        return response
+    except Exception as e:
+        print(f"Error reading {block}: {str(e)}")
+        return None
+
+
+def decode_block(block, response):
+    """Decode a fetched response into {register_id: value}, or None on failure"""
+    if response is None or response.isError():
+        return None
+    try:
+        return block.decode(response)
+    except Exception as e:
+        print(f"Error reading {block}: {str(e)}")
+        return None
+
+
+def read_block(client, block, unit_id=1):
+    """Execute one planned read and return {register_id: value}, or None on failure"""
+    return decode_block(block, fetch_block(client, block, unit_id))
+
+
+def decode_responses(fetched):
+    """Decode a cycle's (block, response) pairs and merge the values"""
+    values = {}
+    for block, response in fetched:
+        block_values = decode_block(block, response)
+        if block_values:
+            values.update(block_values)
+    return values
+
+
+def execute_plan(client, blocks, unit_id=1):
+    """Execute every block of a read plan and merge the decoded values"""
+    values = {}
+    for block in blocks:
+        block_values = read_block(client, block, unit_id)
+        if block_values:
+            values.update(block_values)
+    return values
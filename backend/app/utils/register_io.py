@@ -0,0 +1,213 @@
+from .read_planner import validate_register_area, register_size, HOLDING_REGISTER
+from .derived_tags import DERIVED
+import codecs
+import csv
+import io
+import json
+
+# Columns accepted on import and written on export, in export order
+REGISTER_FIELDS = (
+    'name', 'address', 'register_area', 'data_type', 'scaling_factor', 'history_deadband',
+    'history_deviation', 'unit', 'description', 'is_monitored', 'min_value', 'max_value', 'read_write',
+    'expression'
+)
+
+READ_WRITE_MODES = ('read_write', 'read_only', 'write_only')
+
+# Stop collecting validation errors after this many
+MAX_ERRORS = 100
+
+TRUE_STRINGS = ('1', 'true', 'yes', 'y', 't')
+FALSE_STRINGS = ('0', 'false', 'no', 'n', 'f', '')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_STRINGS:
+        return True
+    if text in FALSE_STRINGS:
+        return False
+    raise ValueError(f'invalid boolean {value!r}')
+
+
+def _to_float(value):
+    return None if _blank(value) else float(value)
+
+
+def parse_register_row(raw):
+    """Normalise one imported row into Register column values, raising ValueError"""
+    if _blank(raw.get('name')):
+        raise ValueError('name is required')
+    register_area = raw.get('register_area')
+    register_area = HOLDING_REGISTER if _blank(register_area) else str(register_area).strip()
+    expression = None if _blank(raw.get('expression')) else str(raw['expression']).strip()
+    if expression is not None or register_area == DERIVED:
+        if expression is None:
+            raise ValueError('expression is required for derived registers')
+        # Derived registers are never read, so they have no address of their own
+        register_area, data_type, address = DERIVED, 'float', 0
+    else:
+        if _blank(raw.get('address')):
+            raise ValueError('address is required')
+        address = int(float(raw['address']))
+        if not 0 <= address <= 65535:
+            raise ValueError(f'address {address} is outside 0..65535')
+        data_type = str(raw.get('data_type') or '').strip()
+        error = validate_register_area(register_area, data_type)
+        if error:
+            raise ValueError(error)
+
+    read_write = raw.get('read_write')
+    read_write = 'read_write' if _blank(read_write) else str(read_write).strip()
+    if read_write not in READ_WRITE_MODES:
+        raise ValueError(f'read_write must be one of {", ".join(READ_WRITE_MODES)}')
+
+    scaling_factor = _to_float(raw.get('scaling_factor'))
+    history_deadband = _to_float(raw.get('history_deadband'))
+    history_deviation = _to_float(raw.get('history_deviation'))
+    if (history_deadband or 0) < 0 or (history_deviation or 0) < 0:
+        raise ValueError('history_deadband and history_deviation must not be negative')
+    return {
+        'name': str(raw['name']).strip()[:80],
+        'address': address,
+        'register_area': register_area,
+        'data_type': data_type,
+        'scaling_factor': 1.0 if scaling_factor is None else scaling_factor,
+        'history_deadband': history_deadband,
+        'history_deviation': history_deviation,
+        'unit': None if _blank(raw.get('unit')) else str(raw['unit']).strip()[:20],
+        'description': None if _blank(raw.get('description')) else str(raw['description'])[:255],
+        'is_monitored': True if _blank(raw.get('is_monitored')) else _to_bool(raw['is_monitored']),
+        'min_value': _to_float(raw.get('min_value')),
+        'max_value': _to_float(raw.get('max_value')),
+        'read_write': read_write,
+        'expression': expression
+    }
+
+
+def iter_csv_rows(stream, encoding='utf-8'):
+    """Yield dict rows from a binary CSV stream without reading it all"""
+    text = codecs.getreader(encoding)(stream)
+    yield from csv.DictReader(text)
+
+
+def iter_json_rows(stream, chunk_size=65536):
+    """Yield objects from a binary JSON array (or JSON Lines) stream incrementally"""
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    eof = False
+    while True:
+        position = 0
+        while True:
+            # Skip separators between objects
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+                position += 1
+            if position >= len(buffer):
+                break
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError('Invalid JSON in request body')
+                break  # Object continues in the next chunk
+            if not isinstance(row, dict):
+                raise ValueError('Each register must be a JSON object')
+            yield row
+            position = end
+        buffer = buffer[position:]
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += reader.decode(chunk, final=eof)
+
+
+def find_overlaps(intervals):
+    """Yield (a, b) label pairs whose [start, end) address intervals overlap.
+
+    ``intervals`` maps a register area to a list of (start, end, label).
+    """
+    for area_intervals in intervals.values():
+        area_intervals.sort()
+        furthest = None
+        for interval in area_intervals:
+            if furthest is not None and interval[0] < furthest[1]:
+                yield furthest[2], interval[2]
+            if furthest is None or interval[1] > furthest[1]:
+                furthest = interval
+
+
+def validate_register_rows(raw_rows, existing=(), validate_expression=None):
+    """Parse and validate imported rows, returning (rows, errors).
+
+    ``existing`` is an iterable of (register_area, address, data_type,
+    name) for registers the import must not overlap. Multi-word types
+    occupy ``register_size`` addresses, so a float at 10 collides with an
+    int16 at 11. Derived rows are checked with ``validate_expression``,
+    returning an error message or None, and refused without it.
+    """
+    rows = []
+    errors = []
+    intervals = {}
+    for register_area, address, data_type, name in existing:
+        if register_area == DERIVED:
+            continue
+        end = address + register_size(register_area, data_type)
+        intervals.setdefault(register_area, []).append((address, end, f'existing register {name!r}'))
+
+    for line, raw in enumerate(raw_rows, start=1):
+        try:
+            row = parse_register_row(raw)
+        except (ValueError, TypeError) as e:
+            if len(errors) < MAX_ERRORS:
+                errors.append({'row': line, 'error': str(e)})
+            continue
+        if row['expression'] is not None:
+            error = (validate_expression(row['expression']) if validate_expression is not None
+                     else 'expression is not allowed here, derived registers belong to a PLC')
+            if error:
+                if len(errors) < MAX_ERRORS:
+                    errors.append({'row': line, 'error': error})
+                continue
+            rows.append(row)
+            continue
+        end = row['address'] + register_size(row['register_area'], row['data_type'])
+        intervals.setdefault(row['register_area'], []).append((row['address'], end, f'row {line}'))
+        rows.append(row)
+
+    for first, second in find_overlaps(intervals):
+        if len(errors) >= MAX_ERRORS:
+            break
+        if first.startswith('existing') and second.startswith('existing'):
+            continue  # Not introduced by this import
+        errors.append({'error': f'{second} overlaps {first}'})
+    return rows, errors
+
+
+def iter_csv_export(rows):
+    """Yield CSV text for an iterable of register tuples in REGISTER_FIELDS order"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REGISTER_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json_export(rows):
+    """Yield a JSON array for an iterable of register tuples in REGISTER_FIELDS order"""
+    yield '['
+    for count, row in enumerate(rows):
+        yield (',' if count else '') + json.dumps(dict(zip(REGISTER_FIELDS, row)))
+    yield ']'
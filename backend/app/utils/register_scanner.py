@@ -0,0 +1,212 @@
+from .read_planner import HOLDING_REGISTER, INPUT_REGISTER, MAX_READ_COUNT, READ_FUNCTIONS
+from .background import sleep
+import numpy as np
+import time
+
+# Address space of one Modbus register area
+ADDRESS_SPACE = 65536
+
+# Exception codes meaning "not here", which the scan bisects around
+# (illegal function, illegal data address, illegal data value, device failure)
+ABSENT_EXCEPTIONS = (1, 2, 3, 4)
+
+SCAN_AREAS = (HOLDING_REGISTER, INPUT_REGISTER)
+
+AREA_PREFIXES = {HOLDING_REGISTER: 'HR', INPUT_REGISTER: 'IR'}
+
+
+class ScanAborted(Exception):
+    pass
+
+
+class RegisterScanner:
+    """Sweeps a device's register space and proposes a register map.
+
+    Each area is read in maximum-size blocks. A block answered with an
+    exception is bisected down to ``resolution`` addresses, so sparse maps
+    cost a few extra requests per boundary rather than one request per
+    address, and any valid range of at least ``2 * resolution - 1``
+    addresses is found with its exact edges. An unmapped block costs about
+    ``2 * block / resolution`` requests. Valid ranges are then
+    sampled a few times and the value statistics are used to guess data
+    types. ``exhaustive=True`` bisects every rejected block down to single
+    addresses, to find shorter ranges at the cost of many more requests.
+
+    ``transaction`` is a context manager factory yielding a connected
+    client (usually ``ModbusBus.transaction``) so the scan shares the bus
+    with live polling, and ``rate_limit`` caps requests per second.
+    """
+
+    def __init__(self, transaction, unit_id=1, areas=SCAN_AREAS, start=0, end=ADDRESS_SPACE,
+                 rate_limit=100.0, samples=3, sample_interval=0.5, resolution=8, exhaustive=False,
+                 progress=None):
+        self.transaction = transaction
+        self.unit_id = unit_id
+        self.areas = areas
+        self.start = max(0, start)
+        self.end = min(ADDRESS_SPACE, end)
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0.0
+        self.samples = max(1, samples)
+        self.sample_interval = sample_interval
+        self.resolution = 1 if exhaustive else max(1, resolution)
+        self.exhaustive = exhaustive
+        self.progress = progress
+        self.requests = 0
+        self.cancelled = False
+        self._last_request = 0.0
+        self._gap = None  # (address, count) of the last rejected block left unresolved
+
+    def _read(self, area, address, count):
+        """Return the words at address, or None if the device rejects the range"""
+        if self.cancelled:
+            raise ScanAborted('Scan cancelled')
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            sleep(wait)
+        try:
+            with self.transaction() as client:
+                response = getattr(client, READ_FUNCTIONS[area])(address, count, slave=self.unit_id)
+        finally:
+            self._last_request = time.monotonic()
+            self.requests += 1
+        if response.isError():
+            if getattr(response, 'exception_code', None) in ABSENT_EXCEPTIONS:
+                return None
+            raise ScanAborted(f'Device stopped responding at {area} {address}: {response}')
+        return response.registers[:count]
+
+    def _sweep(self, area, address, count, ranges, resolution):
+        """Read a range, bisecting rejected ranges larger than ``resolution``.
+
+        Returns True if any address in the range was readable.
+        """
+        words = self._read(area, address, count)
+        if words is not None:
+            # The range may start inside the rejected block just before, so resolve its exact start
+            gap, self._gap = self._gap, None
+            if gap is not None and gap[0] + gap[1] == address:
+                self._sweep(area, gap[0], gap[1], ranges, 1)
+            if ranges and ranges[-1][0] + len(ranges[-1][1]) == address:
+                ranges[-1][1].extend(words)
+            else:
+                ranges.append((address, list(words)))
+            return True
+        # Always resolve the exact end of a range we just found
+        at_edge = bool(ranges) and ranges[-1][0] + len(ranges[-1][1]) == address
+        if count == 1:
+            self._gap = None
+            return False
+        if count <= resolution and not at_edge:
+            self._gap = (address, count)
+            return False
+        half = count // 2
+        found = self._sweep(area, address, half, ranges, resolution)
+        return self._sweep(area, address + half, count - half, ranges, resolution) or found
+
+    def sweep(self, area):
+        """Find the readable address ranges of an area as [(start, words)]"""
+        ranges = []
+        self._gap = None
+        block_size = MAX_READ_COUNT[area]
+        for address in range(self.start, self.end, block_size):
+            count = min(block_size, self.end - address)
+            self._sweep(area, address, count, ranges, self.resolution)
+            if self.progress:
+                self.progress(area, address + count - self.start, self.end - self.start)
+        return ranges
+
+    def sample(self, area, ranges):
+        """Re-read the valid ranges to get (samples, words) arrays per range"""
+        sampled = [[words] for _, words in ranges]
+        for _ in range(self.samples - 1):
+            sleep(self.sample_interval)
+            for (start, words), samples in zip(ranges, sampled):
+                values = []
+                for offset in range(0, len(words), MAX_READ_COUNT[area]):
+                    count = min(MAX_READ_COUNT[area], len(words) - offset)
+                    block = self._read(area, start + offset, count)
+                    values.extend(block if block is not None else words[offset:offset + count])
+                samples.append(values)
+        return [(start, np.asarray(samples, dtype=np.uint32))
+                for (start, _), samples in zip(ranges, sampled)]
+
+    def run(self):
+        """Scan every area and return (ranges, proposed registers)"""
+        found_ranges = []
+        proposals = []
+        for area in self.areas:
+            ranges = self.sweep(area)
+            found_ranges.extend({'register_area': area, 'start': start, 'count': len(words)}
+                                for start, words in ranges)
+            for start, samples in self.sample(area, ranges):
+                proposals.extend(infer_registers(area, start, samples))
+        return found_ranges, proposals
+
+
+def _as_float(low, high):
+    # Same CDAB word order the read planner decodes floats with
+    return ((high << 16) | low).astype(np.uint32).view(np.float32)
+
+
+def _looks_like_float(low, high):
+    if not np.any(high):
+        return False
+    values = _as_float(low, high)
+    if not np.all(np.isfinite(values)):
+        return False
+    magnitudes = np.abs(values[values != 0])
+    return magnitudes.size > 0 and bool(np.all((magnitudes > 1e-4) & (magnitudes < 1e9)))
+
+
+def _looks_like_int32(high, low):
+    # The high word of a 32-bit counter or signed value is mostly sign extension
+    return bool(np.any(low) and np.all(high == high[0]) and high[0] in (0, 0xFFFF) and np.any(low != low[0]))
+
+
+def infer_registers(area, start, samples):
+    """Guess registers for one contiguous range from its (samples, words) values.
+
+    Word pairs whose high word is pure sign extension while the low word
+    changes are proposed as 32-bit integers, other words that stay zero
+    are skipped, pairs that decode to plausible finite floats are
+    proposed as floats, and the remaining words as int16 when they look
+    like small negatives, else uint16.
+    """
+    proposals = []
+    count = samples.shape[1]
+    offset = 0
+    while offset < count:
+        word = samples[:, offset]
+        following = samples[:, offset + 1] if offset + 1 < count else None
+        data_type = None
+        if following is not None and _looks_like_int32(word, following):
+            data_type = 'int32' if word[0] == 0xFFFF else 'uint32'
+        elif not np.any(word):
+            offset += 1
+            continue
+        elif following is not None and _looks_like_float(word, following):
+            data_type = 'float'
+        if data_type is None:
+            data_type = 'int16' if np.all(word >= 0xF000) else 'uint16'
+        size = 1 if data_type in ('int16', 'uint16') else 2
+        values = samples[:, offset:offset + size]
+        if data_type == 'float':
+            decoded = _as_float(values[:, 0], values[:, 1]).astype(np.float64)
+        elif size == 2:
+            decoded = ((values[:, 0] << 16) | values[:, 1]).astype(np.uint32)
+            decoded = decoded.view(np.int32) if data_type == 'int32' else decoded
+        else:
+            decoded = values[:, 0].astype(np.uint16)
+            decoded = decoded.view(np.int16) if data_type == 'int16' else decoded
+        address = start + offset
+        proposals.append({
+            'name': f'{AREA_PREFIXES[area]}{address}',
+            'address': address,
+            'register_area': area,
+            'data_type': data_type,
+            'min_seen': float(decoded.min()),
+            'max_seen': float(decoded.max()),
+            'changing': bool(np.any(decoded != decoded[0]))
+        })
+        offset += size
+    return proposals
@@ -0,0 +1,151 @@
+from flask import request, session, current_app
+from collections import OrderedDict
+from functools import wraps
+from .compression import ENCODINGS
+import hashlib
+import threading
+
+# Serialized responses kept across all users and resources
+MAX_ENTRIES = 1024
+
+PLCS = 'plcs'
+REGISTERS = 'registers'
+ALARM_RULES = 'alarm_rules'
+TEMPLATES = 'templates'
+
+
+class ResponseCache:
+    """Serialized JSON responses keyed by user, URL and resource generations.
+
+    Every cached view depends on one or more resources such as ``'plcs'``
+    or ``('registers', plc_id)``. Write handlers bump the generation of the
+    resources they change, so cached entries built from an older
+    generation are never served again and age out of the LRU.
+
+    Generations live in process memory; with several server processes each
+    keeps its own cache and sees only its own writes.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.generations = {}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, resource):
+        return self.generations.get(resource, 0)
+
+    def bump(self, *resources):
+        with self.lock:
+            for resource in resources:
+                self.generations[resource] = self.generations.get(resource, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+def plcs_changed():
+    """Call after PLC rows, their status or their polling state change"""
+    response_cache.bump(PLCS)
+
+
+def registers_changed(plc_id):
+    """Call after any register of a PLC is created, updated or deleted"""
+    response_cache.bump((REGISTERS, plc_id), REGISTERS)
+
+
+def templates_changed(template_id):
+    """Call after a device template or any of its registers is created, updated or deleted"""
+    response_cache.bump((TEMPLATES, template_id), TEMPLATES, REGISTERS)
+
+
+def alarm_rules_changed(plc_id):
+    """Call after any alarm rule of a PLC's registers is created, updated or deleted"""
+    response_cache.bump((ALARM_RULES, plc_id))
+
+
+def _matching_etag(etag):
+    """The tag from If-None-Match naming this entry in any content coding, or None"""
+    for candidate in (etag,) + tuple(f'{etag}-{encoding}' for encoding in ENCODINGS):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _cached_body(entry):
+    etag, body, headers = entry
+    response = current_app.response_class(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def cached_response(*resources):
+    """Serve a GET view's JSON from the cache, answering 304 to a matching If-None-Match.
+
+    ``resources`` are resource keys, or callables taking the view's
+    keyword arguments and returning one. Place it above
+    ``@login_required``: a hit is keyed by the signed session's user id and
+    answered without loading the user or touching the database, while a
+    miss runs the view (and its login check) and stores a successful
+    response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = session.get('_user_id')
+            if user_id is None:
+                return view(*args, **kwargs)
+            keys = [resource(**kwargs) if callable(resource) else resource for resource in resources]
+            key = (user_id, request.full_path, tuple(response_cache.generation(k) for k in keys))
+
+            entry = response_cache.get(key)
+            if entry is not None:
+                etag = _matching_etag(entry[0])
+                if etag:
+                    return _not_modified(etag)
+                return _cached_body(entry)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype != 'application/json':
+                return response
+            body = response.get_data()
+            # Keep headers such as the pagination cursor, but not per-response ones
+            headers = [(name, value) for name, value in response.headers
+                       if name not in ('Content-Type', 'Content-Length', 'Set-Cookie')]
+            entry = (hashlib.sha256(body).hexdigest()[:32], body, headers)
+            response_cache.put(key, entry)
+            etag = _matching_etag(entry[0])
+            if etag:
+                return _not_modified(etag)
+            response.set_etag(entry[0])
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
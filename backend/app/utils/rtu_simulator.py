@@ -0,0 +1,127 @@
+from pymodbus.utilities import computeCRC
+from .read_planner import COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER
+from .background import start_task
+import os
+import select
+import struct
+import tty
+
+# Function code -> (data area, is a read)
+FUNCTIONS = {
+    1: (COIL, True),
+    2: (DISCRETE_INPUT, True),
+    3: (HOLDING_REGISTER, True),
+    4: (INPUT_REGISTER, True),
+    5: (COIL, False),
+    6: (HOLDING_REGISTER, False),
+    16: (HOLDING_REGISTER, False),
+}
+
+
+class RtuSimulator:
+    """Modbus RTU slaves served on a pseudo-terminal.
+
+    Several unit ids share the pty the way slaves share an RS-485 line, so
+    a PLC configured with ``protocol='rtu'`` and ``serial_port`` set to
+    :attr:`port` exercises the serial framer and bus scheduling without
+    hardware. Frames addressed to unknown unit ids get no answer.
+    """
+
+    def __init__(self, unit_ids=(1,), size=1000):
+        self.master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)
+        self.port = os.ttyname(slave_fd)
+        self._slave_fd = slave_fd
+        self.slaves = {
+            unit_id: {area: [0] * size for area in (COIL, DISCRETE_INPUT, INPUT_REGISTER, HOLDING_REGISTER)}
+            for unit_id in unit_ids
+        }
+        self.frames = 0
+        self.running = False
+        self.thread = None
+
+    def set_values(self, unit_id, area, address, values):
+        self.slaves[unit_id][area][address:address + len(values)] = values
+
+    def get_values(self, unit_id, area, address, count=1):
+        return self.slaves[unit_id][area][address:address + count]
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = start_task(self._serve)
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self._slave_fd)
+
+    def _serve(self):
+        buffer = b''
+        while self.running:
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                # A silent line ends any partial frame
+                buffer = b''
+                continue
+            buffer += os.read(self.master_fd, 256)
+            while True:
+                length = self._frame_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                frame, buffer = buffer[:length], buffer[length:]
+                response = self.handle(frame)
+                if response:
+                    os.write(self.master_fd, response)
+
+    @staticmethod
+    def _frame_length(buffer):
+        if len(buffer) < 2:
+            return None
+        if buffer[1] == 16:
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+        return 8
+
+    def handle(self, frame):
+        """Answer one request frame, or return None if it is not for us"""
+        body, crc = frame[:-2], struct.unpack('>H', frame[-2:])[0]
+        if computeCRC(body) != crc:
+            return None
+        unit_id, function_code = body[0], body[1]
+        if unit_id not in self.slaves:
+            return None
+        self.frames += 1
+        if function_code not in FUNCTIONS:
+            return self._pack(unit_id, function_code | 0x80, bytes([1]))
+
+        area, is_read = FUNCTIONS[function_code]
+        store = self.slaves[unit_id][area]
+        address, quantity = struct.unpack('>HH', body[2:6])
+        if function_code in (5, 6):
+            quantity = 1
+        if address + quantity > len(store):
+            return self._pack(unit_id, function_code | 0x80, bytes([2]))
+
+        if is_read and area in (COIL, DISCRETE_INPUT):
+            packed = bytearray((quantity + 7) // 8)
+            for i, bit in enumerate(store[address:address + quantity]):
+                if bit:
+                    packed[i // 8] |= 1 << (i % 8)
+            return self._pack(unit_id, function_code, bytes([len(packed)]) + bytes(packed))
+        if is_read:
+            words = struct.pack(f'>{quantity}H', *store[address:address + quantity])
+            return self._pack(unit_id, function_code, bytes([len(words)]) + words)
+        if function_code == 5:
+            store[address] = 1 if body[4] == 0xFF else 0
+        elif function_code == 6:
+            store[address] = struct.unpack('>H', body[4:6])[0]
+        else:
+            store[address:address + quantity] = struct.unpack(f'>{quantity}H', body[7:7 + 2 * quantity])
+        return self._pack(unit_id, function_code, body[2:6])
+
+    @staticmethod
+    def _pack(unit_id, function_code, payload):
+        body = bytes([unit_id, function_code]) + payload
+        return body + struct.pack('>H', computeCRC(body))
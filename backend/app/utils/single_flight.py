@@ -0,0 +1,58 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    A caller arriving while a call with the same key is in flight waits
+    for it and gets its result (or exception) instead of starting its own,
+    so ten requests for the same registers cost one device transaction.
+    Nothing is cached once the call returns.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> _Call in flight
+        self.lock = threading.Lock()
+        self.started = 0
+        self.shared = 0
+
+    def do(self, key, function, join=True):
+        """Run ``function`` for ``key``, or wait for the call already in flight;
+        with ``join=False`` such a call is not waited for and ``function`` runs
+        on its own"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.started += 1
+            elif join:
+                self.shared += 1
+        if not leader and not join:
+            return function()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def status(self):
+        with self.lock:
+            return {'calls': self.started, 'coalesced': self.shared, 'in_flight': len(self.calls)}
@@ -0,0 +1,299 @@
+import fcntl
+import gzip
+import numpy as np
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from .background import start_task, run_in_thread
+
+MAGIC = b'PLCRING1'
+VERSION = 1
+
+# One sample as stored on disk: 24 bytes, little-endian
+RECORD = np.dtype([('timestamp', '<f8'), ('plc_id', '<u4'), ('register_id', '<u4'), ('value', '<f8')])
+
+HEADER = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4'),
+    ('capacity', '<u8'),
+    ('head', '<u8'),     # Sequence number of the next sample written
+    ('cursor', '<u8'),   # Sequence number of the next sample to forward
+    ('dropped', '<u8'),  # Samples overwritten before they were forwarded
+])
+
+# Records start on a page boundary after the header
+HEADER_SIZE = 4096
+
+# Content type of an uploaded batch (see Forwarder)
+BATCH_CONTENT_TYPE = 'application/vnd.modbushub.samples'
+
+
+class SampleRing:
+    """Bounded ring of samples in a memory-mapped file.
+
+    Samples are addressed by an ever-increasing sequence number and stored
+    in slot ``sequence % capacity``, so the file never grows past
+    ``capacity`` records. When the writer laps the forward cursor the
+    oldest unsent samples are overwritten and counted in ``dropped``.
+    ``head`` and ``cursor`` live in the file header and survive restarts;
+    :meth:`flush` syncs them to disk. Only one process may open a ring.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'ab')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            raise RuntimeError(f'{path} is in use by another process')
+        if os.path.getsize(path) >= HEADER_SIZE:
+            header = np.memmap(path, dtype=HEADER, mode='r+', shape=(1,))
+            if header['magic'][0] != MAGIC or header['record_size'][0] != RECORD.itemsize:
+                raise ValueError(f'{path} is not a sample ring file')
+            if int(header['capacity'][0]) != capacity:
+                print(f"Keeping the existing capacity of {path} ({int(header['capacity'][0])} samples)")
+            capacity = int(header['capacity'][0])
+        else:
+            self._file.truncate(HEADER_SIZE + capacity * RECORD.itemsize)  # Sparse until written
+            header = np.memmap(path, dtype=HEADER, mode='r+', shape=(1,))
+            header[0] = (MAGIC, VERSION, RECORD.itemsize, capacity, 0, 0, 0)
+            header.flush()
+        self.header = header
+        self.capacity = capacity
+        self.records = np.memmap(path, dtype=RECORD, mode='r+', offset=HEADER_SIZE, shape=(capacity,))
+
+    @property
+    def head(self):
+        return int(self.header['head'][0])
+
+    @property
+    def cursor(self):
+        return int(self.header['cursor'][0])
+
+    @property
+    def dropped(self):
+        return int(self.header['dropped'][0])
+
+    def __len__(self):
+        return self.head - self.cursor
+
+    def append(self, samples):
+        """Append a RECORD array, overwriting the oldest unsent samples when full"""
+        if not len(samples):
+            return
+        with self.lock:
+            head = self.head
+            if len(samples) > self.capacity:
+                head += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+            start = head % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self.records[start:start + first] = samples[:first]
+            self.records[:len(samples) - first] = samples[first:]
+            head += len(samples)
+            cursor = self.cursor
+            if head - cursor > self.capacity:
+                self.header['dropped'] += head - self.capacity - cursor
+                self.header['cursor'] = head - self.capacity
+            self.header['head'] = head
+
+    def read(self, limit):
+        """Return (first sequence, copy of up to ``limit`` unsent samples)"""
+        with self.lock:
+            cursor = self.cursor
+            count = min(limit, self.head - cursor)
+            start = cursor % self.capacity
+            first = min(count, self.capacity - start)
+            batch = np.concatenate((self.records[start:start + first], self.records[:count - first]))
+        return cursor, batch
+
+    def advance(self, sequence, count):
+        """Mark samples up to ``sequence + count`` as forwarded"""
+        with self.lock:
+            # The writer may already have moved the cursor past them
+            if sequence + count > self.cursor:
+                self.header['cursor'] = min(sequence + count, self.head)
+
+    def flush(self):
+        with self.lock:
+            self.records.flush()
+            self.header.flush()
+
+    def close(self):
+        self.flush()
+        del self.records
+        del self.header
+        self._file.close()  # Releases the lock
+
+
+class Forwarder:
+    """Stores polled values in a SampleRing and replays them upstream.
+
+    Every poll cycle is appended to the ring, online or not, and a
+    background thread uploads the backlog from the durable cursor in
+    batches of up to ``batch_size`` samples, keeping the average upload
+    under ``max_bytes_per_second``. A failed upload leaves the cursor
+    where it was and is retried with exponential backoff, so an outage
+    only grows the backlog.
+
+    With ``changes_only`` a register's value is only stored when it
+    differs from the last stored one or ``heartbeat`` seconds have
+    passed, which keeps slow signals from filling the ring.
+
+    Batches are POSTed to ``url`` as gzip-encoded
+    ``application/vnd.modbushub.samples``: the timestamps (float64), PLC
+    ids (uint32), register ids (uint32) and values (float64) of the batch
+    as consecutive little-endian arrays, with ``X-Hub-Id``,
+    ``X-First-Sequence`` and ``X-Sample-Count`` headers. Sequence numbers
+    let the receiver discard a batch it has already accepted.
+    """
+
+    def __init__(self, ring, url, hub_id=None, batch_size=50000, max_bytes_per_second=262144,
+                 compression_level=6, changes_only=True, heartbeat=60.0, timeout=30.0):
+        self.ring = ring
+        self.url = url
+        self.hub_id = hub_id or socket.gethostname()
+        self.batch_size = batch_size
+        self.max_bytes_per_second = max_bytes_per_second
+        self.compression_level = compression_level
+        self.changes_only = changes_only
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.last_stored = {}  # (plc_id, register_id) -> (value, timestamp)
+        self.last_error = None
+        self.last_upload = None
+        self.uploaded = 0
+        self.running = False
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self._store_lock = threading.Lock()
+
+    def store(self, plc_id, values, timestamp=None):
+        """Append one poll cycle's {register_id: value}"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._store_lock:
+            rows = []
+            for register_id, value in values.items():
+                if value is None:
+                    continue
+                value = float(value)
+                if self.changes_only:
+                    # Template registers are shared, so the same id is polled on several PLCs
+                    last = self.last_stored.get((plc_id, register_id))
+                    if last is not None and last[0] == value and timestamp - last[1] < self.heartbeat:
+                        continue
+                    self.last_stored[plc_id, register_id] = (value, timestamp)
+                rows.append((timestamp, plc_id, register_id, value))
+        if rows:
+            self.ring.append(np.array(rows, dtype=RECORD))
+            self.wakeup.set()
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.stopping.clear()
+            self.thread = start_task(self._run)
+
+    def stop(self):
+        self.running = False
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        self.ring.flush()
+
+    def encode(self, batch):
+        body = b''.join(np.ascontiguousarray(batch[field]).tobytes() for field in RECORD.names)
+        return gzip.compress(body, self.compression_level)
+
+    def upload(self, sequence, batch):
+        # Compressing a batch takes long enough to hold up green threads
+        request = urllib.request.Request(self.url, data=run_in_thread(self.encode, batch), method='POST', headers={
+            'Content-Type': BATCH_CONTENT_TYPE,
+            'Content-Encoding': 'gzip',
+            'X-Hub-Id': self.hub_id,
+            'X-First-Sequence': str(sequence),
+            'X-Sample-Count': str(len(batch)),
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+        return len(request.data)
+
+    def _run(self):
+        backoff = 1.0
+        last_flush = time.monotonic()
+        while self.running:
+            if time.monotonic() - last_flush >= 1.0:
+                self.ring.flush()
+                last_flush = time.monotonic()
+            if not len(self.ring):
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                continue
+
+            sequence, batch = self.ring.read(self.batch_size)
+            started = time.monotonic()
+            try:
+                sent = self.upload(sequence, batch)
+            except (urllib.error.URLError, OSError) as e:
+                self.last_error = str(getattr(e, 'reason', e))
+                print(f"Store and forward upload failed, retrying in {backoff:.0f}s: {self.last_error}")
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            backoff = 1.0
+            self.ring.advance(sequence, len(batch))
+            self.ring.flush()  # The cursor must not go back after a restart
+            last_flush = time.monotonic()
+            self.uploaded += len(batch)
+            self.last_upload = time.time()
+            self.last_error = None
+
+            if self.max_bytes_per_second:
+                # Throttle the replay so a backlog does not saturate the uplink
+                wait = sent / self.max_bytes_per_second - (time.monotonic() - started)
+                if wait > 0:
+                    self.stopping.wait(wait)
+
+    def status(self):
+        return {
+            'url': self.url,
+            'hub_id': self.hub_id,
+            'capacity': self.ring.capacity,
+            'stored': self.ring.head,
+            'forwarded': self.ring.cursor,
+            'backlog': len(self.ring),
+            'dropped': self.ring.dropped,
+            'uploaded_this_run': self.uploaded,
+            'last_upload': self.last_upload,
+            'last_error': self.last_error
+        }
+
+
+def init_store_forward(app):
+    """Start store-and-forward when UPSTREAM_URL is configured"""
+    url = app.config.get('UPSTREAM_URL')
+    if not url:
+        return None
+    try:
+        ring = SampleRing(app.config['STORE_FORWARD_PATH'], app.config['STORE_FORWARD_CAPACITY'])
+    except RuntimeError as e:
+        # e.g. the reloader's watcher process, which never polls
+        print(f"Store and forward disabled: {str(e)}")
+        return None
+    forwarder = Forwarder(
+        ring, url,
+        hub_id=app.config.get('HUB_ID'),
+        batch_size=app.config['STORE_FORWARD_BATCH_SIZE'],
+        max_bytes_per_second=app.config['STORE_FORWARD_MAX_BYTES_PER_SECOND'],
+        changes_only=app.config['STORE_FORWARD_CHANGES_ONLY']
+    )
+    forwarder.start()
+    app.extensions['store_forward'] = forwarder
+    return forwarder
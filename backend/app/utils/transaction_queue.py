@@ -0,0 +1,120 @@
+import collections
+import numpy as np
+import threading
+import time
+
+# Transaction classes, most urgent first
+WRITE = 'write'
+READ = 'read'
+FAST_SCAN = 'fast_scan'
+SLOW_SCAN = 'slow_scan'
+DISCOVERY = 'discovery'
+TRANSACTION_CLASSES = (WRITE, READ, FAST_SCAN, SLOW_SCAN, DISCOVERY)
+
+# A waiting class passed over by this many transactions gets the next turn
+FAIR_SHARE_PASSES = 8
+
+
+class TransactionQueue:
+    """Hands a bus to one holder at a time, most urgent class first.
+
+    Waiters of a class are served in arrival order. A holder running a
+    longer job, like a poll cycle of many blocks, calls :meth:`preempt`
+    between its transactions to let any more urgent waiter go first, so a
+    write queued during a 40-block cycle goes out after the block in
+    progress. A class kept waiting while ``passes`` transactions of other
+    classes went ahead gets the next turn, so heavy polling delays slow
+    scans and discovery but never starves them. The thread holding the bus
+    may acquire it again.
+    """
+
+    def __init__(self, passes=FAIR_SHARE_PASSES, samples=1000):
+        self.passes = passes
+        self.condition = threading.Condition()
+        self.waiting = {name: collections.deque() for name in TRANSACTION_CLASSES}
+        self.passed = dict.fromkeys(TRANSACTION_CLASSES, 0)
+        self.owner = None  # Thread ident holding the bus
+        self.owner_class = None
+        self.depth = 0
+        self.counts = dict.fromkeys(TRANSACTION_CLASSES, 0)
+        self.waits = {name: collections.deque(maxlen=samples) for name in TRANSACTION_CLASSES}
+
+    def holding(self):
+        return self.owner == threading.get_ident()
+
+    def acquire(self, priority):
+        me = threading.get_ident()
+        with self.condition:
+            if self.owner == me:
+                self.depth += 1
+                return
+            self._wait_turn(me, priority)
+            self.depth = 1
+
+    def release(self):
+        with self.condition:
+            self.depth -= 1
+            if self.depth:
+                return
+            self.owner = self.owner_class = None
+            self._grant()
+
+    def preempt(self):
+        """Between two transactions of the holder's job: give the bus to a
+        more urgent or starved waiter and wait for it to come back"""
+        me = threading.get_ident()
+        with self.condition:
+            priority = self.owner_class
+            urgent = TRANSACTION_CLASSES[:TRANSACTION_CLASSES.index(priority)]
+            if not any(self.waiting[name] for name in urgent) and not any(
+                    self.waiting[name] and self.passed[name] >= self.passes for name in TRANSACTION_CLASSES):
+                # Carrying on passes everyone waiting
+                for name in TRANSACTION_CLASSES:
+                    if self.waiting[name]:
+                        self.passed[name] += 1
+                return
+            depth = self.depth
+            self.owner = self.owner_class = None
+            # Resume ahead of later arrivals of the same class
+            self.waiting[priority].appendleft(me)
+            self._grant()
+            self._wait_turn(me, priority, queued=False)
+            self.depth = depth
+
+    def _wait_turn(self, me, priority, queued=True):
+        started = time.monotonic()
+        if queued:
+            self.waiting[priority].append(me)
+            if self.owner is None:
+                self._grant()
+        while self.owner != me:
+            self.condition.wait()
+        self.counts[priority] += 1
+        self.waits[priority].append(time.monotonic() - started)
+
+    def _grant(self):
+        waiting = [name for name in TRANSACTION_CLASSES if self.waiting[name]]
+        if not waiting:
+            return
+        starved = [name for name in waiting if self.passed[name] >= self.passes]
+        chosen = (starved or waiting)[0]
+        for name in waiting:
+            self.passed[name] = 0 if name == chosen else self.passed[name] + 1
+        self.owner = self.waiting[chosen].popleft()
+        self.owner_class = chosen
+        self.condition.notify_all()
+
+    def status(self):
+        """Turns on the bus, current waiters and queue-wait milliseconds of each class"""
+        with self.condition:
+            status = {}
+            for name in TRANSACTION_CLASSES:
+                status[name] = {'turns': self.counts[name], 'waiting': len(self.waiting[name])}
+                waits = np.array(self.waits[name]) * 1000
+                if len(waits):
+                    status[name].update({
+                        'wait_p50_ms': round(float(np.percentile(waits, 50)), 3),
+                        'wait_p99_ms': round(float(np.percentile(waits, 99)), 3),
+                        'wait_max_ms': round(float(waits.max()), 3)
+                    })
+            return status
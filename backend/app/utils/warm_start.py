@@ -0,0 +1,189 @@
+from .background import start_task, sleep
+from .live_values import latest_values
+import atexit
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+class StartupMetrics:
+    """How long the hub took from process start to serving, to its first live
+    value and to a live value from every monitor it restored.
+
+    ``started`` is the monotonic time the process started, as near as run.py
+    can tell; marks are seconds after it.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.marks = {}
+        self.snapshot = None
+        self.restored = set()
+        self.waiting = set()  # Restored monitors without a live value yet
+        self.lock = threading.Lock()
+
+    def begin(self, started):
+        self.started_at -= self.started - started
+        self.started = started
+
+    def mark(self, name):
+        with self.lock:
+            if name not in self.marks:
+                self.marks[name] = round(time.monotonic() - self.started, 3)
+
+    def restoring(self, plc_ids):
+        with self.lock:
+            self.restored = set(plc_ids)
+            self.waiting = set(self.restored)
+
+    def value_received(self, plc_id):
+        """Called with every poll cycle's values; cheap once every monitor is live"""
+        if 'first_live_value' in self.marks and not self.waiting:
+            return
+        self.mark('first_live_value')
+        with self.lock:
+            if plc_id not in self.waiting:
+                return
+            self.waiting.discard(plc_id)
+            if self.waiting:
+                return
+        self.mark('all_monitors_live')
+        print(f"Startup: all {len(self.restored)} restored monitors live {self.marks['all_monitors_live']} s "
+              f"after start, the first value after {self.marks['first_live_value']} s")
+
+    def status(self):
+        with self.lock:
+            waiting = len(self.waiting)
+        return {
+            'started_at': self.started_at,
+            'app_ready_seconds': self.marks.get('app_ready'),
+            'first_live_value_seconds': self.marks.get('first_live_value'),
+            'all_monitors_live_seconds': self.marks.get('all_monitors_live'),
+            'monitors_restored': len(self.restored),
+            'monitors_waiting': waiting,
+            'snapshot': self.snapshot
+        }
+
+
+startup_metrics = StartupMetrics()
+
+
+def save_snapshot(path):
+    """Write every PLC's latest values to ``path``, replacing it in one step"""
+    plcs = latest_values.copy()
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'saved_at': time.time(), 'plcs': {
+            plc_id: {register_id: list(latest) for register_id, latest in values.items()}
+            for plc_id, values in plcs.items()
+        }}, f)
+    os.replace(temporary, path)
+
+
+def load_snapshot(path, plc_ids, register_ids):
+    """Seed the latest values from ``path`` for PLCs and registers that still
+    exist, returning what was loaded for the startup metrics"""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error loading latest values snapshot {path}: {str(e)}")
+        return None
+    plcs = {}
+    for plc_id, values in snapshot.get('plcs', {}).items():
+        if int(plc_id) in plc_ids:
+            plcs[int(plc_id)] = {int(register_id): tuple(latest) for register_id, latest in values.items()
+                                 if int(register_id) in register_ids}
+    latest_values.seed(plcs)
+    return {
+        'path': path,
+        'saved_at': snapshot.get('saved_at'),
+        'plcs': len(plcs),
+        'values': sum(len(values) for values in plcs.values())
+    }
+
+
+def _save_snapshots(path, interval):
+    saved = latest_values.updates
+    while True:
+        sleep(interval)
+        if latest_values.updates == saved:
+            continue
+        saved = latest_values.updates
+        try:
+            save_snapshot(path)
+        except OSError as e:
+            print(f"Error saving latest values snapshot {path}: {str(e)}")
+
+
+def init_warm_start(app):
+    """Bound how many buses connect at once, so restoring a site's monitors or
+    reconnecting after an outage does not open every connection together"""
+    from .modbus_bus import BusManager
+
+    concurrency = app.config['MONITOR_CONNECT_CONCURRENCY']
+    BusManager().connect_slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+
+
+def warm_start(app, started=None):
+    """Bring a starting hub back to where the last run left off: seed the
+    latest values from the snapshot, so dashboards show last-known values
+    right away, resume monitoring every PLC that was monitored, and fail the
+    register scans the last run was still doing.
+
+    The restored monitors all start together, their first polls spread over
+    MONITOR_RESTORE_SPREAD seconds and their connects bounded by
+    MONITOR_CONNECT_CONCURRENCY. The snapshot is rewritten every
+    LATEST_VALUES_SNAPSHOT_INTERVAL seconds and on exit.
+    """
+    from .. import db
+    from ..models.plc import PLC, Register
+    from ..models.scan import RegisterScan
+    from .polling_service import polling_service, MONITORING
+
+    if started is not None:
+        startup_metrics.begin(started)
+    startup_metrics.mark('app_ready')
+    path = app.config['LATEST_VALUES_SNAPSHOT_PATH']
+    with app.app_context():
+        # Scans the last run left unfinished never will, and would keep new scans of their PLCs out
+        interrupted = db.session.execute(
+            db.update(RegisterScan).where(RegisterScan.status.in_(['pending', 'running']))
+            .values(status='failed', error='Interrupted by a restart', finished_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if interrupted:
+            print(f"Marked {interrupted} interrupted register scans as failed")
+        plcs = PLC.query.all()
+        if path:
+            register_ids = set(db.session.execute(db.select(Register.id)).scalars())
+            startup_metrics.snapshot = load_snapshot(path, {plc.id for plc in plcs}, register_ids)
+
+    monitored = [plc for plc in plcs if plc.monitoring_enabled] if app.config['MONITOR_RESTORE'] else []
+    startup_metrics.restoring(plc.id for plc in monitored)
+    spread = app.config['MONITOR_RESTORE_SPREAD']
+    now = time.monotonic()
+    for index, plc in enumerate(monitored):
+        polling_service.subscribe(MONITORING, plc, due=now + spread * index / len(monitored))
+
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        start_task(_save_snapshots, path, app.config['LATEST_VALUES_SNAPSHOT_INTERVAL'])
+        atexit.register(save_snapshot, path)
+        # A deploy stops the hub with SIGTERM, which skips atexit unless it exits Python
+        main = threading.current_thread() is threading.main_thread()
+        if main and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    snapshot = startup_metrics.snapshot
+    print(f"Startup: ready {startup_metrics.marks['app_ready']} s after start, "
+          f"{snapshot['values'] if snapshot else 0} last-known values loaded, "
+          f"{len(monitored)} monitors restored")
+    return startup_metrics
@@ -1,56 +0,0 @@
-from flask import Blueprint, request, jsonify
-from flask_login import login_user, logout_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
-from ..models.user import User
-from app import db, login_manager
-
-auth_bp = Blueprint('auth', __name__)
-
-@auth_bp.route('/register', methods=['POST'])
-def register():
-    data = request.get_json()
-    username = data.get('username')
-    email = data.get('email')
-    password = data.get('password')
-
-    if not username or not email or not password:
-        return jsonify({'error': 'Missing username, email, or password'}), 400
-
-    if User.query.filter_by(username=username).first():
-        return jsonify({'error': 'Username already exists'}), 409
-
-    if User.query.filter_by(email=email).first():
-        return jsonify({'error': 'Email already exists'}), 409
-
-    hashed_password = generate_password_hash(password)
-    new_user = User(username=username, email=email, password_hash=hashed_password)
-
-    db.session.add(new_user)
-    db.session.commit()
-
-    return jsonify({'message': 'User registered successfully'}), 201
-
-@auth_bp.route('/login', methods=['POST'])
-def login():
-    data = request.get_json()
-    username = data.get('username')
-    password = data.get('password')
-
-    user = User.query.filter_by(username=username).first()
-
-    if user and check_password_hash(user.password_hash, password):
-        login_user(user)
-        return jsonify({'message': 'Login successful', 'user': {'id': user.id, 'username': user.username, 'email': user.email}})
-    else:
-        return jsonify({'error': 'Invalid username or password'}), 401
-
-@auth_bp.route('/logout', methods=['POST'])
-@login_required
-def logout():
-    logout_user()
-    return jsonify({'message': 'Logged out successfully'})
-
-@auth_bp.route('/me', methods=['GET'])
-@login_required
-def me():
-    return jsonify({'id': login_manager.current_user.id, 'username': login_manager.current_user.username, 'email': login_manager.current_user.email}) 
\ No newline at end of file
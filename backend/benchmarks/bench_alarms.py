@@ -0,0 +1,77 @@
+"""Measure the CPU cost of evaluating alarm rules on poll cycles.
+
+Builds one AlarmEvaluator per PLC with a mix of high, low, rate-of-change
+and deviation rules, feeds each a cycle of drifting values the way
+PLCMonitor does, and reports the rules evaluated per CPU second and the
+share of one core a fleet evaluating --target rules per second would use.
+
+    cd backend
+    python benchmarks/bench_alarms.py --plcs 500 --rules 100 --cycles 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.alarm_engine import AlarmEvaluator, HIGH, LOW, RATE_OF_CHANGE, DEVIATION
+
+
+def plc_rules(rng, count):
+    rules = []
+    for index in range(count):
+        rule_type = (HIGH, LOW, RATE_OF_CHANGE, DEVIATION)[index % 4]
+        rule = {'register_id': index + 1, 'rule_type': rule_type, 'deadband': 1.0,
+                'on_delay': rng.choice((0.0, 2.0)), 'off_delay': rng.choice((0.0, 5.0))}
+        if rule_type == HIGH:
+            rule['threshold'] = 80.0
+        elif rule_type == LOW:
+            rule['threshold'] = 20.0
+        elif rule_type == RATE_OF_CHANGE:
+            rule['threshold'] = 5.0
+        else:
+            rule['threshold'] = 10.0
+            rule['reference_register_id'] = index
+        rules.append(rule)
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--plcs', type=int, default=500)
+    parser.add_argument('--rules', type=int, default=100, help='rules per PLC, one register each')
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--target', type=int, default=50000, help='rules per second to size the CPU share for')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    evaluators = [AlarmEvaluator(plc_rules(rng, args.rules)) for _ in range(args.plcs)]
+    values = [{register_id: rng.uniform(0, 100) for register_id in range(1, args.rules + 1)}
+              for _ in range(args.plcs)]
+    # Pre-generate the drift so only evaluation is timed
+    cycles = []
+    for _ in range(args.cycles):
+        for plc_values in values:
+            for register_id in plc_values:
+                plc_values[register_id] += rng.gauss(0, 3)
+        cycles.append([dict(plc_values) for plc_values in values])
+
+    transitions = 0
+    started = time.process_time()
+    for cycle, cycle_values in enumerate(cycles):
+        for evaluator, plc_values in zip(evaluators, cycle_values):
+            transitions += len(evaluator.evaluate(plc_values, float(cycle)))
+    elapsed = time.process_time() - started
+
+    evaluated = args.plcs * args.rules * args.cycles
+    rate = evaluated / elapsed
+    print(f'{args.plcs} PLCs x {args.rules} rules x {args.cycles} cycles: {elapsed:.2f} s CPU, '
+          f'{transitions} transitions')
+    print(f'{rate:,.0f} rules per CPU second, {elapsed / (args.plcs * args.cycles) * 1e6:.0f} us per PLC cycle')
+    print(f'{args.target:,} rules/s uses {args.target / rate * 100:.1f}% of one core')
+
+
+if __name__ == '__main__':
+    main()
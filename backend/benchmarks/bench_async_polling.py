@@ -0,0 +1,176 @@
+"""Measure HTTP latency while the hub polls 200 PLCs, per async mode.
+
+Starts --plcs simulated Modbus TCP devices in a subprocess, each on its
+own port and answering every read after --frame-ms, provisions them from
+one template of --registers registers in a temporary database and serves
+the hub on a local port under --async-mode, monkey-patching the process
+first like run.py. A client subprocess requests one PLC's latest values
+--rate times a second for --seconds, starts monitoring every PLC, lets
+the pollers settle for --warmup seconds (first maps, alarm rules and
+read plans), keeps requesting for --seconds more and reports the
+latency percentiles of both phases and the poll cycles completed.
+
+    cd backend
+    python benchmarks/bench_async_polling.py --async-mode eventlet --plcs 200
+    python benchmarks/bench_async_polling.py --async-mode threading --plcs 200
+"""
+import argparse
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--async-mode', choices=('eventlet', 'gevent', 'threading'), default='eventlet')
+    parser.add_argument('--plcs', type=int, default=200)
+    parser.add_argument('--registers', type=int, default=40, help='template registers, 10 per read block')
+    parser.add_argument('--frame-ms', type=float, default=5.0)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--rate', type=float, default=50.0, help='HTTP requests per second')
+    parser.add_argument('--seconds', type=float, default=10.0, help='length of each phase')
+    parser.add_argument('--warmup', type=float, default=10.0, help='seconds between starting to poll and measuring')
+    parser.add_argument('--role', choices=('hub', 'slaves', 'client'), default='hub', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+if ARGS.role == 'hub' and ARGS.async_mode == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ARGS.role == 'hub' and ARGS.async_mode == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import json
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def serve_slaves(args):
+    """Answer Modbus TCP reads of any unit and address with zeros, printing the ports"""
+    import asyncio
+    import struct
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction, _, length, unit = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                function, _, count = struct.unpack('>BHH', pdu[:5])
+                await asyncio.sleep(args.frame_ms / 1000)
+                data = bytes(2 * count) if function in (3, 4) else bytes((count + 7) // 8)
+                body = struct.pack('>BB', function, len(data)) + data
+                writer.write(struct.pack('>HHHB', transaction, 0, len(body) + 1, unit) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def main():
+        servers = [await asyncio.start_server(handle, '127.0.0.1', 0) for _ in range(args.plcs)]
+        print(json.dumps([server.sockets[0].getsockname()[1] for server in servers]), flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)] if samples else float('nan')
+
+
+def run_client(args):
+    """Time GET /plcs/1/values before and while every PLC is polled, printing the results"""
+    import http.cookiejar
+    import urllib.request
+
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def call(method, path, body=None):
+        request = urllib.request.Request(args.url + path, method=method, data=json.dumps(body or {}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with opener.open(request, timeout=30) as response:
+            return json.loads(response.read() or 'null')
+
+    def measure():
+        latencies, due = [], time.monotonic()
+        end = due + args.seconds
+        while due < end:
+            time.sleep(max(0.0, due - time.monotonic()))
+            started = time.monotonic()
+            opener.open(args.url + '/api/plcs/1/values', timeout=30).read()
+            latencies.append((time.monotonic() - started) * 1000)
+            due += 1 / args.rate
+        return latencies
+
+    call('POST', '/api/login', {'username': 'bench', 'password': 'bench'})
+    idle = measure()
+    for plc_id in range(1, args.plcs + 1):
+        call('POST', f'/api/plcs/{plc_id}/start-monitoring')
+    time.sleep(args.warmup)
+    before = call('GET', '/api/system/buses')
+    started = time.monotonic()
+    polling = measure()
+    elapsed = time.monotonic() - started
+    buses = call('GET', '/api/system/buses')
+    for plc_id in range(1, args.plcs + 1):
+        call('POST', f'/api/plcs/{plc_id}/stop-monitoring')
+    turns = sum(bus['transactions']['fast_scan']['turns'] for bus in buses) - sum(
+        bus['transactions']['fast_scan']['turns'] for bus in before)
+    print(json.dumps({'idle': idle, 'polling': polling, 'turns': turns, 'elapsed': elapsed}), flush=True)
+
+
+def run_hub(args):
+    import socket
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "async.db")}'
+    os.environ['POLL_INTERVAL'] = str(args.poll_interval)
+    from app import create_app, socketio
+    from app.utils.background import start_task
+
+    slaves = subprocess.Popen([sys.executable, __file__, '--role', 'slaves', '--plcs', str(args.plcs),
+                               '--frame-ms', str(args.frame_ms)], stdout=subprocess.PIPE, text=True)
+    ports = json.loads(slaves.stdout.readline())
+
+    app = create_app()
+    client = app.test_client()
+    client.post('/api/register', json={'username': 'bench', 'email': 'bench@example.com', 'password': 'bench'})
+    client.post('/api/login', json={'username': 'bench', 'password': 'bench'})
+    registers = [{'name': f'R{index}', 'address': 200 * (index // 10) + 2 * (index % 10),
+                  'data_type': 'float' if index % 2 else 'int16'} for index in range(args.registers)]
+    template_id = client.post('/api/templates', json={'name': 'Drive', 'registers': registers}).get_json()['id']
+    devices = [{'name': f'Drive {index}', 'ip_address': '127.0.0.1', 'port': port} for index, port in enumerate(ports)]
+    client.post(f'/api/templates/{template_id}/devices', json={'devices': devices})
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    start_task(socketio.run, app, host='127.0.0.1', port=port, log_output=False, allow_unsafe_werkzeug=True)
+    time.sleep(1)
+    try:
+        output = subprocess.run([sys.executable, __file__, '--role', 'client', '--url', f'http://127.0.0.1:{port}',
+                                 '--plcs', str(args.plcs), '--rate', str(args.rate), '--seconds', str(args.seconds),
+                                 '--warmup', str(args.warmup)],
+                                capture_output=True, text=True).stdout
+    finally:
+        slaves.kill()
+    result = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{args.plcs} PLCs x {args.registers // 10} blocks, {args.frame_ms} ms frames, async mode '
+          f'{app.config["ASYNC_MODE"]}, GET /plcs/1/values {args.rate:g} times a second')
+    print(f'{"phase":<8} {"requests":>9} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for phase in ('idle', 'polling'):
+        latencies = result[phase]
+        print(f'{phase:<8} {len(latencies):>9} {percentile(latencies, 0.5):>8.2f} '
+              f'{percentile(latencies, 0.99):>8.2f} {max(latencies):>8.2f}')
+    print(f'{result["turns"]} poll cycles in {result["elapsed"]:.1f} s, {result["turns"] / result["elapsed"]:.0f} '
+          f'per second of {args.plcs / args.poll_interval:.0f} scheduled')
+
+
+if __name__ == '__main__':
+    {'hub': run_hub, 'slaves': serve_slaves, 'client': run_client}[ARGS.role](ARGS)
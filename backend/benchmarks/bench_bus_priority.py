@@ -0,0 +1,125 @@
+"""Measure how long writes and on-demand reads queue behind heavy polling.
+
+Runs a real ModbusBus against a simulated slave that takes --frame-ms per
+frame, with --fast devices and --slow devices of --blocks blocks each
+polled back to back, while one thread writes a setpoint every
+--write-every seconds, another reads a register on demand as often and a
+register scan probes addresses back to back. Reports the queue wait of
+each transaction class and how many transactions each got, showing
+writes go out between poll blocks and the scan still gets its share.
+
+    cd backend
+    python benchmarks/bench_bus_priority.py --fast 20 --slow 5 --blocks 40 --seconds 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.modbus_bus import ModbusBus, BusDevice
+from app.utils.read_planner import plan_reads, HOLDING_REGISTER
+from app.utils.transaction_queue import TRANSACTION_CLASSES, SLOW_SCAN, DISCOVERY
+
+
+class Response:
+    def __init__(self, registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class SimulatedSlave:
+    """A client whose every frame takes a fixed time on the wire"""
+
+    connected = True
+
+    def __init__(self, frame_time):
+        self.frame_time = frame_time
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read_holding_registers(self, address, count, slave=1):
+        time.sleep(self.frame_time)
+        return Response([0] * count)
+
+    def write_register(self, address, value, slave=1):
+        time.sleep(self.frame_time)
+        return Response([value])
+
+
+class Register:
+    def __init__(self, register_id, address):
+        self.id = register_id
+        self.address = address
+        self.data_type = 'uint16'
+        self.scaling_factor = 1.0
+        self.register_area = HOLDING_REGISTER
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--fast', type=int, default=20, help='devices polled as fast as the bus allows')
+    parser.add_argument('--slow', type=int, default=5, help='slow-scan devices, also polled back to back')
+    parser.add_argument('--blocks', type=int, default=40, help='read blocks per device cycle')
+    parser.add_argument('--frame-ms', type=float, default=5.0)
+    parser.add_argument('--write-every', type=float, default=0.1)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    bus = ModbusBus('bench', SimulatedSlave(args.frame_ms / 1000))
+    # Blocks far enough apart that each is its own request
+    plan = plan_reads([Register(index, index * 200) for index in range(args.blocks)])
+    for unit in range(args.fast + args.slow):
+        device = BusDevice(unit, unit + 1, interval=0.0, scan_class=SLOW_SCAN if unit >= args.fast else None)
+        device.plan = plan
+        bus.add_device(device)
+
+    stop = threading.Event()
+
+    def write():
+        while not stop.wait(args.write_every):
+            bus.write(HOLDING_REGISTER, 100, [1], 1)
+
+    def read():
+        while not stop.wait(args.write_every):
+            bus.read(plan[0], 1)
+
+    def scan():
+        address = 0
+        while not stop.is_set():
+            with bus.transaction(DISCOVERY) as client:
+                client.read_holding_registers(address, 1)
+            address = (address + 1) % 65536
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read), threading.Thread(target=scan)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for unit in range(args.fast + args.slow):
+        bus.remove_device(unit)
+
+    status = bus.status()['transactions']
+    print(f'{args.fast} fast and {args.slow} slow devices x {args.blocks} blocks, {args.frame_ms} ms frames, '
+          f'{args.seconds:.0f} s')
+    print(f'{"class":<10} {"turns":>8} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name in TRANSACTION_CLASSES:
+        row = status[name]
+        if not row['turns']:
+            continue
+        print(f'{name:<10} {row["turns"]:>8} {row["wait_p50_ms"]:>8.2f} {row["wait_p99_ms"]:>8.2f} '
+              f'{row["wait_max_ms"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Report compression ratio and CPU cost for live frames and configuration lists.
+
+Compares the HTTP encodings (gzip levels, brotli qualities when brotli
+is installed) on a register list response and on single register_update
+frames, and permessage-deflate on a stream of successive frames with
+and without context takeover, which is what the websocket transport
+sends. Use it to pick GZIP_LEVEL, BROTLI_QUALITY and the
+WEBSOCKET_COMPRESSION_* settings for a site.
+
+    cd backend
+    python benchmarks/bench_compression.py --registers 200 --frames 500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.compression import brotli, compress
+
+
+def register_list(count):
+    return json.dumps([{
+        'id': index + 1, 'name': f'Tank {index // 10} level {index % 10}', 'address': index * 2,
+        'data_type': 'float', 'register_area': 'holding_register', 'scaling_factor': 1.0, 'unit': 'm',
+        'description': None, 'is_monitored': True, 'min_value': 0.0, 'max_value': 10.0,
+        'read_write': 'read_only'
+    } for index in range(count)]).encode()
+
+
+def update_frames(registers, frames):
+    """Socket.IO text packets for successive register_update events with drifting values"""
+    rng = random.Random(1)
+    values = [rng.uniform(0, 100) for _ in range(registers)]
+    packets = []
+    for _ in range(frames):
+        values = [value + rng.gauss(0, 0.5) if rng.random() < 0.3 else value for value in values]
+        data = {str(index + 1): {'name': f'Tank {index // 10} level {index % 10}', 'unit': 'm',
+                                 'min_value': 0.0, 'max_value': 100.0, 'value': round(value, 3)}
+                for index, value in enumerate(values)}
+        packets.append(('42' + json.dumps(['register_update', {'plc_id': 1, 'data': data}])).encode())
+    return packets
+
+
+def measure(messages, compress_one):
+    started = time.process_time()
+    compressed = sum(len(compress_one(message)) for message in messages)
+    elapsed = time.process_time() - started
+    original = sum(len(message) for message in messages)
+    return original / compressed, elapsed / len(messages) * 1e6
+
+
+def deflate_stream(level, context_takeover):
+    compressor = [zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)]
+
+    def compress_one(message):
+        if not context_takeover:
+            compressor[0] = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return (compressor[0].compress(message) + compressor[0].flush(zlib.Z_SYNC_FLUSH))[:-4]
+    return compress_one
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--registers', type=int, default=200, help='registers per update frame')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--list-size', type=int, default=20000, help='registers in the list response')
+    args = parser.parse_args()
+
+    listing = register_list(args.list_size)
+    frames = update_frames(args.registers, args.frames)
+    methods = [(f'gzip {level}', lambda data, level=level: compress(data, 'gzip', level)) for level in (1, 6, 9)]
+    if brotli is not None:
+        methods += [(f'brotli {quality}', lambda data, quality=quality: compress(data, 'br', quality))
+                    for quality in (1, 5, 9)]
+    else:
+        print('brotli is not installed, skipping it')
+
+    print(f'Register list: {len(listing) / 1024:.0f} KiB, update frame: {len(frames[0]) / 1024:.1f} KiB')
+    print(f'{"method":<34}{"ratio":>8}{"CPU us/msg":>14}')
+    for name, method in methods:
+        ratio, cost = measure([listing], method)
+        print(f'{"list, " + name:<34}{ratio:>8.1f}{cost:>14.0f}')
+    for name, method in methods:
+        ratio, cost = measure(frames, method)
+        print(f'{"frame, " + name:<34}{ratio:>8.1f}{cost:>14.0f}')
+    for level in (1, 6, 9):
+        for takeover in (True, False):
+            label = f'frame stream, deflate {level}' + ('' if takeover else ', no ctx')
+            ratio, cost = measure(frames, deflate_stream(level, takeover))
+            print(f'{label:<34}{ratio:>8.1f}{cost:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
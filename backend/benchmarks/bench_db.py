@@ -0,0 +1,113 @@
+"""Time the register list and monitoring queries on a 100k register database.
+
+Runs each query against the same data twice: once with the lookup
+indexes and SQLite pragmas from the migrations and ``db_engine``, and
+once with the indexes dropped and SQLite defaults, the way databases
+created by ``db.create_all()`` used to look.
+
+    cd backend
+    python benchmarks/bench_db.py --plcs 200 --registers 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert, select, text
+from app.models.plc import PLC, Register
+from app.models.user import User
+from app.utils.db_engine import apply_sqlite_pragmas
+
+INDEXES = ('ix_plc_user_id', 'ix_register_plc_id_is_monitored', 'ix_register_plc_id_area_address')
+AREAS = ('holding_register', 'input_register', 'coil', 'discrete_input')
+
+
+def populate(url, plcs, registers):
+    os.environ['DATABASE_URL'] = url
+    from app import create_app
+    app = create_app()
+    from app import db
+    with app.app_context():
+        db.session.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@example.com'}])
+        db.session.execute(insert(PLC), [
+            {'id': plc_id, 'name': f'PLC {plc_id}', 'ip_address': '10.0.0.1', 'unit_id': plc_id % 247 + 1,
+             'user_id': 1}
+            for plc_id in range(1, plcs + 1)
+        ])
+        per_plc = registers // plcs
+        # Interleave PLCs the way registers are added over time
+        rows = [{
+            'name': f'R{index}', 'address': index // len(AREAS), 'register_area': AREAS[index % len(AREAS)],
+            'data_type': 'uint16' if AREAS[index % len(AREAS)].endswith('register') else 'bool',
+            'is_monitored': index % 3 == 0, 'plc_id': plc_id
+        } for index in range(per_plc) for plc_id in range(1, plcs + 1)]
+        db.session.execute(insert(Register), rows)
+        db.session.commit()
+        db.engine.dispose()
+
+
+def run_queries(engine, plcs, repeat):
+    queries = {
+        'register list (one PLC, ordered)': lambda plc_id: (
+            select(Register.id, Register.name, Register.address, Register.register_area, Register.data_type)
+            .where(Register.plc_id == plc_id)
+            .order_by(Register.register_area, Register.address)),
+        'monitored registers (one PLC)': lambda plc_id: (
+            select(Register.id, Register.address, Register.register_area, Register.data_type,
+                   Register.scaling_factor)
+            .where(Register.plc_id == plc_id, Register.is_monitored.is_(True))),
+        'PLC list (one user)': lambda plc_id: select(PLC.id, PLC.name).where(PLC.user_id == 1),
+    }
+    results = {}
+    with engine.connect() as connection:
+        for name, query in queries.items():
+            timings = []
+            for run in range(repeat):
+                plc_id = run % plcs + 1
+                started = time.perf_counter()
+                connection.execute(query(plc_id)).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), max(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--plcs', type=int, default=200)
+    parser.add_argument('--registers', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        url = f'sqlite:///{path}'
+        started = time.perf_counter()
+        populate(url, args.plcs, args.registers)
+        print(f'Inserted {args.registers} registers for {args.plcs} PLCs in {time.perf_counter() - started:.1f}s')
+
+        tuned = create_engine(url)
+        event.listen(tuned, 'connect', apply_sqlite_pragmas)
+        indexed = run_queries(tuned, args.plcs, args.repeat)
+        tuned.dispose()
+
+        plain = create_engine(url)
+        with plain.begin() as connection:
+            connection.execute(text('PRAGMA journal_mode=DELETE'))
+            for index in INDEXES:
+                connection.execute(text(f'DROP INDEX {index}'))
+        unindexed = run_queries(plain, args.plcs, args.repeat)
+        plain.dispose()
+
+    print(f'{"query":<36}{"indexed + pragmas":>22}{"no indexes, defaults":>24}')
+    for name, (median, worst) in indexed.items():
+        plain_median, plain_worst = unindexed[name]
+        print(f'{name:<36}{median:>10.2f} ms ({worst:6.2f}){plain_median:>12.2f} ms ({plain_worst:6.2f})')
+    print('median (max) over', args.repeat, 'runs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Measure historian compression on simulator signals.
+
+Generates --hours of 1 s samples of the mock PLC's signals (the bounded
+random walks of its temperature, pressure, flow and energy registers, as
+float32 like they are read) plus a status register that changes every few
+minutes and a counter, compresses them with each deadband/deviation
+setting, and reports the storage reduction and the error of the values
+interpolated back at every original timestamp.
+
+    cd backend
+    python benchmarks/bench_historian.py --hours 6
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.historian import SwingingDoor, interpolate, POINT
+from app.utils.mock_plc import MockPLC
+
+# (deadband, deviation) as multiples of each signal's per-second change
+SETTINGS = ((0.0, 0.0), (0.5, 0.0), (0.0, 0.5), (0.5, 1.0), (1.0, 2.0))
+
+
+def signals(rng, seconds):
+    """{name: (values, change per second, hold)} sampled every second"""
+    result = {}
+    names = {0: 'temperature', 2: 'pressure', 4: 'flow', 9: 'energy'}
+    for address, register in MockPLC().registers.items():
+        if address not in names:
+            continue
+        # MockPLC's bounded random walk
+        values = np.empty(seconds)
+        value = register['value']
+        steps = rng.uniform(-register['change_rate'], register['change_rate'], seconds)
+        for index in range(seconds):
+            value = min(register['max'], max(register['min'], value + steps[index]))
+            values[index] = value
+        result[names[address]] = (values.astype(np.float32).astype(np.float64), register['change_rate'], False)
+    # A status that changes state every 1 to 20 minutes, and a counter counting about once a second
+    changes = np.cumsum(rng.integers(60, 1200, seconds // 60 + 1))
+    result['status'] = (rng.integers(0, 4, len(changes))[np.searchsorted(changes, np.arange(seconds))].astype(np.float64),
+                        1.0, True)
+    result['counter'] = (np.cumsum(rng.poisson(1.0, seconds)).astype(np.float64), 1.0, False)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hours', type=float, default=6)
+    args = parser.parse_args()
+
+    seconds = int(args.hours * 3600)
+    timestamps = np.arange(seconds, dtype=np.float64)
+    rng = np.random.default_rng(1)
+    data = signals(rng, seconds)
+    ids = {name: index for index, name in enumerate(data)}
+
+    print(f'{len(data)} signals x {seconds} samples; deadband and deviation in units of the change per second')
+    print(f'{"deadband":>8} {"deviation":>9}  {"signal":<12} {"stored":>7} {"reduction":>9} {"rms error":>10} {"max error":>10}')
+    for deadband, deviation in SETTINGS:
+        compressor = SwingingDoor(max_interval=3600.0)
+        # As for bool registers, signals read back as steps get no swinging door
+        compressor.configure({ids[name]: (deadband * rate, 0.0 if hold else deviation * rate)
+                              for name, (_, rate, hold) in data.items()})
+        archived = {register_id: [] for register_id in ids.values()}
+        started = time.process_time()
+        for index, timestamp in enumerate(timestamps):
+            register_ids, times, values = compressor.add(
+                1, {register_id: data[name][0][index] for name, register_id in ids.items()}, timestamp)
+            for register_id, point_time, value in zip(register_ids.tolist(), times.tolist(), values.tolist()):
+                archived[register_id].append((point_time, value))
+        elapsed = time.process_time() - started
+        total = 0
+        for name, register_id in ids.items():
+            values, rate, hold = data[name]
+            points = np.array(archived[register_id] + compressor.tail(1, register_id), dtype=POINT)
+            total += len(points)
+            error = interpolate(points, timestamps, hold=hold) - values
+            print(f'{deadband:>8} {deviation:>9}  {name:<12} {len(points):>7} {seconds / len(points):>8.1f}x '
+                  f'{np.sqrt(np.mean(error ** 2)):>10.4f} {np.max(np.abs(error)):>10.4f}')
+        print(f'{"":>20}{"all":<12} {total:>7} {seconds * len(data) / total:>8.1f}x, '
+              f'{total * POINT.itemsize / 1024:.0f} KiB, {elapsed / seconds * 1e6:.0f} us CPU per cycle')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Measure streaming history exports: throughput and memory.
+
+Fills a temporary SQLite database with --megabytes of history chunks
+spread over --registers registers, then runs the export behind
+GET /api/history/export in each format, writing the body to a file, and
+reports the rows and bytes per second and the peak memory seen while
+exporting.
+
+    cd backend
+    python benchmarks/bench_history_export.py --megabytes 1024
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from app.models.history import HistoryChunk
+from app.models.plc import PLC, Register
+from app.models.user import User
+from app.utils.historian import POINT
+from app.utils.history_export import WRITERS, available_formats, iter_samples
+
+CHUNK_POINTS = 1024
+
+
+def memory_mb():
+    """Anonymous resident memory: the process's own allocations, without the
+    database pages SQLite maps from the file. Peak RSS where /proc is missing."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def populate(db, registers, megabytes, rng):
+    db.session.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@example.com'}])
+    db.session.execute(insert(PLC), [{'id': 1, 'name': 'PLC 1', 'ip_address': '10.0.0.1', 'user_id': 1}])
+    db.session.execute(insert(Register), [
+        {'id': register_id, 'name': f'R{register_id}', 'address': register_id, 'data_type': 'float32', 'plc_id': 1}
+        for register_id in range(1, registers + 1)])
+    chunks = int(megabytes * 2 ** 20 / (CHUNK_POINTS * POINT.itemsize) / registers)
+    for register_id in range(1, registers + 1):
+        start = 1.7e9
+        for first in range(0, chunks, 256):
+            rows = []
+            for _ in range(min(256, chunks - first)):
+                points = np.empty(CHUNK_POINTS, dtype=POINT)
+                points['timestamp'] = start + np.cumsum(rng.uniform(1, 30, CHUNK_POINTS))
+                points['value'] = np.cumsum(rng.normal(0, 1, CHUNK_POINTS))
+                start = points['timestamp'][-1]
+                rows.append({'plc_id': 1, 'register_id': register_id, 'start_time': float(points['timestamp'][0]),
+                             'end_time': start, 'count': CHUNK_POINTS, 'points': points.tobytes()})
+            db.session.execute(insert(HistoryChunk), rows)
+            db.session.commit()
+    return chunks * registers * CHUNK_POINTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--megabytes', type=float, default=256, help='size of the stored history')
+    parser.add_argument('--registers', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "history.db")}'
+    os.environ['HISTORIAN_FLUSH_INTERVAL'] = '86400'
+    from app import create_app, db
+    app = create_app()
+    historian = app.extensions['historian']
+    with app.app_context():
+        started = time.perf_counter()
+        points = populate(db, args.registers, args.megabytes, np.random.default_rng(1))
+        print(f'{points:,} points in {args.registers} registers ({points * POINT.itemsize / 2 ** 20:.0f} MB) '
+              f'stored in {time.perf_counter() - started:.0f} s')
+        db.session.remove()
+        db.engine.dispose()
+        registers = [(register_id, 1, False) for register_id in range(1, args.registers + 1)]
+
+        output = os.path.join(directory, 'export')
+        for export_format in available_formats():
+            baseline = peak = memory_mb()
+            written = 0
+            started = time.perf_counter()
+            with open(output, 'wb') as body:
+                for part in WRITERS[export_format](iter_samples(historian, registers, 0, 4e9)):
+                    body.write(part.encode() if isinstance(part, str) else part)
+                    written += len(part)
+                    peak = max(peak, memory_mb())
+            elapsed = time.perf_counter() - started
+            print(f'{export_format:>8}: {points / elapsed / 1e6:5.1f} M rows/s, {written / 2 ** 20:6.0f} MB out at '
+                  f'{written / 2 ** 20 / elapsed:5.0f} MB/s, {points * POINT.itemsize / 2 ** 20 / elapsed:5.0f} MB/s '
+                  f'of history read, memory peak {peak:.0f} MB (+{peak - baseline:.0f} MB)')
+        os.remove(output)
+    historian.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Measure Modbus gateway read latency with hundreds of SCADA connections.
+
+Starts --plcs simulated Modbus TCP devices in a subprocess, provisions
+them from one template of --registers registers in a temporary database,
+each presented by the gateway on its own unit id, and serves the gateway
+on a local port under --async-mode, monkey-patching the process first
+like run.py. Once the pollers have filled the register images (--warmup
+seconds), a client subprocess opens --connections connections and reads
+--count holding registers of a random unit on each --rate times a second
+for --seconds, reporting round-trip latency percentiles. The time the
+gateway takes to answer a cached read is timed in-process as well.
+
+    cd backend
+    python benchmarks/bench_modbus_gateway.py --async-mode eventlet --connections 300
+    python benchmarks/bench_modbus_gateway.py --async-mode threading --connections 300
+"""
+import argparse
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--async-mode', choices=('eventlet', 'gevent', 'threading'), default='eventlet')
+    parser.add_argument('--plcs', type=int, default=50, help='at most 247, one unit id each')
+    parser.add_argument('--registers', type=int, default=40, help='template registers, 20 per read block')
+    parser.add_argument('--count', type=int, default=20, help='registers per gateway read, at most 20')
+    parser.add_argument('--connections', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=5.0, help='reads per second on each connection')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds of polling before reading')
+    parser.add_argument('--role', choices=('hub', 'slaves', 'client'), default='hub', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+if ARGS.role == 'hub' and ARGS.async_mode == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ARGS.role == 'hub' and ARGS.async_mode == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import gc
+import json
+import random
+import struct
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def serve_slaves(args):
+    """Answer Modbus TCP reads of any unit and address with the address, printing the ports"""
+    import asyncio
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                transaction, _, length, unit = struct.unpack('>HHHB', await reader.readexactly(7))
+                function, address, count = struct.unpack('>BHH', (await reader.readexactly(length - 1))[:5])
+                if function in (3, 4):
+                    data = struct.pack(f'>{count}H', *range(address, address + count))
+                else:
+                    data = bytes((count + 7) // 8)
+                body = struct.pack('>BB', function, len(data)) + data
+                writer.write(struct.pack('>HHHB', transaction, 0, len(body) + 1, unit) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def main():
+        servers = [await asyncio.start_server(handle, '127.0.0.1', 0) for _ in range(args.plcs)]
+        print(json.dumps([server.sockets[0].getsockname()[1] for server in servers]), flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)] if samples else float('nan')
+
+
+def run_client(args):
+    """Read from the gateway on every connection at the rate, printing latencies and exceptions"""
+    import asyncio
+
+    async def connection(index, end, latencies, exceptions):
+        reader, writer = await asyncio.open_connection('127.0.0.1', args.port)
+        # Spread the connections' reads over the interval
+        due = time.monotonic() + index / args.connections / args.rate
+        transaction = 0
+        while due < end:
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            transaction = (transaction + 1) & 0xFFFF
+            unit = random.randint(1, args.plcs)
+            started = time.monotonic()
+            writer.write(struct.pack('>HHHBBHH', transaction, 0, 6, unit, 3, 0, args.count))
+            header = await reader.readexactly(7)
+            pdu = await reader.readexactly(struct.unpack('>HHHB', header)[2] - 1)
+            latencies.append((time.monotonic() - started) * 1000)
+            if pdu[0] & 0x80:
+                exceptions.append(pdu[1])
+            due += 1 / args.rate
+        writer.close()
+
+    async def main():
+        latencies, exceptions = [], []
+        end = time.monotonic() + args.seconds + 1
+        await asyncio.gather(*(connection(index, end, latencies, exceptions)
+                               for index in range(args.connections)))
+        return latencies, exceptions
+
+    started = time.monotonic()
+    latencies, exceptions = asyncio.run(main())
+    print(json.dumps({'latencies': latencies, 'exceptions': exceptions,
+                      'elapsed': time.monotonic() - started}), flush=True)
+
+
+def run_hub(args):
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "gateway.db")}'
+    os.environ['MODBUS_GATEWAY_PORT'] = '0'
+    os.environ['MODBUS_GATEWAY_HOST'] = '127.0.0.1'
+    from app import create_app
+    from app.utils.modbus_gateway import start_modbus_gateway
+
+    slaves = subprocess.Popen([sys.executable, __file__, '--role', 'slaves', '--plcs', str(args.plcs)],
+                              stdout=subprocess.PIPE, text=True)
+    ports = json.loads(slaves.stdout.readline())
+
+    app = create_app()
+    client = app.test_client()
+    client.post('/api/register', json={'username': 'bench', 'email': 'bench@example.com', 'password': 'bench'})
+    client.post('/api/login', json={'username': 'bench', 'password': 'bench'})
+    registers = [{'name': f'R{index}', 'address': 200 * (index // 20) + index % 20, 'data_type': 'int16'}
+                 for index in range(args.registers)]
+    template_id = client.post('/api/templates', json={'name': 'Drive', 'registers': registers}).get_json()['id']
+    for index, port in enumerate(ports):
+        client.post('/api/plcs', json={'name': f'Drive {index}', 'ip_address': '127.0.0.1', 'port': port,
+                                       'template_id': template_id, 'gateway_unit_id': index + 1})
+    gateway = start_modbus_gateway(app)
+    gc.freeze()  # Like run.py
+    time.sleep(args.warmup)
+
+    # The gateway's own cost of a cached read, without the network
+    request = struct.pack('>BHH', 3, 0, args.count)
+    reads = 20000
+    started = time.perf_counter()
+    for index in range(reads):
+        gateway.handle(index % args.plcs + 1, request)
+    handle_us = (time.perf_counter() - started) / reads * 1e6
+
+    try:
+        output = subprocess.run([sys.executable, __file__, '--role', 'client', '--port', str(gateway.port),
+                                 '--plcs', str(args.plcs), '--count', str(args.count),
+                                 '--connections', str(args.connections), '--rate', str(args.rate),
+                                 '--seconds', str(args.seconds)],
+                                capture_output=True, text=True).stdout
+    finally:
+        slaves.kill()
+    result = json.loads(output.strip().splitlines()[-1])
+    latencies = result['latencies']
+
+    print(f'{args.plcs} PLCs polled, {args.connections} gateway connections reading {args.count} registers '
+          f'{args.rate:g} times a second each, async mode {app.config["ASYNC_MODE"]}')
+    print(f'cached read answered in {handle_us:.1f} us in-process')
+    print(f'{"reads":>7} {"per s":>7} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8} {"exceptions":>11}')
+    print(f'{len(latencies):>7} {len(latencies) / result["elapsed"]:>7.0f} {percentile(latencies, 0.5):>8.2f} '
+          f'{percentile(latencies, 0.99):>8.2f} {max(latencies):>8.2f} {len(result["exceptions"]):>11}')
+
+
+if __name__ == '__main__':
+    {'hub': run_hub, 'slaves': serve_slaves, 'client': run_client}[ARGS.role](ARGS)
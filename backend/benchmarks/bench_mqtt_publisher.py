@@ -0,0 +1,115 @@
+"""Measure MQTT publishing throughput per payload format and QoS.
+
+Starts the minimal MQTT broker of mqtt_broker.py in a subprocess, which
+acknowledges and counts publishes (after --ack-delay-ms, to stand in for
+a slow broker), and feeds an MqttPublisher --plcs poll cycles of --registers
+values every --interval seconds for --seconds, --change of the values
+changing each cycle, under --async-mode. Reports, for JSON and Sparkplug
+B payloads, the cycles offered, messages and bytes published per second,
+what the broker received, the cycles dropped by the bounded queue and
+what ``store`` cost the pollers per cycle.
+
+    cd backend
+    python benchmarks/bench_mqtt_publisher.py --qos 1
+    python benchmarks/bench_mqtt_publisher.py --qos 1 --ack-delay-ms 20 --capacity 1000
+"""
+import argparse
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--async-mode', choices=('eventlet', 'gevent', 'threading'), default='eventlet')
+    parser.add_argument('--plcs', type=int, default=200)
+    parser.add_argument('--registers', type=int, default=40)
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between each PLC\'s cycles')
+    parser.add_argument('--change', type=float, default=0.25, help='fraction of values changing each cycle')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument('--capacity', type=int, default=10000, help='queued cycles')
+    parser.add_argument('--compression-threshold', type=int, default=0, help='bytes, 0 to never compress')
+    parser.add_argument('--ack-delay-ms', type=float, default=0.0)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+if ARGS.async_mode == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ARGS.async_mode == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import json
+import random
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(args, app, payload):
+    from app.utils.mqtt_publisher import MqttPublisher
+    from app.utils.background import sleep
+
+    broker = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), 'mqtt_broker.py'),
+                               '--ack-delay-ms', str(args.ack_delay_ms)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    port = json.loads(broker.stdout.readline())
+    publisher = MqttPublisher(app, f'mqtt://127.0.0.1:{port}', payload=payload, qos=args.qos, hub_id='bench',
+                              capacity=args.capacity, compression_threshold=args.compression_threshold)
+    publisher.start()
+    while not publisher.connected:
+        sleep(0.01)
+
+    values = {plc_id: {register_id: float(register_id) for register_id in range(args.registers)}
+              for plc_id in range(args.plcs)}
+    random.seed(1)
+    offered, store_seconds = 0, 0.0
+    started = time.monotonic()
+    due = started
+    while due - started < args.seconds:
+        sleep(max(0.0, due - time.monotonic()))
+        timestamp = time.time()
+        for plc_id, cycle in values.items():
+            for register_id in random.sample(range(args.registers), int(args.registers * args.change)):
+                cycle[register_id] += 1.0
+            stored = time.perf_counter()
+            publisher.store(plc_id, cycle, timestamp)
+            store_seconds += time.perf_counter() - stored
+            offered += 1
+        due += args.interval
+    # Let the queue drain, as far as it does within a few seconds
+    drain = time.monotonic()
+    while publisher.queue and time.monotonic() - drain < 5:
+        sleep(0.05)
+    elapsed = time.monotonic() - started
+    status = publisher.status()
+    publisher.stop()
+    broker.stdin.write('\n')
+    broker.stdin.flush()
+    received = json.loads(broker.stdout.readline())
+    broker.kill()
+    print(f'{payload:<10} {offered / args.seconds:>8.0f} {status["published"] / elapsed:>8.0f} '
+          f'{status["published_bytes"] / elapsed / 1e6:>8.2f} {received["messages"]:>9} {status["dropped"]:>8} '
+          f'{store_seconds / offered * 1e6:>9.1f}')
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "mqtt.db")}'
+    from app import create_app
+
+    app = create_app()
+    print(f'{args.plcs} PLCs x {args.registers} registers every {args.interval:g} s, {args.change:.0%} changing, '
+          f'QoS {args.qos}, broker acks after {args.ack_delay_ms:g} ms, async mode {app.config["ASYNC_MODE"]}')
+    print(f'{"payload":<10} {"cycles/s":>8} {"msgs/s":>8} {"MB/s":>8} {"received":>9} {"dropped":>8} '
+          f'{"store us":>9}')
+    for payload in ('json', 'sparkplug'):
+        run(args, app, payload)
+
+
+if __name__ == '__main__':
+    main(ARGS)
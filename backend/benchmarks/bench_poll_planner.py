@@ -0,0 +1,138 @@
+"""Measure the latency-aware read planner against the default plan.
+
+Polls a sparse map of --registers holding registers on simulated links,
+a LAN, a cellular (3G) modem and Modbus RTU at 9600 baud, each
+answering a read in a round trip plus the transfer time of its
+response. The PollTuner of each device is fed the timed block reads of
+--cycles poll cycles and re-plans every --replan cycles; the report
+compares the cycle time of the default plan with the tuned one. A last
+device rejects reads of more than 32 registers or of the larger gaps it
+does not map, and the planner learns to avoid both from its exception
+responses.
+
+Time is simulated, so the run takes a second whatever the links.
+
+    cd backend
+    python benchmarks/bench_poll_planner.py --registers 200 --cycles 100
+"""
+import argparse
+import os
+import random
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.read_planner import plan_reads, decode_block, HOLDING_REGISTER
+from app.utils.poll_tuning import PollTuner, seconds_per_byte, ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE
+
+# name, round trip seconds, seconds per response byte, transport prior
+LINKS = (
+    ('lan', 0.002, 0.1e-6, seconds_per_byte('tcp', None)),
+    ('3g', 0.2, 2e-6, seconds_per_byte('tcp', None)),
+    ('rtu-9600', 0.012, 11 / 9600, seconds_per_byte('rtu', 9600)),
+)
+
+
+class Response:
+    def __init__(self, registers=None, exception_code=None):
+        self.registers = registers
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+
+class SimulatedDevice:
+    """Answers block reads, returning the response and the seconds it took"""
+
+    def __init__(self, rtt, per_byte, mapped=None, max_count=125, jitter=0.1, seed=1):
+        self.rtt = rtt
+        self.per_byte = per_byte
+        self.mapped = mapped  # Addresses answered; None answers any
+        self.max_count = max_count
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def read(self, block):
+        rtt = self.rtt * (1 + self.jitter * self.random.random())
+        if block.count > self.max_count:
+            return Response(exception_code=ILLEGAL_DATA_VALUE), rtt
+        if self.mapped is not None and any(address not in self.mapped for address in range(block.start, block.end)):
+            return Response(exception_code=ILLEGAL_DATA_ADDRESS), rtt
+        return Response([0] * block.count), rtt + self.per_byte * 2 * block.count
+
+
+def sparse_map(count, seed):
+    """Registers in runs of a few words, the runs 1 to 60 addresses apart"""
+    rng = random.Random(seed)
+    registers, address = [], 0
+    while len(registers) < count:
+        for _ in range(rng.randint(1, 6)):
+            data_type = rng.choice(('uint16', 'uint16', 'int16', 'float'))
+            registers.append(types.SimpleNamespace(id=len(registers), address=address, data_type=data_type,
+                                                   scaling_factor=1.0, register_area=HOLDING_REGISTER))
+            address += 2 if data_type == 'float' else 1
+        address += rng.choice((1, 2, 3, 5, 8, 12, 20, 40, 60))
+    return registers[:count]
+
+
+def poll(device, tuner, registers, cycles, replan):
+    """Poll ``cycles`` cycles re-planning every ``replan``, returning the
+    last plan, the simulated seconds of each cycle and exception responses"""
+    now, times, exceptions = 0.0, [], 0
+    plan, learned = plan_reads(registers), tuner.exceptions
+    for cycle in range(cycles):
+        if cycle % replan == 0 or tuner.exceptions != learned:
+            plan, learned = plan_reads(registers, **tuner.current(now).options()), tuner.exceptions
+        elapsed = 0.0
+        for block in plan:
+            response, seconds = device.read(block)
+            tuner.observe(block, response, seconds)
+            exceptions += decode_block(block, response) is None
+            elapsed += seconds
+        now += elapsed
+        times.append(elapsed)
+    return plan, times, exceptions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--registers', type=int, default=200)
+    parser.add_argument('--cycles', type=int, default=100)
+    parser.add_argument('--replan', type=int, default=10, help='cycles between re-plans')
+    args = parser.parse_args()
+    registers = sparse_map(args.registers, seed=7)
+    default = plan_reads(registers)
+
+    print(f'{args.registers} registers, {args.cycles} cycles, re-planned every {args.replan}')
+    print(f'{"link":<10} {"max_gap":>8} {"blocks":>13} {"cycle ms":>21} {"saved":>7}  model')
+    for name, rtt, per_byte, prior in LINKS:
+        tuner = PollTuner(per_byte=prior, interval=0.0)
+        plan, times, _ = poll(SimulatedDevice(rtt, per_byte), tuner, registers, args.cycles, args.replan)
+        default_ms = sum(rtt * 1.05 + per_byte * 2 * block.count for block in default) * 1000
+        tuned_ms = sum(times[-args.replan:]) / len(times[-args.replan:]) * 1000
+        fit_rtt, fit_per_byte, source = tuner.fit
+        print(f'{name:<10} {dict(tuner.tuning.max_gap)[HOLDING_REGISTER]:>8} '
+              f'{len(default):>6} -> {len(plan):<4} {default_ms:>9.1f} -> {tuned_ms:<9.1f} '
+              f'{1 - tuned_ms / default_ms:>6.0%}  rtt {fit_rtt * 1000:.2f} ms, '
+              f'{fit_per_byte * 1e6:.2f} us/byte ({source})')
+
+    # Gaps of 20 addresses or more unmapped and a 32 register limit, on the LAN
+    addresses = sorted({register.address + word for register in registers
+                        for word in range(2 if register.data_type == 'float' else 1)})
+    mapped = set(addresses)
+    for address, following in zip(addresses, addresses[1:]):
+        if following - address <= 20:
+            mapped.update(range(address, following))
+    device = SimulatedDevice(0.002, 0.1e-6, mapped=mapped, max_count=32)
+    tuner = PollTuner(per_byte=seconds_per_byte('tcp', None), interval=0.0)
+    plan, times, exceptions = poll(device, tuner, registers, args.cycles, args.replan)
+    _, _, last = poll(device, tuner, registers, args.replan, args.replan)
+    print(f'strict device: {exceptions} failed reads while learning {len(tuner.splits)} splits and a '
+          f'{tuner.area_limit(HOLDING_REGISTER)} register limit, {last} in the next {args.replan} cycles, '
+          f'{len(plan)} blocks')
+
+
+if __name__ == '__main__':
+    main()
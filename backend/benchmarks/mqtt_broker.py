@@ -0,0 +1,181 @@
+"""Minimal MQTT 3.1.1 broker for the MQTT publisher's benchmark and tests.
+
+Accepts any client, acknowledges publishes of every QoS (after
+``ack_delay`` seconds, or never with ``acknowledge=False``, to stand in
+for a slow or failing broker), records what it receives and forwards
+publishes to the clients subscribed to their exact topic. There are no
+sessions, retained messages or wildcards. Runs its own event loop in a
+thread; run as a script it serves until killed, printing its port, then
+the message and byte counts for every line read from stdin.
+
+    python benchmarks/mqtt_broker.py --ack-delay-ms 20
+"""
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 12, 13, 14
+
+
+def _string(data, index):
+    length = struct.unpack_from('>H', data, index)[0]
+    return data[index + 2:index + 2 + length], index + 2 + length
+
+
+def _packet(kind, body, flags=0):
+    header = bytearray([kind << 4 | flags])
+    length = len(body)
+    while True:
+        byte, length = length & 0x7F, length >> 7
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(header) + body
+
+
+class MqttBroker:
+    """``connects`` records each CONNECT's client id and will, ``messages``
+    each PUBLISH received as a dict of topic, payload, qos and dup"""
+
+    def __init__(self, port=0, ack_delay=0.0, acknowledge=True, record=True):
+        self.port = port
+        self.ack_delay = ack_delay
+        self.acknowledge = acknowledge
+        self.record = record
+        self.connects = []
+        self.messages = []
+        self.counts = {'messages': 0, 'bytes': 0}
+        self.subscriptions = {}  # topic -> set of writers
+        self.loop = None
+        self.server = None
+        self.writers = set()
+        self.tasks = set()
+        self.thread = None
+
+    def start(self):
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """Close the listener and drop every connection without a DISCONNECT,
+        like a broker going away"""
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def publish(self, topic, payload, qos=0):
+        """Send a message to the clients subscribed to ``topic``"""
+        self.loop.call_soon_threadsafe(self._forward, topic, payload, qos)
+
+    def _serve(self, started):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+
+    async def _close(self):
+        self.server.close()
+        tasks = list(self.tasks)
+        for writer in list(self.writers):
+            writer.transport.abort()  # Each handler then ends on an incomplete read
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _forward(self, topic, payload, qos):
+        packet_id = b'\x00\x01' if qos else b''
+        body = struct.pack('>H', len(topic)) + topic.encode() + packet_id + payload
+        for writer in self.subscriptions.get(topic, ()):
+            writer.write(_packet(PUBLISH, body, qos << 1))
+
+    async def _acknowledge(self, writer, packet):
+        if self.ack_delay:
+            await asyncio.sleep(self.ack_delay)
+        writer.write(packet)
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        self.tasks.add(asyncio.current_task())
+        try:
+            while True:
+                first = (await reader.readexactly(1))[0]
+                length, shift = 0, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                kind, flags = first >> 4, first & 0x0F
+                if kind == CONNECT:
+                    self._connect(body)
+                    writer.write(_packet(CONNACK, b'\x00\x00'))
+                elif kind == PUBLISH:
+                    self._receive(writer, body, flags)
+                elif kind == PUBREL:
+                    writer.write(_packet(PUBCOMP, body[:2]))
+                elif kind == SUBSCRIBE:
+                    topic, _ = _string(body, 2)
+                    self.subscriptions.setdefault(topic.decode(), set()).add(writer)
+                    writer.write(_packet(SUBACK, body[:2] + bytes([min(body[-1], 1)])))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP, b''))
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.tasks.discard(asyncio.current_task())
+            self.writers.discard(writer)
+            for writers in self.subscriptions.values():
+                writers.discard(writer)
+            writer.close()
+
+    def _connect(self, body):
+        _, index = _string(body, 0)  # Protocol name
+        connect_flags = body[index + 1]
+        client_id, index = _string(body, index + 4)
+        connect = {'client_id': client_id.decode(), 'will_topic': None, 'will_payload': None}
+        if connect_flags & 0x04:
+            will_topic, index = _string(body, index)
+            connect['will_payload'], index = _string(body, index)
+            connect['will_topic'] = will_topic.decode()
+        self.connects.append(connect)
+
+    def _receive(self, writer, body, flags):
+        qos = flags >> 1 & 3
+        topic, index = _string(body, 0)
+        packet_id = body[index:index + 2] if qos else b''
+        payload = body[index + len(packet_id):]
+        self.counts['messages'] += 1
+        self.counts['bytes'] += len(payload)
+        if self.record:
+            self.messages.append({'topic': topic.decode(), 'payload': payload, 'qos': qos, 'dup': bool(flags & 0x08)})
+        if qos and self.acknowledge:
+            ack = _packet(PUBACK if qos == 1 else PUBREC, packet_id)
+            if self.ack_delay:
+                asyncio.ensure_future(self._acknowledge(writer, ack))
+            else:
+                writer.write(ack)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--ack-delay-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    broker = MqttBroker(args.port, args.ack_delay_ms / 1000, record=False).start()
+    print(json.dumps(broker.port), flush=True)
+    for _ in sys.stdin:
+        print(json.dumps(broker.counts), flush=True)
+
+
+if __name__ == '__main__':
+    main()
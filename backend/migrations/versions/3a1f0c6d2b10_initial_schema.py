@@ -0,0 +1,101 @@
+"""Initial schema
+
+Databases created by earlier versions through db.create_all() already
+have these tables, sometimes without the columns added later, so tables
+are only created when missing and missing columns are added in place.
+
+Revision ID: 3a1f0c6d2b10
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a1f0c6d2b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if 'user' not in tables:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=128), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username')
+        )
+
+    if 'plc' not in tables:
+        op.create_table('plc',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('ip_address', sa.String(length=120), nullable=False),
+            sa.Column('port', sa.Integer(), nullable=True),
+            sa.Column('unit_id', sa.Integer(), nullable=True),
+            sa.Column('description', sa.String(length=255), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('is_connected', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('ip_address'),
+            sa.UniqueConstraint('name')
+        )
+    else:
+        existing = _columns(inspector, 'plc')
+        with op.batch_alter_table('plc') as batch_op:
+            if 'description' not in existing:
+                batch_op.add_column(sa.Column('description', sa.String(length=255), nullable=True))
+            if 'last_seen' not in existing:
+                batch_op.add_column(sa.Column('last_seen', sa.DateTime(), nullable=True))
+
+    if 'register' not in tables:
+        op.create_table('register',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('address', sa.Integer(), nullable=False),
+            sa.Column('data_type', sa.String(length=50), nullable=False),
+            sa.Column('scaling_factor', sa.Float(), nullable=True),
+            sa.Column('unit', sa.String(length=20), nullable=True),
+            sa.Column('description', sa.String(length=255), nullable=True),
+            sa.Column('is_monitored', sa.Boolean(), nullable=True),
+            sa.Column('min_value', sa.Float(), nullable=True),
+            sa.Column('max_value', sa.Float(), nullable=True),
+            sa.Column('read_write', sa.String(length=20), server_default='read_write', nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('plc_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['plc_id'], ['plc.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        existing = _columns(inspector, 'register')
+        with op.batch_alter_table('register') as batch_op:
+            if 'min_value' not in existing:
+                batch_op.add_column(sa.Column('min_value', sa.Float(), nullable=True))
+            if 'max_value' not in existing:
+                batch_op.add_column(sa.Column('max_value', sa.Float(), nullable=True))
+            if 'read_write' not in existing:
+                batch_op.add_column(sa.Column('read_write', sa.String(length=20),
+                                              server_default='read_write', nullable=False))
+
+
+def downgrade():
+    op.drop_table('register')
+    op.drop_table('plc')
+    op.drop_table('user')
@@ -0,0 +1,104 @@
+"""Register areas, bus transports, register scans and lookup indexes
+
+Revision ID: 7c2d9e41a5b3
+Revises: 3a1f0c6d2b10
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d9e41a5b3'
+down_revision = '3a1f0c6d2b10'
+branch_labels = None
+depends_on = None
+
+# Names the unnamed unique constraint create_all() put on plc.ip_address
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Databases created by db.create_all() from newer models may already
+    # have some of these, so only add what is missing
+    inspector = sa.inspect(op.get_bind())
+
+    columns = _columns(inspector, 'plc')
+    indexes = _indexes(inspector, 'plc')
+    ip_unique = [
+        constraint for constraint in inspector.get_unique_constraints('plc')
+        if constraint['column_names'] == ['ip_address']
+    ]
+    with op.batch_alter_table('plc', naming_convention=NAMING_CONVENTION) as batch_op:
+        if 'protocol' not in columns:
+            batch_op.add_column(sa.Column('protocol', sa.String(length=20), server_default='tcp', nullable=False))
+        if 'serial_port' not in columns:
+            batch_op.add_column(sa.Column('serial_port', sa.String(length=120), nullable=True))
+        if 'baudrate' not in columns:
+            batch_op.add_column(sa.Column('baudrate', sa.Integer(), nullable=True))
+        if 'inter_frame_delay' not in columns:
+            batch_op.add_column(sa.Column('inter_frame_delay', sa.Float(), nullable=True))
+        # Slaves behind one gateway share an address
+        for constraint in ip_unique:
+            batch_op.drop_constraint(constraint['name'] or 'uq_plc_ip_address', type_='unique')
+        if 'ix_plc_user_id' not in indexes:
+            batch_op.create_index('ix_plc_user_id', ['user_id'], unique=False)
+
+    columns = _columns(inspector, 'register')
+    indexes = _indexes(inspector, 'register')
+    with op.batch_alter_table('register') as batch_op:
+        if 'register_area' not in columns:
+            batch_op.add_column(sa.Column('register_area', sa.String(length=20),
+                                          server_default='holding_register', nullable=False))
+        if 'ix_register_plc_id_is_monitored' not in indexes:
+            batch_op.create_index('ix_register_plc_id_is_monitored', ['plc_id', 'is_monitored'], unique=False)
+        if 'ix_register_plc_id_area_address' not in indexes:
+            batch_op.create_index('ix_register_plc_id_area_address', ['plc_id', 'register_area', 'address'],
+                                  unique=False)
+
+    if 'register_scan' not in inspector.get_table_names():
+        op.create_table('register_scan',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('plc_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('options', sa.JSON(), nullable=True),
+            sa.Column('progress', sa.Float(), nullable=True),
+            sa.Column('requests', sa.Integer(), nullable=True),
+            sa.Column('ranges', sa.JSON(), nullable=True),
+            sa.Column('proposed_registers', sa.JSON(), nullable=True),
+            sa.Column('error', sa.String(length=255), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['plc_id'], ['plc.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'ix_register_scan_plc_id' not in _indexes(sa.inspect(op.get_bind()), 'register_scan'):
+        with op.batch_alter_table('register_scan') as batch_op:
+            batch_op.create_index('ix_register_scan_plc_id', ['plc_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('register_scan') as batch_op:
+        batch_op.drop_index('ix_register_scan_plc_id')
+    op.drop_table('register_scan')
+
+    with op.batch_alter_table('register') as batch_op:
+        batch_op.drop_index('ix_register_plc_id_area_address')
+        batch_op.drop_index('ix_register_plc_id_is_monitored')
+        batch_op.drop_column('register_area')
+
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_index('ix_plc_user_id')
+        batch_op.drop_column('inter_frame_delay')
+        batch_op.drop_column('baudrate')
+        batch_op.drop_column('serial_port')
+        batch_op.drop_column('protocol')
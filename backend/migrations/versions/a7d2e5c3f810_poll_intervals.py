@@ -0,0 +1,33 @@
+"""Poll interval and the slowest interval load shedding may stretch it to
+
+Revision ID: a7d2e5c3f810
+Revises: f6c1d8a4b2e7
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e5c3f810'
+down_revision = 'f6c1d8a4b2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('plc')}
+    # Plain ADD COLUMN: a batch copy of plc would cascade into its registers on SQLite
+    if 'poll_interval' not in columns:
+        op.add_column('plc', sa.Column('poll_interval', sa.Float(), nullable=True))
+    if 'max_poll_interval' not in columns:
+        op.add_column('plc', sa.Column('max_poll_interval', sa.Float(), nullable=True))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_column('max_poll_interval')
+        batch_op.drop_column('poll_interval')
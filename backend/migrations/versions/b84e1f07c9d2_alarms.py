@@ -0,0 +1,77 @@
+"""Alarm rules and alarm history
+
+Revision ID: b84e1f07c9d2
+Revises: 7c2d9e41a5b3
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b84e1f07c9d2'
+down_revision = '7c2d9e41a5b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'alarm_rule' not in tables:
+        op.create_table('alarm_rule',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('register_id', sa.Integer(), nullable=False),
+            sa.Column('rule_type', sa.String(length=20), nullable=False),
+            sa.Column('threshold', sa.Float(), nullable=False),
+            sa.Column('setpoint', sa.Float(), nullable=True),
+            sa.Column('reference_register_id', sa.Integer(), nullable=True),
+            sa.Column('deadband', sa.Float(), nullable=True),
+            sa.Column('on_delay', sa.Float(), nullable=True),
+            sa.Column('off_delay', sa.Float(), nullable=True),
+            sa.Column('severity', sa.String(length=20), nullable=False),
+            sa.Column('message', sa.String(length=255), nullable=True),
+            sa.Column('enabled', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['register_id'], ['register.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['reference_register_id'], ['register.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('alarm_rule') as batch_op:
+            batch_op.create_index('ix_alarm_rule_register_id', ['register_id'], unique=False)
+
+    if 'alarm' not in tables:
+        op.create_table('alarm',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('plc_id', sa.Integer(), nullable=False),
+            sa.Column('register_id', sa.Integer(), nullable=False),
+            sa.Column('rule_id', sa.Integer(), nullable=True),
+            sa.Column('rule_type', sa.String(length=20), nullable=False),
+            sa.Column('severity', sa.String(length=20), nullable=False),
+            sa.Column('message', sa.String(length=255), nullable=True),
+            sa.Column('threshold', sa.Float(), nullable=False),
+            sa.Column('value', sa.Float(), nullable=True),
+            sa.Column('raised_at', sa.DateTime(), nullable=False),
+            sa.Column('cleared_at', sa.DateTime(), nullable=True),
+            sa.Column('clear_value', sa.Float(), nullable=True),
+            sa.Column('acknowledged_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['plc_id'], ['plc.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['register_id'], ['register.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['rule_id'], ['alarm_rule.id'], ondelete='SET NULL'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('alarm') as batch_op:
+            batch_op.create_index('ix_alarm_plc_id_cleared_at', ['plc_id', 'cleared_at'], unique=False)
+            batch_op.create_index('ix_alarm_register_id', ['register_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('alarm') as batch_op:
+        batch_op.drop_index('ix_alarm_register_id')
+        batch_op.drop_index('ix_alarm_plc_id_cleared_at')
+    op.drop_table('alarm')
+
+    with op.batch_alter_table('alarm_rule') as batch_op:
+        batch_op.drop_index('ix_alarm_rule_register_id')
+    op.drop_table('alarm_rule')
@@ -0,0 +1,30 @@
+"""Largest number of registers a PLC answers in one read
+
+Revision ID: c3e9f1b7d254
+Revises: a7d2e5c3f810
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9f1b7d254'
+down_revision = 'a7d2e5c3f810'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('plc')}
+    # Plain ADD COLUMN: a batch copy of plc would cascade into its registers on SQLite
+    if 'max_read_count' not in columns:
+        op.add_column('plc', sa.Column('max_read_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_column('max_read_count')
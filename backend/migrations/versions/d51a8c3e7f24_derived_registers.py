@@ -0,0 +1,28 @@
+"""Derived registers
+
+Revision ID: d51a8c3e7f24
+Revises: b84e1f07c9d2
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd51a8c3e7f24'
+down_revision = 'b84e1f07c9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('register')}
+    if 'expression' not in columns:
+        with op.batch_alter_table('register') as batch_op:
+            batch_op.add_column(sa.Column('expression', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('register') as batch_op:
+        batch_op.drop_column('expression')
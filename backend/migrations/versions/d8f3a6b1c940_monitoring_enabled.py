@@ -0,0 +1,31 @@
+"""Remember which PLCs are monitored across restarts
+
+Revision ID: d8f3a6b1c940
+Revises: c3e9f1b7d254
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3a6b1c940'
+down_revision = 'c3e9f1b7d254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('plc')}
+    # Plain ADD COLUMN: a batch copy of plc would cascade into its registers on SQLite
+    if 'monitoring_enabled' not in columns:
+        op.add_column('plc', sa.Column('monitoring_enabled', sa.Boolean(), server_default=sa.false(),
+                                       nullable=False))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_column('monitoring_enabled')
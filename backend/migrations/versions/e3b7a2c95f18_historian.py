@@ -0,0 +1,50 @@
+"""Historian compression settings and history chunks
+
+Revision ID: e3b7a2c95f18
+Revises: d51a8c3e7f24
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7a2c95f18'
+down_revision = 'd51a8c3e7f24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('register')}
+    with op.batch_alter_table('register') as batch_op:
+        for name in ('history_deadband', 'history_deviation'):
+            if name not in columns:
+                batch_op.add_column(sa.Column(name, sa.Float(), nullable=True))
+
+    if 'history_chunk' not in inspector.get_table_names():
+        op.create_table('history_chunk',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('register_id', sa.Integer(), nullable=False),
+            sa.Column('start_time', sa.Float(), nullable=False),
+            sa.Column('end_time', sa.Float(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('points', sa.LargeBinary(), nullable=False),
+            sa.ForeignKeyConstraint(['register_id'], ['register.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('history_chunk') as batch_op:
+            batch_op.create_index('ix_history_chunk_register_id_start_time', ['register_id', 'start_time'],
+                                  unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('history_chunk') as batch_op:
+        batch_op.drop_index('ix_history_chunk_register_id_start_time')
+    op.drop_table('history_chunk')
+
+    with op.batch_alter_table('register') as batch_op:
+        batch_op.drop_column('history_deviation')
+        batch_op.drop_column('history_deadband')
@@ -0,0 +1,33 @@
+"""Unit id and address offset the Modbus gateway presents a PLC on
+
+Revision ID: e9a4c7d2f615
+Revises: d8f3a6b1c940
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9a4c7d2f615'
+down_revision = 'd8f3a6b1c940'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('plc')}
+    # Plain ADD COLUMN: a batch copy of plc would cascade into its registers on SQLite
+    if 'gateway_unit_id' not in columns:
+        op.add_column('plc', sa.Column('gateway_unit_id', sa.Integer(), nullable=True))
+    if 'gateway_offset' not in columns:
+        op.add_column('plc', sa.Column('gateway_offset', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_column('gateway_offset')
+        batch_op.drop_column('gateway_unit_id')
@@ -0,0 +1,130 @@
+"""Device templates, per-device register overrides and per-PLC history
+
+Revision ID: f6c1d8a4b2e7
+Revises: e3b7a2c95f18
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c1d8a4b2e7'
+down_revision = 'e3b7a2c95f18'
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+    # Batch mode copies and drops tables on SQLite; with foreign keys enforced, dropping
+    # register would cascade into the alarm rules and history referencing it
+    if bind.dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+
+    if 'device_template' not in tables:
+        op.create_table('device_template',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('description', sa.String(length=255), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+
+    if 'template_id' not in _columns(inspector, 'plc'):
+        with op.batch_alter_table('plc') as batch_op:
+            batch_op.add_column(sa.Column('template_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_plc_template_id_device_template', 'device_template',
+                                        ['template_id'], ['id'])
+            batch_op.create_index('ix_plc_template_id', ['template_id'], unique=False)
+
+    if 'template_id' not in _columns(inspector, 'register'):
+        with op.batch_alter_table('register') as batch_op:
+            batch_op.alter_column('plc_id', existing_type=sa.Integer(), nullable=True)
+            batch_op.add_column(sa.Column('template_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_register_template_id_device_template', 'device_template',
+                                        ['template_id'], ['id'], ondelete='CASCADE')
+            batch_op.create_index('ix_register_template_id_area_address',
+                                  ['template_id', 'register_area', 'address'], unique=False)
+
+    if 'register_override' not in tables:
+        op.create_table('register_override',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('plc_id', sa.Integer(), nullable=False),
+            sa.Column('register_id', sa.Integer(), nullable=False),
+            sa.Column('scaling_factor', sa.Float(), nullable=True),
+            sa.Column('unit', sa.String(length=20), nullable=True),
+            sa.Column('is_monitored', sa.Boolean(), nullable=True),
+            sa.Column('min_value', sa.Float(), nullable=True),
+            sa.Column('max_value', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['plc_id'], ['plc.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['register_id'], ['register.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('plc_id', 'register_id', name='uq_register_override_plc_id_register_id')
+        )
+
+    # History is kept per PLC so the PLCs sharing a template register each have their own
+    if 'plc_id' not in _columns(inspector, 'history_chunk'):
+        with op.batch_alter_table('history_chunk') as batch_op:
+            batch_op.add_column(sa.Column('plc_id', sa.Integer(), nullable=True))
+        op.execute('UPDATE history_chunk SET plc_id = '
+                   '(SELECT register.plc_id FROM register WHERE register.id = history_chunk.register_id)')
+        op.execute('DELETE FROM history_chunk WHERE plc_id IS NULL')
+        indexes = _indexes(inspector, 'history_chunk')
+        with op.batch_alter_table('history_chunk') as batch_op:
+            batch_op.alter_column('plc_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key('fk_history_chunk_plc_id_plc', 'plc', ['plc_id'], ['id'], ondelete='CASCADE')
+            if 'ix_history_chunk_register_id_start_time' in indexes:
+                batch_op.drop_index('ix_history_chunk_register_id_start_time')
+            batch_op.create_index('ix_history_chunk_plc_id_register_id_start_time',
+                                  ['plc_id', 'register_id', 'start_time'], unique=False)
+
+    if bind.dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=ON')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+
+    with op.batch_alter_table('history_chunk') as batch_op:
+        batch_op.drop_index('ix_history_chunk_plc_id_register_id_start_time')
+        batch_op.drop_constraint('fk_history_chunk_plc_id_plc', type_='foreignkey')
+        batch_op.drop_column('plc_id')
+        batch_op.create_index('ix_history_chunk_register_id_start_time', ['register_id', 'start_time'],
+                              unique=False)
+
+    op.drop_table('register_override')
+
+    # Template registers have no PLC to go back to
+    op.execute('DELETE FROM register WHERE plc_id IS NULL')
+    with op.batch_alter_table('register') as batch_op:
+        batch_op.drop_index('ix_register_template_id_area_address')
+        batch_op.drop_constraint('fk_register_template_id_device_template', type_='foreignkey')
+        batch_op.drop_column('template_id')
+        batch_op.alter_column('plc_id', existing_type=sa.Integer(), nullable=False)
+
+    with op.batch_alter_table('plc') as batch_op:
+        batch_op.drop_index('ix_plc_template_id')
+        batch_op.drop_constraint('fk_plc_template_id_device_template', type_='foreignkey')
+        batch_op.drop_column('template_id')
+
+    op.drop_table('device_template')
+
+    if bind.dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=ON')
@@ -1,6 +1,37 @@
+import gc
+import os
+import time
+
+STARTED = time.monotonic()
+
+# eventlet (the default when installed) and gevent must patch sockets, sleeps and locks
+# before anything imports them; ASYNC_MODE=threading runs plain threads
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'eventlet')
+if ASYNC_MODE == 'eventlet':
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+    except ImportError:
+        pass
+elif ASYNC_MODE == 'gevent':
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
 from app import create_app, socketio
+from app.utils.warm_start import warm_start
+from app.utils.modbus_gateway import start_modbus_gateway
 
 app = create_app()
+# With debug, the process started by hand only watches for changes; the reloader's child serves
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    warm_start(app, STARTED)
+    start_modbus_gateway(app)
+    # Full collections would keep walking everything loaded at startup, pausing all green threads
+    # for over 100 ms; it lives as long as the process anyway
+    gc.freeze()
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the app and the benchmarks' helpers the way run.py and the benchmarks do
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'benchmarks'))
@@ -0,0 +1,40 @@
+import math
+
+import pytest
+
+from app.utils.derived_tags import DerivedTags, ExpressionError, parse_expression
+
+
+@pytest.mark.parametrize('expression, message', [
+    ('sqrt(r1, r2)', 'sqrt() takes 1 argument, got 2'),
+    ('min(r1)', 'min() takes 2 arguments, got 1'),
+    ('round(r1, 2, 3)', 'round() takes 1 or 2 arguments, got 3'),
+    ('sum()', 'sum() takes at least 1 argument, got 0'),
+    ('round(r1, r2)', "round() needs an integer constant, not 'r2'"),
+    ('round(r1, 1.5)', "round() needs an integer constant, not '1.5'"),
+])
+def test_calls_are_checked_when_parsed(expression, message):
+    with pytest.raises(ExpressionError, match=message.replace('(', r'\(').replace(')', r'\)')):
+        parse_expression(expression)
+
+
+def test_round_keeps_its_digits_an_integer():
+    assert parse_expression('round(r1, 2)') == ('_round(a0, 2)', [1])
+    tags = DerivedTags()
+    tags.load([(10, 1, 'round(r1, 2)'), (11, 1, 'round(r1, -1)')])
+    assert tags.update({1: 3.14159}) == {1: {10: 3.14, 11: 0.0}}
+
+
+def test_a_failing_expression_only_leaves_its_own_tags_without_a_value():
+    tags = DerivedTags()
+    tags.load([(10, 1, 'r1 * 2'), (11, 2, 'sqrt(r1)'), (12, 2, 'r11 + 1')])
+    failing = next(group for group in tags.groups if group.template == '_sqrt(a0)')
+
+    def fail(matrix):
+        raise TypeError('unsupported operand')
+    failing.evaluate = fail
+
+    assert tags.update({1: 4.0}) == {1: {10: 8.0}}
+    assert math.isnan(tags.values[tags.slots[11]]) and math.isnan(tags.values[tags.slots[12]])
+    # and the other tags keep being computed on the following cycles
+    assert tags.update({1: 5.0}) == {1: {10: 10.0}}
@@ -0,0 +1,184 @@
+import json
+import struct
+import time
+
+import pytest
+
+from app.utils.mqtt_publisher import (MqttPublisher, JSON, SPARKPLUG, REBIRTH, paho_error, sparkplug_metric,
+                                      sparkplug_payload)
+from app.utils.response_cache import response_cache, REGISTERS
+from mqtt_broker import MqttBroker
+
+pytestmark = pytest.mark.skipif(paho_error() is not None, reason='needs paho-mqtt 2')
+
+
+def protobuf_fields(data):
+    """(field number, value) of a protobuf message, doubles decoded"""
+    fields, index = [], 0
+
+    def varint():
+        nonlocal index
+        value, shift = 0, 0
+        while True:
+            byte = data[index]
+            index += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    while index < len(data):
+        key = varint()
+        if key & 7 == 0:
+            value = varint()
+        elif key & 7 == 1:
+            value = struct.unpack_from('<d', data, index)[0]
+            index += 8
+        else:
+            length = varint()
+            value = data[index:index + length]
+            index += length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def sparkplug(payload):
+    """A Sparkplug B payload as {'seq', 'metrics': [{'name', 'alias', 'value'}]}"""
+    fields = protobuf_fields(payload)
+    metrics = []
+    for number, metric in fields:
+        if number == 2:
+            metric = dict(protobuf_fields(metric))
+            value = metric.get(13, metric.get(14, metric.get(11)))
+            metrics.append({'name': metric[1].decode() if 1 in metric else None, 'alias': metric.get(2),
+                            'value': bool(value) if metric[4] == 11 else value})
+    return {'seq': dict(fields).get(3), 'metrics': metrics}
+
+
+def bd_seq(payload):
+    return next(metric['value'] for metric in sparkplug(payload)['metrics'] if metric['name'] == 'bdSeq')
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def broker():
+    broker = MqttBroker().start()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def publishers():
+    started = []
+
+    def start(port, **options):
+        publisher = MqttPublisher(None, f'mqtt://127.0.0.1:{port}', hub_id='edge1', group='plant', **options)
+        # Births name registers from the database; these tests have none
+        publisher.names = {1: 'temperature', 2: 'running', 3: 'pressure'}
+        publisher.names_generation = response_cache.generation(REGISTERS)
+        publisher.start()
+        started.append(publisher)
+        return publisher
+
+    yield start
+    for publisher in started:
+        publisher.stop()
+
+
+def test_json_publishes_only_changes_beyond_the_deadband(broker, publishers):
+    publisher = publishers(broker.port, payload=JSON, qos=1, deadband=0.5)
+
+    publisher.store(1, {1: 10.0, 2: True, 3: None}, 100.0)
+    publisher.store(1, {1: 10.3, 2: True}, 101.0)  # Within the deadband
+    publisher.store(1, {1: 10.6, 2: True}, 102.0)
+    publisher.store(1, {1: 10.9, 2: True}, 103.0)  # Within the deadband of 10.6, the last published
+    publisher.store(1, {1: 10.9, 2: False}, 104.0)
+    publisher.store(2, {1: 10.0}, 104.0)  # Another PLC's registers are compared on their own
+
+    assert wait_for(lambda: len(broker.messages) >= 4)
+    time.sleep(0.2)
+    messages = [(message['topic'], message['qos'], json.loads(message['payload'])) for message in broker.messages]
+    assert messages == [
+        ('plc_hub/edge1/plcs/1', 1, {'plc_id': 1, 'timestamp': 100.0, 'values': {'1': 10.0, '2': True}}),
+        ('plc_hub/edge1/plcs/1', 1, {'plc_id': 1, 'timestamp': 102.0, 'values': {'1': 10.6}}),
+        ('plc_hub/edge1/plcs/1', 1, {'plc_id': 1, 'timestamp': 104.0, 'values': {'2': False}}),
+        ('plc_hub/edge1/plcs/2', 1, {'plc_id': 2, 'timestamp': 104.0, 'values': {'1': 10.0}}),
+    ]
+    assert publisher.status()['unchanged'] == 6
+
+
+def test_sparkplug_sequence_numbers_and_bdseq(broker, publishers):
+    publisher = publishers(broker.port, payload=SPARKPLUG, qos=1)
+    assert wait_for(lambda: broker.messages)
+    will = broker.connects[0]
+    assert will['will_topic'] == 'spBv1.0/plant/NDEATH/edge1'
+    first_session = bd_seq(will['will_payload'])
+
+    publisher.store(7, {1: 20.0, 2: True}, 100.0)
+    assert wait_for(lambda: len(broker.messages) >= 2)
+    publisher.store(7, {1: 21.0, 2: True}, 101.0)
+    assert wait_for(lambda: len(broker.messages) >= 3)
+    publisher.store(7, {2: False}, 102.0)
+    assert wait_for(lambda: len(broker.messages) >= 4)
+
+    nbirth, dbirth, ddata, more = broker.messages[:4]
+    assert nbirth['topic'] == 'spBv1.0/plant/NBIRTH/edge1'
+    assert sparkplug(nbirth['payload'])['seq'] == 0
+    assert bd_seq(nbirth['payload']) == first_session
+    assert {'name': REBIRTH, 'alias': None, 'value': False} in sparkplug(nbirth['payload'])['metrics']
+    assert dbirth['topic'] == 'spBv1.0/plant/DBIRTH/edge1/plc-7'
+    assert sparkplug(dbirth['payload']) == {'seq': 1, 'metrics': [
+        {'name': 'temperature', 'alias': 1, 'value': 20.0}, {'name': 'running', 'alias': 2, 'value': True}]}
+    assert ddata['topic'] == 'spBv1.0/plant/DDATA/edge1/plc-7'
+    assert sparkplug(ddata['payload']) == {'seq': 2, 'metrics': [{'name': None, 'alias': 1, 'value': 21.0}]}
+    assert sparkplug(more['payload']) == {'seq': 3, 'metrics': [{'name': None, 'alias': 2, 'value': False}]}
+
+    # A host asking for a rebirth ends the session and starts one with the next bdSeq
+    broker.publish('spBv1.0/plant/NCMD/edge1', sparkplug_payload([sparkplug_metric(True, REBIRTH)]), qos=1)
+    assert wait_for(lambda: len(broker.messages) >= 7)
+    ndeath, nbirth, dbirth = broker.messages[4:7]
+    second_session = (first_session + 1) % 256
+    assert ndeath['topic'] == 'spBv1.0/plant/NDEATH/edge1'
+    assert bd_seq(ndeath['payload']) == first_session
+    assert len(broker.connects) == 2
+    assert bd_seq(broker.connects[1]['will_payload']) == second_session
+    assert nbirth['topic'] == 'spBv1.0/plant/NBIRTH/edge1'
+    assert sparkplug(nbirth['payload'])['seq'] == 0
+    assert bd_seq(nbirth['payload']) == second_session
+    assert sparkplug(dbirth['payload']) == {'seq': 1, 'metrics': [
+        {'name': 'temperature', 'alias': 1, 'value': 21.0}, {'name': 'running', 'alias': 2, 'value': False}]}
+    assert publisher.status()['rebirths'] == 1
+
+    publisher.stop()
+    ndeath = broker.messages[-1]
+    assert ndeath['topic'] == 'spBv1.0/plant/NDEATH/edge1'
+    assert bd_seq(ndeath['payload']) == second_session
+
+
+def test_qos1_messages_are_redelivered_after_a_broker_reconnect(publishers):
+    failing = MqttBroker(acknowledge=False).start()
+    publisher = publishers(failing.port, payload=JSON, qos=1)
+    for cycle in range(3):
+        publisher.store(1, {1: float(cycle)}, 100.0 + cycle)
+    assert wait_for(lambda: len(failing.messages) == 3)
+    assert publisher.status()['unacknowledged'] == 3
+
+    failing.stop()
+    broker = MqttBroker(port=failing.port).start()
+    try:
+        assert wait_for(lambda: len(broker.messages) >= 3 and publisher.status()['unacknowledged'] == 0)
+        assert [message['payload'] for message in broker.messages] == [
+            message['payload'] for message in failing.messages]
+        assert all(message['dup'] and message['qos'] == 1 for message in broker.messages)
+        assert publisher.connected
+    finally:
+        publisher.stop()
+        broker.stop()
@@ -0,0 +1,50 @@
+import contextlib
+import types
+
+import pytest
+
+from app.utils.read_planner import HOLDING_REGISTER
+from app.utils.register_scanner import RegisterScanner
+
+
+class SparseDevice:
+    """Answers reads lying wholly inside one of its ranges with the addresses
+    as values, and any other read with exception 2 (illegal data address)"""
+
+    def __init__(self, ranges):
+        self.valid = {address for start, end in ranges for address in range(start, end)}
+
+    def read_holding_registers(self, address, count, slave=1):
+        if all(address + offset in self.valid for offset in range(count)):
+            return types.SimpleNamespace(registers=list(range(address, address + count)), isError=lambda: False)
+        return types.SimpleNamespace(exception_code=2, isError=lambda: True)
+
+
+def found_ranges(device, **options):
+    scanner = RegisterScanner(lambda: contextlib.nullcontext(device), areas=(HOLDING_REGISTER,),
+                              rate_limit=None, sample_interval=0, **options)
+    ranges = scanner.sweep(HOLDING_REGISTER)
+    for start, words in ranges:
+        assert words == list(range(start, start + len(words)))
+    return [(start, start + len(words)) for start, words in ranges], scanner.requests
+
+
+@pytest.mark.parametrize('resolution', [1, 4, 8, 16])
+def test_ranges_are_found_with_their_exact_edges(resolution):
+    shortest = 2 * resolution - 1
+    expected = [
+        (100, 125),  # Starts and ends off the resolution's multiples
+        (250, 250 + shortest),
+        (252 + shortest, 252 + 2 * shortest),  # Right after a two address gap
+        (373, 500),  # Across a block boundary
+        (1003, 1003 + shortest),  # Short and alone in a long unmapped stretch
+        (3999 - shortest, 4000),  # Up to the end of the scan
+    ]
+    ranges, _ = found_ranges(SparseDevice(expected), start=0, end=4000, resolution=resolution)
+    assert ranges == expected
+
+
+def test_unmapped_space_is_swept_in_few_requests():
+    ranges, requests = found_ranges(SparseDevice([(5000, 5100)]), start=0, end=10000)
+    assert ranges == [(5000, 5100)]
+    assert requests < 10000 / 2
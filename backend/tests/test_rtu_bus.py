@@ -0,0 +1,202 @@
+import os
+import time
+import types
+
+import pytest
+
+from app.utils.modbus_bus import BusManager, BusDevice, RTU, bus_key
+from app.utils.plc_manager import PLCManager
+from app.utils.polling_service import PollingService, MONITORING
+from app.utils.read_planner import plan_reads, HOLDING_REGISTER, INPUT_REGISTER, COIL
+from app.utils.rtu_simulator import RtuSimulator
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs a pseudo-terminal')
+
+INTER_FRAME_DELAY_MS = 20
+
+
+def rtu_plc(plc_id, simulator, unit_id):
+    return types.SimpleNamespace(id=plc_id, protocol=RTU, serial_port=simulator.port, baudrate=19200,
+                                 inter_frame_delay=INTER_FRAME_DELAY_MS, ip_address=None, port=None,
+                                 unit_id=unit_id)
+
+
+def register(register_id, address, area=HOLDING_REGISTER, data_type='uint16'):
+    return types.SimpleNamespace(id=register_id, address=address, data_type=data_type, scaling_factor=1.0,
+                                 register_area=area)
+
+
+class RecordingDevice(BusDevice):
+    def __init__(self, plc_id, unit_id, registers):
+        super().__init__(plc_id, unit_id, interval=0.05)
+        self.registers = registers
+        self.cycles = []
+        self.errors = []
+
+    def refresh(self):
+        self.plan = plan_reads(self.registers)
+
+    def on_values(self, values):
+        self.cycles.append(values)
+
+    def on_error(self, error):
+        self.errors.append(error)
+
+
+@pytest.fixture
+def simulator():
+    simulator = RtuSimulator(unit_ids=(1, 2))
+    frames = []  # (unit id, received at, answered at, answered), monotonic
+    handle = simulator.handle
+
+    def recording_handle(frame):
+        received = time.monotonic()
+        response = handle(frame)
+        frames.append((frame[0], received, time.monotonic(), response is not None))
+        return response
+
+    simulator.handle = recording_handle
+    simulator.frames_seen = frames
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_two_slaves_on_one_port_are_polled_through_one_serialized_bus(simulator):
+    simulator.set_values(1, HOLDING_REGISTER, 0, [101, 102, 103])
+    simulator.set_values(1, COIL, 5, [1, 0, 1])
+    simulator.set_values(2, HOLDING_REGISTER, 0, [201, 202, 203])
+    simulator.set_values(2, INPUT_REGISTER, 10, [0x0000, 0x4120])  # 10.0 as float32, low word first
+    first = RecordingDevice(1, 1, [register(1, 0), register(2, 2), register(3, 5, COIL, 'bool'),
+                                   register(4, 7, COIL, 'bool')])
+    second = RecordingDevice(2, 2, [register(5, 0), register(6, 1), register(7, 10, INPUT_REGISTER, 'float32')])
+    manager = BusManager()
+    assert manager.start_device(rtu_plc(1, simulator, 1), first)
+    assert manager.start_device(rtu_plc(2, simulator, 2), second)
+    try:
+        bus = manager.buses[bus_key(rtu_plc(1, simulator, 1))]
+        assert [key for key in manager.buses if key[0] == RTU] == [bus.key]
+        assert wait_for(lambda: len(first.cycles) >= 5 and len(second.cycles) >= 5)
+    finally:
+        manager.stop_device(1)
+        manager.stop_device(2)
+
+    assert not first.errors and not second.errors
+    assert first.cycles[-1] == {1: 101.0, 2: 103.0, 3: True, 4: True}
+    assert second.cycles[-1] == {5: 201.0, 6: 202.0, 7: 10.0}
+
+    frames = simulator.frames_seen
+    assert {unit_id for unit_id, _, _, _ in frames} == {1, 2}
+    # Every frame arrived whole with a valid CRC, so none overlapped another on the line
+    assert all(answered for _, _, _, answered in frames)
+    # and each request waited for the previous answer plus the inter-frame delay
+    gaps = [received - previous[2] for previous, (_, received, _, _) in zip(frames, frames[1:])]
+    assert min(gaps) >= INTER_FRAME_DELAY_MS / 1000 * 0.9
+
+
+def test_stopping_the_last_device_closes_the_serial_port(simulator):
+    manager = BusManager()
+    plc = rtu_plc(1, simulator, 1)
+    device = RecordingDevice(1, 1, [register(1, 0)])
+    manager.start_device(plc, device)
+    assert wait_for(lambda: device.cycles)
+    bus = manager.buses[bus_key(plc)]
+    scheduler = bus._thread
+
+    manager.stop_device(1)
+
+    assert bus_key(plc) not in manager.buses
+    assert bus.client.socket is None
+    assert not scheduler.is_alive()
+
+    # A read of the now unpolled PLC opens the port again only while it lasts
+    with manager.using(plc) as reading:
+        assert reading is not bus
+        assert reading.read(plan_reads([register(1, 0)])[0], 1) == {1: 0.0}
+    assert bus_key(plc) not in manager.buses
+    assert reading.client.socket is None
+
+
+def test_a_bus_in_use_stays_open_after_its_last_device_stops(simulator):
+    manager = BusManager()
+    plc = rtu_plc(1, simulator, 1)
+    device = RecordingDevice(1, 1, [register(1, 0)])
+    manager.start_device(plc, device)
+    assert wait_for(lambda: device.cycles)
+    bus = manager.buses[bus_key(plc)]
+    closes = []
+    close = bus.client.close
+    bus.client.close = lambda: closes.append(time.monotonic()) or close()
+
+    with manager.using(plc) as reading:
+        assert reading is bus
+        manager.stop_device(1)
+        assert manager.buses[bus_key(plc)] is bus
+        assert wait_for(lambda: bus._thread is None)
+        # The caller's transaction still goes out on the port, never closed under it
+        assert bus.read(plan_reads([register(1, 0)])[0], 1) == {1: 0.0}
+        assert not closes
+    assert bus_key(plc) not in manager.buses
+    assert len(closes) == 1 and bus.client.socket is None
+
+
+def test_a_restarted_plc_is_polled_on_its_new_unit_id(simulator):
+    simulator.set_values(1, HOLDING_REGISTER, 0, [101])
+    simulator.set_values(2, HOLDING_REGISTER, 0, [201])
+    service = PollingService()
+    devices = []
+
+    def create_device(plc):
+        devices.append(RecordingDevice(plc.id, plc.unit_id, [register(1, 0)]))
+        return devices[-1]
+    service.create_device = create_device
+    plc = rtu_plc(1, simulator, 1)
+    assert not service.restart(plc)
+    service.subscribe(MONITORING, plc)
+    try:
+        assert wait_for(lambda: devices[0].cycles)
+        plc.unit_id = 2
+        assert service.restart(plc)
+        assert wait_for(lambda: len(devices) == 2 and devices[1].cycles)
+        assert BusManager().device(1) is devices[1]
+        assert devices[1].cycles[-1] == {1: 201.0}
+        assert devices[0].cycles[-1] == {1: 101.0}
+    finally:
+        service.forget(1)
+
+
+def test_on_demand_requests_go_through_the_polled_bus_to_the_plcs_unit(simulator):
+    simulator.set_values(1, HOLDING_REGISTER, 0, [101, 102])
+    simulator.set_values(2, HOLDING_REGISTER, 0, [201, 202])
+    manager = BusManager()
+    polled = RecordingDevice(1, 1, [register(1, 0)])
+    manager.start_device(rtu_plc(1, simulator, 1), polled)
+    plcs = PLCManager()
+    plcs.set_mock_mode(False)
+    plcs.add_plc(2, None, None, use_mock=False, unit_id=2, protocol=RTU, serial_port=simulator.port)
+    plcs.set_mock_mode(True)
+    try:
+        try:
+            assert wait_for(lambda: polled.cycles)
+            bus = manager.buses[bus_key(rtu_plc(1, simulator, 1))]
+            assert plcs.read_register(2, 0, 2) == [201, 202]
+            assert plcs.write_register(2, 1, 250)
+            assert plcs.read_register(2, 1) == 250
+            status = bus.queue.status()
+            assert status['read']['turns'] == 2 and status['write']['turns'] == 1
+            assert plcs.plcs[2]['instance'].socket is None  # Its own client was never opened
+        finally:
+            manager.stop_device(1)
+        # With nothing polling the port, the PLC's own client reaches the same unit
+        assert plcs.read_register(2, 0) == 201
+    finally:
+        plcs.remove_plc(2)
@@ -11,7 +11,11 @@ export default function AddPLC() {
     ip_address: '',
     port: 502,
     unit_id: 1,
+    protocol: 'tcp',
+    serial_port: '',
+    baudrate: 9600,
   });
+  const isSerial = formData.protocol === 'rtu';
 
   const mutation = useMutation(
     (newPLC) => axios.post('/api/plcs', newPLC),
@@ -58,6 +62,60 @@ export default function AddPLC() {
             />
           </div>
 
+          <div>
+            <label htmlFor="protocol" className="block text-sm font-medium text-gray-700 mb-1">
+              Protocol
+            </label>
+            <select
+              id="protocol"
+              name="protocol"
+              value={formData.protocol}
+              onChange={handleChange}
+              required
+              className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+            >
+              <option value="tcp">Modbus TCP</option>
+              <option value="rtu_over_tcp">Modbus RTU over TCP (gateway)</option>
+              <option value="rtu">Modbus RTU (serial)</option>
+            </select>
+          </div>
+
+          {isSerial && (
+            <div className="flex gap-4">
+              <div className="flex-1">
+                <label htmlFor="serial_port" className="block text-sm font-medium text-gray-700 mb-1">
+                  Serial Port
+                </label>
+                <input
+                  type="text"
+                  id="serial_port"
+                  name="serial_port"
+                  value={formData.serial_port}
+                  onChange={handleChange}
+                  required
+                  className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+                  placeholder="/dev/ttyUSB0"
+                />
+              </div>
+              <div className="flex-1">
+                <label htmlFor="baudrate" className="block text-sm font-medium text-gray-700 mb-1">
+                  Baud Rate
+                </label>
+                <input
+                  type="number"
+                  id="baudrate"
+                  name="baudrate"
+                  value={formData.baudrate}
+                  onChange={handleChange}
+                  required
+                  className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+                  placeholder="9600"
+                />
+              </div>
+            </div>
+          )}
+
+          {!isSerial && (
           <div>
             <label htmlFor="ip_address" className="block text-sm font-medium text-gray-700 mb-1">
               IP Address
@@ -73,6 +131,7 @@ export default function AddPLC() {
               placeholder="Enter IP address"
             />
           </div>
+          )}
 
           <div className="flex gap-4">
             <div className="flex-1">
@@ -11,12 +11,16 @@ export default function AddRegisters() {
     name: '',
     address: '',
     data_type: 'uint16',
+    register_area: 'holding_register',
     scaling_factor: 1,
+    history_deadband: '',
+    history_deviation: '',
     unit: '',
     description: '',
     min_value: '',
     max_value: '',
     read_write: 'read_write',
+    expression: '',
   });
   const [error, setError] = useState('');
 
@@ -33,7 +37,7 @@ export default function AddRegisters() {
         navigate(`/devices/${selectedPLC}`);
       },
       onError: (err) => {
-        setError(err?.response?.data?.message || 'Failed to add register.');
+        setError(err?.response?.data?.error || err?.response?.data?.message || 'Failed to add register.');
       },
     }
   );
@@ -41,7 +45,13 @@ export default function AddRegisters() {
   const handleSubmit = (e) => {
     e.preventDefault();
     setError('');
-    mutation.mutate(formData);
+    // Blank compression settings store every change
+    const toNumber = (value) => (value === '' ? null : Number(value));
+    mutation.mutate({
+      ...formData,
+      history_deadband: toNumber(formData.history_deadband),
+      history_deviation: toNumber(formData.history_deviation),
+    });
   };
 
   const handleChange = (e) => {
@@ -102,7 +112,8 @@ export default function AddRegisters() {
               name="address"
               value={formData.address}
               onChange={handleChange}
-              required
+              required={!formData.expression}
+              disabled={!!formData.expression}
               className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
               placeholder="Enter register address"
             />
@@ -124,6 +135,25 @@ export default function AddRegisters() {
               <option value="uint32">uint32</option>
               <option value="int32">int32</option>
               <option value="float32">float32</option>
+              <option value="bool">bool</option>
+            </select>
+          </div>
+          <div>
+            <label htmlFor="register_area" className="block text-sm font-medium text-gray-700 mb-1">
+              Register Area
+            </label>
+            <select
+              id="register_area"
+              name="register_area"
+              value={formData.register_area}
+              onChange={handleChange}
+              required
+              className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+            >
+              <option value="holding_register">Holding Register (FC03)</option>
+              <option value="input_register">Input Register (FC04)</option>
+              <option value="coil">Coil (FC01)</option>
+              <option value="discrete_input">Discrete Input (FC02)</option>
             </select>
           </div>
           <div className="flex gap-4">
@@ -158,6 +188,40 @@ export default function AddRegisters() {
               />
             </div>
           </div>
+          <div className="flex gap-4">
+            <div className="flex-1">
+              <label htmlFor="history_deadband" className="block text-sm font-medium text-gray-700 mb-1">
+                History Deadband
+              </label>
+              <input
+                type="number"
+                id="history_deadband"
+                name="history_deadband"
+                value={formData.history_deadband}
+                onChange={handleChange}
+                min="0"
+                step="any"
+                className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+                placeholder="Changes smaller than this are not stored"
+              />
+            </div>
+            <div className="flex-1">
+              <label htmlFor="history_deviation" className="block text-sm font-medium text-gray-700 mb-1">
+                History Deviation
+              </label>
+              <input
+                type="number"
+                id="history_deviation"
+                name="history_deviation"
+                value={formData.history_deviation}
+                onChange={handleChange}
+                min="0"
+                step="any"
+                className="w-full rounded-lg border border-gray-200 px-4 py-2 focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+                placeholder="Allowed error of stored trends"
+              />
+            </div>
+          </div>
           <div>
             <label htmlFor="min_value" className="block text-sm font-medium text-gray-700 mb-1">
               Minimum Value
@@ -203,6 +267,23 @@ export default function AddRegisters() {
               <option value="write_only">Write Only</option>
             </select>
           </div>
+          <div>
+            <label htmlFor="expression" className="block text-sm font-medium text-gray-700 mb-1">
+              Expression (derived register)
+            </label>
+            <input
+              type="text"
+              id="expression"
+              name="expression"
+              value={formData.expression}
+              onChange={handleChange}
+              className="w-full rounded-lg border border-gray-200 px-4 py-2 font-mono focus:ring-2 focus:ring-blue-500 focus:border-blue-500 bg-white"
+              placeholder="e.g., r12 * r13 * sqrt(3) * r14 / 1000"
+            />
+            <p className="text-xs text-gray-500 mt-1">
+              Leave empty to read the register from the device. Otherwise it is computed from other registers, referenced by id as r&lt;id&gt;.
+            </p>
+          </div>
           <div>
             <label htmlFor="description" className="block text-sm font-medium text-gray-700 mb-1">
               Description
@@ -1,4 +1,4 @@
-import { useQuery } from 'react-query';
+import { useQuery, useQueryClient } from 'react-query';
 import { useNavigate } from 'react-router-dom';
 import { useState } from 'react';
 import axios from 'axios';
@@ -6,12 +6,48 @@ import { CpuChipIcon } from '@heroicons/react/24/outline';
 
 export default function AllDevices() {
   const navigate = useNavigate();
+  const queryClient = useQueryClient();
   const [search, setSearch] = useState('');
-  const { data: plcs, isLoading } = useQuery('plcs', async () => {
-    const response = await axios.get('/api/plcs');
+  const [testResults, setTestResults] = useState({});
+  const [isTesting, setIsTesting] = useState(false);
+  // Stored status and register counts only; devices are not contacted to list them
+  const { data: plcs, isLoading } = useQuery(['plcs', 'summary'], async () => {
+    const response = await axios.get('/api/plcs/summary');
     return response.data;
   });
 
+  // Results arrive as server-sent events while the probes complete
+  const testAllConnections = async () => {
+    setIsTesting(true);
+    setTestResults({});
+    try {
+      const response = await fetch('/api/plcs/test-connections', {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ plc_ids: plcs.map((plc) => plc.id) }),
+      });
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach((event) => {
+          if (!event.startsWith('event: result')) return;
+          const result = JSON.parse(event.slice(event.indexOf('data: ') + 6));
+          setTestResults((prev) => ({ ...prev, [result.plc_id]: result.connected }));
+        });
+      }
+    } finally {
+      setIsTesting(false);
+      queryClient.invalidateQueries('plcs');
+    }
+  };
+
   const filteredPlcs = plcs?.filter(
     (plc) =>
       plc.name.toLowerCase().includes(search.toLowerCase()) ||
@@ -22,12 +58,21 @@ export default function AllDevices() {
     <div className="max-w-4xl mx-auto mt-8">
       <div className="flex items-center justify-between mb-6">
         <h1 className="text-2xl font-bold text-gray-900">Devices</h1>
+        <div className="flex gap-3">
+        <button
+          onClick={testAllConnections}
+          disabled={isTesting || !plcs?.length}
+          className="border border-gray-300 rounded-lg px-4 py-2 text-gray-700 font-medium hover:bg-gray-50 transition"
+        >
+          {isTesting ? 'Testing...' : 'Test All Connections'}
+        </button>
         <button
           onClick={() => navigate('/add-plc')}
           className="bg-blue-600 hover:bg-blue-700 text-white font-semibold rounded-lg px-5 py-2 flex items-center gap-2 shadow transition"
         >
           <span className="text-xl">+</span> Add Device
         </button>
+        </div>
       </div>
       <div className="bg-white rounded-2xl shadow p-6 mb-8">
         <h2 className="text-xl font-bold text-gray-900 mb-1">Device Management</h2>
@@ -43,17 +88,20 @@ export default function AllDevices() {
           {isLoading ? (
             <div>Loading...</div>
           ) : filteredPlcs && filteredPlcs.length > 0 ? (
-            filteredPlcs.map((plc) => (
+            filteredPlcs.map((plc) => {
+              const isConnected = testResults[plc.id] ?? plc.is_connected;
+              return (
               <div key={plc.id} className="flex items-center justify-between bg-white border border-gray-200 rounded-xl p-4 shadow-sm">
                 <div className="flex items-center gap-4">
                   <CpuChipIcon className="h-6 w-6 text-gray-400" />
                   <div>
                     <div className="font-semibold text-gray-900 flex items-center gap-2">
                       {plc.name}
-                      <span className={`ml-2 h-2 w-2 rounded-full ${plc.is_connected ? 'bg-green-500' : 'bg-gray-400'}`}></span>
-                      <span className="text-xs font-normal text-gray-500">{plc.is_connected ? 'Online' : 'Offline'}</span>
+                      <span className={`ml-2 h-2 w-2 rounded-full ${isConnected ? 'bg-green-500' : 'bg-gray-400'}`}></span>
+                      <span className="text-xs font-normal text-gray-500">{isConnected ? 'Online' : 'Offline'}</span>
                     </div>
                     <div className="text-sm text-gray-500">{plc.ip_address}:{plc.port} &bull; {plc.description || 'No description'}</div>
+                    <div className="text-xs text-gray-400">{plc.register_count} registers &bull; {plc.monitored_count} monitored{plc.is_polling ? ' • Polling' : ''}</div>
                   </div>
                 </div>
                 <button
@@ -63,7 +111,8 @@ export default function AllDevices() {
                   View Details
                 </button>
               </div>
-            ))
+              );
+            })
           ) : (
             <div className="text-gray-500 text-center py-8">No devices found.</div>
           )}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useQuery, useMutation } from 'react-query';
 import axios from 'axios';
 import { io } from 'socket.io-client';
@@ -36,6 +36,10 @@ const socket = io('http://localhost:5000', {
   reconnectionDelay: 1000,
 });
 
+// Seconds of trend fetched on page load and reconnect, and points kept per chart
+const LOOKBACK_SECONDS = 300;
+const MAX_CHART_POINTS = 300;
+
 export default function Dashboard() {
   const [selectedPLC, setSelectedPLC] = useState('');
   const [registerValues, setRegisterValues] = useState({});
@@ -59,6 +63,26 @@ export default function Dashboard() {
     { enabled: !!selectedPLC }
   );
 
+  // --- Fetch active alarms for selected PLC ---
+  const { data: activeAlarms, refetch: refetchAlarms } = useQuery(
+    ['alarms', selectedPLC],
+    async () => {
+      const response = await axios.get(`/api/alarms?active=1&plc_id=${selectedPLC}`);
+      return response.data;
+    },
+    { enabled: !!selectedPLC }
+  );
+
+  const acknowledgeAlarmMutation = useMutation(
+    async (alarmId) => {
+      const response = await axios.post(`/api/alarms/${alarmId}/acknowledge`);
+      return response.data;
+    },
+    {
+      onSuccess: () => refetchAlarms(),
+    }
+  );
+
   // --- Start/Stop Monitoring Mutations ---
   const startMonitoringMutation = useMutation(
     async () => {
@@ -96,40 +120,100 @@ export default function Dashboard() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [selectedPLC]);
 
-  // --- WebSocket: Listen for register updates ---
+  // --- WebSocket: Backfill the trend, then listen for register updates ---
+  const subscriptionRef = useRef({ seq: null, buffered: [] });
+
   useEffect(() => {
+    if (!selectedPLC) return undefined;
+    const plcId = parseInt(selectedPLC);
+
+    function appendUpdate(data) {
+      setRegisterValues(prev => ({
+        ...prev,
+        ...data.data
+      }));
+
+      // Update chart historical data
+      setChartDataHistory(prevHistory => {
+        const newHistory = { ...prevHistory };
+        const currentTime = (data.timestamp ? new Date(data.timestamp * 1000) : new Date()).toLocaleTimeString();
+
+        for (const regId in data.data) {
+          const history = newHistory[regId] || { labels: [], values: [] };
+          newHistory[regId] = {
+            labels: [...history.labels, currentTime].slice(-MAX_CHART_POINTS),
+            values: [...history.values, data.data[regId].value].slice(-MAX_CHART_POINTS),
+          };
+        }
+        return newHistory;
+      });
+    }
+
     function handleRegisterUpdate(data) {
-      if (data.plc_id === parseInt(selectedPLC)) {
-        setRegisterValues(prev => ({
-          ...prev,
-          ...data.data
-        }));
-
-        // Update chart historical data
-        setChartDataHistory(prevHistory => {
-          const newHistory = { ...prevHistory };
-          const currentTime = new Date().toLocaleTimeString();
-
-          for (const regId in data.data) {
-            if (!newHistory[regId]) {
-              newHistory[regId] = { labels: [], values: [] };
-            }
-            newHistory[regId].labels.push(currentTime);
-            newHistory[regId].values.push(data.data[regId].value);
-            // Keep history limited (e.g., last 20 points)
-            if (newHistory[regId].labels.length > 20) {
-              newHistory[regId].labels.shift();
-              newHistory[regId].values.shift();
-            }
-          }
-          return newHistory;
-        });
+      if (data.plc_id !== plcId) return;
+      const subscription = subscriptionRef.current;
+      if (subscription.seq === null) {
+        // Hold live updates until the backfill arrives
+        subscription.buffered.push(data);
+      } else if (data.seq === undefined || data.seq > subscription.seq) {
+        appendUpdate(data);
       }
     }
+
+    function handleBackfill(frame) {
+      if (frame.plc_id !== plcId) return;
+      const labels = frame.offsets.map(offset => new Date(frame.start * 1000 + offset).toLocaleTimeString());
+      const history = {};
+      const latest = {};
+      for (const regId in frame.data) {
+        const values = frame.data[regId];
+        history[regId] = { labels: labels.slice(-MAX_CHART_POINTS), values: values.slice(-MAX_CHART_POINTS) };
+        const last = [...values].reverse().find(value => value !== null);
+        if (last !== undefined) {
+          latest[regId] = { ...registers?.find(reg => reg.id === parseInt(regId)), value: last };
+        }
+      }
+      setChartDataHistory(history);
+      setRegisterValues(latest);
+
+      // Updates already in the backfill are dropped, later ones appended
+      const subscription = subscriptionRef.current;
+      subscription.seq = frame.seq;
+      const buffered = subscription.buffered;
+      subscription.buffered = [];
+      buffered.forEach(handleRegisterUpdate);
+    }
+
+    function subscribe() {
+      subscriptionRef.current = { seq: null, buffered: [] };
+      socket.emit('subscribe', { plc_id: plcId, lookback: LOOKBACK_SECONDS });
+    }
+
     socket.on('register_update', handleRegisterUpdate);
+    socket.on('backfill', handleBackfill);
+    // Subscribe again after a reconnect so the trend has no gap
+    socket.on('connect', subscribe);
+    if (socket.connected) subscribe();
     return () => {
       socket.off('register_update', handleRegisterUpdate);
+      socket.off('backfill', handleBackfill);
+      socket.off('connect', subscribe);
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [selectedPLC]);
+
+  // --- WebSocket: Alarms are only pushed when they are raised or cleared ---
+  useEffect(() => {
+    function handleAlarm(alarm) {
+      if (alarm.plc_id === parseInt(selectedPLC)) {
+        refetchAlarms();
+      }
+    }
+    socket.on('alarm', handleAlarm);
+    return () => {
+      socket.off('alarm', handleAlarm);
     };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [selectedPLC]);
 
   // --- Chart Data Preparation ---
@@ -249,6 +333,33 @@ export default function Dashboard() {
       {/* Content based on PLC selection */}
       {selectedPLC ? (
         <>
+          {/* Active Alarms */}
+          {activeAlarms?.length > 0 && (
+            <div className="mb-8 p-6 bg-white rounded-2xl shadow-lg border border-red-200">
+              <h2 className="text-2xl font-bold text-gray-900 mb-4">Active Alarms</h2>
+              <ul className="space-y-2">
+                {activeAlarms.map(alarm => (
+                  <li key={alarm.id} className="flex items-center justify-between">
+                    <span className={alarm.severity === 'critical' ? 'text-red-600 font-semibold' : 'text-amber-600'}>
+                      {alarm.message || `${registers?.find(reg => reg.id === alarm.register_id)?.name ?? `Register ${alarm.register_id}`} ${alarm.rule_type.replace(/_/g, ' ')} (${alarm.threshold})`}
+                      <span className="text-xs text-gray-500"> | Value: {alarm.value} | Since: {new Date(alarm.raised_at).toLocaleTimeString()}</span>
+                    </span>
+                    {alarm.acknowledged_at ? (
+                      <span className="text-xs text-gray-500">Acknowledged</span>
+                    ) : (
+                      <button
+                        className="text-sm px-3 py-1 rounded-lg border border-gray-300 hover:bg-gray-100"
+                        onClick={() => acknowledgeAlarmMutation.mutate(alarm.id)}
+                      >
+                        Acknowledge
+                      </button>
+                    )}
+                  </li>
+                ))}
+              </ul>
+            </div>
+          )}
+
           {/* Live Gauges Section (Top) */}
           {(registers && registers.filter(reg => reg.is_monitored).length > 0) && (
             <div className="mb-8 p-6 bg-white rounded-2xl shadow-lg">
@@ -1,9 +1,11 @@
 import { useState, useEffect } from 'react';
 import { useParams } from 'react-router-dom';
-import { useQuery, useMutation, useQueryClient } from 'react-query';
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from 'react-query';
 import axios from 'axios';
 import { ComputerDesktopIcon, EyeIcon, EyeSlashIcon, TrashIcon } from '@heroicons/react/24/outline';
 
+const REGISTER_PAGE_SIZE = 500;
+
 export default function RegisterSetup() {
   const { plcId } = useParams();
   const [isAddingRegister, setIsAddingRegister] = useState(false);
@@ -12,6 +14,7 @@ export default function RegisterSetup() {
     name: '',
     address: 0,
     data_type: 'int16',
+    register_area: 'holding_register',
     scaling_factor: 1.0,
     unit: '',
     description: '',
@@ -21,6 +24,7 @@ export default function RegisterSetup() {
     read_write: 'read_write',
   });
   const [editingRegisterId, setEditingRegisterId] = useState(null);
+  const [scanId, setScanId] = useState(null);
   const [currentEditData, setCurrentEditData] = useState(null);
 
   const queryClient = useQueryClient();
@@ -31,10 +35,24 @@ export default function RegisterSetup() {
     return response.data;
   });
 
-  const { data: registers, isLoading } = useQuery(['registers', plcId], async () => {
-    const response = await axios.get(`/api/plcs/${plcId}/registers`);
-    return response.data;
-  });
+  // Registers load a page at a time; the server returns the next page's cursor in X-Next-Cursor
+  const {
+    data: registerPages,
+    isLoading,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery(
+    ['registers', plcId],
+    async ({ pageParam }) => {
+      const response = await axios.get(`/api/plcs/${plcId}/registers`, {
+        params: { limit: REGISTER_PAGE_SIZE, after: pageParam },
+      });
+      return { registers: response.data, nextCursor: response.headers['x-next-cursor'] };
+    },
+    { getNextPageParam: (lastPage) => lastPage.nextCursor }
+  );
+  const registers = registerPages?.pages.flatMap((page) => page.registers);
 
   const addRegisterMutation = useMutation(
     async (register) => {
@@ -49,6 +67,7 @@ export default function RegisterSetup() {
           name: '',
           address: 0,
           data_type: 'int16',
+          register_area: 'holding_register',
           scaling_factor: 1.0,
           unit: '',
           description: '',
@@ -61,6 +80,56 @@ export default function RegisterSetup() {
     }
   );
 
+  // Register map discovery: poll the scan until it finishes, then offer a one-click import
+  const { data: scan } = useQuery(
+    ['scan', plcId, scanId],
+    async () => {
+      const response = await axios.get(`/api/plcs/${plcId}/scans/${scanId}`);
+      return response.data;
+    },
+    {
+      enabled: !!scanId,
+      refetchInterval: (data) => (data && ['completed', 'failed', 'cancelled'].includes(data.status) ? false : 1000),
+    }
+  );
+
+  const startScanMutation = useMutation(
+    async () => {
+      const response = await axios.post(`/api/plcs/${plcId}/scans`, {});
+      return response.data;
+    },
+    {
+      onSuccess: (data) => setScanId(data.id),
+    }
+  );
+
+  const importScanMutation = useMutation(
+    async () => {
+      const response = await axios.post(`/api/plcs/${plcId}/scans/${scanId}/import`, {});
+      return response.data;
+    },
+    {
+      onSuccess: () => {
+        queryClient.invalidateQueries(['registers', plcId]);
+        setScanId(null);
+      },
+    }
+  );
+
+  const bulkImportMutation = useMutation(
+    async (file) => {
+      const response = await axios.post(`/api/plcs/${plcId}/registers/bulk`, file, {
+        headers: { 'Content-Type': file.name.endsWith('.json') ? 'application/json' : 'text/csv' },
+      });
+      return response.data;
+    },
+    {
+      onSuccess: () => {
+        queryClient.invalidateQueries(['registers', plcId]);
+      },
+    }
+  );
+
   const deleteRegisterMutation = useMutation(
     async (registerId) => {
       await axios.delete(`/api/plcs/${plcId}/registers/${registerId}`);
@@ -121,6 +190,7 @@ export default function RegisterSetup() {
       name: register.name,
       address: register.address,
       data_type: register.data_type,
+      register_area: register.register_area ?? 'holding_register',
       scaling_factor: register.scaling_factor,
       unit: register.unit,
       description: register.description,
@@ -207,6 +277,29 @@ export default function RegisterSetup() {
       <div className="bg-white rounded-2xl shadow p-8">
         <div className="flex items-center justify-between mb-6">
           <h2 className="text-2xl font-bold text-gray-900">Registers</h2>
+          <div className="flex gap-3">
+          <label className="border border-gray-300 rounded-lg px-5 py-2 text-gray-700 font-medium hover:bg-gray-50 transition cursor-pointer">
+            {bulkImportMutation.isLoading ? 'Importing...' : 'Import CSV'}
+            <input
+              type="file"
+              accept=".csv,.json"
+              className="hidden"
+              onChange={(e) => { if (e.target.files[0]) bulkImportMutation.mutate(e.target.files[0]); e.target.value = ''; }}
+            />
+          </label>
+          <a
+            href={`/api/plcs/${plcId}/registers/export?format=csv`}
+            className="border border-gray-300 rounded-lg px-5 py-2 text-gray-700 font-medium hover:bg-gray-50 transition"
+          >
+            Export CSV
+          </a>
+          <button
+            onClick={() => startScanMutation.mutate()}
+            disabled={startScanMutation.isLoading || (scan && ['pending', 'running'].includes(scan.status))}
+            className="border border-gray-300 rounded-lg px-5 py-2 text-gray-700 font-medium hover:bg-gray-50 transition"
+          >
+            {scan && ['pending', 'running'].includes(scan.status) ? `Scanning... ${Math.round(scan.progress * 100)}%` : 'Scan Device'}
+          </button>
           <button
             onClick={() => {
               setIsAddingRegister(true);
@@ -216,8 +309,35 @@ export default function RegisterSetup() {
           >
             <span className="text-xl">+</span> Add Register
           </button>
+          </div>
         </div>
 
+        {scan?.status === 'completed' && (
+          <div className="flex items-center justify-between bg-blue-50 border border-blue-200 rounded-xl p-4 mb-6">
+            <div className="text-sm text-blue-800">
+              Scan found {scan.proposed_registers?.length || 0} registers in {scan.ranges?.length || 0} address ranges ({scan.requests} requests).
+            </div>
+            <button
+              onClick={() => importScanMutation.mutate()}
+              disabled={importScanMutation.isLoading || !scan.proposed_registers?.length}
+              className="bg-blue-600 hover:bg-blue-700 text-white font-semibold rounded-lg px-4 py-2 text-sm transition"
+            >
+              {importScanMutation.isLoading ? 'Importing...' : 'Import All'}
+            </button>
+          </div>
+        )}
+        {bulkImportMutation.isError && (
+          <div className="text-red-600 text-sm mb-6">
+            {bulkImportMutation.error?.response?.data?.error || 'Import failed.'}
+            {bulkImportMutation.error?.response?.data?.errors?.slice(0, 5).map((error, index) => (
+              <div key={index}>{error.row ? `Row ${error.row}: ` : ''}{error.error}</div>
+            ))}
+          </div>
+        )}
+        {scan && ['failed', 'cancelled'].includes(scan.status) && (
+          <div className="text-red-600 text-sm mb-6">Scan {scan.status}: {scan.error}</div>
+        )}
+
         <input
           type="text"
           value={search}
@@ -277,8 +397,27 @@ export default function RegisterSetup() {
                     className="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500"
                   >
                     <option value="int16">Int16</option>
+                    <option value="uint16">UInt16</option>
                     <option value="int32">Int32</option>
+                    <option value="uint32">UInt32</option>
                     <option value="float">Float</option>
+                    <option value="bool">Bool (coils / discrete inputs)</option>
+                  </select>
+                </div>
+                <div>
+                  <label htmlFor="registerArea" className="block text-sm font-medium text-gray-700">Register Area</label>
+                  <select
+                    id="registerArea"
+                    name="register_area"
+                    value={isAddingRegister ? newRegister.register_area : currentEditData?.register_area || 'holding_register'}
+                    onChange={isAddingRegister ? (e) => setNewRegister({ ...newRegister, register_area: e.target.value }) : handleEditChange}
+                    required
+                    className="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-blue-500 focus:ring-blue-500"
+                  >
+                    <option value="holding_register">Holding Register (FC03)</option>
+                    <option value="input_register">Input Register (FC04)</option>
+                    <option value="coil">Coil (FC01)</option>
+                    <option value="discrete_input">Discrete Input (FC02)</option>
                   </select>
                 </div>
                 <div>
@@ -417,7 +556,7 @@ export default function RegisterSetup() {
                 <div>
                   <div className="font-semibold text-gray-900 text-lg">{register.name}</div>
                   <div className="text-sm text-gray-500 mb-1">
-                    Address: {register.address} &bull; Data Type: {register.data_type} &bull; Scaling: {register.scaling_factor} &bull; Unit: {register.unit || '-'}
+                    Address: {register.address} &bull; Area: {register.register_area?.replace('_', ' ')} &bull; Data Type: {register.data_type} &bull; Scaling: {register.scaling_factor} &bull; Unit: {register.unit || '-'}
                     {register.min_value !== null && register.min_value !== undefined && register.min_value !== '' && ` • Min: ${register.min_value}`}
                     {register.max_value !== null && register.max_value !== undefined && register.max_value !== '' && ` • Max: ${register.max_value}`}
                     <span className="text-sm text-gray-500"> • Access: {register.read_write?.replace('_', ' ')}</span>
@@ -451,6 +590,15 @@ export default function RegisterSetup() {
                 </div>
               </div>
             ))}
+            {hasNextPage && (
+              <button
+                onClick={() => fetchNextPage()}
+                disabled={isFetchingNextPage}
+                className="w-full border border-gray-300 rounded-lg px-4 py-2 text-gray-700 font-medium hover:bg-gray-50 transition"
+              >
+                {isFetchingNextPage ? 'Loading...' : 'Load More Registers'}
+              </button>
+            )}
           </div>
         )}
       </div>